@@ -60,6 +60,12 @@ const EVENT_TYPES: EventTypeDescriptor[] = [
     description: "Un livreur n'émet plus sa position pendant plus de 20 minutes.",
     severity: "warning",
   },
+  {
+    key: "job_lagging",
+    label: "Tâches de fond en retard",
+    description: "Une boucle de fond (dispatch, relances, expiration) prend du retard ou échoue en série.",
+    severity: "warning",
+  },
   {
     key: "application_submitted",
     label: "Candidatures",
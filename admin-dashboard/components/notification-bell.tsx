@@ -7,6 +7,7 @@ import {
   Bell,
   CheckCheck,
   FileText,
+  Gauge,
   Info,
   Package,
   RotateCcw,
@@ -40,6 +41,7 @@ const ICON_BY_TYPE: Record<string, React.ComponentType<{ className?: string }>>
   parcel_redirected: RotateCcw,
   parcel_cancelled: XCircle,
   mission_released: Undo2,
+  job_lagging: Gauge,
 };
 
 function eventIcon(type: string) {
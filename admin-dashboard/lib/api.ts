@@ -116,11 +116,14 @@ export async function fetchUsers(params: {
   to_date?: string;
   skip?: number;
   limit?: number;
+  cursor?: string;
 }) {
-  const { data } = await api.get<{ users: AdminUser[]; total: number }>(
-    "/api/admin/users",
-    { params },
-  );
+  const { data } = await api.get<{
+    users: AdminUser[];
+    total: number;
+    next_cursor: string | null;
+    has_more: boolean;
+  }>("/api/admin/users", { params: { ...params, include_total: true } });
   return data;
 }
 
@@ -313,11 +316,14 @@ export async function fetchParcels(params: {
   to_date?: string;
   skip?: number;
   limit?: number;
+  cursor?: string;
 }) {
-  const { data } = await api.get<{ parcels: AdminParcel[]; total: number }>(
-    "/api/admin/parcels",
-    { params },
-  );
+  const { data } = await api.get<{
+    parcels: AdminParcel[];
+    total: number;
+    next_cursor: string | null;
+    has_more: boolean;
+  }>("/api/admin/parcels", { params: { ...params, include_total: true } });
   return data;
 }
 
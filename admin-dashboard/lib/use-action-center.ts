@@ -5,13 +5,14 @@ import { fetchActionCenter, type ActionCenter } from "@/lib/api";
 
 /**
  * Hook partagé par la sidebar, le home "À traiter" et la cloche.
- * Un seul polling 30s → tout reste synchro sans multiplier les requêtes.
+ * Rafraîchi à chaque événement admin reçu par SSE (voir useAdminEvents) ;
+ * le polling 5 min ne sert qu'à faire vieillir les SLA affichés.
  */
 export function useActionCenter() {
   return useQuery<ActionCenter>({
     queryKey: ["action-center"],
     queryFn: fetchActionCenter,
-    refetchInterval: 30_000,
+    refetchInterval: 300_000,
     staleTime: 15_000,
   });
 }
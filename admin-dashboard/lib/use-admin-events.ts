@@ -1,17 +1,66 @@
 "use client";
 
-import { useQuery } from "@tanstack/react-query";
-import { fetchAdminEvents, type AdminEventsFeed } from "@/lib/api";
+import * as React from "react";
+import { useQuery, useQueryClient } from "@tanstack/react-query";
+import {
+  api,
+  fetchAdminEvents,
+  type AdminEvent,
+  type AdminEventsFeed,
+} from "@/lib/api";
+
+// Polling de secours uniquement quand le flux SSE est coupé.
+const FALLBACK_POLL_MS = 20_000;
 
 /**
- * Feed d'événements admin pour la cloche. Polling 20s (plus réactif que
- * l'action-center 30s) pour détecter les nouveaux events rapidement.
+ * Feed d'événements admin pour la cloche. Un chargement initial, puis les
+ * nouveaux events arrivent en temps réel via SSE (`/api/admin/events/stream`).
+ * L'EventSource gère seul la reconnexion (Last-Event-ID → rejeu côté API) ;
+ * tant qu'il est coupé on retombe sur un polling 20s.
  */
 export function useAdminEvents(limit = 50) {
+  const qc = useQueryClient();
+  const [streaming, setStreaming] = React.useState(false);
+  const queryKey = React.useMemo(() => ["admin-events", limit], [limit]);
+
+  React.useEffect(() => {
+    if (typeof window === "undefined" || typeof EventSource === "undefined") {
+      return;
+    }
+    const source = new EventSource(
+      `${api.defaults.baseURL}/api/admin/events/stream`,
+      { withCredentials: true },
+    );
+    source.onopen = () => setStreaming(true);
+    source.onerror = () => setStreaming(false);
+    source.addEventListener("admin_event", (message) => {
+      let ev: AdminEvent;
+      try {
+        ev = JSON.parse((message as MessageEvent<string>).data) as AdminEvent;
+      } catch {
+        return;
+      }
+      qc.setQueryData<AdminEventsFeed>(queryKey, (prev) => {
+        if (!prev) return prev;
+        if (prev.events.some((e) => e.event_id === ev.event_id)) return prev;
+        return {
+          events: [ev, ...prev.events].slice(0, limit),
+          unread_count: prev.unread_count + (ev.is_read ? 0 : 1),
+        };
+      });
+      // Un nouvel event = potentiellement un nouvel item "À traiter".
+      qc.invalidateQueries({ queryKey: ["action-center"] });
+    });
+    return () => {
+      source.close();
+      setStreaming(false);
+    };
+  }, [qc, queryKey, limit]);
+
   return useQuery<AdminEventsFeed>({
-    queryKey: ["admin-events", limit],
+    queryKey,
     queryFn: () => fetchAdminEvents({ limit }),
-    refetchInterval: 20_000,
-    staleTime: 10_000,
+    refetchInterval: streaming ? false : FALLBACK_POLL_MS,
+    staleTime: streaming ? Infinity : 10_000,
   });
 }
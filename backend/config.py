@@ -9,6 +9,41 @@ class Settings(BaseSettings):
     # App
     APP_ENV: str = "development"
     DEBUG: bool = False
+    # "api" : HTTP seulement ; "worker" : boucles de fond et jobs planifiés
+    # (`python -m worker`) ; "all" : les deux dans le même process.
+    ROLE: str = "all"
+    # Chaque boucle de fond n'a qu'un propriétaire à la fois (bail Mongo,
+    # voir core/leases.py) ; bascule sur une autre instance en ~1 période.
+    BACKGROUND_LEASE_SECONDS: int = 30
+    # Instrumentation des jobs (core/jobs.py) : alerte admin si un passage
+    # démarre avec plus de FACTOR × intervalle de retard ou après N échecs.
+    JOB_LAG_ALERT_FACTOR: float = 3.0
+    JOB_FAILURE_ALERT_THRESHOLD: int = 3
+    JOB_ALERT_COOLDOWN_MINUTES: int = 30
+    # Stockage des limites de débit (core/limiter.py) : "memory" | "mongo" | "redis"
+    RATE_LIMIT_STORAGE: str = "mongo"
+    RATE_LIMIT_REDIS_URL: Optional[str] = None
+    # Part de la limite réservée par lot dans Mongo (moins d'allers-retours).
+    RATE_LIMIT_RESERVATION_FRACTION: float = 0.1
+    # Taille de lot minimale (plafonnée au quart de la limite).
+    RATE_LIMIT_MIN_RESERVATION: int = 5
+    # Profilage Mongo par requête (core/mongo_profiler.py)
+    MONGO_PROFILER_ENABLED: bool = False
+    MONGO_PROFILER_SAMPLE_RATE: float = 1.0
+    MONGO_PROFILER_OP_BUDGET: int = 50
+    MONGO_PROFILER_REPEAT_THRESHOLD: int = 10
+    # Jeton Bearer exigé sur /metrics (accès libre si vide, ex. réseau privé)
+    METRICS_TOKEN: Optional[str] = None
+    # Cache des principaux authentifiés (core/principal_cache.py) ; les autres
+    # workers sont invalidés par change stream, sinon au plus tard après le TTL.
+    PRINCIPAL_CACHE_TTL_SECONDS: float = 30.0
+    PRINCIPAL_CACHE_MAX_ENTRIES: int = 10000
+    # Cache du suivi public (core/tracking_cache.py) : payload + HTML rendu par
+    # code de suivi, invalidé localement à chaque événement du colis.
+    TRACKING_CACHE_TTL_SECONDS: float = 60.0
+    TRACKING_CACHE_MAX_ENTRIES: int = 2000
+    # Codes inconnus (404) mémorisés brièvement, hors LRU des entrées.
+    TRACKING_MISS_TTL_SECONDS: float = 30.0
     BASE_URL: str = "https://api.denkma.com"
     PUBLIC_SITE_URL: str = "https://denkma.com"
     APP_DOWNLOAD_URL: Optional[str] = None
@@ -63,6 +98,12 @@ class Settings(BaseSettings):
     WHATSAPP_TEMPLATE_APPLICATION_APPROVED: str = "application_approved_v1"
     WHATSAPP_TEMPLATE_APPLICATION_REJECTED: str = "application_rejected_v1"
     WHATSAPP_SEND_SEPARATE_RECIPIENT_CODE: bool = True
+    # Webhook entrant : le payload est mis en file (whatsapp_webhook_inbox) et
+    # traité en arrière-plan, voir services/whatsapp_inbox_service.py.
+    WHATSAPP_INBOX_WORKERS: int = 4
+    WHATSAPP_INBOX_BATCH_SIZE: int = 20
+    WHATSAPP_INBOX_MAX_ATTEMPTS: int = 5
+    WHATSAPP_MEDIA_DOWNLOAD_CONCURRENCY: int = 4
 
     # Flutterwave
     FLUTTERWAVE_SECRET_KEY:    Optional[str] = None
@@ -94,6 +135,29 @@ class Settings(BaseSettings):
     ASSIGNED_MISSION_AUTO_RELEASE_MINUTES: int = 30
     PUBLIC_TRACKING_RETENTION_DAYS: int = 30
 
+    # Rétention des collections à forte croissance (job nocturne, voir
+    # services/retention_service.py). Logs éphémères : TTL Mongo. Données
+    # d'audit : déplacées vers `<collection>_archive` ou en NDJSON gzip.
+    WHATSAPP_LOGS_RETENTION_DAYS: int = 30
+    WHATSAPP_CALL_EVENTS_RETENTION_DAYS: int = 90
+    NOTIFICATIONS_RETENTION_DAYS: int = 90
+    ADMIN_EVENTS_RETENTION_DAYS: int = 180
+    PARCEL_EVENTS_RETENTION_DAYS: int = 365
+    RETENTION_ARCHIVE_FORMAT: str = "collection"  # "collection" | "ndjson"
+    RETENTION_ARCHIVE_DIR: Optional[str] = None   # requis en mode ndjson
+    RETENTION_BATCH_SIZE: int = 500
+    RETENTION_BATCH_PAUSE_MS: int = 200
+    RETENTION_MAX_BATCHES_PER_RUN: int = 200
+    # Tiering chaud / froid (services/archive_service.py) : colis terminés,
+    # missions et événements déplacés vers `*_archive` au-delà de cet âge.
+    PARCEL_ARCHIVE_AFTER_DAYS: int = 180
+    PARCEL_ARCHIVE_BATCH_SIZE: int = 200
+
+    # Réconciliation finance (services/finance_reconciliation_service.py) :
+    # taille des lots d'identifiants et recouvrement du point de reprise.
+    FINANCE_RECONCILIATION_BATCH_SIZE: int = 500
+    FINANCE_RECONCILIATION_OVERLAP_SECONDS: int = 300
+
     # Commission splits — 15 % plateforme, 15 % relais, 70 % livreur = 100 %
     PLATFORM_RATE:    float = 0.15
     RELAY_RATE:       float = 0.15
@@ -121,6 +185,42 @@ class Settings(BaseSettings):
             raise ValueError("ASSIGNED_MISSION_AUTO_RELEASE_MINUTES must be >= 5")
         if self.PUBLIC_TRACKING_RETENTION_DAYS < 1:
             raise ValueError("PUBLIC_TRACKING_RETENTION_DAYS must be >= 1")
+        if self.RETENTION_ARCHIVE_FORMAT not in {"collection", "ndjson"}:
+            raise ValueError("RETENTION_ARCHIVE_FORMAT must be 'collection' or 'ndjson'")
+        if self.RETENTION_ARCHIVE_FORMAT == "ndjson" and not self.RETENTION_ARCHIVE_DIR:
+            raise ValueError("RETENTION_ARCHIVE_DIR must be configured when RETENTION_ARCHIVE_FORMAT=ndjson")
+        if self.RETENTION_BATCH_SIZE < 1:
+            raise ValueError("RETENTION_BATCH_SIZE must be >= 1")
+        # Les statistiques livreurs du mois précédent sont recalculées depuis
+        # les missions chaudes : elles doivent encore y être.
+        if self.PARCEL_ARCHIVE_AFTER_DAYS < 90 or self.PARCEL_ARCHIVE_BATCH_SIZE < 1:
+            raise ValueError("PARCEL_ARCHIVE_AFTER_DAYS must be >= 90 and PARCEL_ARCHIVE_BATCH_SIZE >= 1")
+        if self.FINANCE_RECONCILIATION_BATCH_SIZE < 1 or self.FINANCE_RECONCILIATION_OVERLAP_SECONDS < 0:
+            raise ValueError("FINANCE_RECONCILIATION_BATCH_SIZE must be >= 1 and FINANCE_RECONCILIATION_OVERLAP_SECONDS >= 0")
+        if self.ROLE not in {"api", "worker", "all"}:
+            raise ValueError("ROLE must be 'api', 'worker' or 'all'")
+        if self.BACKGROUND_LEASE_SECONDS < 5:
+            raise ValueError("BACKGROUND_LEASE_SECONDS must be >= 5")
+        if self.JOB_LAG_ALERT_FACTOR <= 1 or self.JOB_FAILURE_ALERT_THRESHOLD < 1:
+            raise ValueError("JOB_LAG_ALERT_FACTOR must be > 1 and JOB_FAILURE_ALERT_THRESHOLD >= 1")
+        if self.RATE_LIMIT_STORAGE not in {"memory", "mongo", "redis"}:
+            raise ValueError("RATE_LIMIT_STORAGE must be 'memory', 'mongo' or 'redis'")
+        if self.RATE_LIMIT_STORAGE == "redis" and not self.RATE_LIMIT_REDIS_URL:
+            raise ValueError("RATE_LIMIT_REDIS_URL must be configured when RATE_LIMIT_STORAGE=redis")
+        if not 0 < self.RATE_LIMIT_RESERVATION_FRACTION <= 1:
+            raise ValueError("RATE_LIMIT_RESERVATION_FRACTION must be in ]0, 1]")
+        if self.RATE_LIMIT_MIN_RESERVATION < 1:
+            raise ValueError("RATE_LIMIT_MIN_RESERVATION must be >= 1")
+        if not 0 <= self.MONGO_PROFILER_SAMPLE_RATE <= 1:
+            raise ValueError("MONGO_PROFILER_SAMPLE_RATE must be between 0 and 1")
+        if self.PRINCIPAL_CACHE_TTL_SECONDS < 0 or self.PRINCIPAL_CACHE_MAX_ENTRIES < 1:
+            raise ValueError("PRINCIPAL_CACHE_TTL_SECONDS must be >= 0 and PRINCIPAL_CACHE_MAX_ENTRIES >= 1")
+        if self.TRACKING_CACHE_TTL_SECONDS < 0 or self.TRACKING_CACHE_MAX_ENTRIES < 1:
+            raise ValueError("TRACKING_CACHE_TTL_SECONDS must be >= 0 and TRACKING_CACHE_MAX_ENTRIES >= 1")
+        if self.TRACKING_MISS_TTL_SECONDS < 0:
+            raise ValueError("TRACKING_MISS_TTL_SECONDS must be >= 0")
+        if self.WHATSAPP_INBOX_WORKERS < 1 or self.WHATSAPP_INBOX_BATCH_SIZE < 1:
+            raise ValueError("WHATSAPP_INBOX_WORKERS and WHATSAPP_INBOX_BATCH_SIZE must be >= 1")
 
         if is_prod and self.WHATSAPP_ACCESS_TOKEN and not self.WHATSAPP_APP_SECRET:
             raise ValueError("WHATSAPP_APP_SECRET must be configured in production when WhatsApp webhooks are enabled")
@@ -4,6 +4,7 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 from core.security import verify_access_token
 from core.exceptions import credentials_exception, forbidden_exception
+from core.principal_cache import load_principal
 from database import db
 from models.common import UserRole
 
@@ -27,6 +28,11 @@ async def get_current_user(
     request: Request,
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
 ) -> dict:
+    """
+    Principal authentifié : projection compacte mise en cache
+    (voir core/principal_cache.py). Utiliser get_current_user_full pour lire
+    les autres champs du document (favoris, fidélité, parrainage…).
+    """
     token = _extract_token(request, credentials)
     if not token:
         raise credentials_exception()
@@ -38,7 +44,7 @@ async def get_current_user(
     if not user_id:
         raise credentials_exception()
 
-    user = await db.users.find_one({"user_id": user_id}, {"_id": 0})
+    user = await load_principal(user_id)
     if not user:
         raise credentials_exception()
     if not user.get("is_active", True):
@@ -51,6 +57,14 @@ async def get_current_user(
     return user
 
 
+async def get_current_user_full(current_user: dict = Depends(get_current_user)) -> dict:
+    """Document utilisateur complet, pour les endpoints qui dépassent la projection."""
+    user = await db.users.find_one({"user_id": current_user["user_id"]}, {"_id": 0})
+    if not user:
+        raise credentials_exception()
+    return user
+
+
 async def get_current_user_optional(
     request: Request,
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
@@ -66,7 +80,7 @@ async def get_current_user_optional(
         user_id = payload.get("sub")
         if not user_id:
             return None
-        user = await db.users.find_one({"user_id": user_id}, {"_id": 0})
+        user = await load_principal(user_id)
         if not user or not user.get("is_active", True) or user.get("is_banned"):
             return None
         return user
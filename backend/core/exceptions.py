@@ -42,3 +42,10 @@ def unprocessable_exception(detail: str) -> HTTPException:
         status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
         detail=detail,
     )
+
+
+def too_many_requests_exception(detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+    )
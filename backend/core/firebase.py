@@ -0,0 +1,68 @@
+"""
+Firebase Admin, initialisé à la demande.
+
+`firebase_admin` tire google.auth, requests et cryptography : ~200 ms d'import
+et plusieurs Mo par worker. Rien n'est importé tant qu'aucun login Firebase
+ni push n'a lieu ; l'application est ensuite partagée par tout le process
+(routers/auth.py, services/notification_service.py).
+"""
+import json
+import logging
+import os
+import threading
+from typing import Any, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_app: Any = None
+_checked = False
+
+
+def _load_credentials():
+    from firebase_admin import credentials
+
+    firebase_creds_env = os.environ.get("FIREBASE_CREDENTIALS")
+    if firebase_creds_env:
+        return credentials.Certificate(json.loads(firebase_creds_env))
+    if settings.FIREBASE_CREDENTIALS_PATH and os.path.exists(settings.FIREBASE_CREDENTIALS_PATH):
+        return credentials.Certificate(settings.FIREBASE_CREDENTIALS_PATH)
+    if os.path.exists("firebase-service-account.json"):
+        return credentials.Certificate("firebase-service-account.json")
+    return None
+
+
+def get_firebase_app() -> Optional[Any]:
+    """Application Firebase Admin, ou None si aucun identifiant n'est configuré."""
+    global _app, _checked
+    if _checked:
+        return _app
+    with _lock:
+        if _checked:
+            return _app
+        try:
+            import firebase_admin
+
+            if firebase_admin._apps:
+                _app = firebase_admin.get_app()
+            else:
+                cred = _load_credentials()
+                if cred is None:
+                    logger.warning("Firebase credentials not found — /auth/firebase et push désactivés")
+                else:
+                    _app = firebase_admin.initialize_app(cred)
+        except Exception as e:
+            logger.warning(f"Firebase Admin non initialisé : {e}")
+        _checked = True
+    return _app
+
+
+def verify_firebase_id_token(id_token: str) -> dict:
+    """Vérifie un ID token Firebase (lève une exception si invalide ou non configuré)."""
+    if get_firebase_app() is None:
+        raise RuntimeError("Firebase Admin non configuré")
+    from firebase_admin import auth as firebase_auth
+
+    return firebase_auth.verify_id_token(id_token)
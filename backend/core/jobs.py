@@ -0,0 +1,320 @@
+"""
+Instrumentation des boucles de fond et des jobs APScheduler.
+
+`job_registry.run_periodic(name, interval, fn)` remplace le motif
+`while True: sleep(); try: ... except: logger.error(...)` : chaque passage est
+chronométré (histogramme), le nombre d'éléments traités et le retard sur
+l'échéance prévue sont relevés, succès/échecs horodatés. `fn` renvoie un
+entier (éléments traités) ou un dict {"items": n, "lag_seconds": s} quand le
+job connaît le retard de ses propres éléments (échéance la plus ancienne).
+
+Chaque passage écrit un instantané dans `job_status` : la route `/health/jobs`
+le lit, quel que soit le process (API ou worker) qui exécute le job. Un job en
+retard (> JOB_LAG_ALERT_FACTOR × intervalle), en échecs répétés ou dont
+APScheduler a manqué une exécution déclenche un événement admin JOB_LAGGING,
+au plus une fois par JOB_ALERT_COOLDOWN_MINUTES.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Optional, Union
+
+from config import settings
+from core.leases import INSTANCE_ID
+from database import db
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+JobResult = Union[int, dict, None]
+JobFunc = Callable[[], Awaitable[JobResult]]
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+@dataclass
+class JobStats:
+    name: str
+    interval_seconds: Optional[float] = None
+    runs: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    missed: int = 0
+    items_total: int = 0
+    last_items: int = 0
+    last_duration_seconds: Optional[float] = None
+    last_lag_seconds: float = 0.0
+    max_lag_seconds: float = 0.0
+    last_started_at: Optional[datetime] = None
+    last_success_at: Optional[datetime] = None
+    last_failure_at: Optional[datetime] = None
+    last_error: Optional[str] = None
+    duration_bucket_counts: list[int] = field(default_factory=lambda: [0] * len(DURATION_BUCKETS))
+    duration_sum: float = 0.0
+
+    def observe_duration(self, seconds: float) -> None:
+        self.last_duration_seconds = seconds
+        self.duration_sum += seconds
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound:
+                self.duration_bucket_counts[index] += 1
+
+    def observe_lag(self, seconds: float) -> None:
+        self.last_lag_seconds = max(seconds, 0.0)
+        self.max_lag_seconds = max(self.max_lag_seconds, self.last_lag_seconds)
+
+    @property
+    def lagging(self) -> bool:
+        if self.consecutive_failures >= settings.JOB_FAILURE_ALERT_THRESHOLD:
+            return True
+        if self.interval_seconds and self.last_lag_seconds > settings.JOB_LAG_ALERT_FACTOR * self.interval_seconds:
+            return True
+        return False
+
+    def to_doc(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "owner": INSTANCE_ID,
+            "interval_seconds": self.interval_seconds,
+            "runs": self.runs,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "missed": self.missed,
+            "items_total": self.items_total,
+            "last_items": self.last_items,
+            "last_duration_seconds": self.last_duration_seconds,
+            "last_lag_seconds": self.last_lag_seconds,
+            "max_lag_seconds": self.max_lag_seconds,
+            "last_started_at": self.last_started_at,
+            "last_success_at": self.last_success_at,
+            "last_failure_at": self.last_failure_at,
+            "last_error": self.last_error,
+            "duration_buckets": dict(zip([str(b) for b in DURATION_BUCKETS], self.duration_bucket_counts)),
+            "duration_sum": self.duration_sum,
+            "lagging": self.lagging,
+            "updated_at": _now(),
+        }
+
+
+def _split_result(result: JobResult) -> tuple[int, Optional[float]]:
+    if isinstance(result, dict):
+        return int(result.get("items") or 0), result.get("lag_seconds")
+    if isinstance(result, bool):
+        return int(result), None
+    if isinstance(result, int):
+        return result, None
+    return 0, None
+
+
+class JobRegistry:
+    def __init__(self) -> None:
+        self._jobs: dict[str, JobStats] = {}
+        self._alerted_at: dict[str, float] = {}
+
+    def stats(self, name: str, interval_seconds: Optional[float] = None) -> JobStats:
+        job = self._jobs.get(name)
+        if job is None:
+            job = self._jobs[name] = JobStats(name=name, interval_seconds=interval_seconds)
+        elif interval_seconds is not None:
+            job.interval_seconds = interval_seconds
+        return job
+
+    def local_snapshot(self) -> list[dict[str, Any]]:
+        return [job.to_doc() for job in self._jobs.values()]
+
+    async def run_once(
+        self,
+        name: str,
+        fn: JobFunc,
+        *,
+        interval_seconds: Optional[float] = None,
+        lag_seconds: float = 0.0,
+    ) -> JobResult:
+        job = self.stats(name, interval_seconds)
+        job.last_started_at = _now()
+        started = time.perf_counter()
+        result: JobResult = None
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            job.failures += 1
+            job.consecutive_failures += 1
+            job.last_failure_at = _now()
+            job.last_error = f"{type(exc).__name__}: {exc}"[:240]
+            logger.exception("Job %s en échec (%s échec(s) consécutif(s))", name, job.consecutive_failures)
+        else:
+            items, items_lag = _split_result(result)
+            job.items_total += items
+            job.last_items = items
+            job.consecutive_failures = 0
+            job.last_success_at = _now()
+            if items_lag is not None:
+                lag_seconds = max(lag_seconds, float(items_lag))
+        finally:
+            job.runs += 1
+            job.observe_duration(time.perf_counter() - started)
+            job.observe_lag(lag_seconds)
+        await self._persist(job)
+        if job.lagging:
+            await self._alert(job)
+        return result
+
+    async def run_periodic(
+        self,
+        name: str,
+        interval_seconds: float,
+        fn: JobFunc,
+    ) -> None:
+        """
+        Exécute `fn` toutes les `interval_seconds`. Le retard mesuré est l'écart
+        entre l'échéance prévue et le départ effectif (passage précédent trop
+        long, boucle asyncio saturée). Un retard supérieur à un intervalle fait
+        sauter les échéances manquées au lieu d'enchaîner les passages ; le
+        retard reste alors mesuré depuis la première échéance manquée, jusqu'à
+        ce qu'un passage reparte à l'heure (des passages toujours plus longs
+        que l'intervalle finissent donc par alerter).
+        """
+        self.stats(name, interval_seconds)
+        due = time.monotonic() + interval_seconds
+        # Première échéance manquée de la série de passages en retard en cours.
+        behind_since: Optional[float] = None
+        while True:
+            delay = due - time.monotonic()
+            if delay > 0:
+                behind_since = None
+            await asyncio.sleep(max(delay, 0.0))
+            lag = time.monotonic() - (due if behind_since is None else behind_since)
+            await self.run_once(name, fn, interval_seconds=interval_seconds, lag_seconds=lag)
+            due += interval_seconds
+            if time.monotonic() - due > interval_seconds:
+                if behind_since is None:
+                    behind_since = due
+                due = time.monotonic()
+
+    def scheduled(self, name: str, fn: JobFunc) -> Callable[[], Awaitable[JobResult]]:
+        """Enveloppe un job APScheduler (à enregistrer avec `id=name`)."""
+
+        async def _run() -> JobResult:
+            return await self.run_once(name, fn)
+
+        _run.__name__ = fn.__name__
+        return _run
+
+    def record_missed(self, name: str) -> None:
+        """Listener EVENT_JOB_MISSED : exécution planifiée non lancée à temps."""
+        job = self.stats(name)
+        job.missed += 1
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        loop.create_task(self._alert(job, reason="exécution planifiée manquée"))
+
+    async def _persist(self, job: JobStats) -> None:
+        try:
+            await db.job_status.update_one({"name": job.name}, {"$set": job.to_doc()}, upsert=True)
+        except Exception as exc:
+            logger.debug("Instantané job %s non enregistré : %s", job.name, exc)
+
+    async def _alert(self, job: JobStats, reason: Optional[str] = None) -> None:
+        cooldown = settings.JOB_ALERT_COOLDOWN_MINUTES * 60
+        last = self._alerted_at.get(job.name)
+        if last is not None and time.monotonic() - last < cooldown:
+            return
+        self._alerted_at[job.name] = time.monotonic()
+        from services.admin_events_service import AdminEventType, record_admin_event
+
+        if reason is None:
+            reason = (
+                f"{job.consecutive_failures} échec(s) consécutif(s) : {job.last_error}"
+                if job.consecutive_failures >= settings.JOB_FAILURE_ALERT_THRESHOLD
+                else f"retard de {job.last_lag_seconds:.0f} s (intervalle {job.interval_seconds:.0f} s)"
+            )
+        await record_admin_event(
+            AdminEventType.JOB_LAGGING,
+            title=f"Tâche de fond en retard — {job.name}",
+            message=reason,
+            metadata={
+                "job": job.name,
+                "consecutive_failures": job.consecutive_failures,
+                "lag_seconds": round(job.last_lag_seconds, 1),
+                "missed": job.missed,
+            },
+        )
+
+
+job_registry = JobRegistry()
+
+
+async def list_job_status() -> list[dict[str, Any]]:
+    """Instantanés de tous les jobs (Mongo), complétés par ceux du process courant."""
+    docs: dict[str, dict[str, Any]] = {}
+    try:
+        async for doc in db.job_status.find({}, {"_id": 0}).sort("name", 1):
+            docs[doc["name"]] = doc
+    except Exception as exc:
+        logger.warning("Lecture job_status impossible : %s", exc)
+    for doc in job_registry.local_snapshot():
+        docs.setdefault(doc["name"], doc)
+    now = _now()
+    for doc in docs.values():
+        updated_at = doc.get("updated_at")
+        if updated_at is not None and updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=timezone.utc)
+        interval = doc.get("interval_seconds")
+        # Boucle périodique sans passage récent : le process propriétaire est
+        # probablement arrêté ou bloqué.
+        doc["stale"] = bool(
+            interval
+            and updated_at is not None
+            and now - updated_at > timedelta(seconds=interval * settings.JOB_LAG_ALERT_FACTOR + 60)
+        )
+    return [docs[name] for name in sorted(docs)]
+
+
+def _timestamp(value: Optional[datetime]) -> float:
+    if value is None:
+        return 0.0
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def render_prometheus(jobs: list[dict[str, Any]]) -> str:
+    """Format d'exposition texte Prometheus (0.0.4)."""
+    lines = [
+        "# HELP denkma_job_duration_seconds Durée d'un passage de job de fond.",
+        "# TYPE denkma_job_duration_seconds histogram",
+    ]
+    for job in jobs:
+        label = f'job="{job["name"]}"'
+        buckets = job.get("duration_buckets") or {}
+        for bound in DURATION_BUCKETS:
+            lines.append(f'denkma_job_duration_seconds_bucket{{{label},le="{bound}"}} {buckets.get(str(bound), 0)}')
+        lines.append(f'denkma_job_duration_seconds_bucket{{{label},le="+Inf"}} {job.get("runs", 0)}')
+        lines.append(f"denkma_job_duration_seconds_sum{{{label}}} {job.get('duration_sum', 0.0)}")
+        lines.append(f"denkma_job_duration_seconds_count{{{label}}} {job.get('runs', 0)}")
+
+    series = (
+        ("denkma_job_runs_total", "counter", "Passages exécutés.", lambda j: j.get("runs", 0)),
+        ("denkma_job_failures_total", "counter", "Passages en échec.", lambda j: j.get("failures", 0)),
+        ("denkma_job_missed_total", "counter", "Exécutions planifiées manquées.", lambda j: j.get("missed", 0)),
+        ("denkma_job_items_processed_total", "counter", "Éléments traités.", lambda j: j.get("items_total", 0)),
+        ("denkma_job_consecutive_failures", "gauge", "Échecs consécutifs en cours.", lambda j: j.get("consecutive_failures", 0)),
+        ("denkma_job_lag_seconds", "gauge", "Retard du dernier passage sur son échéance.", lambda j: j.get("last_lag_seconds", 0.0)),
+        ("denkma_job_last_success_timestamp_seconds", "gauge", "Dernier succès (epoch).", lambda j: _timestamp(j.get("last_success_at"))),
+        ("denkma_job_last_failure_timestamp_seconds", "gauge", "Dernier échec (epoch).", lambda j: _timestamp(j.get("last_failure_at"))),
+    )
+    for metric, kind, help_text, value in series:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for job in jobs:
+            lines.append(f'{metric}{{job="{job["name"]}"}} {value(job)}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,114 @@
+"""
+Élection de leader par bail Mongo pour les tâches de fond.
+
+Chaque boucle (dispatch, relances, scheduler…) est associée à un document
+`background_leases` {_id: name, name, owner, expires_at}. L'exclusivité repose
+sur `_id` : elle ne dépend d'aucun index secondaire, même pendant leur
+construction en tâche de fond. Une instance ne lance la boucle
+qu'après avoir pris le bail, le renouvelle toutes les `ttl / 3` secondes et
+annule la boucle dès qu'elle le perd. Si le propriétaire tombe, le bail expire
+et une autre instance le reprend au plus une période plus tard ; à l'arrêt
+propre, le bail est libéré immédiatement.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable
+
+from pymongo.errors import DuplicateKeyError
+
+from config import settings
+from database import db
+
+logger = logging.getLogger(__name__)
+
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+async def acquire_lease(name: str, ttl_seconds: int, owner: str = INSTANCE_ID) -> bool:
+    """Prend ou renouvelle le bail `name`. False s'il appartient à une autre instance."""
+    now = _now()
+    try:
+        await db.background_leases.update_one(
+            {"_id": name, "$or": [{"owner": owner}, {"expires_at": {"$lte": now}}]},
+            {
+                "$set": {
+                    "name": name,
+                    "owner": owner,
+                    "expires_at": now + timedelta(seconds=ttl_seconds),
+                    "renewed_at": now,
+                },
+                "$setOnInsert": {"acquired_at": now},
+            },
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # Le filtre n'a rien trouvé (bail valide d'une autre instance) et
+        # l'upsert a buté sur `_id`. Ou bien un ancien document (`_id`
+        # ObjectId) bloque via l'index unique `name` : purgé une fois expiré,
+        # le bail sera pris au renouvellement suivant.
+        await db.background_leases.delete_one(
+            {"name": name, "_id": {"$ne": name}, "expires_at": {"$lte": now}}
+        )
+        return False
+    return True
+
+
+async def release_lease(name: str, owner: str = INSTANCE_ID) -> None:
+    await db.background_leases.update_one(
+        {"_id": name, "owner": owner},
+        {"$set": {"expires_at": _now()}},
+    )
+
+
+async def run_exclusive(
+    name: str,
+    factory: Callable[[], Awaitable[None]],
+    *,
+    ttl_seconds: int | None = None,
+) -> None:
+    """
+    Exécute `factory()` uniquement tant que cette instance détient le bail.
+    À annuler à l'arrêt : le bail est alors libéré pour une reprise immédiate.
+    """
+    ttl = ttl_seconds or settings.BACKGROUND_LEASE_SECONDS
+    renew_every = ttl / 3
+    task: asyncio.Task | None = None
+    try:
+        while True:
+            try:
+                held = await acquire_lease(name, ttl)
+            except Exception as exc:
+                logger.error("Bail %s : renouvellement impossible : %s", name, exc)
+                held = False
+
+            if held and task is None:
+                logger.info("Bail %s pris par %s", name, INSTANCE_ID)
+                task = asyncio.create_task(factory(), name=f"lease:{name}")
+            elif not held and task is not None:
+                logger.warning("Bail %s perdu par %s, arrêt de la tâche", name, INSTANCE_ID)
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                task = None
+
+            if task is not None and task.done():
+                # Une boucle ne doit pas se terminer seule : on la relance.
+                if not task.cancelled() and task.exception():
+                    logger.error("Tâche %s arrêtée : %s", name, task.exception())
+                task = asyncio.create_task(factory(), name=f"lease:{name}")
+            await asyncio.sleep(renew_every)
+    finally:
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            try:
+                await release_lease(name)
+            except Exception as exc:
+                logger.warning("Bail %s non libéré : %s", name, exc)
@@ -1,4 +1,30 @@
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
-limiter = Limiter(key_func=get_remote_address)
+from config import settings
+# Enregistre le schéma `denkma-mongo://` auprès de `limits`.
+from core import rate_limit_storage  # noqa: F401
+
+
+def _storage_uri() -> str:
+    """
+    memory : compteurs propres au process (dev, tests) ;
+    mongo  : partagés entre workers (core/rate_limit_storage.py) ;
+    redis  : partagés via RATE_LIMIT_REDIS_URL (paquet `redis` requis).
+    """
+    if settings.RATE_LIMIT_STORAGE == "redis":
+        return settings.RATE_LIMIT_REDIS_URL
+    if settings.RATE_LIMIT_STORAGE == "mongo":
+        return "denkma-mongo://"
+    return "memory://"
+
+
+limiter = Limiter(
+    key_func=get_remote_address,
+    storage_uri=_storage_uri(),
+    strategy="sliding-window-counter",
+    # Stockage partagé indisponible : bascule sur des compteurs locaux plutôt
+    # que de refuser ou de laisser passer tout le trafic.
+    in_memory_fallback_enabled=settings.RATE_LIMIT_STORAGE != "memory",
+    swallow_errors=True,
+)
@@ -0,0 +1,239 @@
+"""
+Métriques Prometheus du process (exposées sur `/metrics`).
+
+Registre minimal sans dépendance : compteurs, jauges et histogrammes à labels,
+rendus au format texte 0.0.4 (même format que /health/jobs/metrics). Labels à
+faible cardinalité uniquement : route *templatée* (`/api/parcels/{parcel_id}`),
+méthode, classe de statut, service externe, nom de commande Mongo.
+
+Sources :
+- `MetricsMiddleware` (ASGI pur) : latence par route, requêtes par statut,
+  requêtes en cours ;
+- `external_call(service, operation)` : durée et issue des appels HTTP sortants
+  (Google Maps, WhatsApp, FCM, Flutterwave, Stripe) ;
+- `mongo_command_metrics` : durée des commandes Mongo (CommandListener) ;
+- `sample_event_loop_lag()` : retard de la boucle asyncio.
+"""
+import asyncio
+import bisect
+import threading
+import time
+from typing import Iterable, Optional
+
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+EXTERNAL_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+EVENT_LOOP_SAMPLE_SECONDS = 0.5
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.label_names = labels
+        self._lock = threading.Lock()
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, *labels: str, value: float) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = (), buckets: Iterable[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        # labels → [compteurs par bucket (+Inf en dernier), somme]
+        self._series: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        for labels, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = _format_labels(self.label_names, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            cumulative += counts[-1]
+            le = _format_labels(self.label_names, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+HTTP_REQUEST_DURATION = Histogram(
+    "denkma_http_request_duration_seconds", "Durée des requêtes HTTP par route.", ("method", "route"),
+)
+HTTP_REQUESTS = Counter(
+    "denkma_http_requests_total", "Requêtes HTTP par route et classe de statut.", ("method", "route", "status"),
+)
+HTTP_IN_FLIGHT = Gauge("denkma_http_requests_in_flight", "Requêtes HTTP en cours de traitement.")
+EXTERNAL_CALL_DURATION = Histogram(
+    "denkma_external_call_duration_seconds",
+    "Durée des appels aux services externes.",
+    ("service", "operation", "outcome"),
+    buckets=EXTERNAL_BUCKETS,
+)
+MONGO_COMMAND_DURATION = Histogram(
+    "denkma_mongo_command_duration_seconds", "Durée des commandes Mongo.", ("command", "outcome"),
+)
+EVENT_LOOP_LAG = Histogram(
+    "denkma_event_loop_lag_seconds", "Retard de la boucle asyncio sur un sommeil planifié.", buckets=LOOP_LAG_BUCKETS,
+)
+
+REGISTRY: list[_Metric] = [
+    HTTP_REQUEST_DURATION,
+    HTTP_REQUESTS,
+    HTTP_IN_FLIGHT,
+    EXTERNAL_CALL_DURATION,
+    MONGO_COMMAND_DURATION,
+    EVENT_LOOP_LAG,
+]
+
+
+def render_metrics() -> str:
+    lines: list[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- HTTP ---------------------------------------------------------------------
+
+class MetricsMiddleware:
+    """Middleware ASGI pur (pas de BaseHTTPMiddleware : quelques µs par requête)."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status_holder = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get("route")
+            # Chemin templaté uniquement : les chemins bruts exploseraient la cardinalité.
+            route_label = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            HTTP_REQUEST_DURATION.observe(elapsed, method, route_label)
+            HTTP_REQUESTS.inc(method, route_label, f"{status_holder[0] // 100}xx")
+
+
+# --- Appels externes ----------------------------------------------------------
+
+class external_call:
+    """
+    Chronomètre un appel sortant : `with external_call("stripe", "checkout") as call:`.
+    Issue `error` si une exception traverse le bloc ou si `call.fail()` est
+    appelé (réponse applicative en échec sans exception).
+    """
+
+    __slots__ = ("service", "operation", "started", "failed")
+
+    def __init__(self, service: str, operation: str) -> None:
+        self.service = service
+        self.operation = operation
+        self.failed = False
+
+    def fail(self) -> None:
+        self.failed = True
+
+    def __enter__(self) -> "external_call":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        outcome = "error" if exc_type is not None or self.failed else "ok"
+        EXTERNAL_CALL_DURATION.observe(time.perf_counter() - self.started, self.service, self.operation, outcome)
+        return False
+
+
+# --- Mongo ----------------------------------------------------------------------
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        pass
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        MONGO_COMMAND_DURATION.observe(event.duration_micros / 1_000_000, event.command_name, "ok")
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        MONGO_COMMAND_DURATION.observe(event.duration_micros / 1_000_000, event.command_name, "error")
+
+
+mongo_command_metrics = MongoCommandMetrics()
+
+
+# --- Boucle asyncio -----------------------------------------------------------
+
+async def sample_event_loop_lag(interval: float = EVENT_LOOP_SAMPLE_SECONDS, iterations: Optional[int] = None) -> None:
+    """Mesure l'écart entre le réveil prévu et le réveil effectif d'un sleep."""
+    count = 0
+    while iterations is None or count < iterations:
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(time.perf_counter() - expected, 0.0))
+        count += 1
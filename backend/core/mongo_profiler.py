@@ -0,0 +1,153 @@
+"""
+Profilage des commandes Mongo par requête HTTP.
+
+Un `CommandListener` pymongo rattache chaque commande à la requête en cours via
+une ContextVar (Motor copie le contexte vers ses threads d'exécution). Pour
+chaque requête échantillonnée : nombre d'opérations, temps cumulé et
+« formes » de requêtes (commande + collection + champs filtrés, sans valeurs).
+
+Sortie : en-tête `Server-Timing: mongo;dur=…;desc="N ops"` et un warning quand
+l'endpoint dépasse MONGO_PROFILER_OP_BUDGET opérations ou répète une même forme
+plus de MONGO_PROFILER_REPEAT_THRESHOLD fois (motif N+1 : find_one dans une
+boucle). Activé par MONGO_PROFILER_ENABLED, échantillonné par
+MONGO_PROFILER_SAMPLE_RATE.
+"""
+import logging
+import random
+import threading
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Optional
+
+from pymongo import monitoring
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Commandes de service (handshake, sessions) et suites de curseur : comptées
+# dans le temps total mais pas comme formes répétées.
+_UNSHAPED_COMMANDS = {"getMore", "killCursors", "endSessions", "hello", "isMaster", "ismaster", "ping"}
+
+
+def _filter_keys(document: Any, prefix: str = "") -> list[str]:
+    if not isinstance(document, dict):
+        return []
+    keys = []
+    for key, value in document.items():
+        if key in {"$and", "$or", "$nor"} and isinstance(value, list):
+            for clause in value:
+                keys.extend(_filter_keys(clause, prefix))
+            continue
+        keys.append(f"{prefix}{key}")
+    return keys
+
+
+def command_shape(command_name: str, command: dict) -> Optional[str]:
+    """Forme d'une commande : `find users {phone,role}` (valeurs exclues)."""
+    if command_name in _UNSHAPED_COMMANDS:
+        return None
+    collection = command.get(command_name)
+    if not isinstance(collection, str):
+        collection = "-"
+    if command_name == "find":
+        filter_doc = command.get("filter")
+    elif command_name in {"count", "distinct"}:
+        filter_doc = command.get("query")
+    elif command_name in {"update", "delete"}:
+        statements = command.get("updates") or command.get("deletes") or [{}]
+        filter_doc = statements[0].get("q")
+    elif command_name == "findAndModify":
+        filter_doc = command.get("query")
+    elif command_name == "aggregate":
+        pipeline = command.get("pipeline") or [{}]
+        filter_doc = pipeline[0].get("$match") if pipeline else None
+    else:
+        filter_doc = None
+    keys = ",".join(sorted(set(_filter_keys(filter_doc))))
+    return f"{command_name} {collection} {{{keys}}}"
+
+
+class RequestProfile:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total_ms = 0.0
+        self.shapes: Counter[str] = Counter()
+
+    def record(self, shape: Optional[str], duration_ms: float) -> None:
+        with self._lock:
+            self.count += 1
+            self.total_ms += duration_ms
+            if shape:
+                self.shapes[shape] += 1
+
+    def server_timing(self) -> str:
+        return f'mongo;dur={self.total_ms:.1f};desc="{self.count} ops"'
+
+    def repeated_shapes(self, threshold: int) -> list[tuple[str, int]]:
+        return [(shape, count) for shape, count in self.shapes.most_common() if count > threshold]
+
+
+_current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("mongo_request_profile", default=None)
+
+
+class MongoCommandProfiler(monitoring.CommandListener):
+    def __init__(self) -> None:
+        self._inflight: dict[tuple[int, Any], tuple[RequestProfile, Optional[str]]] = {}
+        self._lock = threading.Lock()
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        profile = _current_profile.get()
+        if profile is None:
+            return
+        shape = command_shape(event.command_name, event.command)
+        with self._lock:
+            self._inflight[(event.request_id, event.connection_id)] = (profile, shape)
+
+    def _finish(self, event) -> None:
+        with self._lock:
+            entry = self._inflight.pop((event.request_id, event.connection_id), None)
+        if entry is not None:
+            profile, shape = entry
+            profile.record(shape, event.duration_micros / 1000)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finish(event)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finish(event)
+
+
+command_profiler = MongoCommandProfiler()
+
+
+def event_listeners() -> list[monitoring.CommandListener]:
+    """Listeners à passer au client Motor (aucun si le profilage est désactivé)."""
+    return [command_profiler] if settings.MONGO_PROFILER_ENABLED else []
+
+
+def start_request_profile() -> Optional[RequestProfile]:
+    """Ouvre un profil pour la requête courante si elle est échantillonnée."""
+    if not settings.MONGO_PROFILER_ENABLED:
+        return None
+    if random.random() >= settings.MONGO_PROFILER_SAMPLE_RATE:
+        return None
+    profile = RequestProfile()
+    _current_profile.set(profile)
+    return profile
+
+
+def report_request_profile(profile: RequestProfile, method: str, route: str) -> None:
+    """Warnings de budget d'opérations et de formes répétées (N+1)."""
+    endpoint = f"{method} {route}"
+    if profile.count > settings.MONGO_PROFILER_OP_BUDGET:
+        logger.warning(
+            "Mongo : %s a émis %s opérations (budget %s, %.1f ms)",
+            endpoint,
+            profile.count,
+            settings.MONGO_PROFILER_OP_BUDGET,
+            profile.total_ms,
+        )
+    for shape, count in profile.repeated_shapes(settings.MONGO_PROFILER_REPEAT_THRESHOLD):
+        logger.warning("Mongo : %s répète %s× « %s » (N+1 probable)", endpoint, count, shape)
@@ -0,0 +1,137 @@
+"""
+Pagination par clé (keyset) pour les listes volumineuses.
+
+Les listes triées par `(created_at, <id métier>)` renvoient un curseur opaque
+`next_cursor` : la page suivante se lit avec un filtre
+`created_at < c OR (created_at = c AND id < i)` servi par un index composé
+`(…filtre, created_at, id)`. Le coût d'une page ne dépend plus de sa position
+(la page 500 coûte autant que la page 1), contrairement à `skip`.
+
+`skip` reste accepté pour les clients existants (applis mobiles déployées),
+mais n'est plus recommandé. Le total n'est calculé que sur demande
+(`include_total`) : `estimated_document_count` sans filtre, sinon
+`count_documents` mis en cache COUNT_CACHE_TTL_SECONDS.
+"""
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Optional
+
+from core.exceptions import bad_request_exception
+
+DEFAULT_MAX_LIMIT = 1000
+COUNT_CACHE_TTL_SECONDS = 60
+_COUNT_CACHE_MAX_ENTRIES = 1024
+_count_cache: dict[tuple[str, str], tuple[float, int]] = {}
+
+
+def encode_cursor(doc: dict, sort_field: str, id_field: str) -> str:
+    value = doc.get(sort_field)
+    if isinstance(value, datetime):
+        payload = {"d": value.isoformat(), "i": doc.get(id_field)}
+    else:
+        payload = {"v": value, "i": doc.get(id_field)}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> tuple[Any, Any]:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+        value = datetime.fromisoformat(payload["d"]) if "d" in payload else payload["v"]
+        return value, payload["i"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise bad_request_exception("Curseur de pagination invalide")
+
+
+def keyset_query(query: dict, cursor: str, sort_field: str, id_field: str, direction: int = -1) -> dict:
+    """Ajoute à `query` la condition « après le curseur » dans l'ordre de tri."""
+    value, last_id = decode_cursor(cursor)
+    op = "$lt" if direction < 0 else "$gt"
+    if value is None:
+        # Les documents sans valeur de tri sont groupés en fin (desc) ou en début (asc).
+        after = {sort_field: None, id_field: {op: last_id}}
+        if direction > 0:
+            after = {"$or": [after, {sort_field: {"$ne": None}}]}
+    else:
+        after = {"$or": [
+            {sort_field: {op: value}},
+            {sort_field: value, id_field: {op: last_id}},
+        ]}
+        if direction < 0:
+            after["$or"].append({sort_field: None})
+    return {"$and": [query, after]} if query else after
+
+
+async def count_total(collection, query: dict) -> int:
+    """Total pour l'affichage : estimation sans filtre, compte exact en cache sinon."""
+    if not query:
+        return await collection.estimated_document_count()
+    key = (collection.name, json.dumps(query, sort_keys=True, default=str))
+    now = time.monotonic()
+    cached = _count_cache.get(key)
+    if cached and cached[0] > now:
+        return cached[1]
+    total = await collection.count_documents(query)
+    if key not in _count_cache and len(_count_cache) >= _COUNT_CACHE_MAX_ENTRIES:
+        _count_cache.pop(next(iter(_count_cache)))
+    _count_cache[key] = (now + COUNT_CACHE_TTL_SECONDS, total)
+    return total
+
+
+@dataclass
+class Page:
+    items: list[dict]
+    next_cursor: Optional[str]
+    total: Optional[int] = None
+
+    def to_response(self, key: str) -> dict:
+        response: dict[str, Any] = {
+            key: self.items,
+            "next_cursor": self.next_cursor,
+            "has_more": self.next_cursor is not None,
+        }
+        if self.total is not None:
+            response["total"] = self.total
+        return response
+
+
+async def paginate(
+    collection,
+    query: dict,
+    *,
+    id_field: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    sort_field: str = "created_at",
+    direction: int = -1,
+    projection: Optional[dict] = None,
+    include_total: bool = False,
+    max_limit: int = DEFAULT_MAX_LIMIT,
+) -> Page:
+    """
+    Une page de `collection` triée par `(sort_field, id_field)`. Le curseur,
+    s'il est fourni, prime sur `skip`.
+    """
+    limit = min(max(limit, 1), max_limit)
+    find_query = keyset_query(query, cursor, sort_field, id_field, direction) if cursor else query
+    docs = await (
+        collection.find(find_query, projection if projection is not None else {"_id": 0})
+        .sort([(sort_field, direction), (id_field, direction)])
+        .skip(0 if cursor else max(skip, 0))
+        .limit(limit + 1)
+        .to_list(length=limit + 1)
+    )
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1], sort_field, id_field)
+    total = await count_total(collection, query) if include_total else None
+    return Page(items=docs, next_cursor=next_cursor, total=total)
@@ -0,0 +1,177 @@
+"""
+Cache des principaux authentifiés (utilisés par `get_current_user`).
+
+Chaque requête authentifiée relisait le document utilisateur complet (favoris,
+KYC, tokens FCM…) alors que les contrôles d'accès n'ont besoin que d'une
+projection compacte (`PRINCIPAL_FIELDS`). Cette projection est mise en cache
+par process : LRU borné à PRINCIPAL_CACHE_MAX_ENTRIES, TTL court
+(PRINCIPAL_CACHE_TTL_SECONDS).
+
+Invalidation :
+- locale et immédiate via `invalidate_principal(user_id)` aux points d'écriture
+  (bannissement, rôle, disponibilité, profil, photo, KYC) ;
+- inter-workers via `watch_principal_changes` : change stream sur `users`
+  filtré côté serveur aux seuls champs de la projection. Sur un Mongo
+  standalone (pas de change stream), la fraîcheur est bornée par le TTL.
+
+Les endpoints qui lisent d'autres champs chargent le document complet à la
+demande (`core.dependencies.get_current_user_full`).
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from pymongo.errors import OperationFailure
+
+from config import settings
+from database import db
+
+logger = logging.getLogger(__name__)
+
+PRINCIPAL_FIELDS = (
+    "user_id",
+    "role",
+    "phone",
+    "name",
+    "full_name",
+    "email",
+    "is_active",
+    "is_banned",
+    "is_available",
+    "relay_point_id",
+    "profile_picture_url",
+    "profile_picture_status",
+)
+# `_id` est conservé pour relier les événements du change stream (documentKey).
+PRINCIPAL_PROJECTION = {"_id": 1, **{field: 1 for field in PRINCIPAL_FIELDS}}
+
+
+class PrincipalCache:
+    def __init__(self, max_entries: int, ttl_seconds: float) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # user_id → (expiration monotonic, _id Mongo, projection)
+        self._entries: OrderedDict[str, tuple[float, Any, dict]] = OrderedDict()
+        self._by_object_id: dict[Any, str] = {}
+        # Incrémentée à chaque invalidation : un chargement commencé avant
+        # n'est pas mis en cache (il peut avoir lu l'ancienne valeur).
+        self.generation = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, user_id: str) -> Optional[dict]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            self._drop(user_id)
+            return None
+        self._entries.move_to_end(user_id)
+        return dict(entry[2])
+
+    def put(self, user_id: str, doc: dict, generation: Optional[int] = None) -> None:
+        if self.ttl_seconds <= 0 or (generation is not None and generation != self.generation):
+            return
+        doc = dict(doc)
+        object_id = doc.pop("_id", None)
+        self._drop(user_id)
+        self._entries[user_id] = (time.monotonic() + self.ttl_seconds, object_id, doc)
+        if object_id is not None:
+            self._by_object_id[object_id] = user_id
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    def invalidate(self, user_id: Optional[str]) -> None:
+        self.generation += 1
+        if user_id:
+            self._drop(user_id)
+
+    def invalidate_object_id(self, object_id: Any) -> None:
+        self.generation += 1
+        user_id = self._by_object_id.get(object_id)
+        if user_id:
+            self._drop(user_id)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._entries.clear()
+        self._by_object_id.clear()
+
+    def _drop(self, user_id: str) -> None:
+        entry = self._entries.pop(user_id, None)
+        if entry is not None and entry[1] is not None:
+            self._by_object_id.pop(entry[1], None)
+
+
+principal_cache = PrincipalCache(settings.PRINCIPAL_CACHE_MAX_ENTRIES, settings.PRINCIPAL_CACHE_TTL_SECONDS)
+
+
+async def load_principal(user_id: str) -> Optional[dict]:
+    """Projection compacte de l'utilisateur (cache, sinon une lecture Mongo)."""
+    cached = principal_cache.get(user_id)
+    if cached is not None:
+        return cached
+    generation = principal_cache.generation
+    doc = await db.users.find_one({"user_id": user_id}, PRINCIPAL_PROJECTION)
+    if not doc:
+        return None
+    principal_cache.put(user_id, doc, generation)
+    doc.pop("_id", None)
+    return doc
+
+
+def invalidate_principal(user_id: Optional[str]) -> None:
+    """À appeler après toute écriture sur un champ de PRINCIPAL_FIELDS."""
+    principal_cache.invalidate(user_id)
+
+
+def _principal_change_pipeline() -> list[dict]:
+    watched = [{f"updateDescription.updatedFields.{field}": {"$exists": True}} for field in PRINCIPAL_FIELDS]
+    return [{
+        "$match": {
+            "$or": [
+                {"operationType": {"$in": ["delete", "replace", "invalidate", "drop"]}},
+                {"updateDescription.removedFields": {"$in": list(PRINCIPAL_FIELDS)}},
+                *watched,
+            ],
+        },
+    }]
+
+
+def apply_principal_change(change: dict) -> None:
+    object_id = (change.get("documentKey") or {}).get("_id")
+    if object_id is None:
+        principal_cache.clear()
+    else:
+        principal_cache.invalidate_object_id(object_id)
+
+
+async def watch_principal_changes() -> None:
+    """
+    Invalide le cache local quand un autre worker modifie un champ compact.
+
+    Même schéma que `watch_admin_events_changes` : arrêt propre sur Mongo
+    standalone, reprise après 5 s sinon. Le cache est vidé à chaque
+    (re)connexion, des événements ayant pu être manqués entre-temps.
+    """
+    pipeline = _principal_change_pipeline()
+    while True:
+        try:
+            async with db.users.watch(pipeline) as stream:
+                principal_cache.clear()
+                async for change in stream:
+                    apply_principal_change(change)
+        except asyncio.CancelledError:
+            raise
+        except OperationFailure as exc:
+            if exc.code in {40573, 40324}:
+                logger.info("Change stream users indisponible (Mongo standalone) : cache principal borné par le TTL")
+                return
+            logger.warning("Change stream users interrompu : %s", exc)
+        except Exception as exc:
+            logger.warning("Change stream users interrompu : %s", exc)
+        principal_cache.clear()
+        await asyncio.sleep(5)
@@ -0,0 +1,323 @@
+"""
+Stockage partagé des limites slowapi (`limits`), schéma `denkma-mongo://`.
+
+Fenêtre glissante à deux compteurs (stratégie `sliding-window-counter`) : un
+document `rate_limit_buckets` par clé et par fenêtre, incrémenté par `$inc`
+atomique et purgé par index TTL sur `expires_at`.
+
+Pour éviter un aller-retour Mongo par requête, chaque process réserve des jetons
+par lots (RATE_LIMIT_RESERVATION_FRACTION de la limite, au moins
+RATE_LIMIT_MIN_RESERVATION sans dépasser le quart de la limite) : le `$inc`
+compte le lot entier, les requêtes suivantes consomment la réserve locale. Les
+jetons réservés mais inutilisés sont perdus à la fin de la fenêtre : l'erreur va
+toujours dans le sens du refus, la limite globale n'est jamais dépassée. Une
+clé refusée est bloquée localement quelques instants, sans aller-retour.
+
+slowapi appelle le stockage de façon synchrone, depuis la boucle asyncio : aucun
+aller-retour Mongo n'y est fait. Le client pymongo (synchrone) n'est utilisé que
+depuis un thread dédié. Quand la réserve d'une clé passe sous le quart du lot,
+le lot suivant y est réservé par anticipation. Une clé sans réserve (première
+requête de la fenêtre) est admise à crédit, dans la limite d'un lot, pendant
+que la réservation couvrant ce crédit part en arrière-plan ; si la fenêtre
+s'avère épuisée, la clé est bloquée localement et n'a plus de crédit jusqu'à la
+fenêtre suivante. Le dépassement est donc borné à un lot par process, par clé
+et par fenêtre. Une réservation en échec (Mongo injoignable) fait lever
+l'appel suivant : slowapi bascule alors sur ses compteurs en mémoire, et
+`check()` renvoie l'état connu sans attendre Mongo.
+
+Les méthodes `incr`/`get`/`get_sliding_window`… (stratégie fixed-window,
+en-têtes de quota) restent synchrones ; elles ne sont pas sur le chemin des
+requêtes avec la configuration de core/limiter.py.
+"""
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any
+
+from limits.storage import SlidingWindowCounterSupport, Storage
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import PyMongoError
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_COLLECTION = "rate_limit_buckets"
+
+
+class MongoSlidingWindowStorage(Storage, SlidingWindowCounterSupport):
+    STORAGE_SCHEME = ["denkma-mongo"]
+
+    def __init__(self, uri: str | None = None, wrap_exceptions: bool = False, **options: Any):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self._client: MongoClient | None = None
+        # Protège l'état local ci-dessous ; jamais tenu pendant un aller-retour Mongo.
+        self._lock = threading.Lock()
+        # (clé, n° de fenêtre) → jetons réservés restants
+        self._reserved: dict[tuple[str, int], int] = {}
+        # (clé, n° de fenêtre précédente) → compteur final de la fenêtre précédente
+        self._previous: dict[tuple[str, int], int] = {}
+        # clé → instant (time.time) avant lequel on refuse sans interroger Mongo
+        self._blocked_until: dict[str, float] = {}
+        # (clé, n° de fenêtre) → jetons consommés à crédit, pas encore réservés
+        self._owed: dict[tuple[str, int], int] = {}
+        # (clé, n° de fenêtre) dont une réservation est en cours
+        self._pending: set[tuple[str, int]] = set()
+        # (clé, n° de fenêtre) → jetons libres tous process confondus, au dernier aller-retour
+        self._available: dict[tuple[str, int], int] = {}
+        # (clé, n° de fenêtre) épuisées : plus de crédit ni d'anticipation
+        self._exhausted: set[tuple[str, int]] = set()
+        # Faux après l'échec d'un aller-retour en arrière-plan, jusqu'au prochain ping réussi.
+        self._healthy = True
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="rate-limit")
+
+    @property
+    def base_exceptions(self) -> type[Exception]:
+        return PyMongoError
+
+    @property
+    def _buckets(self):
+        if self._client is None:
+            self._client = MongoClient(
+                settings.MONGO_URL,
+                serverSelectionTimeoutMS=2000,
+                connectTimeoutMS=2000,
+                socketTimeoutMS=2000,
+            )
+        return self._client[settings.DB_NAME][BUCKETS_COLLECTION]
+
+    @staticmethod
+    def _bucket_id(key: str, window: int) -> str:
+        return f"{key}/{window}"
+
+    @staticmethod
+    def _lot_size(limit: int) -> int:
+        minimum = min(settings.RATE_LIMIT_MIN_RESERVATION, limit // 4)
+        return max(math.ceil(limit * settings.RATE_LIMIT_RESERVATION_FRACTION), minimum, 1)
+
+    # --- Fenêtre glissante ---------------------------------------------------
+
+    def _previous_count(self, key: str, window: int) -> int:
+        with self._lock:
+            cached = self._previous.get((key, window - 1))
+        if cached is not None:
+            return cached
+        doc = self._buckets.find_one({"_id": self._bucket_id(key, window - 1)}, {"count": 1})
+        count = int(doc["count"]) if doc else 0
+        with self._lock:
+            self._previous[(key, window - 1)] = count
+        return count
+
+    def _reserve(self, key: str, limit: int, expiry: int, amount: int, now: float) -> tuple[int, int]:
+        """
+        Réserve un lot dans Mongo (hors verrou) et renvoie le nombre de jetons
+        obtenus (0 si moins de `amount`) et le nombre de jetons encore libres pour
+        l'ensemble des process. `amount=0` : réapprovisionnement anticipé.
+        """
+        window = int(now / expiry)
+        previous_weight = self._previous_count(key, window) * (1 - (now / expiry) % 1)
+        allowance = limit - math.floor(previous_weight)
+        if amount > allowance:
+            return 0, 0
+        batch = min(max(amount, self._lot_size(limit)), allowance)
+        if batch <= 0:
+            return 0, 0
+        expires_at = datetime.fromtimestamp((window + 2) * expiry, tz=timezone.utc)
+        doc = self._buckets.find_one_and_update(
+            {"_id": self._bucket_id(key, window)},
+            {"$inc": {"count": batch}, "$setOnInsert": {"expires_at": expires_at}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        overflow = int(doc["count"]) - allowance
+        granted = batch - max(overflow, 0)
+        if granted < max(amount, 1):
+            # Une autre instance a pris les derniers jetons : on rend notre lot.
+            self._buckets.update_one({"_id": self._bucket_id(key, window)}, {"$inc": {"count": -batch}})
+            return 0, 0
+        if overflow > 0:
+            self._buckets.update_one({"_id": self._bucket_id(key, window)}, {"$inc": {"count": -overflow}})
+        return granted, max(-overflow, 0)
+
+    def _refill(self, key: str, limit: int, expiry: int, now: float) -> None:
+        """Réservation couvrant le crédit et le lot suivant, exécutée dans le thread dédié."""
+        window = int(now / expiry)
+        with self._lock:
+            owed = self._owed.get((key, window), 0)
+        try:
+            granted, available = self._reserve(key, limit, expiry, owed, now)
+        except PyMongoError as exc:
+            logger.warning("Réservation de limite impossible (%s) : %s", key, exc)
+            with self._lock:
+                self._healthy = False
+                self._pending.discard((key, window))
+            return
+        with self._lock:
+            self._pending.discard((key, window))
+            self._available[(key, window)] = available
+            if not granted:
+                # Fenêtre épuisée : le crédit déjà consommé est perdu (dépassement
+                # borné à un lot) et la clé est refusée localement.
+                self._owed.pop((key, window), None)
+                self._exhausted.add((key, window))
+                if not self._reserved.get((key, window)):
+                    self._block(key, limit, expiry, now)
+                return
+            tokens = self._reserved.get((key, window), 0) + granted
+            owed = self._owed.pop((key, window), 0)
+            settled = min(tokens, owed)
+            self._reserved[(key, window)] = tokens - settled
+            if owed > settled:
+                # Crédit accordé pendant l'aller-retour : nouvelle réservation.
+                self._owed[(key, window)] = owed - settled
+                self._submit(key, limit, expiry, now)
+
+    def _submit(self, key: str, limit: int, expiry: int, now: float) -> None:
+        """Lance une réservation en arrière-plan (appelé sous verrou)."""
+        self._pending.add((key, int(now / expiry)))
+        self._executor.submit(self._refill, key, limit, expiry, now)
+
+    def _block(self, key: str, limit: int, expiry: int, now: float) -> None:
+        """Refus local (appelé sous verrou) : un jeton se libère au plus tôt dans expiry / limit secondes."""
+        window_end = (int(now / expiry) + 1) * expiry
+        self._blocked_until[key] = min(time.time() + expiry / limit, window_end)
+
+    def _schedule_refill(self, key: str, limit: int, expiry: int, now: float, remaining: int) -> None:
+        """Appelé sous verrou après consommation d'un jeton local."""
+        lot = self._lot_size(limit)
+        window = int(now / expiry)
+        # Lot unitaire (petites limites) : un jeton anticipé serait le plus
+        # souvent perdu, la requête suivante passera à crédit.
+        if lot < 2 or remaining > lot // 4:
+            return
+        if (key, window) in self._pending or (key, window) in self._exhausted:
+            return
+        self._submit(key, limit, expiry, now)
+
+    def acquire_sliding_window_entry(self, key: str, limit: int, expiry: int, amount: int = 1) -> bool:
+        if amount > limit:
+            return False
+        now = time.time()
+        window = int(now / expiry)
+        with self._lock:
+            if not self._healthy:
+                raise PyMongoError("rate limit storage unavailable")
+            if self._blocked_until.get(key, 0.0) > now:
+                return False
+            tokens = self._reserved.get((key, window), 0)
+            if tokens >= amount:
+                self._reserved[(key, window)] = tokens - amount
+                self._schedule_refill(key, limit, expiry, now, tokens - amount)
+                return True
+            self._prune(window, expiry)
+            owed = self._owed.get((key, window), 0)
+            lot = self._lot_size(limit)
+            # Crédit borné par un lot et par les jetons libres connus (seul process
+            # actif sur la clé : aucun dépassement).
+            credit = 0 if (key, window) in self._exhausted else min(lot, self._available.get((key, window), lot))
+            admitted = owed + amount <= credit
+            if admitted:
+                self._owed[(key, window)] = owed + amount
+            if (key, window) not in self._pending:
+                # Sans crédit : nouvelle tentative, des jetons ont pu se libérer.
+                self._submit(key, limit, expiry, now)
+            if not credit:
+                self._block(key, limit, expiry, now)
+            return admitted
+
+    def _prune(self, window: int, expiry: int) -> None:
+        """Oublie l'état local des fenêtres révolues (appelé sous verrou)."""
+        if len(self._reserved) + len(self._previous) + len(self._owed) + len(self._available) < 4096:
+            return
+        self._reserved = {k: v for k, v in self._reserved.items() if k[1] >= window}
+        self._previous = {k: v for k, v in self._previous.items() if k[1] >= window - 1}
+        self._owed = {k: v for k, v in self._owed.items() if k[1] >= window}
+        self._available = {k: v for k, v in self._available.items() if k[1] >= window}
+        self._exhausted = {k for k in self._exhausted if k[1] >= window}
+        now = time.time()
+        self._blocked_until = {k: v for k, v in self._blocked_until.items() if v > now}
+
+    def get_sliding_window(self, key: str, expiry: int) -> tuple[int, float, int, float]:
+        now = time.time()
+        window = int(now / expiry)
+        docs = {
+            doc["_id"]: int(doc.get("count") or 0)
+            for doc in self._buckets.find(
+                {"_id": {"$in": [self._bucket_id(key, window - 1), self._bucket_id(key, window)]}},
+                {"count": 1},
+            )
+        }
+        previous_count = docs.get(self._bucket_id(key, window - 1), 0)
+        current_count = docs.get(self._bucket_id(key, window), 0)
+        previous_ttl = (1 - (now / expiry) % 1) * expiry if previous_count else 0.0
+        current_ttl = (1 - (now / expiry) % 1) * expiry + expiry
+        return previous_count, previous_ttl, current_count, current_ttl
+
+    def clear_sliding_window(self, key: str, expiry: int) -> None:
+        window = int(time.time() / expiry)
+        self._buckets.delete_many(
+            {"_id": {"$in": [self._bucket_id(key, window - 1), self._bucket_id(key, window)]}}
+        )
+        with self._lock:
+            self._reserved.pop((key, window), None)
+            self._previous.pop((key, window - 1), None)
+            self._owed.pop((key, window), None)
+            self._available.pop((key, window), None)
+            self._exhausted.discard((key, window))
+            self._blocked_until.pop(key, None)
+
+    # --- Interface Storage (stratégie fixed-window) ---------------------------
+
+    def incr(self, key: str, expiry: float, amount: int = 1) -> int:
+        expires_at = datetime.fromtimestamp(time.time() + expiry, tz=timezone.utc)
+        doc = self._buckets.find_one_and_update(
+            {"_id": key},
+            {"$inc": {"count": amount}, "$setOnInsert": {"expires_at": expires_at}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return int(doc["count"])
+
+    def get(self, key: str) -> int:
+        doc = self._buckets.find_one({"_id": key}, {"count": 1})
+        return int(doc["count"]) if doc else 0
+
+    def get_expiry(self, key: str) -> float:
+        doc = self._buckets.find_one({"_id": key}, {"expires_at": 1})
+        if not doc:
+            return time.time()
+        expires_at = doc["expires_at"]
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        return expires_at.timestamp()
+
+    def clear(self, key: str) -> None:
+        self._buckets.delete_one({"_id": key})
+
+    def _ping(self) -> None:
+        try:
+            self._buckets.database.command("ping")
+            healthy = True
+        except PyMongoError:
+            healthy = False
+        with self._lock:
+            self._healthy = healthy
+
+    def check(self) -> bool:
+        """Non bloquant : dernier état connu, rafraîchi par un ping en arrière-plan."""
+        self._executor.submit(self._ping)
+        with self._lock:
+            return self._healthy
+
+    def reset(self) -> int | None:
+        with self._lock:
+            self._reserved.clear()
+            self._previous.clear()
+            self._owed.clear()
+            self._available.clear()
+            self._exhausted.clear()
+            self._blocked_until.clear()
+        return self._buckets.delete_many({}).deleted_count
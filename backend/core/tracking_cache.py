@@ -0,0 +1,143 @@
+"""
+Cache des réponses du suivi public (routers/tracking.py).
+
+Chaque appel à /api/tracking/{code}, /events ou /view relisait le colis et sa
+timeline. Le payload public construit est mis en cache par process, avec son
+ETag fort (empreinte du contenu) et sa date de dernière modification ; le HTML
+de /view y est ajouté au premier rendu. LRU borné à
+TRACKING_CACHE_MAX_ENTRIES, TTL TRACKING_CACHE_TTL_SECONDS. Un hit ne lit pas
+Mongo. Les codes inconnus (ou au suivi expiré) sont mémorisés à part pendant
+TRACKING_MISS_TTL_SECONDS, dans une table de même taille : une énumération ne
+peut pas évincer les entrées utiles.
+
+Invalidation :
+- locale et immédiate via `invalidate_tracking_parcel(parcel_id)` à chaque
+  événement du colis (`_record_event`, donc `transition_status`) et dans le
+  job d'expiration ;
+- pour les autres workers, la fraîcheur est bornée par le TTL.
+"""
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Optional
+
+from config import settings
+
+
+@dataclass
+class TrackingEntry:
+    parcel_id: Optional[str]
+    payload: dict
+    digest: str
+    last_modified: Optional[datetime]
+    expires_at: Optional[datetime]
+    html: Optional[str] = None
+
+    def etag(self, variant: str = "") -> str:
+        """ETag fort ; une variante par représentation (JSON, événements, HTML)."""
+        return f'"{self.digest}-{variant}"' if variant else f'"{self.digest}"'
+
+
+def payload_digest(payload: dict[str, Any]) -> str:
+    encoded = json.dumps(payload, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()[:32]
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparaison faible d'If-None-Match (RFC 9110 §13.1.2)."""
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or etag in (value.removeprefix("W/") for value in candidates)
+
+
+class TrackingCache:
+    def __init__(self, max_entries: int, ttl_seconds: float, miss_ttl_seconds: float = 0.0) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.miss_ttl_seconds = miss_ttl_seconds
+        # code de suivi → (expiration monotonic, entrée)
+        self._entries: OrderedDict[str, tuple[float, TrackingEntry]] = OrderedDict()
+        self._by_parcel_id: dict[str, str] = {}
+        # code de suivi inconnu → expiration monotonic
+        self._misses: OrderedDict[str, float] = OrderedDict()
+        # Incrémentée à chaque invalidation : un chargement commencé avant
+        # n'est pas mis en cache (il peut avoir lu l'ancienne version).
+        self.generation = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, tracking_code: str) -> Optional[TrackingEntry]:
+        cached = self._entries.get(tracking_code)
+        if cached is None:
+            return None
+        if cached[0] <= time.monotonic():
+            self._drop(tracking_code)
+            return None
+        self._entries.move_to_end(tracking_code)
+        return cached[1]
+
+    def put(self, tracking_code: str, entry: TrackingEntry, generation: Optional[int] = None) -> None:
+        if self.ttl_seconds <= 0 or (generation is not None and generation != self.generation):
+            return
+        self._drop(tracking_code)
+        self._entries[tracking_code] = (time.monotonic() + self.ttl_seconds, entry)
+        if entry.parcel_id:
+            self._by_parcel_id[entry.parcel_id] = tracking_code
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    def is_miss(self, tracking_code: str) -> bool:
+        expires = self._misses.get(tracking_code)
+        if expires is None:
+            return False
+        if expires <= time.monotonic():
+            del self._misses[tracking_code]
+            return False
+        return True
+
+    def put_miss(self, tracking_code: str, generation: Optional[int] = None) -> None:
+        if self.miss_ttl_seconds <= 0 or (generation is not None and generation != self.generation):
+            return
+        self._misses.pop(tracking_code, None)
+        self._misses[tracking_code] = time.monotonic() + self.miss_ttl_seconds
+        while len(self._misses) > self.max_entries:
+            self._misses.popitem(last=False)
+
+    def invalidate(self, tracking_code: str) -> None:
+        self.generation += 1
+        self._drop(tracking_code)
+        self._misses.pop(tracking_code, None)
+
+    def invalidate_parcel(self, parcel_id: Optional[str]) -> None:
+        self.generation += 1
+        tracking_code = self._by_parcel_id.get(parcel_id) if parcel_id else None
+        if tracking_code:
+            self._drop(tracking_code)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._entries.clear()
+        self._by_parcel_id.clear()
+        self._misses.clear()
+
+    def _drop(self, tracking_code: str) -> None:
+        cached = self._entries.pop(tracking_code, None)
+        if cached is not None and cached[1].parcel_id:
+            self._by_parcel_id.pop(cached[1].parcel_id, None)
+
+
+tracking_cache = TrackingCache(
+    settings.TRACKING_CACHE_MAX_ENTRIES,
+    settings.TRACKING_CACHE_TTL_SECONDS,
+    settings.TRACKING_MISS_TTL_SECONDS,
+)
+
+
+def invalidate_tracking_parcel(parcel_id: Optional[str]) -> None:
+    """À appeler après toute écriture visible dans le suivi public du colis."""
+    tracking_cache.invalidate_parcel(parcel_id)
@@ -1,13 +1,26 @@
+import asyncio
+import hashlib
+import json
 import logging
+from datetime import datetime, timezone
 from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo import IndexModel, ASCENDING
 from pymongo.errors import OperationFailure
 from config import settings
+from core.metrics import mongo_command_metrics
+from core.mongo_profiler import event_listeners
 
 logger = logging.getLogger(__name__)
 
 client: AsyncIOMotorClient = None
 _db_instance = None
+_index_task: "asyncio.Task | None" = None
+# Capacité transactionnelle (replica set / mongos), détectée une fois à la
+# connexion ; None tant qu'elle n'est pas connue.
+_transactions_supported: "bool | None" = None
+
+# État de la gestion des index, exposé par /health/ready.
+index_status: dict = {"state": "pending", "version": None, "errors": []}
 
 
 class _DbProxy:
@@ -39,35 +52,62 @@ def get_client():
     return client
 
 
+def transactions_supported() -> "bool | None":
+    return _transactions_supported
+
+
+def set_transactions_supported(supported: bool) -> None:
+    global _transactions_supported
+    _transactions_supported = supported
+
+
+async def _detect_transactions_support() -> "bool | None":
+    try:
+        hello = await client.admin.command("hello")
+    except Exception as exc:
+        # Détection reportée : le premier appel transactionnel tranchera.
+        logger.warning("Détection replica set impossible au démarrage : %s", exc)
+        return None
+    return bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+
+
 async def connect_db():
     global client, _db_instance
     client = AsyncIOMotorClient(
         settings.MONGO_URL,
         serverSelectionTimeoutMS=5000,
         connectTimeoutMS=10000,
+        event_listeners=[mongo_command_metrics, *event_listeners()],
     )
     _db_instance = client[settings.DB_NAME]
     logger.info(f"Connected to MongoDB: {settings.DB_NAME}")
-    try:
-        await create_indexes()
-    except Exception as e:
-        logger.warning(f"Could not create indexes (non-blocking): {e}")
+    global _transactions_supported
+    _transactions_supported = await _detect_transactions_support()
+    if _transactions_supported is False:
+        logger.warning("MongoDB standalone : écritures wallet en mode non atomique")
+    await ensure_indexes()
 
 
 async def close_db():
     global client
+    if _index_task and not _index_task.done():
+        _index_task.cancel()
+        await asyncio.gather(_index_task, return_exceptions=True)
     if client:
         client.close()
         logger.info("MongoDB connection closed")
 
 
-async def create_indexes():
-    collections_to_index = {
+def index_manifest() -> dict[str, list[IndexModel]]:
+    """Index attendus, par collection. Toute modification change la version du manifeste."""
+    return {
         "users": [
             IndexModel([("user_id", 1)], unique=True),
             IndexModel([("phone", 1)], unique=True),
             IndexModel([("email", 1)], sparse=True),
-            IndexModel([("role", 1)]),
+            # Pagination par clé (core/pagination.py) : tri (created_at, id) desc.
+            IndexModel([("created_at", -1), ("user_id", -1)]),
+            IndexModel([("role", 1), ("created_at", -1), ("user_id", -1)]),
         ],
         "otps": [
             IndexModel([("phone", 1)]),
@@ -81,21 +121,46 @@ async def create_indexes():
         "relay_points": [
             IndexModel([("relay_id", 1)], unique=True),
             IndexModel([("owner_user_id", 1)]),
-            IndexModel([("is_active", 1)]),
+            IndexModel([("is_active", 1), ("created_at", -1), ("relay_id", -1)]),
         ],
         "parcels": [
             IndexModel([("parcel_id", 1)], unique=True),
             IndexModel([("tracking_code", 1)], unique=True),
-            IndexModel([("sender_user_id", 1)]),
-            IndexModel([("recipient_phone", 1)]),
-            IndexModel([("origin_relay_id", 1)]),
-            IndexModel([("destination_relay_id", 1)]),
             IndexModel([("status", 1)]),
-            IndexModel([("assigned_driver_id", 1)]),
-            IndexModel([("created_at", 1)]),
+            # Listes paginées par clé : une branche d'index par champ des $or de
+            # GET /api/parcels, chacune déjà triée (created_at, parcel_id) desc.
+            IndexModel([("created_at", -1), ("parcel_id", -1)]),
+            *(
+                IndexModel([(field, 1), ("created_at", -1), ("parcel_id", -1)])
+                for field in (
+                    "sender_user_id",
+                    "recipient_user_id",
+                    "recipient_phone",
+                    "assigned_driver_id",
+                    "origin_relay_id",
+                    "destination_relay_id",
+                    "redirect_relay_id",
+                    "transit_relay_id",
+                )
+            ),
+            # Réconciliation incrémentale (colis livrés non payés modifiés)
+            IndexModel([("status", 1), ("updated_at", 1)]),
+            # Job d'expiration (parcel_service.expire_overdue_parcels)
+            IndexModel([("status", 1), ("expires_at", 1)]),
+            # Relances GPS (main._gps_confirmation_reminder_loop) : seuls les
+            # colis non confirmés entrent dans ces index partiels.
+            IndexModel(
+                [("gps_reminder_next_at.sender", 1)],
+                partialFilterExpression={"pickup_confirmed": False},
+            ),
+            IndexModel(
+                [("gps_reminder_next_at.recipient", 1)],
+                partialFilterExpression={"delivery_confirmed": False},
+            ),
         ],
         "parcel_events": [
-            IndexModel([("parcel_id", 1)]),
+            # Historique complet d'un colis, déjà trié (remplace parcel_id_1)
+            IndexModel([("parcel_id", 1), ("created_at", 1)]),
             IndexModel([("created_at", 1)]),
         ],
         "delivery_missions": [
@@ -103,6 +168,11 @@ async def create_indexes():
             IndexModel([("driver_id", 1)]),
             IndexModel([("parcel_id", 1)]),
             IndexModel([("status", 1)]),
+            # Échéances de collecte (services/mission_deadline_service.py)
+            IndexModel([("status", 1), ("auto_release_at", 1)]),
+            IndexModel([("status", 1), ("pickup_reminder_due_at", 1)]),
+            # Flotte en ligne du dashboard (positions de moins d'une heure)
+            IndexModel([("location_updated_at", 1)]),
         ],
         "pricing_zones": [
             IndexModel([("zone_id", 1)], unique=True),
@@ -114,10 +184,11 @@ async def create_indexes():
         "wallets": [
             IndexModel([("wallet_id", 1)], unique=True),
             IndexModel([("owner_id", 1)], unique=True),
+            IndexModel([("updated_at", 1)]),
         ],
         "wallet_transactions": [
             IndexModel([("tx_id", 1)], unique=True),
-            IndexModel([("wallet_id", 1)]),
+            IndexModel([("wallet_id", 1), ("created_at", -1), ("tx_id", -1)]),
             IndexModel([("parcel_id", 1)]),
             IndexModel([("reference", 1)]),
             IndexModel([("created_at", 1)]),
@@ -130,10 +201,12 @@ async def create_indexes():
         "payout_requests": [
             IndexModel([("payout_id", 1)], unique=True),
             IndexModel([("wallet_id", 1)]),
+            IndexModel([("owner_id", 1), ("created_at", -1), ("payout_id", -1)]),
             IndexModel([("status", 1)]),
+            IndexModel([("updated_at", 1)]),
         ],
         "notifications": [
-            IndexModel([("user_id", 1)]),
+            IndexModel([("user_id", 1), ("channel", 1), ("created_at", -1), ("notif_id", -1)]),
             IndexModel([("created_at", 1)]),
             IndexModel(
                 [("user_id", 1), ("dedupe_key", 1)],
@@ -141,6 +214,12 @@ async def create_indexes():
                 partialFilterExpression={"dedupe_key": {"$type": "string"}},
             ),
         ],
+        # Cloche admin : rejeu SSE (ancre par event_id puis tri created_at) et
+        # archivage par âge (services/retention_service.py).
+        "admin_events": [
+            IndexModel([("event_id", 1)]),
+            IndexModel([("created_at", 1)]),
+        ],
         "notification_broadcasts": [
             IndexModel([("broadcast_id", 1)], unique=True),
             IndexModel([("created_at", -1)]),
@@ -184,23 +263,250 @@ async def create_indexes():
             IndexModel([("matched_user_id", 1)]),
             IndexModel([("matched_parcel_id", 1)]),
         ],
+        "whatsapp_call_events": [
+            IndexModel([("call_event_id", 1), ("event", 1), ("status", 1), ("timestamp", 1)]),
+        ],
+        # File du webhook WhatsApp (services/whatsapp_inbox_service.py) ;
+        # les entrées traitées sont purgées au bout de 7 jours.
+        "whatsapp_webhook_inbox": [
+            IndexModel([("inbox_id", 1)], unique=True),
+            IndexModel([("payload_sha256", 1)], unique=True),
+            IndexModel([("status", 1), ("available_at", 1)]),
+            IndexModel([("processed_at", 1)], expireAfterSeconds=7 * 86400),
+        ],
+        # Classement mensuel (services/ranking_service.py)
+        "driver_stats": [
+            IndexModel([("driver_id", 1), ("period", 1)], unique=True),
+            IndexModel([("period", 1), ("rank", 1)]),
+        ],
+        # Instantanés de solde (services/ledger_service.py)
+        "wallet_balance_snapshots": [
+            IndexModel([("snapshot_id", 1)], unique=True),
+            IndexModel([("wallet_id", 1), ("as_of_created_at", -1), ("as_of_tx_id", -1)]),
+            IndexModel([("created_at", -1)]),
+        ],
+        # Réconciliation finance (services/finance_reconciliation_service.py)
+        "finance_discrepancies": [
+            IndexModel([("discrepancy_id", 1)], unique=True),
+            IndexModel([("kind", 1), ("status", 1), ("subject_id", 1)]),
+            IndexModel([("kind", 1), ("status", 1), ("first_seen_at", -1)]),
+        ],
+        "reconciliation_runs": [
+            IndexModel([("status", 1), ("started_at", -1)]),
+        ],
+        # Baux des boucles de fond (core/leases.py)
+        "background_leases": [
+            IndexModel([("name", 1)], unique=True),
+        ],
+        # Compteurs de limites de débit (core/rate_limit_storage.py)
+        "rate_limit_buckets": [
+            IndexModel([("expires_at", 1)], expireAfterSeconds=0),
+        ],
+        # Compteurs du dashboard (services/counters_service.py) ; seuls les
+        # documents journaliers portent expires_at.
+        "ops_counters": [
+            IndexModel([("expires_at", 1)], expireAfterSeconds=0),
+        ],
+        # Dernier instantané de chaque job de fond (core/jobs.py)
+        "job_status": [
+            IndexModel([("name", 1)], unique=True),
+        ],
         "legal_contents": [
             IndexModel([("document_type", 1)], unique=True),
         ],
+        # Archives alimentées par services/retention_service.py et
+        # services/archive_service.py (tiering des colis terminés)
+        "parcels_archive": [
+            IndexModel([("parcel_id", 1)], unique=True),
+            IndexModel([("tracking_code", 1)], unique=True),
+        ],
+        "delivery_missions_archive": [
+            IndexModel([("mission_id", 1)], unique=True),
+            IndexModel([("parcel_id", 1)]),
+        ],
+        "notifications_archive": [
+            IndexModel([("user_id", 1), ("created_at", -1)]),
+        ],
+        "admin_events_archive": [
+            IndexModel([("created_at", -1)]),
+        ],
+        "parcel_events_archive": [
+            IndexModel([("parcel_id", 1), ("created_at", 1)]),
+        ],
+        "retention_runs": [
+            IndexModel([("started_at", -1)]),
+        ],
     }
 
-    await _repair_ttl_index("otps", "expires_at_1", "expires_at", 0)
-    await _repair_ttl_index("user_sessions", "expires_at_1", "expires_at", 0)
-    await _repair_user_session_indexes()
 
-    for collection_name, index_models in collections_to_index.items():
-        try:
-            await _db_instance[collection_name].create_indexes(index_models)
-            logger.info(f"Indexes created for collection: {collection_name}")
-        except Exception as e:
-            logger.error(f"Failed to create indexes for collection {collection_name}: {e}")
+# À incrémenter quand les réparations ci-dessous changent sans toucher au manifeste.
+INDEX_REPAIR_REVISION = 2
+
+# Index mono-champ remplacés par un index composé du manifeste qui commence par
+# le même champ (pagination par clé, historique trié).
+SUPERSEDED_INDEXES: tuple[tuple[str, str], ...] = (
+    ("users", "role_1"),
+    ("relay_points", "is_active_1"),
+    ("parcels", "sender_user_id_1"),
+    ("parcels", "recipient_phone_1"),
+    ("parcels", "origin_relay_id_1"),
+    ("parcels", "destination_relay_id_1"),
+    ("parcels", "assigned_driver_id_1"),
+    ("parcels", "created_at_1"),
+    ("parcel_events", "parcel_id_1"),
+    ("parcel_events_archive", "parcel_id_1"),
+    ("wallet_transactions", "wallet_id_1"),
+    ("notifications", "user_id_1"),
+)
+
+
+def index_manifest_version(manifest: dict[str, list[IndexModel]] | None = None) -> str:
+    """Empreinte stable du manifeste (clés dans l'ordre, options triées)."""
+    manifest = manifest if manifest is not None else index_manifest()
+    canonical = []
+    for collection_name in sorted(manifest):
+        for model in manifest[collection_name]:
+            document = dict(model.document)
+            key = list(document.pop("key").items())
+            canonical.append([collection_name, key, document])
+    payload = json.dumps([INDEX_REPAIR_REVISION, canonical], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def split_index_manifest(
+    manifest: dict[str, list[IndexModel]],
+) -> tuple[dict[str, list[IndexModel]], dict[str, list[IndexModel]]]:
+    """
+    Sépare les index de contrainte (unique, TTL), dont dépend la correction des
+    écritures, des index de performance qui peuvent être construits plus tard.
+    """
+    constraints: dict[str, list[IndexModel]] = {}
+    performance: dict[str, list[IndexModel]] = {}
+    for collection_name, index_models in manifest.items():
+        for model in index_models:
+            document = model.document
+            is_constraint = document.get("unique") or "expireAfterSeconds" in document
+            target = constraints if is_constraint else performance
+            target.setdefault(collection_name, []).append(model)
+    return constraints, performance
+
+
+async def ensure_indexes() -> None:
+    """
+    Au démarrage : une seule lecture de `schema_meta`. Si la version stockée
+    correspond au manifeste, aucun travail d'index ; sinon les index de
+    contrainte sont construits avant de servir (leases, `job_status`, inbox
+    WhatsApp…) et les index de performance en tâche de fond, /health/ready
+    restant à 503 jusqu'à la fin.
+    """
+    global _index_task
+    version = index_manifest_version()
+    index_status.update({"state": "checking", "version": version, "errors": []})
+    try:
+        stored = await _db_instance.schema_meta.find_one({"_id": "indexes"}, {"version": 1})
+    except Exception as e:
+        logger.warning(f"Could not read index manifest version (non-blocking): {e}")
+        stored = None
+    if stored and stored.get("version") == version:
+        index_status.update({"state": "ready", "finished_at": datetime.now(timezone.utc)})
+        logger.info("MongoDB indexes up to date (manifest %s)", version)
+        return
+    index_status.update({"state": "building", "started_at": datetime.now(timezone.utc)})
+    constraint_errors = await create_constraint_indexes()
+    _index_task = asyncio.create_task(create_indexes(version, constraint_errors), name="create_indexes")
+
+
+async def _create_collection_indexes(collection_name: str, index_models: list[IndexModel]) -> str | None:
+    try:
+        await _db_instance[collection_name].create_indexes(index_models)
+        logger.info(f"Indexes created for collection: {collection_name}")
+        return None
+    except Exception as e:
+        logger.error(f"Failed to create indexes for collection {collection_name}: {e}")
+        return f"{collection_name}: {e}"[:240]
+
 
-    logger.info("All MongoDB indexes creation attempts completed.")
+async def _build_indexes(manifest: dict[str, list[IndexModel]]) -> list[str]:
+    results = await asyncio.gather(*(
+        _create_collection_indexes(collection_name, index_models)
+        for collection_name, index_models in manifest.items()
+    ))
+    return [error for error in results if error]
+
+
+async def create_constraint_indexes() -> list[str]:
+    """
+    Réparations puis index unique et TTL du manifeste. Attendu avant de servir :
+    les verrous et la déduplication reposent sur ces contraintes.
+    """
+    try:
+        await _repair_ttl_index("otps", "expires_at_1", "expires_at", 0)
+        await _repair_ttl_index("user_sessions", "expires_at_1", "expires_at", 0)
+        await _repair_user_session_indexes()
+        constraints, _ = split_index_manifest(index_manifest())
+        return await _build_indexes(constraints)
+    except Exception as e:
+        logger.error(f"Could not create constraint indexes: {e}")
+        return [str(e)[:240]]
+
+
+async def create_indexes(version: str | None = None, constraint_errors: list[str] | None = None):
+    """
+    Construction concurrente des index de performance, après les index de
+    contrainte (construits ici si l'appelant ne l'a pas déjà fait). La version
+    n'est enregistrée que si toutes les collections ont réussi : une erreur
+    sera retentée au prochain démarrage.
+    """
+    manifest = index_manifest()
+    version = version or index_manifest_version(manifest)
+    started_at = index_status.get("started_at") or datetime.now(timezone.utc)
+    index_status.update({"state": "building", "version": version, "errors": []})
+    try:
+        if constraint_errors is None:
+            started_at = datetime.now(timezone.utc)
+            index_status["started_at"] = started_at
+            constraint_errors = await create_constraint_indexes()
+        _, performance = split_index_manifest(manifest)
+        errors = [*constraint_errors, *await _build_indexes(performance)]
+        if not errors:
+            # Préfixes des index composés : supprimés seulement une fois ces
+            # derniers construits.
+            for collection_name, index_name in SUPERSEDED_INDEXES:
+                await _drop_superseded_index(collection_name, index_name)
+        finished_at = datetime.now(timezone.utc)
+        if not errors:
+            await _db_instance.schema_meta.update_one(
+                {"_id": "indexes"},
+                {"$set": {"version": version, "applied_at": finished_at}},
+                upsert=True,
+            )
+        index_status.update({
+            "state": "degraded" if errors else "ready",
+            "errors": errors,
+            "finished_at": finished_at,
+        })
+        logger.info(
+            "MongoDB indexes ensured in %.1fs (manifest %s, %s error(s))",
+            (finished_at - started_at).total_seconds(),
+            version,
+            len(errors),
+        )
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        index_status.update({"state": "degraded", "errors": [str(e)[:240]]})
+        logger.warning(f"Could not create indexes (non-blocking): {e}")
+
+
+async def _drop_superseded_index(collection_name: str, index_name: str):
+    collection = _db_instance[collection_name]
+    try:
+        indexes = await collection.index_information()
+        if index_name in indexes:
+            await collection.drop_index(index_name)
+            logger.warning("Dropped superseded index %s.%s", collection_name, index_name)
+    except OperationFailure as e:
+        logger.error("Failed to drop superseded index %s.%s: %s", collection_name, index_name, e)
 
 
 async def _repair_ttl_index(collection_name: str, index_name: str, field_name: str, expire_after_seconds: int):
@@ -2,8 +2,8 @@ import asyncio
 import logging
 from contextlib import asynccontextmanager
 from datetime import datetime, timezone, timedelta
-from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from slowapi.errors import RateLimitExceeded
@@ -12,8 +12,16 @@ from slowapi import _rate_limit_exceeded_handler
 from core.limiter import limiter
 
 from config import UPLOADS_DIR, settings
-from database import connect_db, close_db, db
-
+from database import connect_db, close_db, db, index_status
+from services.admin_events_service import watch_admin_events_changes
+from services.whatsapp_inbox_service import run_whatsapp_inbox_workers
+from core.leases import run_exclusive
+from core.jobs import job_registry, list_job_status, render_prometheus
+from core.mongo_profiler import report_request_profile, start_request_profile
+from core.metrics import MetricsMiddleware, render_metrics, sample_event_loop_lag
+from core.principal_cache import watch_principal_changes
+
+from apscheduler.events import EVENT_JOB_MISSED
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 # Routers
@@ -30,178 +38,81 @@ logger = logging.getLogger(__name__)
 
 async def _auto_release_stuck_missions() -> None:
     """
-    Toutes les 2 min : libère les missions ASSIGNED après le délai configuré
-    sans que le livreur ait confirmé la collecte (started_at absent).
+    Toutes les 2 min : libère les missions ASSIGNED dont `auto_release_at` est
+    dépassé sans collecte confirmée et envoie les rappels échus. Ne lit que les
+    missions échues (voir services/mission_deadline_service.py).
     """
-    from database import db as _db
-    from services.notification_service import (
-        notify_driver_mission_auto_released,
-        notify_driver_pickup_confirmation_reminder,
-    )
-    from services.parcel_service import get_assigned_mission_auto_release_minutes
+    from services.mission_deadline_service import backfill_pickup_deadlines, process_pickup_deadlines
 
-    while True:
-        await asyncio.sleep(120)  # vérification toutes les 2 minutes
-        try:
-            now = datetime.now(timezone.utc)
-            auto_release_minutes = await get_assigned_mission_auto_release_minutes()
-            cutoff = now - timedelta(minutes=auto_release_minutes)
-            cursor = _db.delivery_missions.find({
-                "status":      "assigned",
-                "assigned_at": {"$lt": cutoff},
-                "started_at":  None,          # collecte jamais confirmée
-            })
-            released = 0
-            async for mission in cursor:
-                update_result = await _db.delivery_missions.update_one(
-                    {
-                        "mission_id": mission["mission_id"],
-                        "status": "assigned",
-                        "assigned_at": {"$lt": cutoff},
-                        "started_at": None,
-                        "driver_id": mission.get("driver_id"),
-                    },
-                    {
-                        "$set": {
-                            "status": "pending",
-                            "driver_id": None,
-                            "assigned_at": None,
-                            "updated_at": now,
-                        },
-                        "$unset": {
-                            "pickup_reminder_10_sent_at": "",
-                            "pickup_reminder_5_sent_at": "",
-                        },
-                    },
-                )
-                if update_result.modified_count == 0:
-                    continue
-                await _db.parcels.update_one(
-                    {
-                        "parcel_id": mission["parcel_id"],
-                        "assigned_driver_id": mission.get("driver_id"),
-                    },
-                    {"$set": {"assigned_driver_id": None, "updated_at": now}},
-                )
-                if mission.get("driver_id"):
-                    await notify_driver_mission_auto_released(
-                        user_id=mission["driver_id"],
-                        mission=mission,
-                    )
-                released += 1
-            reminder_cursor = _db.delivery_missions.find(
-                {
-                    "status": "assigned",
-                    "started_at": None,
-                    "assigned_at": {"$ne": None},
-                },
-                {"_id": 0},
+    try:
+        backfilled = await backfill_pickup_deadlines()
+        if backfilled:
+            logger.info("Auto-release : échéance calculée pour %s mission(s) existante(s)", backfilled)
+    except Exception as exc:
+        logger.error("Erreur initialisation échéances de collecte : %s", exc)
+
+    async def _pass() -> int:
+        stats = await process_pickup_deadlines()
+        if stats["released"] or stats["reminded"]:
+            logger.info(
+                "Auto-release : %s mission(s) libérée(s), %s rappel(s) de collecte",
+                stats["released"],
+                stats["reminded"],
             )
-            async for mission in reminder_cursor:
-                assigned_at = mission.get("assigned_at")
-                driver_id = mission.get("driver_id")
-                if not assigned_at or not driver_id:
-                    continue
-                assigned_at = (
-                    assigned_at.replace(tzinfo=timezone.utc)
-                    if assigned_at.tzinfo is None
-                    else assigned_at.astimezone(timezone.utc)
-                )
-                deadline = assigned_at + timedelta(minutes=auto_release_minutes)
-                remaining_seconds = int((deadline - now).total_seconds())
-                if remaining_seconds <= 0:
-                    continue
-                for threshold_minutes, field_name in (
-                    (10, "pickup_reminder_10_sent_at"),
-                    (5, "pickup_reminder_5_sent_at"),
-                ):
-                    if auto_release_minutes <= threshold_minutes:
-                        continue
-                    if remaining_seconds > threshold_minutes * 60:
-                        continue
-                    if mission.get(field_name):
-                        continue
-                    reminder_update = await _db.delivery_missions.update_one(
-                        {
-                            "mission_id": mission["mission_id"],
-                            field_name: {"$in": [None, False]},
-                            "status": "assigned",
-                            "started_at": None,
-                        },
-                        {"$set": {field_name: now, "updated_at": now}},
-                    )
-                    if reminder_update.modified_count == 0:
-                        continue
-                    await notify_driver_pickup_confirmation_reminder(
-                        user_id=driver_id,
-                        mission=mission,
-                        minutes_remaining=max(1, (remaining_seconds + 59) // 60),
-                    )
-            if released:
-                logger.info(
-                    "Auto-release : %s mission(s) libérée(s) après %s min d'inactivité",
-                    released,
-                    auto_release_minutes,
-                )
-        except Exception as exc:
-            logger.error(f"Erreur auto-release missions : {exc}")
+        return stats["released"] + stats["reminded"]
+
+    await job_registry.run_periodic("auto_release_missions", 120, _pass)  # toutes les 2 minutes
 
 
 async def _monthly_ranking_job():
     """Tourne le 1er de chaque mois à 01:00 UTC."""
-    try:
-        now = datetime.now(timezone.utc)
-        # Calculer pour le mois précédent
-        if now.month == 1:
-            period = f"{now.year - 1}-12"
-        else:
-            period = f"{now.year}-{now.month - 1:02d}"
-
-        logger.info(f"Démarrage du calcul des classements mensuels pour {period}...")
-        
-        from services.ranking_service import (
-            compute_driver_stats_for_period, 
-            pay_monthly_driver_bonuses,
-            compute_relay_stats_and_pay_bonuses
-        )
-        
-        # 1. Stats Drivers
-        stats = await compute_driver_stats_for_period(period)
-        for stat in stats:
-            await db.driver_stats.update_one(
-                {"driver_id": stat["driver_id"], "period": period},
-                {"$set": stat},
-                upsert=True,
-            )
-        
-        # 2. Bonus Drivers
-        await pay_monthly_driver_bonuses(period)
-        
-        # 3. Stats & Bonus Relais
-        await compute_relay_stats_and_pay_bonuses(period)
-        
-        logger.info(f"Classements et bonus pour {period} terminés avec succès.")
-    except Exception as exc:
-        logger.error(f"Erreur lors du calcul mensuel des classements : {exc}")
+    now = datetime.now(timezone.utc)
+    # Calculer pour le mois précédent
+    if now.month == 1:
+        period = f"{now.year - 1}-12"
+    else:
+        period = f"{now.year}-{now.month - 1:02d}"
+
+    logger.info(f"Démarrage du calcul des classements mensuels pour {period}...")
+    
+    from services.ranking_service import (
+        refresh_driver_stats_for_period,
+        pay_monthly_driver_bonuses,
+        compute_relay_stats_and_pay_bonuses
+    )
+    
+    # 1. Stats Drivers
+    ranked = await refresh_driver_stats_for_period(period)
+    
+    # 2. Bonus Drivers
+    await pay_monthly_driver_bonuses(period)
+    
+    # 3. Stats & Bonus Relais
+    await compute_relay_stats_and_pay_bonuses(period)
+    
+    logger.info(f"Classements et bonus pour {period} terminés avec succès.")
+    return ranked
 
 
 async def _advance_delivery_dispatch_loop() -> None:
     """Fait progresser le dispatch en cascade hors des endpoints GET."""
-    while True:
-        await asyncio.sleep(15)
-        try:
-            updated = await deliveries.advance_pending_delivery_dispatch()
-            if updated:
-                logger.info("Dispatch cascade : %s mission(s) avancée(s)", updated)
-        except Exception as exc:
-            logger.error("Erreur dispatch cascade : %s", exc)
+
+    async def _pass() -> int:
+        updated = await deliveries.advance_pending_delivery_dispatch()
+        if updated:
+            logger.info("Dispatch cascade : %s mission(s) avancée(s)", updated)
+        return updated or 0
+
+    await job_registry.run_periodic("delivery_dispatch", 15, _pass)
 
 
 async def _maybe_send_gps_reminder(parcel: dict, actor: str, now: datetime) -> bool:
     from services.notification_service import notify_location_confirmation_request
     from services.notification_service import notify_sender_recipient_position_pending
-    from services.parcel_service import _record_event
+    from services.parcel_service import GPS_REMINDER_CLOSED_STATUSES, _record_event, gps_reminder_next_at
 
+    if parcel.get("status") in GPS_REMINDER_CLOSED_STATUSES:
+        return False
     reminders = parcel.get("gps_reminders") or {}
     reminder_state = reminders.get(actor) or {}
     if reminder_state.get("confirmed_at"):
@@ -254,12 +165,18 @@ async def _maybe_send_gps_reminder(parcel: dict, actor: str, now: datetime) -> b
     elif has_app:
         channel = "in_app_push"
 
+    sent_state = {**reminder_state, "count": count + 1, "last_sent_at": now}
+    next_at = gps_reminder_next_at(
+        {**parcel, "gps_reminders": {**reminders, actor: sent_state}},
+        actor,
+    )
     await db.parcels.update_one(
         {"parcel_id": parcel["parcel_id"]},
         {"$set": {
             f"gps_reminders.{actor}.count": count + 1,
             f"gps_reminders.{actor}.last_sent_at": now,
             f"gps_reminders.{actor}.last_channel": channel,
+            f"gps_reminder_next_at.{actor}": next_at,
             "updated_at": now,
         }},
     )
@@ -274,65 +191,169 @@ async def _maybe_send_gps_reminder(parcel: dict, actor: str, now: datetime) -> b
     return True
 
 
-async def _gps_confirmation_reminder_loop() -> None:
-    while True:
-        await asyncio.sleep(120)
-        try:
-            query = {
-                "status": {
-                    "$nin": [
-                        "delivered",
-                        "cancelled",
-                        "returned",
-                        "expired",
-                    ]
+GPS_REMINDER_BATCH_SIZE = 200
+_GPS_CONFIRMED_FIELD = {"sender": "pickup_confirmed", "recipient": "delivery_confirmed"}
+_GPS_SCHEDULE_PROJECTION = {
+    "_id": 0,
+    "parcel_id": 1,
+    "status": 1,
+    "delivery_mode": 1,
+    "pickup_confirmed": 1,
+    "delivery_confirmed": 1,
+    "sender_confirm_token": 1,
+    "recipient_confirm_token": 1,
+    "sender_user_id": 1,
+    "recipient_user_id": 1,
+    "gps_reminders": 1,
+    "created_at": 1,
+}
+
+
+async def _backfill_gps_reminder_schedule() -> int:
+    """Colis créés avant `gps_reminder_next_at` : calcul unique de l'échéance."""
+    from pymongo import UpdateOne
+    from services.parcel_service import GPS_REMINDER_ACTORS, gps_reminder_next_at
+
+    scheduled = 0
+    for actor in GPS_REMINDER_ACTORS:
+        while True:
+            legacy = await db.parcels.find(
+                {
+                    _GPS_CONFIRMED_FIELD[actor]: False,
+                    f"gps_reminder_next_at.{actor}": {"$exists": False},
                 },
-                "$or": [
-                    {
-                        "delivery_mode": {"$regex": "^home_to_"},
-                        "pickup_confirmed": False,
-                        "sender_confirm_token": {"$exists": True},
-                    },
-                    {
-                        "delivery_mode": {"$regex": "_to_home$"},
-                        "delivery_confirmed": False,
-                        "recipient_confirm_token": {"$exists": True},
-                    },
+                _GPS_SCHEDULE_PROJECTION,
+            ).limit(GPS_REMINDER_BATCH_SIZE).to_list(length=GPS_REMINDER_BATCH_SIZE)
+            if not legacy:
+                break
+            await db.parcels.bulk_write(
+                [
+                    UpdateOne(
+                        {"parcel_id": parcel["parcel_id"]},
+                        {"$set": {f"gps_reminder_next_at.{actor}": gps_reminder_next_at(parcel, actor)}},
+                    )
+                    for parcel in legacy
                 ],
-            }
-            parcels_to_remind = await db.parcels.find(query, {"_id": 0}).to_list(length=200)
-            reminded = 0
-            now = datetime.now(timezone.utc)
-            for parcel in parcels_to_remind:
-                if parcel.get("delivery_mode", "").startswith("home_to_") and not parcel.get("pickup_confirmed"):
-                    reminded += 1 if await _maybe_send_gps_reminder(parcel, "sender", now) else 0
-                if parcel.get("delivery_mode", "").endswith("_to_home") and not parcel.get("delivery_confirmed"):
-                    reminded += 1 if await _maybe_send_gps_reminder(parcel, "recipient", now) else 0
-            if reminded:
-                logger.info("Relances GPS envoyées : %s", reminded)
-        except Exception as exc:
-            logger.error("Erreur relances GPS : %s", exc)
+                ordered=False,
+            )
+            scheduled += len(legacy)
+            if len(legacy) < GPS_REMINDER_BATCH_SIZE:
+                break
+    return scheduled
 
 
-async def _expire_stale_parcels():
-    """Expire les colis AVAILABLE_AT_RELAY / REDIRECTED_TO_RELAY dont expires_at est dépassé."""
+async def _send_due_gps_reminders(actor: str, now: datetime) -> int:
+    """
+    Relance les colis dont `gps_reminder_next_at.<actor>` est échu, par lots.
+    Un colis non relancé (confirmé entre-temps, clos, plafond atteint) voit son
+    échéance recalculée — future ou None — et sort donc de la requête.
+    """
+    from pymongo import UpdateOne
+    from services.parcel_service import GPS_REMINDER_CLOSED_STATUSES, gps_reminder_next_at
+
+    next_field = f"gps_reminder_next_at.{actor}"
+    # Le statut reste un filtre résiduel : l'index partiel porte sur l'échéance.
+    query = {
+        _GPS_CONFIRMED_FIELD[actor]: False,
+        next_field: {"$lte": now},
+        "status": {"$nin": list(GPS_REMINDER_CLOSED_STATUSES)},
+    }
+    seen: set[str] = set()
+    reminded = 0
+    while True:
+        batch = await db.parcels.find(query, {"_id": 0}).sort(next_field, 1).limit(
+            GPS_REMINDER_BATCH_SIZE
+        ).to_list(length=GPS_REMINDER_BATCH_SIZE)
+        batch = [parcel for parcel in batch if parcel["parcel_id"] not in seen]
+        if not batch:
+            break
+        reschedule = []
+        for parcel in batch:
+            seen.add(parcel["parcel_id"])
+            try:
+                if await _maybe_send_gps_reminder(parcel, actor, now):
+                    reminded += 1
+                    continue
+                next_at = gps_reminder_next_at(parcel, actor)
+            except Exception as exc:
+                logger.warning("Relance GPS %s du colis %s en échec : %s", actor, parcel["parcel_id"], exc)
+                next_at = now + timedelta(minutes=settings.GPS_REMINDER_ESCALATION_MINUTES)
+            reschedule.append(UpdateOne({"parcel_id": parcel["parcel_id"]}, {"$set": {next_field: next_at}}))
+        if reschedule:
+            await db.parcels.bulk_write(reschedule, ordered=False)
+    return reminded
+
+
+async def _gps_confirmation_reminder_loop() -> None:
+    from services.parcel_service import GPS_REMINDER_ACTORS
+
     try:
-        from services.notification_service import notify_parcel_expired
-        now = datetime.now(timezone.utc)
-        query = {
-            "status": {"$in": ["available_at_relay", "redirected_to_relay"]},
-            "expires_at": {"$lte": now},
-        }
-        expired_parcels = await db.parcels.find(query, {"_id": 0}).to_list(length=100)
-        for parcel in expired_parcels:
-            await db.parcels.update_one(
-                {"parcel_id": parcel["parcel_id"]},
-                {"$set": {"status": "expired", "updated_at": now}},
-            )
-            await notify_parcel_expired(parcel)
-            logger.info("Colis %s expiré automatiquement", parcel.get("tracking_code"))
+        scheduled = await _backfill_gps_reminder_schedule()
+        if scheduled:
+            logger.info("Relances GPS : échéance calculée pour %s colis existant(s)", scheduled)
     except Exception as exc:
-        logger.error("Erreur job expiration colis : %s", exc)
+        logger.error("Erreur initialisation relances GPS : %s", exc)
+
+    async def _pass() -> int:
+        now = datetime.now(timezone.utc)
+        reminded = 0
+        for actor in GPS_REMINDER_ACTORS:
+            reminded += await _send_due_gps_reminders(actor, now)
+        if reminded:
+            logger.info("Relances GPS envoyées : %s", reminded)
+        return reminded
+
+    await job_registry.run_periodic("gps_confirmation_reminders", 120, _pass)
+
+
+async def _expire_stale_parcels():
+    """Expire les colis AVAILABLE_AT_RELAY / REDIRECTED_TO_RELAY dont expires_at est dépassé."""
+    from services.parcel_service import expire_overdue_parcels
+    totals = await expire_overdue_parcels()
+    if totals["expired"]:
+        logger.info(
+            "Expiration colis : %s colis expiré(s), %s relais mis à jour, %s notification(s)",
+            totals["expired"],
+            totals["relays"],
+            totals["notified"],
+        )
+    return totals["expired"]
+
+
+async def _counters_reconcile_job():
+    """Recalcule les compteurs du dashboard depuis les collections (tous les jours à 02:45 UTC)."""
+    from services.counters_service import reconcile_counters
+    return await reconcile_counters()
+
+
+async def _driver_stats_refresh_job():
+    """
+    Recalcul complet du classement du mois en cours (tous les jours à 02:15 UTC) :
+    ajoute les livreurs sans activité et rattrape les affectations, qui ne
+    déclenchent pas de mise à jour incrémentale.
+    """
+    from services.ranking_service import current_period, refresh_driver_stats_for_period
+    return await refresh_driver_stats_for_period(current_period())
+
+
+async def _finance_reconciliation_job():
+    """Réconciliation finance incrémentale (toutes les heures à H:20)."""
+    from services.finance_reconciliation_service import run_reconciliation
+    run = await run_reconciliation()
+    return sum(check["checked"] for check in run["checks"].values()) if run else 0
+
+
+async def _wallet_snapshots_job():
+    """Instantanés de solde des wallets actifs (tous les jours à 01:30 UTC)."""
+    from services.ledger_service import snapshot_wallets
+    return await snapshot_wallets()
+
+
+async def _retention_job():
+    """Archive / purge les collections à forte croissance (tous les jours à 03:30 UTC)."""
+    from services.retention_service import run_retention
+    run = await run_retention()
+    return run["documents_moved"]
 
 
 async def _admin_anomaly_notifier_loop() -> None:
@@ -353,133 +374,204 @@ async def _admin_anomaly_notifier_loop() -> None:
     ]
     ACTIVE_MISSION_STATUSES = ["assigned", "in_progress"]
 
-    while True:
-        await asyncio.sleep(120)
-        try:
-            now = datetime.now(timezone.utc)
-
-            # Signal GPS perdu — missions actives sans update de position depuis 20 min.
-            signal_cutoff = now - SIGNAL_LOST_THRESHOLD
-            signal_query = {
-                "status": {"$in": ACTIVE_MISSION_STATUSES},
-                "location_updated_at": {"$lt": signal_cutoff},
-                "signal_lost_notified_at": {"$in": [None, False]},
-            }
-            async for mission in db.delivery_missions.find(
-                signal_query,
-                {"_id": 0, "mission_id": 1, "parcel_id": 1, "driver_id": 1, "location_updated_at": 1},
-            ):
-                upd = await db.delivery_missions.update_one(
-                    {
-                        "mission_id": mission["mission_id"],
-                        "signal_lost_notified_at": {"$in": [None, False]},
-                    },
-                    {"$set": {"signal_lost_notified_at": now}},
-                )
-                if upd.modified_count == 0:
-                    continue
-                await record_admin_event(
-                    AdminEventType.SIGNAL_LOST,
-                    title="Perte de signal GPS livreur",
-                    message=f"Mission {mission['mission_id']} sans position depuis plus de 20 min.",
-                    href="/dashboard/fleet?filter=signal_lost",
-                    metadata={
-                        "mission_id": mission["mission_id"],
-                        "parcel_id": mission.get("parcel_id"),
-                        "driver_id": mission.get("driver_id"),
-                    },
-                )
-
-            # Retard critique — missions actives non terminées depuis plus de 3 h.
-            delay_cutoff = now - CRITICAL_DELAY_THRESHOLD
-            delay_query = {
-                "status": {"$in": ACTIVE_MISSION_STATUSES},
-                "assigned_at": {"$lt": delay_cutoff},
-                "critical_delay_notified_at": {"$in": [None, False]},
-            }
-            async for mission in db.delivery_missions.find(
-                delay_query,
-                {"_id": 0, "mission_id": 1, "parcel_id": 1, "driver_id": 1, "assigned_at": 1},
-            ):
-                upd = await db.delivery_missions.update_one(
-                    {
-                        "mission_id": mission["mission_id"],
-                        "critical_delay_notified_at": {"$in": [None, False]},
-                    },
-                    {"$set": {"critical_delay_notified_at": now}},
-                )
-                if upd.modified_count == 0:
-                    continue
-                await record_admin_event(
-                    AdminEventType.MISSION_CRITICAL_DELAY,
-                    title="Mission en retard critique",
-                    message=f"Mission {mission['mission_id']} assignée depuis plus de 3 h sans complétion.",
-                    href="/dashboard/stale",
-                    metadata={
-                        "mission_id": mission["mission_id"],
-                        "parcel_id": mission.get("parcel_id"),
-                        "driver_id": mission.get("driver_id"),
-                    },
-                )
-
-            # Colis stagnants — en relais depuis plus de 7 j sans mouvement.
-            stale_cutoff = now - STALE_PARCEL_THRESHOLD
-            stale_query = {
-                "status": {"$in": STALE_RELAY_STATUSES},
-                "updated_at": {"$lt": stale_cutoff},
-                "stale_notified_at": {"$in": [None, False]},
-            }
-            async for parcel in db.parcels.find(
-                stale_query,
-                {"_id": 0, "parcel_id": 1, "tracking_code": 1, "status": 1, "updated_at": 1},
-            ):
-                upd = await db.parcels.update_one(
-                    {
-                        "parcel_id": parcel["parcel_id"],
-                        "stale_notified_at": {"$in": [None, False]},
-                    },
-                    {"$set": {"stale_notified_at": now}},
-                )
-                if upd.modified_count == 0:
-                    continue
-                tracking = parcel.get("tracking_code") or parcel["parcel_id"]
-                await record_admin_event(
-                    AdminEventType.PARCEL_STALE,
-                    title=f"Colis stagnant — {tracking}",
-                    message=f"Sans mouvement depuis plus de 7 jours ({parcel.get('status')}).",
-                    href=f"/dashboard/parcels/{parcel['parcel_id']}",
-                    metadata={
-                        "parcel_id": parcel["parcel_id"],
-                        "tracking_code": tracking,
-                        "parcel_status": parcel.get("status"),
-                    },
-                )
-        except Exception as exc:
-            logger.error("Erreur admin anomaly notifier : %s", exc)
+    async def _pass() -> int:
+        now = datetime.now(timezone.utc)
+        emitted = 0
+
+        # Signal GPS perdu — missions actives sans update de position depuis 20 min.
+        signal_cutoff = now - SIGNAL_LOST_THRESHOLD
+        signal_query = {
+            "status": {"$in": ACTIVE_MISSION_STATUSES},
+            "location_updated_at": {"$lt": signal_cutoff},
+            "signal_lost_notified_at": {"$in": [None, False]},
+        }
+        async for mission in db.delivery_missions.find(
+            signal_query,
+            {"_id": 0, "mission_id": 1, "parcel_id": 1, "driver_id": 1, "location_updated_at": 1},
+        ):
+            upd = await db.delivery_missions.update_one(
+                {
+                    "mission_id": mission["mission_id"],
+                    "signal_lost_notified_at": {"$in": [None, False]},
+                },
+                {"$set": {"signal_lost_notified_at": now}},
+            )
+            if upd.modified_count == 0:
+                continue
+            await record_admin_event(
+                AdminEventType.SIGNAL_LOST,
+                title="Perte de signal GPS livreur",
+                message=f"Mission {mission['mission_id']} sans position depuis plus de 20 min.",
+                href="/dashboard/fleet?filter=signal_lost",
+                metadata={
+                    "mission_id": mission["mission_id"],
+                    "parcel_id": mission.get("parcel_id"),
+                    "driver_id": mission.get("driver_id"),
+                },
+            )
+            emitted += 1
+
+        # Retard critique — missions actives non terminées depuis plus de 3 h.
+        delay_cutoff = now - CRITICAL_DELAY_THRESHOLD
+        delay_query = {
+            "status": {"$in": ACTIVE_MISSION_STATUSES},
+            "assigned_at": {"$lt": delay_cutoff},
+            "critical_delay_notified_at": {"$in": [None, False]},
+        }
+        async for mission in db.delivery_missions.find(
+            delay_query,
+            {"_id": 0, "mission_id": 1, "parcel_id": 1, "driver_id": 1, "assigned_at": 1},
+        ):
+            upd = await db.delivery_missions.update_one(
+                {
+                    "mission_id": mission["mission_id"],
+                    "critical_delay_notified_at": {"$in": [None, False]},
+                },
+                {"$set": {"critical_delay_notified_at": now}},
+            )
+            if upd.modified_count == 0:
+                continue
+            await record_admin_event(
+                AdminEventType.MISSION_CRITICAL_DELAY,
+                title="Mission en retard critique",
+                message=f"Mission {mission['mission_id']} assignée depuis plus de 3 h sans complétion.",
+                href="/dashboard/stale",
+                metadata={
+                    "mission_id": mission["mission_id"],
+                    "parcel_id": mission.get("parcel_id"),
+                    "driver_id": mission.get("driver_id"),
+                },
+            )
+            emitted += 1
+
+        # Colis stagnants — en relais depuis plus de 7 j sans mouvement.
+        stale_cutoff = now - STALE_PARCEL_THRESHOLD
+        stale_query = {
+            "status": {"$in": STALE_RELAY_STATUSES},
+            "updated_at": {"$lt": stale_cutoff},
+            "stale_notified_at": {"$in": [None, False]},
+        }
+        async for parcel in db.parcels.find(
+            stale_query,
+            {"_id": 0, "parcel_id": 1, "tracking_code": 1, "status": 1, "updated_at": 1},
+        ):
+            upd = await db.parcels.update_one(
+                {
+                    "parcel_id": parcel["parcel_id"],
+                    "stale_notified_at": {"$in": [None, False]},
+                },
+                {"$set": {"stale_notified_at": now}},
+            )
+            if upd.modified_count == 0:
+                continue
+            tracking = parcel.get("tracking_code") or parcel["parcel_id"]
+            await record_admin_event(
+                AdminEventType.PARCEL_STALE,
+                title=f"Colis stagnant — {tracking}",
+                message=f"Sans mouvement depuis plus de 7 jours ({parcel.get('status')}).",
+                href=f"/dashboard/parcels/{parcel['parcel_id']}",
+                metadata={
+                    "parcel_id": parcel["parcel_id"],
+                    "tracking_code": tracking,
+                    "parcel_status": parcel.get("status"),
+                },
+            )
+            emitted += 1
+        return emitted
+
+    await job_registry.run_periodic("admin_anomaly_notifier", 120, _pass)
 
 
 scheduler = AsyncIOScheduler()
-scheduler.add_job(_monthly_ranking_job, "cron", day=1, hour=1, minute=0)
-scheduler.add_job(_expire_stale_parcels, "interval", hours=1)
+scheduler.add_job(
+    job_registry.scheduled("monthly_ranking", _monthly_ranking_job),
+    "cron", day=1, hour=1, minute=0, id="monthly_ranking",
+)
+scheduler.add_job(
+    job_registry.scheduled("expire_parcels", _expire_stale_parcels),
+    "interval", hours=1, id="expire_parcels",
+)
+scheduler.add_job(
+    job_registry.scheduled("retention", _retention_job),
+    "cron", hour=3, minute=30, id="retention",
+)
+scheduler.add_job(
+    job_registry.scheduled("driver_stats_refresh", _driver_stats_refresh_job),
+    "cron", hour=2, minute=15, id="driver_stats_refresh",
+)
+scheduler.add_job(
+    job_registry.scheduled("finance_reconciliation", _finance_reconciliation_job),
+    "cron", minute=20, id="finance_reconciliation",
+)
+scheduler.add_job(
+    job_registry.scheduled("wallet_snapshots", _wallet_snapshots_job),
+    "cron", hour=1, minute=30, id="wallet_snapshots",
+)
+scheduler.add_job(
+    job_registry.scheduled("counters_reconcile", _counters_reconcile_job),
+    "cron", hour=2, minute=45, id="counters_reconcile",
+)
+scheduler.add_listener(lambda event: job_registry.record_missed(event.job_id), EVENT_JOB_MISSED)
+
+
+async def _run_scheduler() -> None:
+    """Le scheduler démarre en pause partout et ne tourne que chez le leader."""
+    scheduler.resume()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        scheduler.pause()
+
+
+def start_background_tasks() -> list[asyncio.Task]:
+    """
+    Boucles de fond du rôle worker. Chacune est gardée par un bail Mongo : avec
+    plusieurs process (`--workers N`, plusieurs conteneurs), une seule instance
+    l'exécute. Les workers du webhook WhatsApp réclament leurs entrées un par
+    un et tournent donc partout.
+    """
+    scheduler.start(paused=True)
+    exclusive = {
+        "auto_release_missions": _auto_release_stuck_missions,
+        "delivery_dispatch": _advance_delivery_dispatch_loop,
+        "gps_confirmation_reminders": _gps_confirmation_reminder_loop,
+        "admin_anomaly_notifier": _admin_anomaly_notifier_loop,
+        "scheduler": _run_scheduler,
+    }
+    tasks = [
+        asyncio.create_task(run_exclusive(name, factory), name=f"background:{name}")
+        for name, factory in exclusive.items()
+    ]
+    tasks.append(asyncio.create_task(run_whatsapp_inbox_workers(), name="background:whatsapp_inbox"))
+    return tasks
+
+
+async def stop_background_tasks(tasks: list[asyncio.Task]) -> None:
+    for task in tasks:
+        task.cancel()
+    # On attend la fin des tâches pour que les baux soient libérés.
+    await asyncio.gather(*tasks, return_exceptions=True)
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     await connect_db()
-    scheduler.start()
-    auto_release_task = asyncio.create_task(_auto_release_stuck_missions())
-    dispatch_task = asyncio.create_task(_advance_delivery_dispatch_loop())
-    gps_reminder_task = asyncio.create_task(_gps_confirmation_reminder_loop())
-    anomaly_notifier_task = asyncio.create_task(_admin_anomaly_notifier_loop())
-    logger.info("Denkma API started (with scheduler)")
+    tasks: list[asyncio.Task] = []
+    if settings.ROLE in {"api", "all"}:
+        # Alimente le flux SSE de ce process : nécessaire sur chaque worker HTTP.
+        tasks.append(asyncio.create_task(watch_admin_events_changes()))
+        # Invalide le cache des principaux quand un autre worker modifie un utilisateur.
+        tasks.append(asyncio.create_task(watch_principal_changes()))
+    if settings.ROLE in {"worker", "all"}:
+        tasks.extend(start_background_tasks())
+    tasks.append(asyncio.create_task(sample_event_loop_lag(), name="metrics:event_loop_lag"))
+    logger.info("Denkma API started (role=%s)", settings.ROLE)
     yield
     # Shutdown
-    auto_release_task.cancel()
-    dispatch_task.cancel()
-    gps_reminder_task.cancel()
-    anomaly_notifier_task.cancel()
-    scheduler.shutdown()
+    await stop_background_tasks(tasks)
     await close_db()
     logger.info("Denkma API stopped")
 
@@ -546,6 +638,22 @@ async def add_security_headers(request: Request, call_next):
     )
     return response
 
+# Ajouté après les middlewares HTTP : il les englobe et mesure la requête entière.
+app.add_middleware(MetricsMiddleware)
+
+
+@app.middleware("http")
+async def profile_mongo_commands(request: Request, call_next):
+    """Server-Timing + détection N+1 (désactivé par défaut, voir core/mongo_profiler.py)."""
+    profile = start_request_profile()
+    if profile is None:
+        return await call_next(request)
+    response = await call_next(request)
+    response.headers.append("Server-Timing", profile.server_timing())
+    route = request.scope.get("route")
+    report_request_profile(profile, request.method, getattr(route, "path", request.url.path))
+    return response
+
 # Les photos de profil sont désormais servies via l'endpoint authentifié
 # /api/users/photo/{filename}. StaticFiles reste monté en lecture seule pour
 # servir les URLs legacy déjà stockées en base — à retirer après migration
@@ -600,3 +708,62 @@ async def android_assetlinks():
 @app.get("/health", tags=["Health"])
 async def health():
     return {"status": "ok", "app": "denkma", "version": "1.0.0"}
+
+
+@app.get("/health/ready", tags=["Health"])
+async def health_ready():
+    """
+    Readiness (distinct de /health, la liveness) : Mongo joignable et index du
+    manifeste en place. Pendant une construction d'index, répond 503.
+    """
+    try:
+        await asyncio.wait_for(db.command("ping"), timeout=2)
+        mongo_ok = True
+    except Exception:
+        mongo_ok = False
+    indexes = {key: index_status.get(key) for key in ("state", "version", "errors")}
+    ready = mongo_ok and indexes["state"] in {"ready", "degraded"}
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not_ready", "mongo": mongo_ok, "indexes": indexes},
+    )
+
+
+def _metrics_unauthorized(request: Request) -> JSONResponse | None:
+    """Jeton Bearer METRICS_TOKEN exigé (s'il est configuré) sur /metrics et /health/jobs*."""
+    if settings.METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {settings.METRICS_TOKEN}":
+        return JSONResponse(status_code=401, content={"detail": "Unauthorized"})
+    return None
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """Métriques Prometheus du process (latences par route, appels externes, Mongo, boucle asyncio)."""
+    if unauthorized := _metrics_unauthorized(request):
+        return unauthorized
+    body = render_metrics() + render_prometheus(job_registry.local_snapshot())
+    return Response(content=body, media_type="text/plain; version=0.0.4")
+
+
+@app.get("/health/jobs", tags=["Health"])
+async def health_jobs(request: Request):
+    """
+    État des boucles de fond et jobs planifiés (dernier passage, retard, échecs).
+    Expose erreurs et propriétaires (hôte:pid) : même jeton que /metrics.
+    """
+    if unauthorized := _metrics_unauthorized(request):
+        return unauthorized
+    jobs = await list_job_status()
+    degraded = [job["name"] for job in jobs if job.get("lagging") or job.get("stale")]
+    return {"status": "degraded" if degraded else "ok", "degraded": degraded, "jobs": jobs}
+
+
+@app.get("/health/jobs/metrics", tags=["Health"], include_in_schema=False)
+async def health_jobs_metrics(request: Request):
+    """Mêmes données au format d'exposition Prometheus."""
+    if unauthorized := _metrics_unauthorized(request):
+        return unauthorized
+    return PlainTextResponse(
+        render_prometheus(await list_job_status()),
+        media_type="text/plain; version=0.0.4",
+    )
@@ -1,6 +1,7 @@
 """
 Router admin : tableau de bord, gestion globale colis/relais/drivers/wallets.
 """
+import asyncio
 import mimetypes
 import uuid
 from calendar import monthrange
@@ -15,24 +16,35 @@ from pydantic import BaseModel, Field
 
 from config import settings
 from core.dependencies import require_role
-from core.exceptions import not_found_exception, bad_request_exception
+from core.exceptions import conflict_exception, not_found_exception, bad_request_exception
 from core.limiter import limiter
+from core.pagination import paginate
+from core.principal_cache import invalidate_principal
 from core.security import hash_password
 from database import db
 from models.common import UserRole, ParcelStatus
 from models.delivery import MissionStatus
 from models.wallet import TransactionType
 from services.parcel_service import (
+    PARCEL_LIST_PROJECTION,
+    PICKUP_DEADLINE_UNSET,
     _record_event,
     get_assigned_mission_auto_release_minutes,
     get_delivery_dispatch_settings,
     normalize_assigned_mission_auto_release_minutes,
     normalize_delivery_dispatch_settings,
+    pickup_deadline_fields,
     sync_active_mission_with_parcel,
 )
 from services.pricing_service import get_pricing_settings
 from services.notification_service import notify_payout_result, send_targeted_notifications
 from services.admin_events_service import AdminEventType, record_admin_event
+from services.counters_service import (
+    counter,
+    load_counters,
+    record_payout_change,
+    record_user_change,
+)
 from core.date_filters import date_range_query, parse_date_range
 from services.whatsapp_support_service import (
     MAX_WHATSAPP_MEDIA_BYTES,
@@ -61,10 +73,17 @@ from services.user_service import (
     is_referral_sponsor_enabled_for_user,
 )
 from services.referral_service import mark_referral_rewarded
+from services.archive_service import find_one_with_archive, find_with_archive
+from services.retention_service import list_retention_runs
+from services.finance_reconciliation_service import (
+    get_reconciliation_report,
+    run_reconciliation,
+)
 from services.performance_rewards_service import (
     get_performance_rewards_settings,
     set_performance_rewards_settings,
 )
+from services.ledger_service import audit_wallet
 from services.wallet_service import (
     credit_wallet,
     compute_delivery_commission_breakdown,
@@ -1261,7 +1280,6 @@ async def resolve_phones(
 @router.get("/dashboard", summary="KPIs temps réel")
 async def dashboard(_admin=Depends(require_admin_dep)):
     now = datetime.now(timezone.utc)
-    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
     fleet_cutoff = now - timedelta(hours=1)
     signal_lost_cutoff = now - timedelta(minutes=20)
     long_mission_cutoff = now - timedelta(hours=3)
@@ -1288,43 +1306,51 @@ async def dashboard(_admin=Depends(require_admin_dep)):
         ParcelStatus.REDIRECTED_TO_RELAY.value,
     ]
 
-    total_parcels = await db.parcels.count_documents({})
-    parcels_today = await db.parcels.count_documents({"created_at": {"$gte": today_start}})
-    delivered     = await db.parcels.count_documents({"status": ParcelStatus.DELIVERED.value})
-    failed        = await db.parcels.count_documents({"status": ParcelStatus.DELIVERY_FAILED.value})
-    active_parcels = await db.parcels.count_documents({"status": {"$in": active_statuses}})
-    pending_payouts = await db.payout_requests.count_documents({"status": "pending"})
-    active_relays = await db.relay_points.count_documents({"is_active": True})
-    active_drivers = await db.users.count_documents({"role": UserRole.DRIVER.value, "is_active": True})
-    live_fleet = await db.delivery_missions.count_documents({"location_updated_at": {"$gte": fleet_cutoff}})
-    signal_lost = await db.delivery_missions.count_documents({
-        "status": {"$in": ["assigned", "in_progress"]},
-        "location_updated_at": {"$lt": signal_lost_cutoff},
-    })
-    critical_delay = await db.delivery_missions.count_documents({
-        "status": {"$in": ["assigned", "in_progress"]},
-        "assigned_at": {"$lt": long_mission_cutoff},
-    })
-    stale_parcels = await db.parcels.count_documents({
-        "status": {"$in": stale_statuses},
-        "updated_at": {"$lt": stale_cutoff},
-    })
-    payment_blocked_parcels = await db.parcels.count_documents({
-        "status": {"$in": payment_blocked_statuses},
-        "payment_status": {"$ne": "paid"},
-        "payment_override": {"$ne": True},
-    })
+    # Volumes cumulés : compteurs incrémentaux (services/counters_service.py).
+    counters, today_counters = await load_counters(now)
+    by_status = counter(counters, "parcels.by_status", {})
+    total_parcels = counter(counters, "parcels.total")
+    parcels_today = counter(today_counters, "parcels_created")
+    delivered = by_status.get(ParcelStatus.DELIVERED.value, 0)
+    failed = by_status.get(ParcelStatus.DELIVERY_FAILED.value, 0)
+    active_parcels = sum(by_status.get(status, 0) for status in active_statuses)
+    pending_payouts = counter(counters, "payouts.by_status.pending")
+    active_drivers = counter(counters, "users.active_drivers")
+    ca = counter(counters, "revenue_xof", 0.0)
+
+    # Indicateurs relatifs à l'heure courante : bornés par les colis / missions
+    # en cours (index status, location_updated_at), pas par l'historique.
+    (
+        active_relays,
+        live_fleet,
+        signal_lost,
+        critical_delay,
+        stale_parcels,
+        payment_blocked_parcels,
+    ) = await asyncio.gather(
+        db.relay_points.count_documents({"is_active": True}),
+        db.delivery_missions.count_documents({"location_updated_at": {"$gte": fleet_cutoff}}),
+        db.delivery_missions.count_documents({
+            "status": {"$in": ["assigned", "in_progress"]},
+            "location_updated_at": {"$lt": signal_lost_cutoff},
+        }),
+        db.delivery_missions.count_documents({
+            "status": {"$in": ["assigned", "in_progress"]},
+            "assigned_at": {"$lt": long_mission_cutoff},
+        }),
+        db.parcels.count_documents({
+            "status": {"$in": stale_statuses},
+            "updated_at": {"$lt": stale_cutoff},
+        }),
+        db.parcels.count_documents({
+            "status": {"$in": payment_blocked_statuses},
+            "payment_status": {"$ne": "paid"},
+            "payment_override": {"$ne": True},
+        }),
+    )
 
     success_rate = round(delivered / total_parcels * 100, 1) if total_parcels else 0.0
 
-    # Chiffre d'affaires : somme des paid_price des colis livrés
-    pipeline = [
-        {"$match": {"status": ParcelStatus.DELIVERED.value, "paid_price": {"$ne": None}}},
-        {"$group": {"_id": None, "total": {"$sum": "$paid_price"}}},
-    ]
-    ca_result = await db.parcels.aggregate(pipeline).to_list(length=1)
-    ca = ca_result[0]["total"] if ca_result else 0.0
-
     return {
         "total_parcels":  total_parcels,
         "parcels_today":  parcels_today,
@@ -1355,6 +1381,8 @@ async def admin_list_parcels(
     to_date: Optional[str] = Query(None, description="Date fin YYYY-MM-DD (UTC)"),
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = Query(None, description="Curseur next_cursor de la page précédente"),
+    include_total: bool = False,
     _admin=Depends(require_admin_dep),
 ):
     query: dict = {}
@@ -1497,16 +1525,12 @@ async def admin_list_parcels(
         }
         query["parcel_id"] = {"$in": sorted(finance_parcel_ids) or ["__none__"]}
 
-    safe_limit = min(max(limit, 1), 1000)
-    safe_skip = max(skip, 0)
-    cursor = (
-        db.parcels.find(query, {"_id": 0})
-        .sort("created_at", -1)
-        .skip(safe_skip)
-        .limit(safe_limit)
+    page = await paginate(
+        db.parcels, query,
+        id_field="parcel_id", limit=limit, cursor=cursor, skip=skip, include_total=include_total,
+        projection=PARCEL_LIST_PROJECTION,
     )
-    total = await db.parcels.count_documents(query)
-    parcels = await cursor.to_list(length=safe_limit)
+    parcels = page.items
     await _restore_admin_parcel_phones(parcels)
 
     parcel_ids = [str(parcel.get("parcel_id") or "") for parcel in parcels if parcel.get("parcel_id")]
@@ -1620,7 +1644,7 @@ async def admin_list_parcels(
         parcel["platform_commission_received"] = platform_commission_received_by_parcel.get(parcel_id, False)
         parcel["platform_commission_debt"] = platform_commission_debt_by_parcel.get(parcel_id, False)
         parcel["platform_commission_offered"] = platform_commission_offered_by_parcel.get(parcel_id, False)
-    return {"parcels": parcels, "total": total}
+    return page.to_response("parcels")
 
 
 @router.get("/parcels/overview", summary="Synthese colis (Admin)")
@@ -1852,12 +1876,9 @@ async def admin_drivers(
     active: Optional[bool] = None,
     _admin=Depends(require_admin_dep),
 ):
-    from services.ranking_service import refresh_driver_stats_for_period
+    from services.ranking_service import count_ranked_drivers, current_period, get_driver_stats_for_drivers
 
-    now = datetime.now(timezone.utc)
-    period = f"{now.year}-{now.month:02d}"
-    period_stats = await refresh_driver_stats_for_period(period)
-    stats_by_driver = {s.get("driver_id"): s for s in period_stats if s.get("driver_id")}
+    period = current_period()
 
     query = {"role": UserRole.DRIVER.value}
     if active is not None:
@@ -1865,6 +1886,8 @@ async def admin_drivers(
     cursor = db.users.find(query, {"_id": 0}).sort("created_at", -1)
     drivers = await cursor.to_list(length=200)
     driver_ids = [d["user_id"] for d in drivers if d.get("user_id")]
+    stats_by_driver = await get_driver_stats_for_drivers(period, driver_ids)
+    total_ranked = await count_ranked_drivers(period)
     mission_counts = {}
     if driver_ids:
         mission_count_rows = await db.delivery_missions.aggregate([
@@ -1902,7 +1925,7 @@ async def admin_drivers(
         d["monthly_success_rate"] = stat.get("success_rate", 0)
         d["monthly_earned_xof"] = stat.get("total_earned_xof", 0)
         d["monthly_bonus_paid_xof"] = stat.get("bonus_paid_xof", 0)
-        d["total_ranked_drivers"] = len(period_stats)
+        d["total_ranked_drivers"] = total_ranked
         d["profile_picture_status"] = _profile_picture_status(d)
         d["active_mission"] = active_missions.get(driver_id)
     return {"drivers": drivers}
@@ -1920,6 +1943,17 @@ async def admin_pending_payouts(
     return {"payouts": await cursor.to_list(length=200)}
 
 
+@router.get("/wallets/{wallet_id}/audit", summary="Auditer le solde d'un wallet contre le grand livre")
+async def admin_audit_wallet(
+    wallet_id: str,
+    _admin=Depends(require_admin_dep),
+):
+    audit = await audit_wallet(wallet_id)
+    if not audit:
+        raise not_found_exception("Wallet")
+    return audit
+
+
 @router.put("/wallets/payouts/{payout_id}/approve", summary="Valider retrait")
 @limiter.limit("10/minute")
 async def approve_payout(
@@ -1967,6 +2001,7 @@ async def approve_payout(
             {"$set": {"status": "pending", "updated_at": datetime.now(timezone.utc)}},
         )
         raise bad_request_exception("Solde bloqué incohérent pour cette demande")
+    await record_payout_change(payout, {**payout, "status": "approved"})
 
     wallet_after = await db.wallets.find_one({"wallet_id": payout["wallet_id"]}, {"_id": 0})
     await record_wallet_transaction(
@@ -2099,6 +2134,26 @@ async def admin_users_overview(
     user_query = date_range_query(from_date, to_date, field="created_at")
     parcel_query = date_range_query(from_date, to_date, field="created_at")
 
+    if not user_query:
+        # Sans période : lecture directe des compteurs incrémentaux.
+        counters, _today = await load_counters()
+        by_status = counter(counters, "parcels.by_status", {})
+        return {
+            "users": {
+                "total": counter(counters, "users.total"),
+                "banned": counter(counters, "users.banned"),
+                "kyc_verified": counter(counters, "users.kyc_verified"),
+                "phone_verified": counter(counters, "users.phone_verified"),
+                "by_role": counter(counters, "users.by_role", {}),
+            },
+            "parcels": {
+                "total": counter(counters, "parcels.total"),
+                "delivered": by_status.get(ParcelStatus.DELIVERED.value, 0),
+                "cancelled": by_status.get(ParcelStatus.CANCELLED.value, 0),
+                "by_mode": counter(counters, "parcels.by_mode", {}),
+            },
+        }
+
     user_rows = await db.users.aggregate([
         {"$match": user_query},
         {"$group": {"_id": "$role", "count": {"$sum": 1}}},
@@ -2155,22 +2210,25 @@ async def admin_list_users(
     role: str = None,
     from_date: Optional[str] = Query(None, description="Date début YYYY-MM-DD (UTC)"),
     to_date: Optional[str] = Query(None, description="Date fin YYYY-MM-DD (UTC)"),
+    cursor: Optional[str] = Query(None, description="Curseur next_cursor de la page précédente"),
+    include_total: bool = False,
     _admin=Depends(require_admin_dep),
 ):
-    from services.ranking_service import refresh_driver_stats_for_period
-
-    now = datetime.now(timezone.utc)
-    period = f"{now.year}-{now.month:02d}"
-    period_stats = await refresh_driver_stats_for_period(period)
-    stats_by_driver = {s.get("driver_id"): s for s in period_stats if s.get("driver_id")}
+    from services.ranking_service import count_ranked_drivers, current_period, get_driver_stats_for_drivers
 
     query = {}
     if role:
         query["role"] = role
     query.update(date_range_query(from_date, to_date, field="created_at"))
     
-    cursor = db.users.find(query, {"_id": 0}).skip(skip).limit(limit).sort("created_at", -1)
-    users = await cursor.to_list(length=limit)
+    page = await paginate(
+        db.users, query, id_field="user_id", limit=limit, cursor=cursor, skip=skip, include_total=include_total,
+    )
+    users = page.items
+    period = current_period()
+    driver_ids = [user["user_id"] for user in users if user.get("role") == UserRole.DRIVER.value and user.get("user_id")]
+    stats_by_driver = await get_driver_stats_for_drivers(period, driver_ids)
+    total_ranked = await count_ranked_drivers(period) if driver_ids else 0
     for user in users:
         user["profile_picture_status"] = _profile_picture_status(user)
         if user.get("role") == UserRole.DRIVER.value:
@@ -2179,10 +2237,9 @@ async def admin_list_users(
             user["monthly_deliveries_success"] = stat.get("deliveries_success", 0)
             user["monthly_success_rate"] = stat.get("success_rate", 0)
             user["monthly_earned_xof"] = stat.get("total_earned_xof", 0)
-            user["total_ranked_drivers"] = len(period_stats)
-    total = await db.users.count_documents(query)
-    
-    return {"users": users, "total": total}
+            user["total_ranked_drivers"] = total_ranked
+
+    return page.to_response("users")
 
 
 @router.post("/notifications/send", summary="Envoyer une notification ciblée")
@@ -2310,6 +2367,7 @@ async def admin_moderate_profile_photo(
         updates["profile_picture_rejected_reason"] = None
 
     await db.users.update_one({"user_id": user_id}, {"$set": updates})
+    invalidate_principal(user_id)
     await _record_event(
         event_type=f"PROFILE_PHOTO_{body.status.upper()}",
         actor_id=admin_user.get("user_id"),
@@ -2362,6 +2420,8 @@ async def admin_moderate_user_kyc(
         updates["is_available"] = False
 
     await db.users.update_one({"user_id": user_id}, {"$set": updates})
+    invalidate_principal(user_id)
+    await record_user_change(user, {**user, **updates})
     await _record_event(
         event_type=f"USER_KYC_{body.status.upper()}",
         actor_id=admin_user.get("user_id"),
@@ -2476,15 +2536,14 @@ async def admin_user_detail(
 
     driver_performance = None
     if user.get("role") == UserRole.DRIVER.value or await db.delivery_missions.count_documents({"driver_id": user_id}) > 0:
-        from services.ranking_service import refresh_driver_stats_for_period
+        from services.ranking_service import count_ranked_drivers
 
-        period_stats = await refresh_driver_stats_for_period(current_period)
-        stat = next((item for item in period_stats if item.get("driver_id") == user_id), None)
+        stat = await db.driver_stats.find_one({"driver_id": user_id, "period": current_period}, {"_id": 0})
         if stat:
             driver_performance = {
                 "period": current_period,
                 "rank": stat.get("rank"),
-                "total_ranked_drivers": len(period_stats),
+                "total_ranked_drivers": await count_ranked_drivers(current_period),
                 "deliveries_success": stat.get("deliveries_success", 0),
                 "deliveries_total": stat.get("deliveries_total", 0),
                 "success_rate": stat.get("success_rate", 0),
@@ -2718,9 +2777,11 @@ async def admin_ban_user(
     )
     if result.matched_count == 0:
         raise not_found_exception("Utilisateur")
+    invalidate_principal(user_id)
 
     await db.user_sessions.delete_many({"user_id": user_id})
     after = await db.users.find_one({"user_id": user_id}, {"_id": 0})
+    await record_user_change(before, after)
 
     await _record_event(
         event_type="USER_BANNED",
@@ -2780,8 +2841,10 @@ async def admin_unban_user(
     )
     if result.matched_count == 0:
         raise not_found_exception("Utilisateur")
+    invalidate_principal(user_id)
 
     after = await db.users.find_one({"user_id": user_id}, {"_id": 0})
+    await record_user_change(before, after)
 
     await _record_event(
         event_type="USER_UNBANNED",
@@ -3074,7 +3137,7 @@ async def get_parcel_audit(parcel_id: str, _admin=Depends(require_admin_dep)):
     (Scans, traces GPS, etc.) et noms des intervenants.
     """
     from services.parcel_service import get_parcel_timeline
-    parcel = await db.parcels.find_one({"parcel_id": parcel_id}, {"_id": 0})
+    parcel = await find_one_with_archive("parcels", {"parcel_id": parcel_id}, {"_id": 0})
     if not parcel:
         raise not_found_exception("Colis")
         
@@ -3096,8 +3159,7 @@ async def get_parcel_audit(parcel_id: str, _admin=Depends(require_admin_dep)):
                 event["actor_name"] = actor["name"]
 
     # On cherche aussi les traces GPS associées aux missions de ce colis
-    missions_cursor = db.delivery_missions.find({"parcel_id": parcel_id}, {"_id": 0})
-    missions = await missions_cursor.to_list(length=10)
+    missions = await find_with_archive("delivery_missions", {"parcel_id": parcel_id}, {"_id": 0}, length=10)
     
     # Enrichir les missions avec le nom du livreur
     for m in missions:
@@ -3563,7 +3625,7 @@ async def get_parcel_audit_rich(parcel_id: str, _admin=Depends(require_admin_dep
     """Retourne l'historique complet avec trace, route et durees de mission."""
     from services.parcel_service import get_parcel_timeline
 
-    parcel = await db.parcels.find_one({"parcel_id": parcel_id}, {"_id": 0})
+    parcel = await find_one_with_archive("parcels", {"parcel_id": parcel_id}, {"_id": 0})
     if not parcel:
         raise not_found_exception("Colis")
     await _restore_admin_parcel_phones([parcel])
@@ -3581,8 +3643,7 @@ async def get_parcel_audit_rich(parcel_id: str, _admin=Depends(require_admin_dep
             if actor:
                 event["actor_name"] = actor["name"]
 
-    missions_cursor = db.delivery_missions.find({"parcel_id": parcel_id}, {"_id": 0})
-    missions = await missions_cursor.to_list(length=10)
+    missions = await find_with_archive("delivery_missions", {"parcel_id": parcel_id}, {"_id": 0}, length=10)
     commission_breakdown = compute_delivery_commission_breakdown(parcel)
     origin_relay_credit_tx = await db.wallet_transactions.find_one(
         {
@@ -3705,13 +3766,13 @@ async def get_user_history(user_id: str, _admin=Depends(require_admin_dep)):
     if not user:
         raise not_found_exception("Utilisateur")
 
-    parcels_sent = await db.parcels.find({"sender_user_id": user_id}, {"_id": 0}).sort("updated_at", -1).limit(100).to_list(length=100)
+    parcels_sent = await db.parcels.find({"sender_user_id": user_id}, PARCEL_LIST_PROJECTION).sort("updated_at", -1).limit(100).to_list(length=100)
     parcels_received = await db.parcels.find({
         "$or": [
             {"recipient_phone": user.get("phone")},
             {"recipient_user_id": user_id}
         ]
-    }, {"_id": 0}).sort("updated_at", -1).limit(100).to_list(length=100)
+    }, PARCEL_LIST_PROJECTION).sort("updated_at", -1).limit(100).to_list(length=100)
 
     missions = []
     if user.get("role") == UserRole.DRIVER.value:
@@ -3927,181 +3988,27 @@ async def get_finance_monthly_summary(
 
 
 @router.get("/finance/reconciliation", summary="Rapport de reconciliation finance et operations")
-async def get_finance_reconciliation(_admin=Depends(require_admin_dep)):
-    wallets = await db.wallets.find(
-        {},
-        {
-            "_id": 0,
-            "wallet_id": 1,
-            "owner_id": 1,
-            "owner_type": 1,
-            "balance": 1,
-            "pending": 1,
-            "currency": 1,
-            "updated_at": 1,
-        },
-    ).to_list(length=2000)
-    payouts = await db.payout_requests.find(
-        {},
-        {
-            "_id": 0,
-            "payout_id": 1,
-            "wallet_id": 1,
-            "owner_id": 1,
-            "amount": 1,
-            "method": 1,
-            "phone": 1,
-            "status": 1,
-            "created_at": 1,
-            "updated_at": 1,
-        },
-    ).to_list(length=5000)
-    txs = await db.wallet_transactions.find(
-        {"reference": {"$ne": None}},
-        {
-            "_id": 0,
-            "wallet_id": 1,
-            "reference": 1,
-            "tx_type": 1,
-            "amount": 1,
-            "created_at": 1,
-        },
-    ).to_list(length=10000)
+async def get_finance_reconciliation(
+    limit: int = Query(20, ge=1, le=200),
+    _admin=Depends(require_admin_dep),
+):
+    """
+    Écarts ouverts issus de la dernière réconciliation (job horaire). Tant
+    qu'aucune exécution n'a eu lieu, le rapport est vide (`last_run_id` nul) :
+    POST /finance/reconciliation/run lance une passe.
+    """
+    return await get_reconciliation_report(limit)
 
-    tx_index = {
-        (tx.get("wallet_id"), tx.get("reference"), tx.get("tx_type")): tx
-        for tx in txs
-        if tx.get("reference")
-    }
 
-    pending_by_wallet: dict[str, float] = {}
-    for payout in payouts:
-        if payout.get("status") == "pending":
-            wallet_id = payout.get("wallet_id")
-            pending_by_wallet[wallet_id] = pending_by_wallet.get(wallet_id, 0.0) + float(payout.get("amount", 0.0) or 0.0)
-
-    wallet_pending_mismatches = []
-    negative_wallets = []
-    for wallet in wallets:
-        wallet_id = wallet["wallet_id"]
-        expected_pending = round(pending_by_wallet.get(wallet_id, 0.0), 2)
-        actual_pending = round(float(wallet.get("pending", 0.0) or 0.0), 2)
-        if abs(actual_pending - expected_pending) > 0.01:
-            wallet_pending_mismatches.append({
-                "wallet_id": wallet_id,
-                "owner_id": wallet.get("owner_id"),
-                "owner_type": wallet.get("owner_type"),
-                "wallet_pending": actual_pending,
-                "expected_pending": expected_pending,
-                "updated_at": wallet.get("updated_at"),
-            })
-        if float(wallet.get("balance", 0.0) or 0.0) < 0 or actual_pending < 0:
-            negative_wallets.append({
-                "wallet_id": wallet_id,
-                "owner_id": wallet.get("owner_id"),
-                "owner_type": wallet.get("owner_type"),
-                "balance": float(wallet.get("balance", 0.0) or 0.0),
-                "pending": actual_pending,
-                "updated_at": wallet.get("updated_at"),
-            })
-
-    payout_ledger_gaps = []
-    expected_tx_types = {
-        "pending": TransactionType.PENDING.value,
-        "approved": TransactionType.DEBIT.value,
-        "rejected": TransactionType.CREDIT.value,
-    }
-    for payout in payouts:
-        expected_type = expected_tx_types.get(payout.get("status"))
-        if not expected_type:
-            continue
-        key = (payout.get("wallet_id"), payout.get("payout_id"), expected_type)
-        if key not in tx_index:
-            payout_ledger_gaps.append({
-                "payout_id": payout.get("payout_id"),
-                "wallet_id": payout.get("wallet_id"),
-                "owner_id": payout.get("owner_id"),
-                "status": payout.get("status"),
-                "expected_tx_type": expected_type,
-                "amount": float(payout.get("amount", 0.0) or 0.0),
-                "updated_at": payout.get("updated_at"),
-            })
-
-    active_missions = await db.delivery_missions.find(
-        {"status": {"$in": ["pending", "assigned", "in_progress"]}},
-        {"_id": 0, "mission_id": 1, "parcel_id": 1, "status": 1, "driver_id": 1, "updated_at": 1},
-    ).to_list(length=1000)
-    active_parcel_statuses = {
-        ParcelStatus.CREATED.value,
-        ParcelStatus.DROPPED_AT_ORIGIN_RELAY.value,
-        ParcelStatus.IN_TRANSIT.value,
-        ParcelStatus.AT_DESTINATION_RELAY.value,
-        ParcelStatus.AVAILABLE_AT_RELAY.value,
-        ParcelStatus.OUT_FOR_DELIVERY.value,
-        ParcelStatus.REDIRECTED_TO_RELAY.value,
-        ParcelStatus.INCIDENT_REPORTED.value,
-        ParcelStatus.SUSPENDED.value,
-    }
-    mission_parcel_mismatches = []
-    if active_missions:
-        parcel_ids = [mission["parcel_id"] for mission in active_missions if mission.get("parcel_id")]
-        parcels = await db.parcels.find(
-            {"parcel_id": {"$in": parcel_ids}},
-            {"_id": 0, "parcel_id": 1, "status": 1, "payment_status": 1, "payment_override": 1, "updated_at": 1},
-        ).to_list(length=len(parcel_ids))
-        parcel_map = {parcel["parcel_id"]: parcel for parcel in parcels}
-        for mission in active_missions:
-            parcel = parcel_map.get(mission.get("parcel_id"))
-            if not parcel or parcel.get("status") not in active_parcel_statuses:
-                mission_parcel_mismatches.append({
-                    "mission_id": mission.get("mission_id"),
-                    "parcel_id": mission.get("parcel_id"),
-                    "mission_status": mission.get("status"),
-                    "parcel_status": parcel.get("status") if parcel else None,
-                    "driver_id": mission.get("driver_id"),
-                    "updated_at": mission.get("updated_at"),
-                })
-
-    delivered_unpaid = await db.parcels.find(
-        {
-            "status": ParcelStatus.DELIVERED.value,
-            "payment_status": {"$ne": "paid"},
-            "payment_override": {"$ne": True},
-            "who_pays": {"$ne": "recipient"},
-        },
-        {
-            "_id": 0,
-            "parcel_id": 1,
-            "tracking_code": 1,
-            "payment_status": 1,
-            "who_pays": 1,
-            "updated_at": 1,
-        },
-    ).to_list(length=100)
-
-    return {
-        "summary": {
-            "wallets_checked": len(wallets),
-            "payouts_checked": len(payouts),
-            "wallet_pending_mismatches": len(wallet_pending_mismatches),
-            "negative_wallets": len(negative_wallets),
-            "payout_ledger_gaps": len(payout_ledger_gaps),
-            "mission_parcel_mismatches": len(mission_parcel_mismatches),
-            "delivered_unpaid": len(delivered_unpaid),
-            "issues_total": (
-                len(wallet_pending_mismatches)
-                + len(negative_wallets)
-                + len(payout_ledger_gaps)
-                + len(mission_parcel_mismatches)
-                + len(delivered_unpaid)
-            ),
-        },
-        "wallet_pending_mismatches": wallet_pending_mismatches[:20],
-        "negative_wallets": negative_wallets[:20],
-        "payout_ledger_gaps": payout_ledger_gaps[:20],
-        "mission_parcel_mismatches": mission_parcel_mismatches[:20],
-        "delivered_unpaid": delivered_unpaid[:20],
-    }
+@router.post("/finance/reconciliation/run", summary="Relancer la reconciliation finance")
+async def run_finance_reconciliation(
+    full: bool = False,
+    _admin=Depends(require_admin_dep),
+):
+    run = await run_reconciliation(full=full)
+    if run is None:
+        raise conflict_exception("Une réconciliation est déjà en cours")
+    return {"run": run, "report": await get_reconciliation_report()}
 
 
 @router.post("/missions/{mission_id}/reassign", summary="Reassigner une mission a un autre livreur")
@@ -4214,6 +4121,7 @@ async def admin_reassign_mission(
             "admin_assignment_status": "awaiting_driver_response",
             "commission_charge_mode": "wallet_hold",
         })
+        mission_unset.update(PICKUP_DEADLINE_UNSET)
         await db.delivery_missions.update_one(
             {"mission_id": mission_id},
             {"$set": mission_set, "$unset": mission_unset},
@@ -4227,6 +4135,7 @@ async def admin_reassign_mission(
             "driver_id": body.new_driver_id,
             "status": MissionStatus.ASSIGNED.value,
             "assigned_at": now,
+            **pickup_deadline_fields(now, await get_assigned_mission_auto_release_minutes()),
             "admin_assignment_status": "forced",
             "commission_charge_mode": assignment_mode,
             "wallet_balance_required_xof": 0.0,
@@ -4320,10 +4229,15 @@ async def admin_resolve_incident(
     from models.delivery import MissionStatus
 
     # 1. Clôturer l'ancienne mission si elle est encore active
-    await db.delivery_missions.update_one(
+    closed_mission = await db.delivery_missions.find_one_and_update(
         {"parcel_id": parcel_id, "status": {"$in": ["assigned", "in_progress", "incident_reported"]}},
-        {"$set": {"status": MissionStatus.FAILED.value, "completed_at": now, "updated_at": now}}
+        {"$set": {"status": MissionStatus.FAILED.value, "completed_at": now, "updated_at": now}},
+        projection={"_id": 0, "driver_id": 1},
     )
+    if closed_mission and closed_mission.get("driver_id"):
+        from services.ranking_service import update_driver_stat
+
+        await update_driver_stat(closed_mission["driver_id"])
 
     actor = {"actor_id": _admin["user_id"] if isinstance(_admin, dict) else "admin_system", "actor_role": "admin"}
 
@@ -4408,19 +4322,13 @@ async def admin_trigger_monthly(
     Déclenche le calcul des stats et le versement des bonus pour une période donnée.
     """
     from services.ranking_service import (
-        compute_driver_stats_for_period, 
+        refresh_driver_stats_for_period,
         pay_monthly_driver_bonuses,
         compute_relay_stats_and_pay_bonuses
     )
     
     # 1. Stats Drivers
-    stats = await compute_driver_stats_for_period(period)
-    for stat in stats:
-        await db.driver_stats.update_one(
-            {"driver_id": stat["driver_id"], "period": period},
-            {"$set": stat},
-            upsert=True,
-        )
+    await refresh_driver_stats_for_period(period)
     
     # 2. Bonus Drivers
     await pay_monthly_driver_bonuses(period)
@@ -4436,13 +4344,9 @@ async def admin_get_driver_stats(
     period: str,
     _admin=Depends(require_admin_dep),
 ):
-    from services.ranking_service import refresh_driver_stats_for_period
+    from services.ranking_service import get_driver_stats_for_period
 
-    await refresh_driver_stats_for_period(period)
-    stats = await db.driver_stats.find(
-        {"period": period},
-        {"_id": 0},
-    ).sort("rank", 1).to_list(length=500)
+    stats = await get_driver_stats_for_period(period, limit=500)
     driver_ids = [s.get("driver_id") for s in stats if s.get("driver_id")]
     drivers = await db.users.find(
         {"user_id": {"$in": driver_ids}},
@@ -4692,6 +4596,14 @@ async def admin_get_audit_log(
     return {"events": events}
 
 
+@router.get("/retention/runs", summary="Rapports du job de rétention (archivage / TTL)")
+async def retention_runs(
+    limit: int = Query(20, ge=1, le=100),
+    _admin=Depends(require_admin_dep),
+):
+    return {"runs": await list_retention_runs(limit)}
+
+
 @router.put("/wallets/payouts/{payout_id}/reject", summary="Rejeter retrait")
 @limiter.limit("10/minute")
 async def reject_payout(
@@ -4738,6 +4650,7 @@ async def reject_payout(
             {"$set": {"status": "pending", "updated_at": datetime.now(timezone.utc)}},
         )
         raise bad_request_exception("Solde bloqué incohérent pour cette demande")
+    await record_payout_change(payout, {**payout, "status": "rejected"})
 
     wallet_after = await db.wallets.find_one({"wallet_id": payout["wallet_id"]}, {"_id": 0})
     await record_wallet_transaction(
@@ -5,10 +5,14 @@ Un seul endpoint alimente la sidebar (badges), la section "À traiter" du home,
 et sert de source de vérité pour les compteurs d'urgence. Chaque item retourne
 assez d'infos pour être traité inline sans navigation supplémentaire.
 """
+import asyncio
+import json
 from datetime import datetime, timedelta, timezone
 from typing import Any, Optional
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Header, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 
 from core.dependencies import require_role
 from core.exceptions import not_found_exception
@@ -16,10 +20,13 @@ from core.date_filters import parse_date_range
 from database import db
 from models.common import UserRole, ParcelStatus
 from services.admin_events_service import (
+    broker,
     count_unread,
     list_admin_events,
+    list_admin_events_after,
     mark_all_read,
     mark_event_read,
+    public_event,
 )
 
 router = APIRouter()
@@ -439,6 +446,63 @@ async def admin_events_feed(
     return {"events": events, "unread_count": unread}
 
 
+# Commentaire SSE envoyé en l'absence d'événement : garde la connexion ouverte
+# derrière les proxies (Railway coupe les connexions inactives ~60 s).
+SSE_HEARTBEAT_SECONDS = 20
+
+
+def _sse_frame(event: dict[str, Any]) -> str:
+    data = json.dumps(jsonable_encoder(event), ensure_ascii=False)
+    return f"id: {event['event_id']}\nevent: admin_event\ndata: {data}\n\n"
+
+
+@router.get("/events/stream", summary="Flux temps réel des événements admin (SSE)")
+async def admin_events_stream(
+    request: Request,
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    _admin=Depends(require_admin_dep),
+):
+    """
+    Server-Sent Events : pousse chaque nouvel événement dès son insertion.
+    À la reconnexion, le navigateur renvoie `Last-Event-ID` et on rejoue les
+    événements manqués depuis `admin_events`. Hors reconnexion, aucune requête
+    Mongo n'est faite tant que la connexion reste ouverte.
+    """
+    admin_id = _admin_id(_admin)
+    # Abonnement avant le rejeu : un événement inséré pendant le rejeu n'est
+    # pas perdu (au pire reçu deux fois, le client déduplique par event_id).
+    queue = broker.subscribe()
+
+    async def _stream():
+        try:
+            yield "retry: 3000\n\n"
+            if last_event_id:
+                for event in await list_admin_events_after(admin_id, last_event_id):
+                    yield _sse_frame(event)
+            while True:
+                if await request.is_disconnected():
+                    break
+                try:
+                    doc = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if doc is None:
+                    break
+                yield _sse_frame(public_event(doc, admin_id))
+        finally:
+            broker.unsubscribe(queue)
+
+    return StreamingResponse(
+        _stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
 @router.get("/events/unread-count", summary="Nombre d'événements non lus")
 async def admin_events_unread_count(_admin=Depends(require_admin_dep)):
     return {"unread_count": await count_unread(_admin_id(_admin))}
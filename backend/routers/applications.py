@@ -15,9 +15,11 @@ from config import settings
 from core.dependencies import get_current_user, require_role
 from core.exceptions import not_found_exception, bad_request_exception
 from core.date_filters import date_range_query
+from core.principal_cache import invalidate_principal
 from database import db
 from models.common import UserRole, GeoPin, clean_optional_text
 from services.admin_events_service import AdminEventType, record_admin_event
+from services.counters_service import USER_COUNTER_PROJECTION, record_user_change
 from services.notification_service import notify_application_result
 
 router = APIRouter()
@@ -407,6 +409,8 @@ async def approve_application(
                 "updated_at": now
             }},
         )
+        invalidate_principal(user_id)
+        await record_user_change(user, {**user, "role": UserRole.DRIVER.value, "kyc_status": "verified"})
 
     elif app["type"] == "relay":
         data = app["data"]
@@ -437,14 +441,18 @@ async def approve_application(
             "updated_at":        now,
         }
         await db.relay_points.insert_one(relay_doc)
-        await db.users.update_one(
+        before = await db.users.find_one_and_update(
             {"user_id": user_id},
             {"$set": {
                 "role":           UserRole.RELAY_AGENT.value,
                 "relay_point_id": relay_id,
                 "updated_at":     now,
             }},
+            projection=USER_COUNTER_PROJECTION,
         )
+        invalidate_principal(user_id)
+        if before is not None:
+            await record_user_change(before, {**before, "role": UserRole.RELAY_AGENT.value})
 
     await db.applications.update_one(
         {"application_id": application_id},
@@ -20,12 +20,13 @@ from core.security import (
     verify_refresh_token,
     fingerprint_token,
 )
-from core.dependencies import get_current_user
+from core.dependencies import get_current_user_full
 from core.datetime_utils import as_aware_utc
 from core.utils import normalize_phone, is_supported_phone, phone_suffix
 from database import db
 from models.common import clean_optional_text
 from models.user import OTPRequest, TokenResponse, RefreshRequest, ProfileUpdate, User
+from services.counters_service import record_user_change
 from services.parcel_service import _record_event
 from services.referral_service import upsert_referral_record
 from services.user_service import (
@@ -64,6 +65,7 @@ def _build_refresh_session(user_id: str, refresh_token: str) -> dict:
 
 
 from core.limiter import limiter
+from core.principal_cache import invalidate_principal
 
 
 def _mobile_admin_role_for_phone(phone: str) -> str | None:
@@ -91,6 +93,8 @@ async def _ensure_mobile_admin_user(phone: str, role: str) -> dict:
                 {"phone": phone},
                 {"$set": {"role": role, "updated_at": now}},
             )
+            invalidate_principal(user_doc.get("user_id"))
+            await record_user_change(user_doc, {**user_doc, "role": role})
             user_doc["role"] = role
             user_doc["updated_at"] = now
         return user_doc
@@ -120,23 +124,11 @@ async def _ensure_mobile_admin_user(phone: str, role: str) -> dict:
         "updated_at": now,
     }
     await db.users.insert_one(user_doc)
+    await record_user_change(None, user_doc)
     return user_doc
 
-import firebase_admin
-from firebase_admin import credentials, auth as firebase_auth
-
-if not firebase_admin._apps:
-    import os, json
-    firebase_creds_env = os.environ.get("FIREBASE_CREDENTIALS")
-    if firebase_creds_env:
-        cred = credentials.Certificate(json.loads(firebase_creds_env))
-    elif settings.FIREBASE_CREDENTIALS_PATH and os.path.exists(settings.FIREBASE_CREDENTIALS_PATH):
-        cred = credentials.Certificate(settings.FIREBASE_CREDENTIALS_PATH)
-    else:
-        cred = None
-        logger.warning("Firebase credentials not found — /auth/firebase will not work")
-    if cred:
-        firebase_admin.initialize_app(cred)
+# Firebase Admin n'est importé / initialisé qu'au premier login Firebase.
+from core.firebase import verify_firebase_id_token
 
 
 class FirebaseAuthRequest(BaseModel):
@@ -150,7 +142,7 @@ async def firebase_login(body: FirebaseAuthRequest, request: Request):
     Crée ou connecte l'utilisateur et renvoie les JWT Denkma.
     """
     try:
-        decoded = firebase_auth.verify_id_token(body.id_token)
+        decoded = verify_firebase_id_token(body.id_token)
     except Exception as e:
         logger.warning("Firebase token verification failed: %s", e)
         raise bad_request_exception("Token Firebase invalide ou expiré")
@@ -182,6 +174,7 @@ async def firebase_login(body: FirebaseAuthRequest, request: Request):
         {"phone": phone},
         {"$set": {"is_phone_verified": True, "updated_at": datetime.now(timezone.utc)}},
     )
+    await record_user_change(user_doc, {**user_doc, "is_phone_verified": True})
     user_doc["is_phone_verified"] = True
 
     token_data = {"sub": user_doc["user_id"], "role": user_doc["role"]}
@@ -380,6 +373,7 @@ async def complete_registration(body: CompleteRegistrationRequest, request: Requ
         "updated_at":        now,
     }
     await db.users.insert_one(user_doc)
+    await record_user_change(None, user_doc)
     phone_candidates = {phone, normalize_phone(phone)}
     suffix = phone_suffix(phone)
     recipient_phone_filters = [{"recipient_phone": {"$in": list(phone_candidates)}}]
@@ -454,7 +448,7 @@ class FirebaseResetPinRequest(BaseModel):
 @limiter.limit("5/minute")
 async def reset_pin_firebase(body: FirebaseResetPinRequest, request: Request):
     try:
-        decoded = firebase_auth.verify_id_token(body.id_token)
+        decoded = verify_firebase_id_token(body.id_token)
     except Exception as e:
         logger.warning("Firebase reset-pin token verification failed: %s", e)
         raise bad_request_exception("Vérification Firebase invalide ou expirée")
@@ -539,19 +533,20 @@ async def logout(body: RefreshRequest):
 
 
 @router.get("/me", response_model=User, summary="Profil courant")
-async def me(current_user: dict = Depends(get_current_user)):
+async def me(current_user: dict = Depends(get_current_user_full)):
     return User(**current_user)
 
 
 @router.put("/profile", response_model=User, summary="Mettre à jour profil")
 async def update_profile(
     body: ProfileUpdate,
-    current_user: dict = Depends(get_current_user),
+    current_user: dict = Depends(get_current_user_full),
 ):
     updates = body.model_dump(exclude_none=True)
     if not updates:
         return User(**current_user)
     updates["updated_at"] = datetime.now(timezone.utc)
     await db.users.update_one({"user_id": current_user["user_id"]}, {"$set": updates})
+    invalidate_principal(current_user["user_id"])
     updated = await db.users.find_one({"user_id": current_user["user_id"]}, {"_id": 0})
     return User(**updated)
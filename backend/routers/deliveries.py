@@ -26,21 +26,27 @@ from services.parcel_service import (
     _record_event,
     _find_candidate_drivers_within_radius,
     build_location_area_label,
+    PICKUP_DEADLINE_UNSET,
     get_assigned_mission_auto_release_minutes,
     get_delivery_dispatch_settings,
+    pickup_deadline_fields,
     resolve_delivery_dispatch_state,
     transition_status,
 )
 from services.admin_events_service import AdminEventType, record_admin_event
 from services.google_maps_service import get_directions_eta
 from services.performance_rewards_service import get_performance_rewards_settings
-from services.ranking_service import refresh_driver_stats_for_period
+from services.ranking_service import (
+    count_ranked_drivers,
+    get_driver_stats_for_period,
+    update_driver_stat,
+)
 from services.notification_service import (
+    DispatchNotificationBatch,
     expire_mission_availability_for_user,
     expire_mission_availability_notifications,
     notify_approaching_driver,
     notify_new_mission_dispatch_wave,
-    notify_pending_mission_dispatch_reminder,
     notify_sender_driver_assigned,
     notify_sender_parcel_collected,
 )
@@ -307,7 +313,15 @@ def _attach_pickup_confirmation_window(
         mission["pickup_confirmation_remaining_seconds"] = None
         return
 
-    deadline_at = assigned_at + timedelta(minutes=auto_release_minutes)
+    # Échéance figée à l'assignation (celle qu'applique le job de libération) ;
+    # le réglage courant ne sert qu'aux missions antérieures à `auto_release_at`.
+    deadline_at = _as_aware_utc(mission.get("auto_release_at"))
+    if deadline_at is None:
+        deadline_at = assigned_at + timedelta(minutes=auto_release_minutes)
+    else:
+        mission["pickup_confirmation_timeout_minutes"] = max(
+            0, round((deadline_at - assigned_at).total_seconds() / 60)
+        )
     mission["pickup_confirmation_deadline_at"] = deadline_at.isoformat()
 
     if (
@@ -561,6 +575,7 @@ async def advance_pending_delivery_dispatch() -> int:
     )
     updated_count = 0
     reminder_interval = timedelta(minutes=5)
+    notifications = DispatchNotificationBatch()
 
     for mission in raw_missions:
         pickup_geopin = _normalize_geopin(mission.get("pickup_geopin"))
@@ -648,21 +663,23 @@ async def advance_pending_delivery_dispatch() -> int:
 
         updated_mission = {**mission, **updates}
         if new_driver_ids:
-            await notify_new_mission_dispatch_wave(
-                user_ids=new_driver_ids,
-                mission=updated_mission,
-                radius_km=dispatch_state["radius_km"],
-            )
+            notifications.add_wave(new_driver_ids, updated_mission, dispatch_state["radius_km"])
         if reminder_driver_ids:
             reminder_targets = [
                 driver_id for driver_id in reminder_driver_ids if driver_id not in new_driver_ids
             ]
             if reminder_targets:
-                await notify_pending_mission_dispatch_reminder(
-                    user_ids=reminder_targets,
-                    mission=updated_mission,
-                    radius_km=dispatch_state["radius_km"],
-                )
+                notifications.add_reminder(reminder_targets, updated_mission, dispatch_state["radius_km"])
+
+    # Un seul push par livreur pour tout le tick (au lieu d'un par mission).
+    push_stats = await notifications.flush()
+    if push_stats["uncoalesced_pushes"] > push_stats["pushes"]:
+        logger.info(
+            "Dispatch notifications : %s push(s) pour %s livreur(s) au lieu de %s",
+            push_stats["pushes"],
+            push_stats["drivers"],
+            push_stats["uncoalesced_pushes"],
+        )
 
     return updated_count
 
@@ -1234,8 +1251,7 @@ async def accept_mission(
         "status": MissionStatus.ASSIGNED.value,
         "assigned_at": now,
         "updated_at": now,
-        "pickup_reminder_10_sent_at": None,
-        "pickup_reminder_5_sent_at": None,
+        **pickup_deadline_fields(now, await get_assigned_mission_auto_release_minutes()),
         "admin_assignment_status": "accepted" if requested_driver_id else mission.get("admin_assignment_status"),
         "platform_commission_xof": breakdown["platform_commission_xof"],
         "relay_commission_xof": breakdown["relay_commission_xof"],
@@ -1303,6 +1319,7 @@ async def accept_mission(
                         "total_commission_xof": "",
                         "wallet_balance_required_xof": "",
                         "platform_commission_wallet_reference": "",
+                        **PICKUP_DEADLINE_UNSET,
                     },
                 },
             )
@@ -1887,10 +1904,7 @@ async def release_mission(
                 "assigned_at": None,
                 "updated_at": now,
             },
-            "$unset": {
-                "pickup_reminder_10_sent_at": "",
-                "pickup_reminder_5_sent_at": "",
-            },
+            "$unset": PICKUP_DEADLINE_UNSET,
         },
     )
     await db.parcels.update_one(
@@ -2077,6 +2091,8 @@ async def confirm_return_to_sender(
             "updated_at": now,
         }},
     )
+    if mission.get("driver_id"):
+        await update_driver_stat(mission["driver_id"])
 
     actor = {"actor_id": current_user["user_id"], "actor_role": current_user["role"]}
     updated = await transition_status(
@@ -2119,7 +2135,6 @@ async def get_rankings(
     current_user: dict = Depends(get_current_user),
 ):
     period = _period_or_current(period)
-    all_stats = await refresh_driver_stats_for_period(period)
 
     is_admin = current_user.get("role") in [UserRole.ADMIN.value, UserRole.SUPERADMIN.value]
     is_driver = current_user.get("role") == UserRole.DRIVER.value
@@ -2127,11 +2142,7 @@ async def get_rankings(
     if not (is_admin or is_driver):
         raise forbidden_exception("Acces reserve aux livreurs et administrateurs")
 
-    stats = await db.driver_stats.find(
-        {"period": period},
-        sort=[("rank", 1)],
-        limit=50,
-    ).to_list(length=50)
+    stats = await get_driver_stats_for_period(period, limit=50)
 
     result = []
     for s in stats:
@@ -2162,7 +2173,7 @@ async def get_rankings(
 
     return {
         "period": period,
-        "total_ranked_drivers": len(all_stats),
+        "total_ranked_drivers": await count_ranked_drivers(period),
         "rankings": result,
     }
 
@@ -2309,10 +2320,22 @@ async def _driver_month_history(driver_id: str, current_period: str, months: int
             cursor_year -= 1
         periods.append(f"{cursor_year}-{cursor_month:02d}")
 
+    stats_by_period = {
+        stat["period"]: stat
+        for stat in await db.driver_stats.find(
+            {"driver_id": driver_id, "period": {"$in": periods}},
+            {"_id": 0},
+        ).to_list(length=months)
+    }
+    ranked_rows = await db.driver_stats.aggregate([
+        {"$match": {"period": {"$in": periods}}},
+        {"$group": {"_id": "$period", "count": {"$sum": 1}}},
+    ]).to_list(length=months)
+    ranked_by_period = {row["_id"]: row["count"] for row in ranked_rows}
+
     history = []
     for period in periods:
-        stats = await refresh_driver_stats_for_period(period)
-        stat = next((item for item in stats if item.get("driver_id") == driver_id), None)
+        stat = stats_by_period.get(period)
         if not stat:
             stat = {
                 "rank": 0,
@@ -2323,7 +2346,7 @@ async def _driver_month_history(driver_id: str, current_period: str, months: int
         history.append({
             "period": period,
             "rank": int(stat.get("rank") or 0),
-            "total_drivers": len(stats),
+            "total_drivers": ranked_by_period.get(period, 0),
             "deliveries_success": int(stat.get("deliveries_success") or 0),
             "success_rate": float(stat.get("success_rate") or 0),
             "total_earned_xof": float(stat.get("total_earned_xof") or 0),
@@ -2346,7 +2369,12 @@ def _driver_motivation_message(stat: dict, missing_top3: int, monthly_goal: int)
     return "Objectif mensuel atteint. Chaque course renforce votre classement."
 
 
-async def _format_driver_ranking(stat: dict, current_user: dict, podium_stats: list[dict]) -> dict:
+async def _format_driver_ranking(
+    stat: dict,
+    current_user: dict,
+    podium_stats: list[dict],
+    total_ranked: int,
+) -> dict:
     rewards = await get_performance_rewards_settings()
     monthly_goal = rewards["driver"]["monthly_goal_deliveries"]
     activity = await _driver_month_activity(current_user["user_id"], stat["period"])
@@ -2393,7 +2421,7 @@ async def _format_driver_ranking(stat: dict, current_user: dict, podium_stats: l
         "badges_earned": _badge_items(stat, activity),
         "achievements": _achievement_items(stat, activity),
         "missing_deliveries_to_top3": missing_top3,
-        "total_ranked_drivers": len(podium_stats),
+        "total_ranked_drivers": total_ranked,
         "general_ranking": general,
         "monthly_history": history,
         "message": _driver_motivation_message(stat, missing_top3, monthly_goal),
@@ -2407,8 +2435,11 @@ async def get_my_ranking(
     current_user: dict = Depends(require_role(UserRole.DRIVER)),
 ):
     period = _period_or_current(period)
-    stats = await refresh_driver_stats_for_period(period)
-    stat = next((item for item in stats if item.get("driver_id") == current_user["user_id"]), None)
+    podium_stats = await get_driver_stats_for_period(period, limit=3)
+    stat = await db.driver_stats.find_one(
+        {"driver_id": current_user["user_id"], "period": period},
+        {"_id": 0},
+    )
 
     if not stat:
         stat = {
@@ -2424,4 +2455,4 @@ async def get_my_ranking(
             "bonus_paid_xof": 0,
         }
 
-    return await _format_driver_ranking(stat, current_user, stats)
+    return await _format_driver_ranking(stat, current_user, podium_stats, await count_ranked_drivers(period))
@@ -8,7 +8,7 @@ from fastapi.responses import Response
 from gridfs.errors import NoFile
 from motor.motor_asyncio import AsyncIOMotorGridFSBucket
 
-from core.dependencies import get_current_user, require_role
+from core.dependencies import get_current_user, get_current_user_full, require_role
 from core.exceptions import bad_request_exception
 from config import settings
 from database import db
@@ -263,7 +263,7 @@ async def get_campaign_image(filename: str):
 @router.get("/campaigns/active", response_model=dict)
 async def active_campaigns(
     role: Optional[str] = Query(None),
-    current_user: dict = Depends(get_current_user),
+    current_user: dict = Depends(get_current_user_full),
 ):
     notification_prefs = current_user.get("notification_prefs") or {}
     if notification_prefs.get("promotions") is False:
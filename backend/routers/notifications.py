@@ -9,6 +9,7 @@ from fastapi import APIRouter, Depends, Query
 
 from core.dependencies import get_current_user
 from core.exceptions import not_found_exception
+from core.pagination import paginate
 from database import db
 from models.notification import NotificationChannel
 
@@ -31,6 +32,8 @@ async def list_notifications(
     skip: int = Query(0, ge=0),
     limit: int = Query(30, ge=1, le=100),
     unread_only: bool = Query(False),
+    cursor: Optional[str] = Query(None, description="Curseur next_cursor de la page précédente"),
+    include_total: bool = Query(False),
     current_user: dict = Depends(get_current_user),
 ):
     query: dict = {
@@ -41,15 +44,12 @@ async def list_notifications(
     if unread_only:
         query["read_at"] = None
 
-    cursor = (
-        db.notifications.find(query, {"_id": 0})
-        .sort("created_at", -1)
-        .skip(skip)
-        .limit(limit)
+    page = await paginate(
+        db.notifications, query,
+        id_field="notif_id", limit=limit, cursor=cursor, skip=skip, include_total=include_total,
     )
-    notifs = [_serialize(n) for n in await cursor.to_list(length=limit)]
-    total = await db.notifications.count_documents(query)
-    return {"notifications": notifs, "total": total}
+    page.items = [_serialize(n) for n in page.items]
+    return page.to_response("notifications")
 
 
 @router.get("/unread-count", summary="Nombre de notifications non lues")
@@ -22,6 +22,7 @@ from pydantic import BaseModel, Field
 from core.dependencies import get_current_user, get_current_user_optional, require_role
 from core.exceptions import not_found_exception, forbidden_exception, bad_request_exception
 from core.limiter import limiter
+from core.pagination import paginate
 from core.utils import (
     check_code_lockout,
     clear_code_attempts,
@@ -50,6 +51,7 @@ from services.parcel_service import (
     create_parcel,
     transition_status,
     get_parcel_timeline,
+    PARCEL_LIST_PROJECTION,
     _create_delivery_mission,
     _record_event,
     preview_address_change,
@@ -61,6 +63,7 @@ from services.pricing_service import calculate_price, _haversine_km
 from services.notification_service import notify_quote_finalized, notify_relay_agent_parcel_arrived, notify_new_parcel_message
 from services.wallet_service import credit_wallet, debit_wallet
 from services.google_maps_service import reverse_geocode
+from services.archive_service import find_one_with_archive
 from config import UPLOADS_DIR, settings
 
 router = APIRouter()
@@ -578,6 +581,8 @@ async def list_parcels(
     role_view: Optional[str] = None,
     skip: int = 0,
     limit: int = 50,
+    cursor: Optional[str] = Query(None, description="Curseur next_cursor de la page précédente"),
+    include_total: bool = False,
     current_user: dict = Depends(get_current_user),
 ):
     role = current_user["role"]
@@ -616,9 +621,12 @@ async def list_parcels(
     if status:
         query["status"] = status
 
-    cursor = db.parcels.find(query, {"_id": 0}).skip(skip).limit(limit)
-    parcels = await cursor.to_list(length=limit)
-    total = await db.parcels.count_documents(query)
+    page = await paginate(
+        db.parcels, query,
+        id_field="parcel_id", limit=limit, cursor=cursor, skip=skip, include_total=include_total,
+        projection=PARCEL_LIST_PROJECTION,
+    )
+    parcels = page.items
 
     # Enrichir chaque colis avec is_recipient pour Flutter
     if role not in [UserRole.ADMIN.value, UserRole.SUPERADMIN.value]:
@@ -639,7 +647,7 @@ async def list_parcels(
             p["recipient_phone"] = mask_phone(p["recipient_phone"])
         _mask_payment_fields(p, current_user)
 
-    return {"parcels": parcels, "total": total}
+    return page.to_response("parcels")
 
 
 def _mask_payment_fields(parcel: dict, current_user: dict) -> None:
@@ -751,7 +759,7 @@ async def get_driver_location(parcel_id: str, current_user: dict = Depends(get_c
 
 @router.get("/{parcel_id}", summary="Détail + timeline")
 async def get_parcel(parcel_id: str, current_user: dict = Depends(get_current_user)):
-    parcel = await db.parcels.find_one({"parcel_id": parcel_id}, {"_id": 0})
+    parcel = await find_one_with_archive("parcels", {"parcel_id": parcel_id}, {"_id": 0})
     if not parcel:
         raise not_found_exception("Colis")
 
@@ -849,7 +857,10 @@ async def get_parcel(parcel_id: str, current_user: dict = Depends(get_current_us
         elif mode.endswith("_to_relay"):
             parcel.pop("delivery_code", None)
 
+    # Timeline complète (acteurs, métadonnées) : l'embarquée ne sert qu'au suivi public.
     timeline = await get_parcel_timeline(parcel_id)
+    parcel.pop("recent_events", None)
+    parcel.pop("event_count", None)
 
     # ── Enrichissement avec Photos ──
     # Sender
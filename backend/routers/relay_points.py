@@ -17,6 +17,7 @@ from services.performance_rewards_service import get_performance_rewards_setting
 router = APIRouter()
 
 from core.limiter import limiter
+from core.pagination import paginate
 
 
 def _relay_id() -> str:
@@ -65,14 +66,18 @@ async def list_relay_points(
     is_active: bool = True,
     skip: int = 0,
     limit: int = 50,
+    cursor: Optional[str] = Query(None, description="Curseur next_cursor de la page précédente"),
+    include_total: bool = False,
 ):
     query = {"is_active": is_active}
     if city:
         query["address.city"] = city
-        
-    cursor = db.relay_points.find(query, {"_id": 0}).skip(skip).limit(limit)
-    relays = await cursor.to_list(length=limit)
-    return {"relay_points": relays, "total": await db.relay_points.count_documents(query)}
+
+    page = await paginate(
+        db.relay_points, query,
+        id_field="relay_id", limit=limit, cursor=cursor, skip=skip, include_total=include_total, max_limit=200,
+    )
+    return page.to_response("relay_points")
 
 
 @router.get("/nearby", summary="Relais proches d'un geopin")
@@ -2,18 +2,28 @@
 Router tracking : endpoints publics (sans authentification).
 """
 import html
+import logging
 from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from typing import Optional
 from urllib.parse import urlencode
 
 from config import settings
 from fastapi import APIRouter, Request, Response
 from fastapi.responses import HTMLResponse
+from limits import parse as parse_rate_limit
+from limits.storage import MemoryStorage
+from limits.strategies import MovingWindowRateLimiter
+from slowapi.util import get_remote_address
 
 from core.datetime_utils import as_aware_utc
-from core.exceptions import not_found_exception
+from core.exceptions import not_found_exception, too_many_requests_exception
 from core.limiter import limiter
-from database import db
-from services.parcel_service import get_parcel_timeline
+from core.tracking_cache import TrackingEntry, etag_matches, payload_digest, tracking_cache
+from services.archive_service import find_one_with_archive
+from services.parcel_service import get_parcel_timeline_for
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -39,11 +49,21 @@ _PUBLIC_TRACKING_TERMINAL_STATUSES = {
     "returned",
 }
 
+# Pas de cache partagé, mais le navigateur peut revalider (ETag → 304).
 _PUBLIC_RESPONSE_HEADERS = {
-    "Cache-Control": "no-store, private, max-age=0",
-    "Pragma": "no-cache",
+    "Cache-Control": "private, no-cache",
     "X-Robots-Tag": "noindex, nofollow, noarchive",
 }
+# Les hits du cache (core/tracking_cache.py) ne lisent pas Mongo : la limite
+# des endpoints peut être large. Les lectures Mongo (code absent du cache,
+# connu ou non) gardent par IP l'ancienne limite de 5/minute : une énumération
+# de codes ne coûte pas plus cher qu'avant le cache.
+_PUBLIC_RATE_LIMIT = "60/minute"
+_PUBLIC_LOOKUP_RATE_LIMIT = parse_rate_limit("5/minute")
+# Budget partagé via le stockage du limiter (core/rate_limit_storage.py : aucun
+# aller-retour Mongo sur la boucle). S'il lève, repli sur un budget propre au
+# process plutôt que de laisser l'énumération libre.
+_LOCAL_LOOKUP_LIMITER = MovingWindowRateLimiter(MemoryStorage())
 
 
 def _serialize_public_event(event: dict) -> dict:
@@ -172,62 +192,127 @@ def _build_public_tracking_payload(parcel: dict, timeline: list[dict]) -> dict:
     }
 
 
-async def _load_public_tracking_payload(tracking_code: str) -> dict:
-    parcel = await db.parcels.find_one({"tracking_code": tracking_code}, {"_id": 0})
+def _public_last_modified(payload: dict) -> datetime | None:
+    moments = [
+        _parse_public_datetime(payload.get("updated_at")),
+        *(_parse_public_datetime(evt.get("created_at")) for evt in payload.get("events", [])[-1:]),
+    ]
+    moments = [moment for moment in moments if moment]
+    return max(moments) if moments else None
+
+
+async def _load_public_tracking_entry(tracking_code: str) -> Optional[TrackingEntry]:
+    """None si le code est inconnu ou si son suivi public a expiré."""
+    parcel = await find_one_with_archive("parcels", {"tracking_code": tracking_code}, {"_id": 0})
     if not parcel:
-        raise not_found_exception("Colis")
+        return None
 
-    parcel_id = parcel.get("parcel_id")
-    timeline = await get_parcel_timeline(parcel_id) if parcel_id else []
+    timeline = await get_parcel_timeline_for(parcel) if parcel.get("parcel_id") else []
     if _public_tracking_has_expired(parcel, timeline):
+        return None
+    payload = _build_public_tracking_payload(parcel, timeline)
+    return TrackingEntry(
+        parcel_id=parcel.get("parcel_id"),
+        payload=payload,
+        digest=payload_digest(payload),
+        last_modified=_public_last_modified(payload),
+        expires_at=payload.get("tracking_expires_at"),
+    )
+
+
+def _consume_lookup_budget(request: Request) -> None:
+    """Décompte une lecture Mongo du suivi public ; 429 au-delà du budget de l'IP."""
+    if not limiter.enabled:
+        return
+    identifiers = ("tracking-lookup", get_remote_address(request))
+    try:
+        allowed = limiter.limiter.hit(_PUBLIC_LOOKUP_RATE_LIMIT, *identifiers)
+    except Exception as exc:
+        logger.warning("Budget partagé de recherche du suivi indisponible : %s", exc)
+        allowed = _LOCAL_LOOKUP_LIMITER.hit(_PUBLIC_LOOKUP_RATE_LIMIT, *identifiers)
+    if not allowed:
+        raise too_many_requests_exception("Trop de recherches de suivi, réessayez dans une minute")
+
+
+async def _public_tracking_entry(request: Request, tracking_code: str) -> TrackingEntry:
+    """Entrée du cache de suivi ; Mongo n'est lu qu'en cas d'absence."""
+    entry = tracking_cache.get(tracking_code)
+    if entry is None:
+        if tracking_cache.is_miss(tracking_code):
+            raise not_found_exception("Colis")
+        _consume_lookup_budget(request)
+        generation = tracking_cache.generation
+        entry = await _load_public_tracking_entry(tracking_code)
+        if entry is None:
+            tracking_cache.put_miss(tracking_code, generation)
+            raise not_found_exception("Colis")
+        tracking_cache.put(tracking_code, entry, generation)
+    if entry.expires_at and datetime.now(timezone.utc) >= entry.expires_at:
+        tracking_cache.invalidate(tracking_code)
+        tracking_cache.put_miss(tracking_code)
         raise not_found_exception("Colis")
-    return _build_public_tracking_payload(parcel, timeline)
+    return entry
+
+
+def _conditional_headers(entry: TrackingEntry, variant: str = "") -> dict[str, str]:
+    headers = {**_PUBLIC_RESPONSE_HEADERS, "ETag": entry.etag(variant)}
+    if entry.last_modified:
+        headers["Last-Modified"] = format_datetime(entry.last_modified, usegmt=True)
+    return headers
+
+
+def _not_modified(request: Request, headers: dict[str, str]) -> Response | None:
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return None
 
 
 @router.get("/{tracking_code}", summary="Statut public d'un colis")
-@limiter.limit("5/minute")
+@limiter.limit(_PUBLIC_RATE_LIMIT)
 async def track_parcel(
     tracking_code: str,
     request: Request,
     response: Response,
 ):
-    response.headers.update(_PUBLIC_RESPONSE_HEADERS)
-    return await _load_public_tracking_payload(tracking_code)
+    entry = await _public_tracking_entry(request, tracking_code)
+    headers = _conditional_headers(entry)
+    not_modified = _not_modified(request, headers)
+    if not_modified:
+        return not_modified
+    response.headers.update(headers)
+    return entry.payload
 
 
 @router.get("/{tracking_code}/events", summary="Historique public du colis")
-@limiter.limit("5/minute")
+@limiter.limit(_PUBLIC_RATE_LIMIT)
 async def track_parcel_events(
     tracking_code: str,
     request: Request,
     response: Response,
 ):
-    response.headers.update(_PUBLIC_RESPONSE_HEADERS)
-    parcel = await db.parcels.find_one(
-        {"tracking_code": tracking_code},
-        {
-            "_id": 0,
-            "parcel_id": 1,
-            "status": 1,
-            "created_at": 1,
-            "updated_at": 1,
-        },
-    )
-    if not parcel:
-        raise not_found_exception("Colis")
-
-    timeline = await get_parcel_timeline(parcel["parcel_id"])
-    if _public_tracking_has_expired(parcel, timeline):
-        raise not_found_exception("Colis")
-    public_timeline = [_serialize_public_event(evt) for evt in timeline]
-    return {"tracking_code": tracking_code, "events": public_timeline}
+    entry = await _public_tracking_entry(request, tracking_code)
+    headers = _conditional_headers(entry, "events")
+    not_modified = _not_modified(request, headers)
+    if not_modified:
+        return not_modified
+    response.headers.update(headers)
+    return {"tracking_code": tracking_code, "events": entry.payload["events"]}
 
 
 @router.get("/view/{tracking_code}", response_class=HTMLResponse, summary="Page de suivi Web (sans app)")
-@limiter.limit("5/minute")
+@limiter.limit(_PUBLIC_RATE_LIMIT)
 async def view_parcel_web(tracking_code: str, request: Request):
-    parcel = await _load_public_tracking_payload(tracking_code)
+    entry = await _public_tracking_entry(request, tracking_code)
+    headers = _conditional_headers(entry, "html")
+    not_modified = _not_modified(request, headers)
+    if not_modified:
+        return not_modified
+    if entry.html is None:
+        entry.html = _render_tracking_page(tracking_code, entry.payload)
+    return HTMLResponse(entry.html, headers=headers)
+
 
+def _render_tracking_page(tracking_code: str, parcel: dict) -> str:
     current_status = parcel.get("status", "created")
     status_label = _STATUS_LABELS.get(current_status, current_status)
     safe_tracking_code = html.escape(str(tracking_code))
@@ -360,4 +445,4 @@ async def view_parcel_web(tracking_code: str, request: Request):
     </body>
     </html>
     """
-    return HTMLResponse(page, headers=_PUBLIC_RESPONSE_HEADERS)
+    return page
@@ -7,7 +7,7 @@ import os
 import uuid
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Literal
+from typing import Literal, Optional
 from urllib.parse import quote_plus
 
 from bson import ObjectId
@@ -19,14 +19,18 @@ from motor.motor_asyncio import AsyncIOMotorGridFSBucket
 from pydantic import BaseModel, Field
 
 from config import UPLOADS_DIR, settings
-from core.dependencies import get_current_user, require_role
+from core.dependencies import get_current_user, get_current_user_full, require_role
 from core.exceptions import bad_request_exception, forbidden_exception, not_found_exception
 from core.limiter import limiter
+from core.pagination import paginate
+from core.principal_cache import invalidate_principal
 from core.security import hash_password, verify_password
 from core.utils import normalize_phone
 from database import db, get_db
 from models.common import UserRole
 from models.user import FavoriteAddress, ProfileUpdate, User
+from services.counters_service import USER_COUNTER_PROJECTION, record_user_change
+from services.notification_service import invalidate_notification_profile
 from services.parcel_service import _record_event
 from services.referral_service import ensure_referral_record_for_user, refresh_referral_progress, upsert_referral_record
 from services.user_service import (
@@ -363,11 +367,14 @@ async def _serve_kyc_file(
 async def list_users(
     skip: int = 0,
     limit: int = 50,
+    cursor: Optional[str] = Query(None, description="Curseur next_cursor de la page précédente"),
+    include_total: bool = False,
     _admin=Depends(require_role(UserRole.ADMIN, UserRole.SUPERADMIN)),
 ):
-    cursor = db.users.find({}, {"_id": 0}).skip(skip).limit(limit)
-    users = await cursor.to_list(length=limit)
-    return {"users": users, "total": await db.users.count_documents({})}
+    page = await paginate(
+        db.users, {}, id_field="user_id", limit=limit, cursor=cursor, skip=skip, include_total=include_total,
+    )
+    return page.to_response("users")
 
 
 @router.get("/{user_id}", response_model=User, summary="Detail utilisateur")
@@ -388,12 +395,15 @@ async def change_role(
     role: UserRole,
     _admin=Depends(require_role(UserRole.ADMIN, UserRole.SUPERADMIN)),
 ):
-    result = await db.users.update_one(
+    before = await db.users.find_one_and_update(
         {"user_id": user_id},
         {"$set": {"role": role.value, "updated_at": datetime.now(timezone.utc)}},
+        projection=USER_COUNTER_PROJECTION,
     )
-    if result.matched_count == 0:
+    if before is None:
         raise not_found_exception("Utilisateur")
+    invalidate_principal(user_id)
+    await record_user_change(before, {**before, "role": role.value})
 
     await _record_event(
         event_type="USER_ROLE_CHANGED",
@@ -447,6 +457,7 @@ async def toggle_availability(
         {"user_id": current_user["user_id"]},
         {"$set": {"is_available": new_val, "updated_at": datetime.now(timezone.utc)}},
     )
+    invalidate_principal(current_user["user_id"])
     return {"is_available": new_val}
 
 
@@ -527,6 +538,7 @@ async def update_fcm_token(
         {"user_id": current_user["user_id"]},
         {"$pull": {"fcm_tokens": {"token": {"$in": [None, ""]}}}},
     )
+    invalidate_notification_profile(current_user["user_id"])
     return {"message": "Token FCM mis a jour"}
 
 
@@ -560,11 +572,12 @@ async def delete_fcm_token(
             {"user_id": current_user["user_id"]},
             {"$set": {"fcm_token": latest}},
         )
+    invalidate_notification_profile(current_user["user_id"])
     return {"message": "Token FCM retire"}
 
 
 @router.delete("/me", summary="Supprimer son compte")
-async def delete_my_account(current_user: dict = Depends(get_current_user)):
+async def delete_my_account(current_user: dict = Depends(get_current_user_full)):
     user_id = current_user["user_id"]
     now = datetime.now(timezone.utc)
     deletion_ref = uuid.uuid4().hex[:10]
@@ -660,12 +673,17 @@ async def delete_my_account(current_user: dict = Depends(get_current_user)):
         "relay_application": "",
     }
 
-    await db.users.update_one(
+    before = await db.users.find_one_and_update(
         {"user_id": user_id},
         {"$set": user_update, "$unset": unset_fields},
+        projection=USER_COUNTER_PROJECTION,
     )
+    if before is not None:
+        await record_user_change(before, {**before, **user_update})
     await db.user_sessions.delete_many({"user_id": user_id})
     await db.notifications.delete_many({"user_id": user_id})
+    invalidate_notification_profile(user_id)
+    invalidate_principal(user_id)
 
     otp_filters = [{"user_id": user_id}]
     if previous_phone:
@@ -711,7 +729,7 @@ async def delete_my_account(current_user: dict = Depends(get_current_user)):
 @router.put("/me/profile", summary="Mise a jour profil (Bio, Email, Prefs)")
 async def update_my_profile(
     body: ProfileUpdate,
-    current_user: dict = Depends(get_current_user),
+    current_user: dict = Depends(get_current_user_full),
 ):
     updates = body.model_dump(exclude_none=True)
     if not updates:
@@ -729,6 +747,8 @@ async def update_my_profile(
         {"user_id": current_user["user_id"]},
         {"$set": updates},
     )
+    invalidate_notification_profile(current_user["user_id"])
+    invalidate_principal(current_user["user_id"])
 
     updated_user = await db.users.find_one(
         {"user_id": current_user["user_id"]},
@@ -789,14 +809,14 @@ async def update_my_pin(
 
 
 @router.get("/me/favorite-addresses", summary="Mes adresses favorites")
-async def get_favorites(current_user: dict = Depends(get_current_user)):
+async def get_favorites(current_user: dict = Depends(get_current_user_full)):
     return current_user.get("favorite_addresses", [])
 
 
 @router.post("/me/favorite-addresses", summary="Ajouter une adresse favorite")
 async def add_favorite(
     addr: FavoriteAddress,
-    current_user: dict = Depends(get_current_user),
+    current_user: dict = Depends(get_current_user_full),
 ):
     favs = current_user.get("favorite_addresses", [])
     if any(f["name"] == addr.name for f in favs):
@@ -816,7 +836,7 @@ async def add_favorite(
 async def update_favorite(
     name: str,
     addr: FavoriteAddress,
-    current_user: dict = Depends(get_current_user),
+    current_user: dict = Depends(get_current_user_full),
 ):
     favs = current_user.get("favorite_addresses", [])
     existing = next((fav for fav in favs if fav["name"] == name), None)
@@ -917,6 +937,7 @@ async def upload_avatar(
             "updated_at": datetime.now(timezone.utc),
         }},
     )
+    invalidate_principal(current_user["user_id"])
     return {"profile_picture_url": profile_url, "profile_picture_status": "pending"}
 
 
@@ -980,7 +1001,7 @@ async def download_user_kyc(
 
 
 @router.get("/me/stats", summary="Statistiques d'activite utilisateur")
-async def get_my_stats(current_user: dict = Depends(get_current_user)):
+async def get_my_stats(current_user: dict = Depends(get_current_user_full)):
     """Retourne des stats sur les colis envoyes/recus."""
     user_id = current_user["user_id"]
     period, start, end = _current_month_bounds()
@@ -1055,16 +1076,19 @@ async def assign_relay_point(
     relay = await db.relay_points.find_one({"relay_id": relay_id})
     if not relay:
         raise not_found_exception("Point relais")
-    result = await db.users.update_one(
+    before = await db.users.find_one_and_update(
         {"user_id": user_id},
         {"$set": {
             "relay_point_id": relay_id,
             "role": UserRole.RELAY_AGENT.value,
             "updated_at": datetime.now(timezone.utc),
         }},
+        projection=USER_COUNTER_PROJECTION,
     )
-    if result.matched_count == 0:
+    if before is None:
         raise not_found_exception("Utilisateur")
+    invalidate_principal(user_id)
+    await record_user_change(before, {**before, "role": UserRole.RELAY_AGENT.value})
 
     await _record_event(
         event_type="USER_RELAY_ASSIGNED",
@@ -1078,7 +1102,7 @@ async def assign_relay_point(
 
 
 @router.get("/me/loyalty", summary="Statistiques de fidelite")
-async def get_my_loyalty(current_user: dict = Depends(get_current_user)):
+async def get_my_loyalty(current_user: dict = Depends(get_current_user_full)):
     """Retourne les points, le tier et l'historique de fidelite."""
     from services.user_service import compute_tier
 
@@ -1338,7 +1362,7 @@ async def referral_landing(code: str):
 
 
 @router.post("/refer", summary="Code parrainage")
-async def get_referral_info(current_user: dict = Depends(get_current_user)):
+async def get_referral_info(current_user: dict = Depends(get_current_user_full)):
     """Retourne le code parrainage, le lien et l'etat effectif du programme."""
     return await _build_referral_payload(current_user)
 
@@ -1350,7 +1374,7 @@ class ApplyReferralRequest(BaseModel):
 @router.post("/apply-referral", summary="Appliquer un parrain")
 async def apply_referral_code(
     body: ApplyReferralRequest,
-    current_user: dict = Depends(get_current_user),
+    current_user: dict = Depends(get_current_user_full),
 ):
     """Lie l'utilisateur courant a un parrain via son code."""
     code = body.referral_code.upper().strip()
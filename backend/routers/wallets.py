@@ -8,16 +8,20 @@ import re
 from typing import Optional
 
 from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
 from core.dependencies import get_current_user
 from core.exceptions import bad_request_exception, not_found_exception
 from core.limiter import limiter
+from core.pagination import paginate
 from core.utils import normalize_phone
 from database import db
 from models.wallet import PayoutRequest, TransactionType
 from services.wallet_service import get_or_create_wallet, record_wallet_transaction
+from services.ledger_service import statement_page_balances, stream_statement_csv
 from services.admin_events_service import AdminEventType, record_admin_event
+from services.counters_service import record_payout_change
 from services.stripe_service import create_wallet_topup_checkout
 
 router = APIRouter()
@@ -68,6 +72,15 @@ def _payout_block_message(wallet: dict, failed_mission: Optional[dict]) -> Optio
     return None
 
 
+def _month_bounds(period: str) -> tuple[datetime, datetime]:
+    year, month = map(int, period.split("-"))
+    if not 1 <= month <= 12:
+        raise bad_request_exception("Période invalide")
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    end = datetime(year, month, monthrange(year, month)[1], 23, 59, 59, 999000, tzinfo=timezone.utc)
+    return start, end
+
+
 def _transaction_period_filter(period: Optional[str]) -> dict:
     if not period:
         return {}
@@ -79,11 +92,7 @@ def _transaction_period_filter(period: Optional[str]) -> dict:
         return {"created_at": {"$gte": now - timedelta(days=30)}}
 
     if re.fullmatch(r"\d{4}-\d{2}", period):
-        year, month = map(int, period.split("-"))
-        if not 1 <= month <= 12:
-            raise bad_request_exception("Période invalide")
-        start = datetime(year, month, 1, tzinfo=timezone.utc)
-        end = datetime(year, month, monthrange(year, month)[1], 23, 59, 59, 999000, tzinfo=timezone.utc)
+        start, end = _month_bounds(period)
         return {"created_at": {"$gte": start, "$lte": end}}
 
     raise bad_request_exception("Période invalide")
@@ -109,25 +118,64 @@ async def get_my_transactions(
     skip: int = 0,
     limit: int = 50,
     period: Optional[str] = Query(None, description="Filtre: 'week', 'month' ou 'YYYY-MM'"),
+    cursor: Optional[str] = Query(None, description="Curseur next_cursor de la page précédente"),
+    include_total: bool = False,
     current_user: dict = Depends(get_current_user),
 ):
     wallet = await db.wallets.find_one({"owner_id": current_user["user_id"]}, {"_id": 0})
     if not wallet:
-        return {"transactions": [], "total": 0}
+        return {"transactions": [], "next_cursor": None, "has_more": False, "total": 0}
 
     query: dict = {"wallet_id": wallet["wallet_id"]}
     query.update(_transaction_period_filter(period))
 
-    cursor = (
-        db.wallet_transactions.find(query, {"_id": 0})
-        .sort("created_at", -1)
-        .skip(skip)
-        .limit(limit)
+    page = await paginate(
+        db.wallet_transactions, query,
+        id_field="tx_id", limit=limit, cursor=cursor, skip=skip, include_total=include_total,
     )
+    return page.to_response("transactions")
+
+
+@router.get("/me/statement", summary="Relevé du wallet avec solde courant")
+async def get_my_statement(
+    limit: int = 50,
+    period: Optional[str] = Query(None, description="Filtre: 'week', 'month' ou 'YYYY-MM'"),
+    cursor: Optional[str] = Query(None, description="Curseur next_cursor de la page précédente"),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Mouvements du plus récent au plus ancien, chacun avec `balance_after`
+    (solde du grand livre après le mouvement), calculé depuis l'instantané
+    de solde le plus proche.
+    """
+    wallet = await db.wallets.find_one({"owner_id": current_user["user_id"]}, {"_id": 0, "wallet_id": 1})
+    if not wallet:
+        return {"transactions": [], "next_cursor": None, "has_more": False}
 
-    txs = await cursor.to_list(length=limit)
-    total = await db.wallet_transactions.count_documents(query)
-    return {"transactions": txs, "total": total}
+    query: dict = {"wallet_id": wallet["wallet_id"]}
+    query.update(_transaction_period_filter(period))
+    page = await paginate(
+        db.wallet_transactions, query,
+        id_field="tx_id", limit=limit, cursor=cursor, max_limit=200,
+    )
+    page.items = await statement_page_balances(wallet["wallet_id"], page.items)
+    return page.to_response("transactions")
+
+
+@router.get("/me/statement/export", summary="Exporter le relevé mensuel (CSV)")
+async def export_my_statement(
+    period: str = Query(..., pattern=r"^\d{4}-\d{2}$", description="Mois au format YYYY-MM"),
+    current_user: dict = Depends(get_current_user),
+):
+    start, end = _month_bounds(period)
+    wallet = await db.wallets.find_one({"owner_id": current_user["user_id"]}, {"_id": 0, "wallet_id": 1})
+    if not wallet:
+        raise not_found_exception("Wallet")
+    return StreamingResponse(
+        stream_statement_csv(wallet["wallet_id"], start, end),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="releve-{period}.csv"'},
+    )
 
 
 @router.post("/me/payout", summary="Demander un retrait")
@@ -203,6 +251,7 @@ async def request_payout(
         await db.payout_requests.delete_one({"payout_id": payout["payout_id"]})
         raise
 
+    await record_payout_change(None, payout)
     await record_admin_event(
         AdminEventType.PAYOUT_REQUESTED,
         title=f"Demande de décaissement : {body.amount:,} XOF".replace(",", " "),
@@ -233,12 +282,11 @@ async def create_stripe_wallet_topup(
 async def get_my_payouts(
     skip: int = 0,
     limit: int = 20,
+    cursor: Optional[str] = Query(None, description="Curseur next_cursor de la page précédente"),
     current_user: dict = Depends(get_current_user),
 ):
-    cursor = (
-        db.payout_requests.find({"owner_id": current_user["user_id"]}, {"_id": 0})
-        .sort("created_at", -1)
-        .skip(skip)
-        .limit(limit)
+    page = await paginate(
+        db.payout_requests, {"owner_id": current_user["user_id"]},
+        id_field="payout_id", limit=limit, cursor=cursor, skip=skip,
     )
-    return {"payouts": await cursor.to_list(length=limit)}
+    return page.to_response("payouts")
@@ -18,7 +18,7 @@ from database import db
 from services.parcel_service import _record_event
 from services.payment_service import verify_payment
 from services.stripe_service import handle_stripe_event
-from services.whatsapp_support_service import record_whatsapp_inbound_message
+from services.whatsapp_inbox_service import enqueue_whatsapp_payload
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -71,53 +71,9 @@ async def whatsapp_webhook(
     except Exception:
         raise HTTPException(status_code=400, detail="JSON invalide")
 
-    entries = payload.get("entry") or []
-    for entry in entries:
-        for change in entry.get("changes") or []:
-            value = change.get("value") or {}
-            for status in value.get("statuses") or []:
-                logger.info(
-                    "WhatsApp status: id=%s recipient=%s status=%s timestamp=%s",
-                    status.get("id"),
-                    status.get("recipient_id"),
-                    status.get("status"),
-                    status.get("timestamp"),
-                )
-            for message in value.get("messages") or []:
-                try:
-                    await record_whatsapp_inbound_message(value, message)
-                except Exception as exc:
-                    logger.warning("WhatsApp message non associ? au support: %s", exc)
-                logger.info(
-                    "WhatsApp message re?u: from=%s id=%s type=%s timestamp=%s",
-                    message.get("from"),
-                    message.get("id"),
-                    message.get("type"),
-                    message.get("timestamp"),
-                )
-            for call in value.get("calls") or []:
-                call_doc = {
-                    "call_event_id": call.get("id") or call.get("call_id"),
-                    "phone_number_id": (value.get("metadata") or {}).get("phone_number_id"),
-                    "display_phone_number": (value.get("metadata") or {}).get("display_phone_number"),
-                    "from": call.get("from"),
-                    "to": call.get("to"),
-                    "direction": call.get("direction"),
-                    "status": call.get("status"),
-                    "event": call.get("event"),
-                    "timestamp": call.get("timestamp"),
-                    "raw_call": call,
-                    "created_at": datetime.now(timezone.utc),
-                }
-                await db.whatsapp_call_events.insert_one(call_doc)
-                logger.info(
-                    "WhatsApp call event: id=%s from=%s status=%s event=%s",
-                    call_doc["call_event_id"],
-                    call_doc["from"],
-                    call_doc["status"],
-                    call_doc["event"],
-                )
-
+    # Traitement différé (services/whatsapp_inbox_service.py) : Meta relance
+    # les webhooks qui ne répondent pas vite.
+    await enqueue_whatsapp_payload(payload, payload_bytes)
     return {"received": True}
 
 
@@ -0,0 +1,86 @@
+"""
+Mesure le temps de démarrage de l'API : import de `main` puis entrée dans le
+lifespan (connexion Mongo, vérification du manifeste d'index, tâches de fond).
+
+Usage :
+    cd backend
+    python -m scripts.benchmark_startup [--runs 5] [--role api|worker|all]
+
+Chaque mesure tourne dans un interpréteur neuf (imports froids). Le rapport
+indique aussi l'état des index à la fin du démarrage : `ready` si le
+manifeste n'a pas changé, `building` si la construction tourne en fond.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+
+async def _measure_once() -> dict:
+    started = time.perf_counter()
+    import main  # noqa: PLC0415 — c'est précisément ce que l'on mesure
+    from database import index_status
+
+    imported = time.perf_counter()
+    async with main.app.router.lifespan_context(main.app):
+        ready = time.perf_counter()
+        state = index_status.get("state")
+    return {
+        "import_s": imported - started,
+        "lifespan_s": ready - imported,
+        "total_s": ready - started,
+        "index_state": state,
+    }
+
+
+def _child() -> None:
+    print(json.dumps(asyncio.run(_measure_once())))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--role", choices=["api", "worker", "all"], default=None)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        _child()
+        return 0
+
+    env = dict(os.environ)
+    if args.role:
+        env["ROLE"] = args.role
+    samples = []
+    for run in range(1, args.runs + 1):
+        result = subprocess.run(
+            [sys.executable, "-m", "scripts.benchmark_startup", "--child"],
+            cwd=BACKEND_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            print(result.stderr, file=sys.stderr)
+            return result.returncode
+        sample = json.loads(result.stdout.strip().splitlines()[-1])
+        samples.append(sample)
+        print(
+            f"run {run}: import={sample['import_s']:.3f}s lifespan={sample['lifespan_s']:.3f}s "
+            f"total={sample['total_s']:.3f}s indexes={sample['index_state']}"
+        )
+
+    for key in ("import_s", "lifespan_s", "total_s"):
+        values = [sample[key] for sample in samples]
+        print(f"{key}: median={statistics.median(values):.3f}s min={min(values):.3f}s max={max(values):.3f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""
+Non-régression du démarrage : échoue si l'import de `main` dépasse le budget
+de temps ou de mémoire, ou s'il charge un SDK censé rester paresseux.
+
+Usage :
+    cd backend
+    python -m scripts.check_import_budget [--max-seconds 3.0] [--max-rss-mb 250] [--runs 3]
+
+Le temps retenu est la médiane de `--runs` imports à froid. Code de sortie 1
+en cas de dépassement (utilisable en CI).
+"""
+import argparse
+import statistics
+import sys
+
+from scripts.profile_imports import profile
+
+# SDK initialisés à la demande (core/firebase.py) : ne doivent pas être
+# chargés par le simple import de l'application.
+LAZY_MODULES = (
+    "firebase_admin",
+    "google.auth",
+    "google.cloud",
+)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--max-seconds", type=float, default=3.0)
+    parser.add_argument("--max-rss-mb", type=float, default=250.0)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    reports = [profile(args.module) for _ in range(max(args.runs, 1))]
+    seconds = statistics.median(report["seconds"] for report in reports)
+    rss_mb = max(report["max_rss_mb"] for report in reports)
+    loaded = set(reports[-1]["loaded_modules"])
+    eager = sorted(
+        name for name in loaded
+        if any(name == lazy or name.startswith(f"{lazy}.") for lazy in LAZY_MODULES)
+    )
+
+    failures = []
+    if seconds > args.max_seconds:
+        failures.append(f"import {args.module} : {seconds:.3f}s > {args.max_seconds:.3f}s")
+    if rss_mb > args.max_rss_mb:
+        failures.append(f"RSS : {rss_mb:.1f} Mo > {args.max_rss_mb:.1f} Mo")
+    if eager:
+        failures.append(f"SDK chargés à l'import : {', '.join(eager[:10])}")
+
+    print(f"import {args.module}: médiane {seconds:.3f}s, RSS max {rss_mb:.1f} Mo")
+    for failure in failures:
+        print(f"ÉCHEC — {failure}")
+    if not failures:
+        print("OK")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+Profil d'import de l'API (`python -X importtime`).
+
+Usage :
+    cd backend
+    python -m scripts.profile_imports [--module main] [--top 25]
+
+Importe le module dans un interpréteur neuf et affiche : temps total, mémoire
+résidente après import, modules les plus coûteux (temps propre et cumulé) et
+coût cumulé par package de premier niveau. Voir aussi
+scripts/check_import_budget.py pour la vérification de non-régression.
+"""
+import argparse
+import json
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+_RSS_PROBE = (
+    "import importlib, json, resource, sys, time\n"
+    "started = time.perf_counter()\n"
+    "importlib.import_module(sys.argv[1])\n"
+    "elapsed = time.perf_counter() - started\n"
+    "rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss\n"
+    "print(json.dumps({'seconds': elapsed, 'max_rss_kb': rss_kb, 'modules': sorted(sys.modules)}))\n"
+)
+
+
+def parse_importtime(stderr: str) -> list[dict]:
+    """Lignes `-X importtime` → [{module, self_us, cumulative_us, depth}]."""
+    entries = []
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        entries.append({
+            "module": module,
+            "self_us": int(self_us),
+            "cumulative_us": int(cumulative_us),
+            "depth": len(indent) // 2,
+        })
+    return entries
+
+
+def per_package(entries: list[dict]) -> dict[str, int]:
+    """Temps propre cumulé par package de premier niveau (µs)."""
+    totals: dict[str, int] = defaultdict(int)
+    for entry in entries:
+        totals[entry["module"].split(".")[0]] += entry["self_us"]
+    return dict(totals)
+
+
+def profile(module: str = "main") -> dict:
+    """Profil d'import + mémoire de `module`, chacun dans un interpréteur neuf."""
+    traced = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if traced.returncode != 0:
+        raise RuntimeError(traced.stderr[-2000:])
+    probe = subprocess.run(
+        [sys.executable, "-c", _RSS_PROBE, module],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if probe.returncode != 0:
+        raise RuntimeError(probe.stderr[-2000:])
+    measured = json.loads(probe.stdout.strip().splitlines()[-1])
+    entries = parse_importtime(traced.stderr)
+    return {
+        "module": module,
+        "seconds": measured["seconds"],
+        "max_rss_mb": measured["max_rss_kb"] / 1024,
+        "loaded_modules": measured["modules"],
+        "entries": entries,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args()
+
+    report = profile(args.module)
+    entries = report["entries"]
+    print(
+        f"import {report['module']}: {report['seconds']:.3f}s, "
+        f"RSS max {report['max_rss_mb']:.1f} Mo, {len(entries)} module(s)"
+    )
+
+    print(f"\nTop {args.top} — temps propre")
+    for entry in sorted(entries, key=lambda e: e["self_us"], reverse=True)[:args.top]:
+        print(f"  {entry['self_us'] / 1000:8.1f} ms  {entry['module']}")
+
+    print(f"\nTop {args.top} — temps cumulé")
+    for entry in sorted(entries, key=lambda e: e["cumulative_us"], reverse=True)[:args.top]:
+        print(f"  {entry['cumulative_us'] / 1000:8.1f} ms  {entry['module']}")
+
+    print(f"\nTop {args.top} — par package")
+    packages = sorted(per_package(entries).items(), key=lambda item: item[1], reverse=True)
+    for package, total_us in packages[:args.top]:
+        print(f"  {total_us / 1000:8.1f} ms  {package}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,16 +5,25 @@ Chaque événement critique du système (payout demandé, incident signalé, lit
 candidature driver/relay, etc.) écrit ici un document immutable. Le dashboard admin lit
 ce flux pour la cloche, affiche le compteur de non lus par admin, et peut "marquer lu".
 
+Temps réel : chaque insertion est aussi publiée sur un bus en mémoire auquel
+s'abonnent les connexions SSE (`GET /api/admin/events/stream`). En déploiement
+multi-workers, `watch_admin_events_changes` relaie les insertions faites par les
+autres processus via un change stream Mongo (replica set requis).
+
 L'état "lu" est stocké comme un set d'admin_id sur chaque événement → chaque admin a
 son propre compteur de non lus sans collection séparée.
 """
 from __future__ import annotations
 
+import asyncio
 import logging
 import uuid
+from collections import deque
 from datetime import datetime, timezone
 from typing import Any, Optional
 
+from pymongo.errors import OperationFailure
+
 from database import db
 
 logger = logging.getLogger(__name__)
@@ -34,6 +43,7 @@ class AdminEventType:
     PARCEL_REDIRECTED = "parcel_redirected"
     PARCEL_CANCELLED = "parcel_cancelled"
     MISSION_RELEASED = "mission_released"
+    JOB_LAGGING = "job_lagging"
 
 
 # Sévérité : critical → rouge + son, warning → orange, info → gris.
@@ -50,6 +60,7 @@ SEVERITY_BY_TYPE: dict[str, str] = {
     AdminEventType.PARCEL_REDIRECTED: "warning",
     AdminEventType.PARCEL_CANCELLED: "info",
     AdminEventType.MISSION_RELEASED: "info",
+    AdminEventType.JOB_LAGGING: "warning",
 }
 
 
@@ -57,6 +68,63 @@ def _event_id() -> str:
     return f"adm_{uuid.uuid4().hex[:14]}"
 
 
+# ── Bus temps réel (SSE) ─────────────────────────────────────────────────────
+
+# Taille max de la file d'un abonné : un onglet admin qui ne consomme plus
+# (réseau coupé, onglet gelé) ne doit pas faire grossir la mémoire du process.
+SUBSCRIBER_QUEUE_SIZE = 100
+# Fenêtre d'event_id déjà publiés : évite le double envoi quand l'insertion
+# locale et le change stream remontent le même événement.
+_RECENT_IDS_SIZE = 500
+
+
+class AdminEventBroker:
+    """Pub/sub en mémoire : un `asyncio.Queue` par connexion SSE."""
+
+    def __init__(self) -> None:
+        self._subscribers: set[asyncio.Queue] = set()
+        self._recent_ids: deque[str] = deque(maxlen=_RECENT_IDS_SIZE)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+
+    def publish(self, event: dict[str, Any]) -> bool:
+        event_id = event.get("event_id")
+        if not event_id or event_id in self._recent_ids:
+            return False
+        self._recent_ids.append(event_id)
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Abonné trop lent : on le déconnecte (sentinelle None), le
+                # client se reconnecte avec Last-Event-ID et rattrape depuis
+                # `admin_events`.
+                self._subscribers.discard(queue)
+                queue.get_nowait()
+                queue.put_nowait(None)
+        return True
+
+
+broker = AdminEventBroker()
+
+
+def public_event(doc: dict[str, Any], admin_id: Optional[str] = None) -> dict[str, Any]:
+    """Forme envoyée au dashboard (même contrat que `list_admin_events`)."""
+    event = {key: value for key, value in doc.items() if key not in {"_id", "read_by"}}
+    event["is_read"] = bool(admin_id) and admin_id in (doc.get("read_by") or [])
+    return event
+
+
 async def record_admin_event(
     event_type: str,
     title: str,
@@ -84,6 +152,7 @@ async def record_admin_event(
             "read_by": [],  # liste des admin_id ayant marqué comme lu
         }
         await db.admin_events.insert_one(doc)
+        broker.publish(doc)
         return doc["event_id"]
     except Exception as exc:
         logger.warning("record_admin_event failed: %s", exc)
@@ -136,3 +205,62 @@ async def mark_all_read(admin_id: str) -> int:
         {"$addToSet": {"read_by": admin_id}},
     )
     return result.modified_count
+
+
+async def list_admin_events_after(
+    admin_id: str,
+    last_event_id: str,
+    *,
+    limit: int = 200,
+) -> list[dict[str, Any]]:
+    """
+    Rejoue les événements postérieurs à `last_event_id` (reconnexion SSE avec
+    l'en-tête Last-Event-ID), du plus ancien au plus récent.
+    """
+    anchor = await db.admin_events.find_one(
+        {"event_id": last_event_id},
+        {"_id": 0, "created_at": 1},
+    )
+    if not anchor or not anchor.get("created_at"):
+        return []
+    cursor = (
+        db.admin_events.find(
+            {"created_at": {"$gte": anchor["created_at"]}, "event_id": {"$ne": last_event_id}},
+            {"_id": 0},
+        )
+        .sort("created_at", 1)
+        .limit(limit)
+    )
+    return [public_event(ev, admin_id) async for ev in cursor]
+
+
+async def watch_admin_events_changes() -> None:
+    """
+    Relaie sur le bus local les événements insérés par les autres workers.
+
+    Nécessite un replica set : sur un Mongo standalone le change stream est
+    refusé, on s'arrête proprement (mono-worker, le bus local suffit).
+    """
+    resume_token = None
+    while True:
+        try:
+            async with db.admin_events.watch(
+                [{"$match": {"operationType": "insert"}}],
+                resume_after=resume_token,
+            ) as stream:
+                async for change in stream:
+                    resume_token = stream.resume_token
+                    doc = change.get("fullDocument") or {}
+                    doc.pop("_id", None)
+                    broker.publish(doc)
+        except asyncio.CancelledError:
+            raise
+        except OperationFailure as exc:
+            if exc.code in {40573, 40324}:
+                logger.info("Change stream admin_events indisponible (Mongo standalone)")
+                return
+            logger.warning("Change stream admin_events interrompu : %s", exc)
+            resume_token = None
+        except Exception as exc:
+            logger.warning("Change stream admin_events interrompu : %s", exc)
+        await asyncio.sleep(5)
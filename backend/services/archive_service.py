@@ -0,0 +1,154 @@
+"""
+Tiering chaud / froid des colis terminés.
+
+Les colis en statut terminal (livré, annulé, expiré, retourné) dont la
+dernière modification dépasse `PARCEL_ARCHIVE_AFTER_DAYS` quittent les
+collections opérationnelles avec leurs missions et leurs événements :
+`parcels` → `parcels_archive`, `delivery_missions` → `delivery_missions_archive`,
+`parcel_events` → `parcel_events_archive`. Le déplacement se fait par lots
+bornés, avec une pause entre chaque lot (mêmes réglages de débit que la
+rétention) ; il est déclenché par le job de rétention.
+
+Ne sont jamais archivés : un colis dont une mission est encore ouverte, ni un
+colis livré non payé (il doit rester visible de la réconciliation finance).
+
+Les lectures unitaires (détail colis, suivi public, audit admin) passent par
+`find_one_with_archive` / `find_with_archive` : collection chaude d'abord,
+archive seulement si rien n'y est trouvé. Les listes et agrégats
+opérationnels ne lisent que les collections chaudes ; seule la réconciliation
+des compteurs du dashboard (services/counters_service.py) inclut
+`parcels_archive`, pour que les cumuls ne baissent pas après un tiering.
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from config import settings
+from database import db
+from models.common import ParcelStatus
+from models.delivery import MissionStatus
+from services.finance_reconciliation_service import DELIVERED_UNPAID_QUERY
+from services.retention_service import insert_into_archive
+
+logger = logging.getLogger(__name__)
+
+ARCHIVABLE_PARCEL_STATUSES = (
+    ParcelStatus.DELIVERED.value,
+    ParcelStatus.CANCELLED.value,
+    ParcelStatus.EXPIRED.value,
+    ParcelStatus.RETURNED.value,
+)
+_OPEN_MISSION_STATUSES = {
+    MissionStatus.PENDING.value,
+    MissionStatus.ASSIGNED.value,
+    MissionStatus.IN_PROGRESS.value,
+    MissionStatus.INCIDENT_REPORTED.value,
+}
+# Ordre de copie : le colis en dernier, pour qu'il ne soit jamais visible dans
+# l'archive sans sa timeline. Ordre de suppression : le colis en premier.
+_TIERED_COLLECTIONS = ("parcel_events", "delivery_missions", "parcels")
+
+
+def archive_collection_name(collection_name: str) -> str:
+    return f"{collection_name}_archive"
+
+
+async def find_one_with_archive(
+    collection_name: str,
+    query: dict[str, Any],
+    projection: Optional[dict[str, Any]] = None,
+) -> Optional[dict]:
+    doc = await db[collection_name].find_one(query, projection)
+    if doc is not None:
+        return doc
+    return await db[archive_collection_name(collection_name)].find_one(query, projection)
+
+
+async def find_with_archive(
+    collection_name: str,
+    query: dict[str, Any],
+    projection: Optional[dict[str, Any]] = None,
+    *,
+    sort: Optional[list[tuple[str, int]]] = None,
+    length: int = 100,
+) -> list[dict]:
+    """Documents chauds ; à défaut, ceux de l'archive (jamais un mélange des deux)."""
+    for name in (collection_name, archive_collection_name(collection_name)):
+        cursor = db[name].find(query, projection)
+        if sort:
+            cursor = cursor.sort(sort)
+        docs = await cursor.to_list(length=length)
+        if docs:
+            return docs
+    return []
+
+
+def archivable_parcels_query(cutoff: datetime, excluded_ids: list[str]) -> dict[str, Any]:
+    query: dict[str, Any] = {
+        "status": {"$in": list(ARCHIVABLE_PARCEL_STATUSES)},
+        "updated_at": {"$lt": cutoff},
+        "$nor": [DELIVERED_UNPAID_QUERY],
+    }
+    if excluded_ids:
+        query["parcel_id"] = {"$nin": excluded_ids}
+    return query
+
+
+async def _move_batch(docs_by_collection: dict[str, list[dict]], moved: dict[str, int]) -> None:
+    now = datetime.now(timezone.utc)
+    # Copie complète avant toute suppression : une interruption laisse au pire
+    # des doublons (chaud + archive), jamais un trou.
+    for name in _TIERED_COLLECTIONS:
+        if docs_by_collection[name]:
+            await insert_into_archive(name, docs_by_collection[name], now)
+    for name in reversed(_TIERED_COLLECTIONS):
+        docs = docs_by_collection[name]
+        if not docs:
+            continue
+        result = await db[name].delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+        moved[name] += result.deleted_count
+
+
+async def archive_terminal_parcels(
+    cutoff: datetime,
+    *,
+    batch_size: Optional[int] = None,
+    max_batches: Optional[int] = None,
+    pause_seconds: Optional[float] = None,
+) -> dict[str, int]:
+    """Déplace par lots les colis terminés avant `cutoff`, missions et événements compris."""
+    batch_size = batch_size or settings.PARCEL_ARCHIVE_BATCH_SIZE
+    max_batches = max_batches or settings.RETENTION_MAX_BATCHES_PER_RUN
+    if pause_seconds is None:
+        pause_seconds = settings.RETENTION_BATCH_PAUSE_MS / 1000
+    moved = {name: 0 for name in _TIERED_COLLECTIONS}
+    # Colis écartés (mission encore ouverte) : exclus des lots suivants pour ne
+    # pas les relire en boucle.
+    skipped: list[str] = []
+    for _ in range(max_batches):
+        parcels = await db.parcels.find(archivable_parcels_query(cutoff, skipped)).sort(
+            "updated_at", 1
+        ).limit(batch_size).to_list(length=batch_size)
+        if not parcels:
+            break
+        parcel_ids = [parcel["parcel_id"] for parcel in parcels]
+        missions = await db.delivery_missions.find({"parcel_id": {"$in": parcel_ids}}).to_list(length=None)
+        busy = {mission["parcel_id"] for mission in missions if mission.get("status") in _OPEN_MISSION_STATUSES}
+        if busy:
+            skipped.extend(sorted(busy))
+            parcels = [parcel for parcel in parcels if parcel["parcel_id"] not in busy]
+            missions = [mission for mission in missions if mission["parcel_id"] not in busy]
+            parcel_ids = [parcel["parcel_id"] for parcel in parcels]
+        if parcel_ids:
+            events = await db.parcel_events.find({"parcel_id": {"$in": parcel_ids}}).to_list(length=None)
+            await _move_batch(
+                {"parcels": parcels, "delivery_missions": missions, "parcel_events": events},
+                moved,
+            )
+        if len(parcels) + len(busy) < batch_size:
+            break
+        await asyncio.sleep(pause_seconds)
+    if skipped:
+        logger.warning("Tiering : %s colis terminé(s) conservé(s) (mission encore ouverte)", len(skipped))
+    return moved
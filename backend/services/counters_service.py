@@ -0,0 +1,314 @@
+"""
+Compteurs opérationnels du dashboard admin, maintenus au fil de l'eau.
+
+Collection `ops_counters` :
+  - `_id: "global"` : colis par statut / par mode, chiffre d'affaires cumulé
+    (paid_price des colis livrés), demandes de retrait par statut, utilisateurs
+    par rôle, bannis, KYC vérifiés, téléphones vérifiés, livreurs actifs ;
+  - `_id: "day:YYYY-MM-DD"` (UTC) : colis et comptes créés, colis livrés et CA
+    du jour.
+
+Chaque écriture métier (création de colis, `transition_status`, retraits,
+cycle de vie des comptes) applique la *différence* des compteurs entre l'état
+avant et après (`$inc` atomique, un seul aller-retour `bulk_write`). Les
+compteurs ne sont pas écrits dans la même transaction que la donnée : un échec
+entre les deux, ou une écriture hors de ces chemins, crée une dérive que
+`reconcile_counters` (job nocturne) corrige en recalculant tout depuis les
+collections sources. Les colis archivés (`parcels_archive`, voir
+services/archive_service.py) restent comptés dans les cumuls globaux.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import Any, Optional
+
+from pymongo import UpdateOne
+
+from database import db
+from models.common import ParcelStatus, UserRole
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_ID = "global"
+# Les documents journaliers sont purgés par index TTL après cette durée.
+DAY_RETENTION_DAYS = 400
+RECONCILE_DAYS = 2
+
+_DELIVERED = ParcelStatus.DELIVERED.value
+
+
+def day_id(when: datetime) -> str:
+    return f"day:{when.astimezone(timezone.utc).strftime('%Y-%m-%d')}"
+
+
+def _price(parcel: dict) -> float:
+    try:
+        return float(parcel.get("paid_price") or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+# --- Valeurs de compteurs par document ------------------------------------------
+
+def parcel_counter_values(parcel: Optional[dict]) -> dict[str, float]:
+    if not parcel:
+        return {}
+    values: dict[str, float] = {
+        "parcels.total": 1,
+        f"parcels.by_status.{parcel.get('status') or 'unknown'}": 1,
+        f"parcels.by_mode.{parcel.get('delivery_mode') or 'unknown'}": 1,
+    }
+    if parcel.get("status") == _DELIVERED:
+        values["revenue_xof"] = _price(parcel)
+    return values
+
+
+def user_counter_values(user: Optional[dict]) -> dict[str, float]:
+    if not user:
+        return {}
+    role = user.get("role") or "unknown"
+    values: dict[str, float] = {"users.total": 1, f"users.by_role.{role}": 1}
+    if user.get("is_banned"):
+        values["users.banned"] = 1
+    if user.get("kyc_status") == "verified":
+        values["users.kyc_verified"] = 1
+    if user.get("is_phone_verified"):
+        values["users.phone_verified"] = 1
+    if role == UserRole.DRIVER.value and user.get("is_active", True):
+        values["users.active_drivers"] = 1
+    return values
+
+
+def payout_counter_values(payout: Optional[dict]) -> dict[str, float]:
+    if not payout:
+        return {}
+    return {f"payouts.by_status.{payout.get('status') or 'unknown'}": 1}
+
+
+# Champs à relire avant une écriture pour calculer la différence.
+PARCEL_COUNTER_PROJECTION = {"_id": 0, "status": 1, "delivery_mode": 1, "paid_price": 1}
+USER_COUNTER_PROJECTION = {
+    "_id": 0, "role": 1, "is_active": 1, "is_banned": 1, "kyc_status": 1, "is_phone_verified": 1,
+}
+
+
+def counter_deltas(before: dict[str, float], after: dict[str, float]) -> dict[str, float]:
+    deltas = {key: after.get(key, 0) - before.get(key, 0) for key in {*before, *after}}
+    return {key: value for key, value in deltas.items() if value}
+
+
+# --- Écriture ---------------------------------------------------------------------
+
+async def apply_counter_deltas(
+    deltas: dict[str, float],
+    day_deltas: Optional[dict[str, float]] = None,
+    when: Optional[datetime] = None,
+) -> None:
+    """`$inc` sur le document global (et journalier) ; n'échoue jamais l'appelant."""
+    if not deltas and not day_deltas:
+        return
+    when = when or datetime.now(timezone.utc)
+    operations = []
+    if deltas:
+        operations.append(UpdateOne({"_id": GLOBAL_ID}, {"$inc": deltas}, upsert=True))
+    if day_deltas:
+        operations.append(UpdateOne(
+            {"_id": day_id(when)},
+            {
+                "$inc": day_deltas,
+                "$setOnInsert": {"expires_at": when + timedelta(days=DAY_RETENTION_DAYS)},
+            },
+            upsert=True,
+        ))
+    try:
+        await db.ops_counters.bulk_write(operations, ordered=False)
+    except Exception as exc:
+        logger.warning("Compteurs dashboard non mis à jour (corrigé à la réconciliation) : %s", exc)
+
+
+async def record_parcel_change(before: Optional[dict], after: Optional[dict]) -> None:
+    """Création (`before=None`) ou changement de statut d'un colis."""
+    day: dict[str, float] = {}
+    if before is None and after:
+        day["parcels_created"] = 1
+        day[f"parcels_created_by_mode.{after.get('delivery_mode') or 'unknown'}"] = 1
+    if after and after.get("status") == _DELIVERED and (before or {}).get("status") != _DELIVERED:
+        day["parcels_delivered"] = 1
+        day["revenue_xof"] = _price(after)
+    await apply_counter_deltas(
+        counter_deltas(parcel_counter_values(before), parcel_counter_values(after)),
+        day,
+    )
+
+
+async def record_parcels_status_change(from_status: str, to_status: str, count: int) -> None:
+    """Changement de statut en masse (expiration) hors statut livré."""
+    if count:
+        await apply_counter_deltas({
+            f"parcels.by_status.{from_status}": -count,
+            f"parcels.by_status.{to_status}": count,
+        })
+
+
+async def record_user_change(before: Optional[dict], after: Optional[dict]) -> None:
+    """Création (`before=None`) ou modification de rôle / bannissement / KYC / téléphone."""
+    day: dict[str, float] = {}
+    if before is None and after:
+        day["users_created"] = 1
+    await apply_counter_deltas(
+        counter_deltas(user_counter_values(before), user_counter_values(after)),
+        day,
+    )
+
+
+async def record_payout_change(before: Optional[dict], after: Optional[dict]) -> None:
+    await apply_counter_deltas(counter_deltas(payout_counter_values(before), payout_counter_values(after)))
+
+
+# --- Lecture ------------------------------------------------------------------------
+
+def counter(doc: Optional[dict], path: str, default: Any = 0) -> Any:
+    """Valeur d'un compteur imbriqué (`parcels.by_status.delivered`)."""
+    current: Any = doc or {}
+    for part in path.split("."):
+        if not isinstance(current, dict):
+            return default
+        current = current.get(part)
+    return default if current is None else current
+
+
+async def load_counters(now: Optional[datetime] = None) -> tuple[dict, dict]:
+    """
+    (document global, document du jour) en une seule requête. Au premier appel
+    sur une base sans compteurs, ils sont d'abord construits par réconciliation.
+    """
+    now = now or datetime.now(timezone.utc)
+    today = day_id(now)
+    docs = await db.ops_counters.find({"_id": {"$in": [GLOBAL_ID, today]}}).to_list(length=2)
+    by_id = {doc["_id"]: doc for doc in docs}
+    if GLOBAL_ID not in by_id:
+        await reconcile_counters(now)
+        docs = await db.ops_counters.find({"_id": {"$in": [GLOBAL_ID, today]}}).to_list(length=2)
+        by_id = {doc["_id"]: doc for doc in docs}
+    return by_id.get(GLOBAL_ID, {}), by_id.get(today, {})
+
+
+# --- Réconciliation -----------------------------------------------------------------
+
+def _flatten(prefix: str, rows: list[dict]) -> dict[str, float]:
+    return {f"{prefix}.{row['_id'] or 'unknown'}": row["n"] for row in rows}
+
+
+_PARCEL_COUNTER_FIELDS = {"_id": 0, "status": 1, "delivery_mode": 1, "paid_price": 1}
+
+
+async def _rebuild_global() -> dict[str, float]:
+    parcels = (await db.parcels.aggregate([
+        {"$project": _PARCEL_COUNTER_FIELDS},
+        {"$unionWith": {"coll": "parcels_archive", "pipeline": [{"$project": _PARCEL_COUNTER_FIELDS}]}},
+        {"$facet": {
+            "by_status": [{"$group": {"_id": "$status", "n": {"$sum": 1}}}],
+            "by_mode": [{"$group": {"_id": "$delivery_mode", "n": {"$sum": 1}}}],
+            "revenue": [
+                {"$match": {"status": _DELIVERED, "paid_price": {"$ne": None}}},
+                {"$group": {"_id": None, "n": {"$sum": "$paid_price"}}},
+            ],
+        }},
+    ]).to_list(length=1))[0]
+    users = (await db.users.aggregate([{"$facet": {
+        "by_role": [{"$group": {"_id": "$role", "n": {"$sum": 1}}}],
+        "banned": [{"$match": {"is_banned": True}}, {"$count": "n"}],
+        "kyc_verified": [{"$match": {"kyc_status": "verified"}}, {"$count": "n"}],
+        "phone_verified": [{"$match": {"is_phone_verified": True}}, {"$count": "n"}],
+        "active_drivers": [
+            {"$match": {"role": UserRole.DRIVER.value, "is_active": {"$ne": False}}},
+            {"$count": "n"},
+        ],
+    }}]).to_list(length=1))[0]
+    payouts = await db.payout_requests.aggregate([
+        {"$group": {"_id": "$status", "n": {"$sum": 1}}},
+    ]).to_list(length=50)
+
+    values: dict[str, float] = {
+        **_flatten("parcels.by_status", parcels["by_status"]),
+        **_flatten("parcels.by_mode", parcels["by_mode"]),
+        **_flatten("users.by_role", users["by_role"]),
+        **_flatten("payouts.by_status", payouts),
+        "parcels.total": sum(row["n"] for row in parcels["by_status"]),
+        "users.total": sum(row["n"] for row in users["by_role"]),
+        "revenue_xof": parcels["revenue"][0]["n"] if parcels["revenue"] else 0,
+    }
+    for key in ("banned", "kyc_verified", "phone_verified", "active_drivers"):
+        values[f"users.{key}"] = users[key][0]["n"] if users[key] else 0
+    return values
+
+
+async def _rebuild_day(start: datetime) -> dict[str, float]:
+    end = start + timedelta(days=1)
+    created = {"created_at": {"$gte": start, "$lt": end}}
+    by_mode = await db.parcels.aggregate([
+        {"$match": created},
+        {"$group": {"_id": "$delivery_mode", "n": {"$sum": 1}}},
+    ]).to_list(length=50)
+    delivered_ids = await db.parcel_events.distinct("parcel_id", {
+        "event_type": "STATUS_CHANGED",
+        "to_status": _DELIVERED,
+        "created_at": {"$gte": start, "$lt": end},
+    })
+    revenue = await db.parcels.aggregate([
+        {"$match": {"parcel_id": {"$in": delivered_ids}, "paid_price": {"$ne": None}}},
+        {"$group": {"_id": None, "n": {"$sum": "$paid_price"}}},
+    ]).to_list(length=1)
+    return {
+        **_flatten("parcels_created_by_mode", by_mode),
+        "parcels_created": sum(row["n"] for row in by_mode),
+        "users_created": await db.users.count_documents(created),
+        "parcels_delivered": len(delivered_ids),
+        "revenue_xof": revenue[0]["n"] if revenue else 0,
+    }
+
+
+def _flatten_doc(doc: dict, prefix: str = "") -> dict[str, float]:
+    flat: dict[str, float] = {}
+    for key, value in doc.items():
+        if key in {"_id", "expires_at", "reconciled_at"}:
+            continue
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten_doc(value, f"{path}."))
+        else:
+            flat[path] = value
+    return flat
+
+
+async def reconcile_counters(now: Optional[datetime] = None) -> int:
+    """
+    Recalcule les compteurs depuis les collections sources (job nocturne) et
+    corrige la dérive par `$inc` (recalcul − valeur lue juste après), pour ne
+    pas écraser les incréments concurrents. Reste une fenêtre, limitée à la
+    durée d'une agrégation : un incrément appliqué après son instantané mais
+    avant la lecture est annulé par la correction, jusqu'au passage suivant.
+    Retourne le nombre de compteurs corrigés ; une dérive est journalisée.
+    """
+    now = now or datetime.now(timezone.utc)
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    targets = [(GLOBAL_ID, _rebuild_global)]
+    for offset in range(RECONCILE_DAYS):
+        start = today - timedelta(days=offset)
+        targets.append((day_id(start), partial(_rebuild_day, start)))
+
+    corrected = 0
+    for doc_id, rebuild in targets:
+        values = await rebuild()
+        previous = await db.ops_counters.find_one({"_id": doc_id}) or {}
+        drift = counter_deltas(_flatten_doc(previous), values)
+        if drift:
+            corrected += len(drift)
+            logger.warning("Compteurs %s : dérive corrigée %s", doc_id, drift)
+        update: dict = {"$set": {"reconciled_at": now}}
+        if drift:
+            update["$inc"] = drift
+        if doc_id != GLOBAL_ID:
+            update["$setOnInsert"] = {"expires_at": now + timedelta(days=DAY_RETENTION_DAYS)}
+        await db.ops_counters.update_one({"_id": doc_id}, update, upsert=True)
+    return corrected
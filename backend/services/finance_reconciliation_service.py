@@ -0,0 +1,420 @@
+"""
+Réconciliation finance / opérations, en flux et incrémentale.
+
+Chaque contrôle parcourt ses sujets (wallets, retraits, missions, colis) par
+lots triés de FINANCE_RECONCILIATION_BATCH_SIZE identifiants ; pour un lot,
+les totaux (retraits en attente, sommes du grand livre par type) sont calculés
+par des agrégations Mongo groupées par wallet. Rien n'est chargé en entier :
+la mémoire reste bornée par la taille d'un lot, quelle que soit la taille du
+grand livre.
+
+Le point de reprise est le `started_at` de la dernière exécution terminée
+(`reconciliation_runs`) : une exécution incrémentale n'examine que les wallets
+et retraits touchés depuis (moins FINANCE_RECONCILIATION_OVERLAP_SECONDS),
+plus les écarts encore ouverts. Les missions actives, en nombre borné par
+l'activité, sont toujours relues en entier.
+
+Les écarts sont persistés dans `finance_discrepancies` (un document par
+contrôle et par sujet, `open` puis `resolved`) ; le rapport de
+GET /api/admin/finance/reconciliation se lit dans cette collection.
+"""
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from pymongo import UpdateMany, UpdateOne
+
+from config import settings
+from core.leases import acquire_lease, release_lease
+from database import db
+from models.common import ParcelStatus
+from models.wallet import TransactionType
+
+logger = logging.getLogger(__name__)
+
+RECONCILIATION_LEASE = "finance_reconciliation"
+_LEASE_TTL_SECONDS = 3600
+_AMOUNT_TOLERANCE = 0.01
+
+ISSUE_KINDS = (
+    "wallet_pending_mismatches",
+    "negative_wallets",
+    "payout_ledger_gaps",
+    "mission_parcel_mismatches",
+    "delivered_unpaid",
+)
+
+ACTIVE_MISSION_STATUSES = ["pending", "assigned", "in_progress"]
+ACTIVE_PARCEL_STATUSES = {
+    ParcelStatus.CREATED.value,
+    ParcelStatus.DROPPED_AT_ORIGIN_RELAY.value,
+    ParcelStatus.IN_TRANSIT.value,
+    ParcelStatus.AT_DESTINATION_RELAY.value,
+    ParcelStatus.AVAILABLE_AT_RELAY.value,
+    ParcelStatus.OUT_FOR_DELIVERY.value,
+    ParcelStatus.REDIRECTED_TO_RELAY.value,
+    ParcelStatus.INCIDENT_REPORTED.value,
+    ParcelStatus.SUSPENDED.value,
+}
+DELIVERED_UNPAID_QUERY = {
+    "status": ParcelStatus.DELIVERED.value,
+    "payment_status": {"$ne": "paid"},
+    "payment_override": {"$ne": True},
+    "who_pays": {"$ne": "recipient"},
+}
+# Type de mouvement attendu au grand livre pour chaque statut de retrait.
+EXPECTED_PAYOUT_TX_TYPES = {
+    "pending": TransactionType.PENDING.value,
+    "approved": TransactionType.DEBIT.value,
+    "rejected": TransactionType.CREDIT.value,
+}
+
+Issue = tuple[str, str, dict]
+Source = tuple[str, dict, str]
+
+
+def _amount(value: Any) -> float:
+    return round(float(value or 0.0), 2)
+
+
+async def stream_ids(
+    collection_name: str,
+    query: dict,
+    field: str,
+    batch_size: int,
+) -> AsyncIterator[list[str]]:
+    """
+    Valeurs distinctes de `field` pour `query`, triées, par lots de
+    `batch_size` (curseur d'agrégation, regroupement côté serveur).
+    """
+    pipeline = [
+        {"$match": query},
+        {"$group": {"_id": f"${field}"}},
+        {"$sort": {"_id": 1}},
+    ]
+    batch: list[str] = []
+    cursor = db[collection_name].aggregate(pipeline, allowDiskUse=True, batchSize=batch_size)
+    async for row in cursor:
+        if row.get("_id") is None:
+            continue
+        batch.append(row["_id"])
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ── Contrôles : un lot d'identifiants -> écarts constatés ────────────────────
+
+async def evaluate_wallets(wallet_ids: list[str]) -> list[Issue]:
+    wallets = await db.wallets.find(
+        {"wallet_id": {"$in": wallet_ids}},
+        {"_id": 0, "wallet_id": 1, "owner_id": 1, "owner_type": 1, "balance": 1, "pending": 1, "updated_at": 1},
+    ).to_list(length=len(wallet_ids))
+    pending_rows = await db.payout_requests.aggregate([
+        {"$match": {"wallet_id": {"$in": wallet_ids}, "status": "pending"}},
+        {"$group": {"_id": "$wallet_id", "amount": {"$sum": "$amount"}}},
+    ]).to_list(length=len(wallet_ids))
+    ledger_rows = await db.wallet_transactions.aggregate([
+        {"$match": {"wallet_id": {"$in": wallet_ids}}},
+        {"$group": {
+            "_id": {"wallet_id": "$wallet_id", "tx_type": "$tx_type"},
+            "amount": {"$sum": "$amount"},
+        }},
+    ]).to_list(length=None)
+
+    pending_by_wallet = {row["_id"]: _amount(row.get("amount")) for row in pending_rows}
+    ledger_by_wallet: dict[str, dict[str, float]] = {}
+    for row in ledger_rows:
+        key = row["_id"]
+        ledger_by_wallet.setdefault(key.get("wallet_id"), {})[key.get("tx_type")] = _amount(row.get("amount"))
+
+    issues: list[Issue] = []
+    for wallet in wallets:
+        wallet_id = wallet["wallet_id"]
+        expected_pending = pending_by_wallet.get(wallet_id, 0.0)
+        actual_pending = _amount(wallet.get("pending"))
+        balance = float(wallet.get("balance", 0.0) or 0.0)
+        base = {
+            "wallet_id": wallet_id,
+            "owner_id": wallet.get("owner_id"),
+            "owner_type": wallet.get("owner_type"),
+            "updated_at": wallet.get("updated_at"),
+        }
+        if abs(actual_pending - expected_pending) > _AMOUNT_TOLERANCE:
+            issues.append(("wallet_pending_mismatches", wallet_id, {
+                **base,
+                "wallet_pending": actual_pending,
+                "expected_pending": expected_pending,
+                "ledger_totals": ledger_by_wallet.get(wallet_id, {}),
+            }))
+        if balance < 0 or actual_pending < 0:
+            issues.append(("negative_wallets", wallet_id, {
+                **base,
+                "balance": balance,
+                "pending": actual_pending,
+            }))
+    return issues
+
+
+async def evaluate_payouts(payout_ids: list[str]) -> list[Issue]:
+    payouts = await db.payout_requests.find(
+        {"payout_id": {"$in": payout_ids}, "status": {"$in": list(EXPECTED_PAYOUT_TX_TYPES)}},
+        {"_id": 0, "payout_id": 1, "wallet_id": 1, "owner_id": 1, "amount": 1, "status": 1, "updated_at": 1},
+    ).to_list(length=len(payout_ids))
+    if not payouts:
+        return []
+    txs = await db.wallet_transactions.find(
+        {"reference": {"$in": [payout["payout_id"] for payout in payouts]}},
+        {"_id": 0, "wallet_id": 1, "reference": 1, "tx_type": 1},
+    ).to_list(length=None)
+    recorded = {(tx.get("wallet_id"), tx.get("reference"), tx.get("tx_type")) for tx in txs}
+
+    issues: list[Issue] = []
+    for payout in payouts:
+        expected_type = EXPECTED_PAYOUT_TX_TYPES[payout["status"]]
+        if (payout.get("wallet_id"), payout["payout_id"], expected_type) in recorded:
+            continue
+        issues.append(("payout_ledger_gaps", payout["payout_id"], {
+            "payout_id": payout["payout_id"],
+            "wallet_id": payout.get("wallet_id"),
+            "owner_id": payout.get("owner_id"),
+            "status": payout.get("status"),
+            "expected_tx_type": expected_type,
+            "amount": float(payout.get("amount", 0.0) or 0.0),
+            "updated_at": payout.get("updated_at"),
+        }))
+    return issues
+
+
+async def evaluate_missions(mission_ids: list[str]) -> list[Issue]:
+    missions = await db.delivery_missions.find(
+        {"mission_id": {"$in": mission_ids}, "status": {"$in": ACTIVE_MISSION_STATUSES}},
+        {"_id": 0, "mission_id": 1, "parcel_id": 1, "status": 1, "driver_id": 1, "updated_at": 1},
+    ).to_list(length=len(mission_ids))
+    parcel_ids = [mission["parcel_id"] for mission in missions if mission.get("parcel_id")]
+    parcels = await db.parcels.find(
+        {"parcel_id": {"$in": parcel_ids}},
+        {"_id": 0, "parcel_id": 1, "status": 1},
+    ).to_list(length=len(parcel_ids)) if parcel_ids else []
+    parcel_map = {parcel["parcel_id"]: parcel for parcel in parcels}
+
+    issues: list[Issue] = []
+    for mission in missions:
+        parcel = parcel_map.get(mission.get("parcel_id"))
+        if parcel and parcel.get("status") in ACTIVE_PARCEL_STATUSES:
+            continue
+        issues.append(("mission_parcel_mismatches", mission["mission_id"], {
+            "mission_id": mission["mission_id"],
+            "parcel_id": mission.get("parcel_id"),
+            "mission_status": mission.get("status"),
+            "parcel_status": parcel.get("status") if parcel else None,
+            "driver_id": mission.get("driver_id"),
+            "updated_at": mission.get("updated_at"),
+        }))
+    return issues
+
+
+async def evaluate_delivered_unpaid(parcel_ids: list[str]) -> list[Issue]:
+    parcels = await db.parcels.find(
+        {"parcel_id": {"$in": parcel_ids}, **DELIVERED_UNPAID_QUERY},
+        {"_id": 0, "parcel_id": 1, "tracking_code": 1, "payment_status": 1, "who_pays": 1, "updated_at": 1},
+    ).to_list(length=len(parcel_ids))
+    return [("delivered_unpaid", parcel["parcel_id"], parcel) for parcel in parcels]
+
+
+def reconciliation_checks(since: Optional[datetime]) -> list[dict[str, Any]]:
+    """
+    Contrôles et sources de sujets. `since` à None = passage complet ; sinon
+    seuls les sujets modifiés depuis `since` sont relus. Les écarts encore
+    ouverts sont ajoutés comme source dans les deux cas.
+    """
+    touched = {"$gte": since} if since else None
+
+    def _sources(full: list[Source], incremental: list[Source]) -> list[Source]:
+        return incremental if since else full
+
+    return [
+        {
+            "name": "wallets",
+            "kinds": ("wallet_pending_mismatches", "negative_wallets"),
+            "evaluate": evaluate_wallets,
+            "sources": _sources(
+                [("wallets", {}, "wallet_id")],
+                [
+                    ("wallets", {"updated_at": touched}, "wallet_id"),
+                    ("payout_requests", {"updated_at": touched}, "wallet_id"),
+                    ("wallet_transactions", {"created_at": touched}, "wallet_id"),
+                ],
+            ),
+        },
+        {
+            "name": "payouts",
+            "kinds": ("payout_ledger_gaps",),
+            "evaluate": evaluate_payouts,
+            "sources": _sources(
+                [("payout_requests", {}, "payout_id")],
+                [
+                    ("payout_requests", {"updated_at": touched}, "payout_id"),
+                    ("wallet_transactions", {"created_at": touched, "reference": {"$ne": None}}, "reference"),
+                ],
+            ),
+        },
+        {
+            "name": "missions",
+            "kinds": ("mission_parcel_mismatches",),
+            "evaluate": evaluate_missions,
+            "sources": [("delivery_missions", {"status": {"$in": ACTIVE_MISSION_STATUSES}}, "mission_id")],
+        },
+        {
+            "name": "parcels",
+            "kinds": ("delivered_unpaid",),
+            "evaluate": evaluate_delivered_unpaid,
+            "sources": _sources(
+                [("parcels", DELIVERED_UNPAID_QUERY, "parcel_id")],
+                [("parcels", {**DELIVERED_UNPAID_QUERY, "updated_at": touched}, "parcel_id")],
+            ),
+        },
+    ]
+
+
+async def _persist_batch(kinds: tuple[str, ...], subject_ids: list[str], issues: list[Issue], run_id: str) -> None:
+    """Ouvre / rafraîchit les écarts constatés et clôt ceux qui ont disparu."""
+    now = datetime.now(timezone.utc)
+    flagged: dict[str, set[str]] = {kind: set() for kind in kinds}
+    operations: list[Any] = []
+    for kind, subject_id, details in issues:
+        flagged[kind].add(subject_id)
+        operations.append(UpdateOne(
+            {"discrepancy_id": f"{kind}:{subject_id}"},
+            {
+                "$set": {
+                    "kind": kind,
+                    "subject_id": subject_id,
+                    "status": "open",
+                    "details": details,
+                    "last_seen_at": now,
+                    "run_id": run_id,
+                },
+                "$setOnInsert": {"first_seen_at": now},
+                "$unset": {"resolved_at": ""},
+            },
+            upsert=True,
+        ))
+    for kind in kinds:
+        cleared = [subject_id for subject_id in subject_ids if subject_id not in flagged[kind]]
+        if cleared:
+            operations.append(UpdateMany(
+                {"kind": kind, "subject_id": {"$in": cleared}, "status": "open"},
+                {"$set": {"status": "resolved", "resolved_at": now, "run_id": run_id}},
+            ))
+    if operations:
+        await db.finance_discrepancies.bulk_write(operations, ordered=False)
+
+
+async def _run_check(check: dict[str, Any], run_id: str, batch_size: int) -> dict[str, int]:
+    evaluate: Callable[[list[str]], Awaitable[list[Issue]]] = check["evaluate"]
+    sources: list[Source] = [
+        *check["sources"],
+        ("finance_discrepancies", {"kind": {"$in": list(check["kinds"])}, "status": "open"}, "subject_id"),
+    ]
+    report = {"checked": 0, "issues": 0}
+    for collection_name, query, field in sources:
+        async for subject_ids in stream_ids(collection_name, query, field, batch_size):
+            issues = await evaluate(subject_ids)
+            await _persist_batch(check["kinds"], subject_ids, issues, run_id)
+            report["checked"] += len(subject_ids)
+            report["issues"] += len(issues)
+    return report
+
+
+async def last_completed_run() -> Optional[dict[str, Any]]:
+    return await db.reconciliation_runs.find_one(
+        {"status": "completed"},
+        {"_id": 0},
+        sort=[("started_at", -1)],
+    )
+
+
+async def run_reconciliation(full: bool = False) -> Optional[dict[str, Any]]:
+    """
+    Exécute la réconciliation (incrémentale depuis le dernier point de reprise,
+    complète si `full` ou s'il n'y en a pas encore) et persiste le rapport dans
+    `reconciliation_runs`. None si une exécution est déjà en cours, y compris
+    dans ce process : le bail est pris au nom de l'exécution, pas de l'instance.
+    """
+    owner = uuid.uuid4().hex
+    if not await acquire_lease(RECONCILIATION_LEASE, _LEASE_TTL_SECONDS, owner=owner):
+        logger.info("Réconciliation finance déjà en cours")
+        return None
+    try:
+        started_at = datetime.now(timezone.utc)
+        previous = None if full else await last_completed_run()
+        since = None
+        if previous and previous.get("started_at"):
+            since = previous["started_at"] - timedelta(seconds=settings.FINANCE_RECONCILIATION_OVERLAP_SECONDS)
+
+        run: dict[str, Any] = {
+            "run_id": f"rec_{uuid.uuid4().hex[:12]}",
+            "mode": "incremental" if since else "full",
+            "since": since,
+            "started_at": started_at,
+            "status": "running",
+            "checks": {},
+        }
+        await db.reconciliation_runs.insert_one({**run})
+        batch_size = settings.FINANCE_RECONCILIATION_BATCH_SIZE
+        try:
+            for check in reconciliation_checks(since):
+                run["checks"][check["name"]] = await _run_check(check, run["run_id"], batch_size)
+            run["status"] = "completed"
+        except Exception as exc:
+            logger.error("Réconciliation finance en échec : %s", exc)
+            run["status"] = "failed"
+            run["error"] = str(exc)[:240]
+        run["finished_at"] = datetime.now(timezone.utc)
+        await db.reconciliation_runs.update_one(
+            {"run_id": run["run_id"]},
+            {"$set": {key: run[key] for key in ("status", "checks", "finished_at", *(("error",) if "error" in run else ()))}},
+        )
+        logger.info(
+            "Réconciliation finance %s (%s) : %s",
+            run["status"],
+            run["mode"],
+            {name: check["checked"] for name, check in run["checks"].items()},
+        )
+        return run
+    finally:
+        await release_lease(RECONCILIATION_LEASE, owner=owner)
+
+
+async def get_reconciliation_report(limit: int = 20) -> dict[str, Any]:
+    """Écarts ouverts (les `limit` plus récents par contrôle) et dernière exécution."""
+    counts_rows = await db.finance_discrepancies.aggregate([
+        {"$match": {"status": "open"}},
+        {"$group": {"_id": "$kind", "count": {"$sum": 1}}},
+    ]).to_list(length=len(ISSUE_KINDS))
+    counts = {row["_id"]: int(row["count"]) for row in counts_rows}
+    last_run = await last_completed_run()
+    checks = (last_run or {}).get("checks", {})
+
+    report: dict[str, Any] = {
+        "summary": {
+            "wallets_checked": checks.get("wallets", {}).get("checked", 0),
+            "payouts_checked": checks.get("payouts", {}).get("checked", 0),
+            **{kind: counts.get(kind, 0) for kind in ISSUE_KINDS},
+            "issues_total": sum(counts.get(kind, 0) for kind in ISSUE_KINDS),
+            "last_run_id": (last_run or {}).get("run_id"),
+            "last_run_mode": (last_run or {}).get("mode"),
+            "last_run_at": (last_run or {}).get("finished_at"),
+        },
+    }
+    for kind in ISSUE_KINDS:
+        rows = await db.finance_discrepancies.find(
+            {"kind": kind, "status": "open"},
+            {"_id": 0, "details": 1},
+        ).sort("first_seen_at", -1).limit(limit).to_list(length=limit)
+        report[kind] = [row.get("details", {}) for row in rows]
+    return report
@@ -64,6 +64,10 @@ async def update_driver_gamification(driver_id: str, action: str, **kwargs):
         await db.users.update_one({"user_id": driver_id}, {"$set": update_fields})
         logger.info(f"Gamification updated for {driver_id}: {action} (+{xp_to_add} XP)")
 
+    if "average_rating" in update_fields:
+        from services.ranking_service import update_driver_stat
+        await update_driver_stat(driver_id)
+
 async def _evaluate_badges(user: dict, current_updates: dict) -> list[str]:
     """Vérifie si de nouveaux badges doivent être attribués."""
     badges = []
@@ -6,6 +6,7 @@ from typing import Optional, Dict, Any
 logger = logging.getLogger(__name__)
 
 from config import settings
+from core.metrics import external_call
 
 GOOGLE_DIRECTIONS_API_URL = "https://maps.googleapis.com/maps/api/directions/json"
 GOOGLE_GEOCODE_API_URL = "https://maps.googleapis.com/maps/api/geocode/json"
@@ -38,9 +39,12 @@ async def get_directions_eta(origin_lat: float, origin_lng: float, dest_lat: flo
     
     try:
         async with httpx.AsyncClient() as client:
-            response = await client.get(GOOGLE_DIRECTIONS_API_URL, params=params)
-            response.raise_for_status()
-            data = response.json()
+            with external_call("google_maps", "directions") as call:
+                response = await client.get(GOOGLE_DIRECTIONS_API_URL, params=params)
+                response.raise_for_status()
+                data = response.json()
+                if data.get("status") not in ("OK", "ZERO_RESULTS"):
+                    call.fail()
             
             if data.get("status") == "OK":
                 route = data["routes"][0]["legs"][0]
@@ -88,9 +92,12 @@ async def reverse_geocode(lat: float, lng: float) -> Optional[Dict]:
 
     try:
         async with httpx.AsyncClient(timeout=8.0) as client:
-            response = await client.get(GOOGLE_GEOCODE_API_URL, params=params)
-            response.raise_for_status()
-            data = response.json()
+            with external_call("google_maps", "reverse_geocode") as call:
+                response = await client.get(GOOGLE_GEOCODE_API_URL, params=params)
+                response.raise_for_status()
+                data = response.json()
+                if data.get("status") not in ("OK", "ZERO_RESULTS"):
+                    call.fail()
 
         if data.get("status") != "OK" or not data.get("results"):
             logger.warning(
@@ -186,9 +193,12 @@ async def geocode_address_suggestions(
 
     try:
         async with httpx.AsyncClient(timeout=8.0) as client:
-            response = await client.get(GOOGLE_GEOCODE_API_URL, params=params)
-            response.raise_for_status()
-            data = response.json()
+            with external_call("google_maps", "geocode") as call:
+                response = await client.get(GOOGLE_GEOCODE_API_URL, params=params)
+                response.raise_for_status()
+                data = response.json()
+                if data.get("status") not in ("OK", "ZERO_RESULTS"):
+                    call.fail()
 
         if data.get("status") not in ("OK", "ZERO_RESULTS"):
             logger.warning(
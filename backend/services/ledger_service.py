@@ -0,0 +1,296 @@
+"""
+Grand livre des wallets : instantanés de solde, relevés et audit.
+
+L'ordre du grand livre est `(created_at, tx_id)` croissant ; chaque mouvement
+porte son effet sur le solde et sur le montant en attente (`balance_delta`,
+`pending_delta`, écrits par `record_wallet_transaction`). Les mouvements
+antérieurs à ces champs sont interprétés selon leur type :
+
+  - credit  : +montant au solde (restitution d'un retrait rejeté : le
+    montant quitte aussi `pending`) ;
+  - debit   : −montant au solde, sauf le débit d'un retrait approuvé, déjà
+    sorti du solde à la demande, qui ne fait que vider `pending` ;
+  - pending : le montant passe du solde à `pending` ;
+  - revenue : hors solde (revenu livreur informatif).
+
+Un instantané (`wallet_balance_snapshots`) fige le solde « après le
+mouvement N ». Le solde à une position quelconque = instantané le plus proche
+en amont + somme des mouvements suivants : un audit ou une page de relevé ne
+relit que les mouvements postérieurs au dernier instantané.
+"""
+import csv
+import io
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Optional
+
+from database import db
+from models.wallet import TransactionType
+
+logger = logging.getLogger(__name__)
+
+# Identifiants de retrait (routers/wallets._payout_id) utilisés en référence.
+PAYOUT_REFERENCE_PREFIX = "pay_"
+# Les mouvements plus récents ne sont pas figés : un mouvement horodaté avant
+# l'instantané mais inséré après fausserait tous les soldes suivants.
+SNAPSHOT_SETTLE_SECONDS = 300
+SNAPSHOT_BATCH_SIZE = 500
+STATEMENT_EXPORT_BATCH_SIZE = 500
+
+LedgerKey = tuple[datetime, str]
+
+_IS_PAYOUT_REFERENCE = {
+    "$eq": [
+        {"$substrCP": [{"$ifNull": ["$reference", ""]}, 0, len(PAYOUT_REFERENCE_PREFIX)]},
+        PAYOUT_REFERENCE_PREFIX,
+    ]
+}
+_NEGATIVE_AMOUNT = {"$multiply": ["$amount", -1]}
+
+BALANCE_DELTA_EXPR = {"$ifNull": ["$balance_delta", {"$switch": {
+    "branches": [
+        {"case": {"$eq": ["$tx_type", TransactionType.CREDIT.value]}, "then": "$amount"},
+        {"case": {"$eq": ["$tx_type", TransactionType.PENDING.value]}, "then": _NEGATIVE_AMOUNT},
+        {
+            "case": {"$and": [{"$eq": ["$tx_type", TransactionType.DEBIT.value]}, {"$not": [_IS_PAYOUT_REFERENCE]}]},
+            "then": _NEGATIVE_AMOUNT,
+        },
+    ],
+    "default": 0,
+}}]}
+PENDING_DELTA_EXPR = {"$ifNull": ["$pending_delta", {"$switch": {
+    "branches": [
+        {"case": {"$eq": ["$tx_type", TransactionType.PENDING.value]}, "then": "$amount"},
+        {
+            "case": {"$and": [
+                {"$in": ["$tx_type", [TransactionType.CREDIT.value, TransactionType.DEBIT.value]]},
+                _IS_PAYOUT_REFERENCE,
+            ]},
+            "then": _NEGATIVE_AMOUNT,
+        },
+    ],
+    "default": 0,
+}}]}
+
+
+def ledger_deltas(tx: dict) -> tuple[float, float]:
+    """(effet sur le solde, effet sur pending) d'un mouvement."""
+    if "balance_delta" in tx:
+        return float(tx.get("balance_delta") or 0), float(tx.get("pending_delta") or 0)
+    amount = float(tx.get("amount") or 0)
+    tx_type = tx.get("tx_type")
+    is_payout = str(tx.get("reference") or "").startswith(PAYOUT_REFERENCE_PREFIX)
+    if tx_type == TransactionType.CREDIT.value:
+        return amount, (-amount if is_payout else 0.0)
+    if tx_type == TransactionType.DEBIT.value:
+        return (0.0, -amount) if is_payout else (-amount, 0.0)
+    if tx_type == TransactionType.PENDING.value:
+        return -amount, amount
+    return 0.0, 0.0
+
+
+def _up_to(key: LedgerKey) -> dict:
+    created_at, tx_id = key
+    return {"$or": [{"created_at": {"$lt": created_at}}, {"created_at": created_at, "tx_id": {"$lte": tx_id}}]}
+
+
+def _after(key: LedgerKey) -> dict:
+    created_at, tx_id = key
+    return {"$or": [{"created_at": {"$gt": created_at}}, {"created_at": created_at, "tx_id": {"$gt": tx_id}}]}
+
+
+def _snapshot_key(snapshot: Optional[dict]) -> Optional[LedgerKey]:
+    if not snapshot:
+        return None
+    return snapshot["as_of_created_at"], snapshot["as_of_tx_id"]
+
+
+async def latest_snapshot(wallet_id: str, up_to: Optional[LedgerKey] = None) -> Optional[dict]:
+    """Instantané le plus récent, ou le plus récent qui ne dépasse pas `up_to`."""
+    query: dict[str, Any] = {"wallet_id": wallet_id}
+    if up_to:
+        created_at, tx_id = up_to
+        query["$or"] = [
+            {"as_of_created_at": {"$lt": created_at}},
+            {"as_of_created_at": created_at, "as_of_tx_id": {"$lte": tx_id}},
+        ]
+    return await db.wallet_balance_snapshots.find_one(
+        query,
+        {"_id": 0},
+        sort=[("as_of_created_at", -1), ("as_of_tx_id", -1)],
+    )
+
+
+async def sum_ledger(
+    wallet_id: str,
+    after: Optional[LedgerKey] = None,
+    up_to: Optional[LedgerKey] = None,
+    created_before: Optional[datetime] = None,
+) -> dict[str, Any]:
+    """Somme des effets des mouvements dans ]after, up_to] (index wallet_id, created_at, tx_id)."""
+    clauses: list[dict] = [{"wallet_id": wallet_id}]
+    if after:
+        clauses.append(_after(after))
+    if up_to:
+        clauses.append(_up_to(up_to))
+    if created_before:
+        clauses.append({"created_at": {"$lt": created_before}})
+    rows = await db.wallet_transactions.aggregate([
+        {"$match": {"$and": clauses}},
+        {"$sort": {"created_at": 1, "tx_id": 1}},
+        {"$group": {
+            "_id": None,
+            "balance": {"$sum": BALANCE_DELTA_EXPR},
+            "pending": {"$sum": PENDING_DELTA_EXPR},
+            "count": {"$sum": 1},
+            "last_created_at": {"$last": "$created_at"},
+            "last_tx_id": {"$last": "$tx_id"},
+        }},
+    ]).to_list(length=1)
+    if not rows:
+        return {"balance": 0.0, "pending": 0.0, "count": 0, "last": None}
+    row = rows[0]
+    return {
+        "balance": float(row.get("balance") or 0),
+        "pending": float(row.get("pending") or 0),
+        "count": int(row.get("count") or 0),
+        "last": (row["last_created_at"], row["last_tx_id"]),
+    }
+
+
+async def balance_as_of(wallet_id: str, key: Optional[LedgerKey] = None) -> dict[str, Any]:
+    """Solde et pending après le mouvement `key` (après le dernier si None)."""
+    snapshot = await latest_snapshot(wallet_id, up_to=key)
+    since = await sum_ledger(wallet_id, after=_snapshot_key(snapshot), up_to=key)
+    return {
+        "balance": round(float((snapshot or {}).get("balance") or 0) + since["balance"], 2),
+        "pending": round(float((snapshot or {}).get("pending") or 0) + since["pending"], 2),
+        "snapshot_as_of": _snapshot_key(snapshot),
+        "transactions_scanned": since["count"],
+    }
+
+
+async def audit_wallet(wallet_id: str) -> Optional[dict[str, Any]]:
+    """Compare le solde stocké au grand livre, en ne relisant que l'après-instantané."""
+    wallet = await db.wallets.find_one(
+        {"wallet_id": wallet_id},
+        {"_id": 0, "wallet_id": 1, "owner_id": 1, "balance": 1, "pending": 1},
+    )
+    if not wallet:
+        return None
+    ledger = await balance_as_of(wallet_id)
+    wallet_balance = round(float(wallet.get("balance") or 0), 2)
+    wallet_pending = round(float(wallet.get("pending") or 0), 2)
+    snapshot_as_of = ledger["snapshot_as_of"]
+    return {
+        "wallet_id": wallet_id,
+        "owner_id": wallet.get("owner_id"),
+        "wallet_balance": wallet_balance,
+        "ledger_balance": ledger["balance"],
+        "balance_drift": round(wallet_balance - ledger["balance"], 2),
+        "wallet_pending": wallet_pending,
+        "ledger_pending": ledger["pending"],
+        "pending_drift": round(wallet_pending - ledger["pending"], 2),
+        "snapshot_as_of": (
+            {"created_at": snapshot_as_of[0], "tx_id": snapshot_as_of[1]} if snapshot_as_of else None
+        ),
+        "transactions_scanned": ledger["transactions_scanned"],
+    }
+
+
+async def take_snapshot(wallet_id: str, settled_before: datetime) -> Optional[dict]:
+    """Nouvel instantané après le dernier mouvement antérieur à `settled_before`."""
+    previous = await latest_snapshot(wallet_id)
+    since = await sum_ledger(wallet_id, after=_snapshot_key(previous), created_before=settled_before)
+    if not since["count"]:
+        return None
+    snapshot = {
+        "snapshot_id": f"wsn_{uuid.uuid4().hex[:12]}",
+        "wallet_id": wallet_id,
+        "as_of_created_at": since["last"][0],
+        "as_of_tx_id": since["last"][1],
+        "balance": round(float((previous or {}).get("balance") or 0) + since["balance"], 2),
+        "pending": round(float((previous or {}).get("pending") or 0) + since["pending"], 2),
+        "tx_count": int((previous or {}).get("tx_count") or 0) + since["count"],
+        "created_at": datetime.now(timezone.utc),
+    }
+    await db.wallet_balance_snapshots.insert_one({**snapshot})
+    return snapshot
+
+
+async def snapshot_wallets() -> int:
+    """
+    Job périodique : un instantané pour chaque wallet ayant des mouvements
+    depuis la passe précédente (point de reprise = date du dernier instantané).
+    """
+    from services.finance_reconciliation_service import stream_ids
+
+    now = datetime.now(timezone.utc)
+    settled_before = now - timedelta(seconds=SNAPSHOT_SETTLE_SECONDS)
+    last = await db.wallet_balance_snapshots.find_one({}, {"_id": 0, "created_at": 1}, sort=[("created_at", -1)])
+    query: dict[str, Any] = {}
+    if last and last.get("created_at"):
+        query["created_at"] = {"$gte": last["created_at"] - timedelta(seconds=SNAPSHOT_SETTLE_SECONDS)}
+
+    created = 0
+    async for wallet_ids in stream_ids("wallet_transactions", query, "wallet_id", SNAPSHOT_BATCH_SIZE):
+        for wallet_id in wallet_ids:
+            try:
+                if await take_snapshot(wallet_id, settled_before):
+                    created += 1
+            except Exception as exc:
+                logger.warning("Instantané du wallet %s en échec : %s", wallet_id, exc)
+    logger.info("Instantanés de wallets : %s créé(s)", created)
+    return created
+
+
+def with_running_balance(transactions: list[dict], balance_after_first: float) -> list[dict]:
+    """
+    Ajoute `balance_after` à une page triée du plus récent au plus ancien, à
+    partir du solde après le premier mouvement de la page.
+    """
+    running = balance_after_first
+    for tx in transactions:
+        tx["balance_after"] = round(running, 2)
+        running -= ledger_deltas(tx)[0]
+    return transactions
+
+
+async def statement_page_balances(wallet_id: str, transactions: list[dict]) -> list[dict]:
+    if not transactions:
+        return transactions
+    newest = transactions[0]
+    opening = await balance_as_of(wallet_id, (newest["created_at"], newest["tx_id"]))
+    return with_running_balance(transactions, opening["balance"])
+
+
+async def stream_statement_csv(wallet_id: str, start: datetime, end: datetime) -> AsyncIterator[str]:
+    """Relevé CSV des mouvements de [start, end], produit au fil du curseur."""
+    opening = await balance_as_of(wallet_id, (start, ""))
+    running = opening["balance"]
+
+    def _row(values: list[Any]) -> str:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(values)
+        return buffer.getvalue()
+
+    yield _row(["date", "tx_id", "type", "description", "reference", "parcel_id", "montant", "solde_apres"])
+    yield _row([start.isoformat(), "", "opening_balance", "Solde d'ouverture", "", "", "", f"{running:.2f}"])
+    cursor = db.wallet_transactions.find(
+        {"wallet_id": wallet_id, "created_at": {"$gte": start, "$lte": end}},
+        {"_id": 0},
+    ).sort([("created_at", 1), ("tx_id", 1)]).batch_size(STATEMENT_EXPORT_BATCH_SIZE)
+    async for tx in cursor:
+        running += ledger_deltas(tx)[0]
+        created_at = tx.get("created_at")
+        yield _row([
+            created_at.isoformat() if isinstance(created_at, datetime) else "",
+            tx.get("tx_id", ""),
+            tx.get("tx_type", ""),
+            tx.get("description", ""),
+            tx.get("reference") or "",
+            tx.get("parcel_id") or "",
+            f"{float(tx.get('amount') or 0):.2f}",
+            f"{running:.2f}",
+        ])
@@ -0,0 +1,272 @@
+"""
+Échéances des missions ASSIGNED sans collecte confirmée.
+
+`auto_release_at` et `pickup_reminder_due_at` sont posés à l'assignation
+(parcel_service.pickup_deadline_fields) : l'échéance est figée à ce moment, un
+changement ultérieur du délai d'auto-libération ne s'applique qu'aux missions
+assignées ensuite. Les missions antérieures à ces champs sont complétées une
+seule fois au démarrage (`backfill_pickup_deadlines`).
+
+Le job de fond ne lit que les missions échues via les index
+(status, auto_release_at) / (status, pickup_reminder_due_at), écrit en
+bulk_write puis relit les missions effectivement modifiées (champ horodaté
+avec `now`) avant de notifier : une mission démarrée ou libérée entre
+la lecture et l'écriture n'est ni réattribuée ni notifiée.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from pymongo import UpdateOne
+
+from core.datetime_utils import as_aware_utc
+from database import db
+from services.notification_service import (
+    load_notification_profiles,
+    notify_driver_mission_auto_released,
+    notify_driver_pickup_confirmation_reminder,
+)
+from services.parcel_service import (
+    PICKUP_DEADLINE_UNSET,
+    get_assigned_mission_auto_release_minutes,
+    next_pickup_reminder_due_at,
+    pickup_deadline_fields,
+)
+
+logger = logging.getLogger(__name__)
+
+DEADLINE_BATCH_SIZE = 200
+_MISSION_PROJECTION = {
+    "_id": 0,
+    "mission_id": 1,
+    "parcel_id": 1,
+    "tracking_code": 1,
+    "driver_id": 1,
+    "assigned_at": 1,
+    "auto_release_at": 1,
+    "pickup_reminder_due_at": 1,
+    "pickup_reminder_10_sent_at": 1,
+    "pickup_reminder_5_sent_at": 1,
+}
+
+
+async def _notify_drivers(missions: list[dict], send) -> None:
+    profiles = await load_notification_profiles([m["driver_id"] for m in missions])
+    results = await asyncio.gather(
+        *(send(mission, profiles.get(mission["driver_id"])) for mission in missions),
+        return_exceptions=True,
+    )
+    for mission, result in zip(missions, results):
+        if isinstance(result, Exception):
+            logger.warning("Notification mission %s non envoyée : %s", mission["mission_id"], result)
+
+
+async def backfill_pickup_deadlines() -> int:
+    """
+    Missions assignées avant l'introduction des échéances : calcul unique, par
+    lots, au démarrage du worker (pas à chaque passage du job).
+    """
+    minutes = await get_assigned_mission_auto_release_minutes()
+    backfilled = 0
+    while True:
+        legacy = await db.delivery_missions.find(
+            {
+                "status": "assigned",
+                "started_at": None,
+                "assigned_at": {"$ne": None},
+                "auto_release_at": {"$exists": False},
+            },
+            _MISSION_PROJECTION,
+        ).to_list(length=DEADLINE_BATCH_SIZE)
+        if not legacy:
+            return backfilled
+        result = await db.delivery_missions.bulk_write(_backfill_operations(legacy, minutes), ordered=False)
+        backfilled += result.modified_count
+        if len(legacy) < DEADLINE_BATCH_SIZE or result.modified_count == 0:
+            return backfilled
+
+
+def _backfill_operations(legacy: list[dict], minutes: int) -> list[UpdateOne]:
+    operations = []
+    for mission in legacy:
+        fields = pickup_deadline_fields(as_aware_utc(mission["assigned_at"]), minutes)
+        sent = tuple(
+            threshold
+            for threshold, field in ((10, "pickup_reminder_10_sent_at"), (5, "pickup_reminder_5_sent_at"))
+            if mission.get(field)
+        )
+        fields["pickup_reminder_due_at"] = next_pickup_reminder_due_at(
+            as_aware_utc(mission["assigned_at"]), fields["auto_release_at"], sent
+        )
+        fields.pop("pickup_reminder_10_sent_at")
+        fields.pop("pickup_reminder_5_sent_at")
+        operations.append(UpdateOne(
+            {"mission_id": mission["mission_id"], "auto_release_at": {"$exists": False}},
+            {"$set": fields},
+        ))
+    return operations
+
+
+async def release_due_missions(now: datetime) -> int:
+    """Remet en PENDING les missions dont `auto_release_at` est dépassé."""
+    released_total = 0
+    while True:
+        due = await db.delivery_missions.find(
+            {"status": "assigned", "auto_release_at": {"$lte": now}, "started_at": None},
+            _MISSION_PROJECTION,
+        ).sort("auto_release_at", 1).limit(DEADLINE_BATCH_SIZE).to_list(length=DEADLINE_BATCH_SIZE)
+        if not due:
+            break
+        result = await db.delivery_missions.bulk_write(
+            [
+                UpdateOne(
+                    {
+                        "mission_id": mission["mission_id"],
+                        "status": "assigned",
+                        "started_at": None,
+                        "driver_id": mission.get("driver_id"),
+                        "auto_release_at": {"$lte": now},
+                    },
+                    {
+                        "$set": {
+                            "status": "pending",
+                            "driver_id": None,
+                            "assigned_at": None,
+                            "auto_released_at": now,
+                            "updated_at": now,
+                        },
+                        "$unset": PICKUP_DEADLINE_UNSET,
+                    },
+                )
+                for mission in due
+            ],
+            ordered=False,
+        )
+        released_ids = {
+            doc["mission_id"]
+            async for doc in db.delivery_missions.find(
+                {"mission_id": {"$in": [m["mission_id"] for m in due]}, "auto_released_at": now},
+                {"_id": 0, "mission_id": 1},
+            )
+        }
+        released = [m for m in due if m["mission_id"] in released_ids]
+        if released:
+            await db.parcels.bulk_write(
+                [
+                    UpdateOne(
+                        {"parcel_id": mission["parcel_id"], "assigned_driver_id": mission.get("driver_id")},
+                        {"$set": {"assigned_driver_id": None, "updated_at": now}},
+                    )
+                    for mission in released
+                ],
+                ordered=False,
+            )
+            await _notify_drivers(
+                [m for m in released if m.get("driver_id")],
+                lambda mission, profile: notify_driver_mission_auto_released(
+                    user_id=mission["driver_id"],
+                    mission=mission,
+                    profile=profile,
+                ),
+            )
+        released_total += len(released)
+        # Lot entièrement concurrencé (missions modifiées entre-temps) : on
+        # laisse le prochain tick relire plutôt que boucler sur les mêmes.
+        if len(due) < DEADLINE_BATCH_SIZE or result.modified_count == 0:
+            break
+    return released_total
+
+
+def _reminder_update(mission: dict, now: datetime) -> tuple[int, dict[str, Any]] | None:
+    assigned_at = as_aware_utc(mission.get("assigned_at"))
+    auto_release_at = as_aware_utc(mission.get("auto_release_at"))
+    if not assigned_at or not auto_release_at or auto_release_at <= now:
+        return None
+    remaining = auto_release_at - now
+    # Le rappel le plus urgent déjà échu ; les seuils plus larges sont
+    # considérés comme envoyés (pas deux rappels dans le même tick).
+    sent: list[int] = []
+    threshold_sent = None
+    for threshold, field in ((10, "pickup_reminder_10_sent_at"), (5, "pickup_reminder_5_sent_at")):
+        if mission.get(field):
+            sent.append(threshold)
+        elif remaining <= timedelta(minutes=threshold):
+            sent.append(threshold)
+            threshold_sent = threshold
+    fields: dict[str, Any] = {
+        "pickup_reminder_due_at": next_pickup_reminder_due_at(assigned_at, auto_release_at, tuple(sent)),
+        "updated_at": now,
+    }
+    for threshold in sent:
+        field = f"pickup_reminder_{threshold}_sent_at"
+        if not mission.get(field):
+            fields[field] = now
+    return threshold_sent, fields
+
+
+async def send_due_pickup_reminders(now: datetime) -> int:
+    """Envoie les rappels « Collecte à confirmer » dont l'échéance est passée."""
+    sent_total = 0
+    while True:
+        due = await db.delivery_missions.find(
+            {"status": "assigned", "pickup_reminder_due_at": {"$lte": now}, "started_at": None},
+            _MISSION_PROJECTION,
+        ).sort("pickup_reminder_due_at", 1).limit(DEADLINE_BATCH_SIZE).to_list(length=DEADLINE_BATCH_SIZE)
+        if not due:
+            break
+        operations = []
+        to_notify: list[dict] = []
+        for mission in due:
+            planned = _reminder_update(mission, now)
+            guard = {
+                "mission_id": mission["mission_id"],
+                "status": "assigned",
+                "started_at": None,
+                "pickup_reminder_due_at": mission["pickup_reminder_due_at"],
+            }
+            if planned is None:
+                # Échéance dépassée : la réattribution s'en charge, on retire le rappel.
+                operations.append(UpdateOne(guard, {"$set": {"pickup_reminder_due_at": None}}))
+                continue
+            threshold, fields = planned
+            fields["pickup_reminder_last_sent_at"] = now
+            operations.append(UpdateOne(guard, {"$set": fields}))
+            if threshold is not None and mission.get("driver_id"):
+                to_notify.append(mission)
+        result = await db.delivery_missions.bulk_write(operations, ordered=False)
+
+        if to_notify:
+            applied = {
+                doc["mission_id"]
+                async for doc in db.delivery_missions.find(
+                    {
+                        "mission_id": {"$in": [m["mission_id"] for m in to_notify]},
+                        "pickup_reminder_last_sent_at": now,
+                    },
+                    {"_id": 0, "mission_id": 1},
+                )
+            }
+            to_notify = [m for m in to_notify if m["mission_id"] in applied]
+
+            def _send(mission: dict, profile):
+                remaining_seconds = int((as_aware_utc(mission["auto_release_at"]) - now).total_seconds())
+                return notify_driver_pickup_confirmation_reminder(
+                    user_id=mission["driver_id"],
+                    mission=mission,
+                    minutes_remaining=max(1, (remaining_seconds + 59) // 60),
+                    profile=profile,
+                )
+
+            await _notify_drivers(to_notify, _send)
+            sent_total += len(to_notify)
+        if len(due) < DEADLINE_BATCH_SIZE or result.modified_count == 0:
+            break
+    return sent_total
+
+
+async def process_pickup_deadlines() -> dict[str, int]:
+    now = datetime.now(timezone.utc)
+    released = await release_due_missions(now)
+    reminded = await send_due_pickup_reminders(now)
+    return {"released": released, "reminded": reminded}
@@ -1,14 +1,21 @@
 """
 Service notification : envoi de notifications push, SMS, WhatsApp aux utilisateurs.
 """
+import asyncio
 import logging
 import re
+import time
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
+from types import MappingProxyType
 from urllib.parse import urlencode
 import uuid
-from typing import Optional
+from typing import Iterable, Mapping, Optional
+
+from pymongo import UpdateOne
 
 from config import settings
+from core.metrics import external_call
 from core.utils import normalize_phone
 from database import db
 from models.notification import NotificationChannel, NotificationStatus
@@ -23,33 +30,13 @@ _firebase_initialized = False
 
 
 def _ensure_firebase():
-    """Vérifie que Firebase Admin est initialisé (par auth.py ou ici)."""
+    """Vérifie que Firebase Admin est initialisé (application partagée, core/firebase.py)."""
     global _firebase_initialized
     if _firebase_initialized:
         return
-    try:
-        import firebase_admin
-        # Vérifier si déjà initialisé par auth.py
-        if firebase_admin._apps:
-            _firebase_initialized = True
-            return
-        # Sinon, initialiser
-        import os, json
-        from firebase_admin import credentials
-        firebase_creds_env = os.environ.get("FIREBASE_CREDENTIALS")
-        if firebase_creds_env:
-            cred = credentials.Certificate(json.loads(firebase_creds_env))
-        elif settings.FIREBASE_CREDENTIALS_PATH and os.path.exists(settings.FIREBASE_CREDENTIALS_PATH):
-            cred = credentials.Certificate(settings.FIREBASE_CREDENTIALS_PATH)
-        elif os.path.exists("firebase-service-account.json"):
-            cred = credentials.Certificate("firebase-service-account.json")
-        else:
-            cred = None
-        if cred:
-            firebase_admin.initialize_app(cred)
-        _firebase_initialized = True
-    except Exception as e:
-        logger.warning(f"Firebase Admin non initialisé (push désactivé) : {e}")
+    from core.firebase import get_firebase_app
+
+    _firebase_initialized = get_firebase_app() is not None
 
 
 def _push_tokens_from_user(
@@ -265,11 +252,137 @@ def _phone_lookup_values(phone: str | None) -> list[str]:
     return [value for value in values if value]
 
 
-async def _find_user_by_phone(phone: str | None) -> dict | None:
-    values = _phone_lookup_values(phone)
-    if not values:
+# ── Profils destinataires ────────────────────────────────────────────────────
+#
+# Une notification a besoin de quelques champs du user (prefs, tokens, phone,
+# rôle) à trois étapes (stockage in-app, push, WhatsApp). On les charge une
+# seule fois, pour tous les destinataires d'un événement, dans un profil figé
+# transmis de bout en bout. Un cache court absorbe les rafales (dispatch,
+# changements de statut successifs sur un même colis).
+
+NOTIFICATION_PROFILE_PROJECTION = {
+    "_id": 0,
+    "user_id": 1,
+    "role": 1,
+    "phone": 1,
+    "fcm_token": 1,
+    "fcm_tokens": 1,
+    "notification_prefs": 1,
+}
+NOTIFICATION_PROFILE_TTL_SECONDS = 5.0
+_PROFILE_CACHE_MAX_ENTRIES = 2048
+_profile_cache: dict[str, tuple[float, "NotificationProfile"]] = {}
+
+
+@dataclass(frozen=True)
+class NotificationProfile:
+    user_id: str
+    role: Optional[str] = None
+    phone: Optional[str] = None
+    fcm_token: Optional[str] = None
+    fcm_tokens: tuple = ()
+    notification_prefs: Mapping = field(default_factory=lambda: MappingProxyType({}))
+
+    @classmethod
+    def from_user(cls, user: dict) -> "NotificationProfile":
+        return cls(
+            user_id=user["user_id"],
+            role=user.get("role"),
+            phone=user.get("phone"),
+            fcm_token=user.get("fcm_token"),
+            fcm_tokens=tuple(
+                MappingProxyType(dict(item))
+                for item in (user.get("fcm_tokens") or [])
+                if isinstance(item, dict)
+            ),
+            notification_prefs=MappingProxyType(dict(user.get("notification_prefs") or {})),
+        )
+
+    def as_user_doc(self) -> dict:
+        """Vue dict compatible avec les helpers historiques (`_push_tokens_from_user`...)."""
+        return {
+            "user_id": self.user_id,
+            "role": self.role,
+            "phone": self.phone,
+            "fcm_token": self.fcm_token,
+            "fcm_tokens": [dict(item) for item in self.fcm_tokens],
+            "notification_prefs": dict(self.notification_prefs),
+        }
+
+
+def _cache_profile(profile: NotificationProfile, now: float) -> None:
+    if profile.user_id not in _profile_cache and len(_profile_cache) >= _PROFILE_CACHE_MAX_ENTRIES:
+        _profile_cache.pop(next(iter(_profile_cache)))
+    _profile_cache[profile.user_id] = (now + NOTIFICATION_PROFILE_TTL_SECONDS, profile)
+
+
+def invalidate_notification_profile(user_id: Optional[str]) -> None:
+    """À appeler quand tokens FCM, préférences ou téléphone d'un user changent."""
+    if user_id:
+        _profile_cache.pop(user_id, None)
+
+
+async def load_notification_profiles(
+    user_ids: Iterable[Optional[str]] = (),
+    phones: Iterable[Optional[str]] = (),
+) -> dict[str, NotificationProfile]:
+    """
+    Résout tous les destinataires d'un événement en une seule requête
+    (`user_id $in` + variantes de téléphone). Les user_id encore en cache ne
+    sont pas relus. Le résultat est indexé par user_id ; utiliser
+    `profile_for_phone` pour retrouver un destinataire par numéro.
+    """
+    now = time.monotonic()
+    profiles: dict[str, NotificationProfile] = {}
+    missing_ids: list[str] = []
+    for user_id in user_ids:
+        if not user_id or user_id in profiles or user_id in missing_ids:
+            continue
+        cached = _profile_cache.get(user_id)
+        if cached and cached[0] > now:
+            profiles[user_id] = cached[1]
+        else:
+            missing_ids.append(user_id)
+
+    phone_values: list[str] = []
+    for phone in phones:
+        phone_values.extend(_phone_lookup_values(phone))
+
+    clauses: list[dict] = []
+    if missing_ids:
+        clauses.append({"user_id": {"$in": missing_ids}})
+    if phone_values:
+        clauses.append({"phone": {"$in": list(dict.fromkeys(phone_values))}})
+    if not clauses:
+        return profiles
+
+    query = clauses[0] if len(clauses) == 1 else {"$or": clauses}
+    async for user in db.users.find(query, NOTIFICATION_PROFILE_PROJECTION):
+        if not user.get("user_id"):
+            continue
+        profile = NotificationProfile.from_user(user)
+        profiles[profile.user_id] = profile
+        _cache_profile(profile, now)
+    return profiles
+
+
+async def get_notification_profile(user_id: Optional[str]) -> Optional[NotificationProfile]:
+    if not user_id:
         return None
-    return await db.users.find_one({"phone": {"$in": values}}, {"user_id": 1})
+    return (await load_notification_profiles([user_id])).get(user_id)
+
+
+def profile_for_phone(
+    profiles: Mapping[str, NotificationProfile],
+    phone: Optional[str],
+) -> Optional[NotificationProfile]:
+    target = normalize_phone(phone)
+    if not target:
+        return None
+    return next(
+        (profile for profile in profiles.values() if normalize_phone(profile.phone) == target),
+        None,
+    )
 
 
 async def _resolve_recipient_relay(parcel: dict) -> dict | None:
@@ -453,7 +566,11 @@ def _should_notify_recipient(parcel: dict, status: ParcelStatus) -> bool:
     return True
 
 
-async def _notify_driver_parcel_change(parcel: dict, new_status: ParcelStatus) -> None:
+async def _notify_driver_parcel_change(
+    parcel: dict,
+    new_status: ParcelStatus,
+    profile: Optional[NotificationProfile] = None,
+) -> None:
     """Notifie le livreur affecté quand le colis change d'état d'une manière
     qui impacte sa mission (suspension, annulation, retour)."""
     if new_status not in _DRIVER_NOTIFY_STATUSES:
@@ -482,6 +599,7 @@ async def _notify_driver_parcel_change(parcel: dict, new_status: ParcelStatus) -
         event_type="mission_unavailable" if is_unavailable else "mission_detail",
         target_view="driver",
         dedupe_key=f"driver_parcel_status:{parcel.get('parcel_id')}:{new_status.value}",
+        profile=profile,
     )
 
 
@@ -529,14 +647,27 @@ async def notify_parcel_status_change(parcel: dict, new_status: ParcelStatus):
     notify_sender = _should_notify_sender(parcel, new_status)
     notify_recipient = _should_notify_recipient(parcel, new_status)
 
+    # Une seule lecture `users` pour tous les destinataires de la transition.
+    sender_id = parcel.get("sender_user_id")
+    recipient_phone = parcel.get("recipient_phone")
+    recipient_user_id = parcel.get("recipient_user_id")
+    driver_id = parcel.get("assigned_driver_id") if new_status in _DRIVER_NOTIFY_STATUSES else None
+    profiles = await load_notification_profiles(
+        user_ids=[
+            driver_id,
+            sender_id if notify_sender else None,
+            recipient_user_id if notify_recipient else None,
+        ],
+        phones=[recipient_phone] if notify_recipient and not recipient_user_id else [],
+    )
+
     # Notifier le livreur si la transition impacte directement sa mission
     # (suspension, annulation, retour). Ne dépend ni du sender ni du recipient.
-    await _notify_driver_parcel_change(parcel, new_status)
+    await _notify_driver_parcel_change(parcel, new_status, profiles.get(driver_id))
 
     # Notifier expéditeur — règle : un seul WhatsApp à la création (template
     # parcel_created avec lien de tracking). Tous les autres changements de
     # statut pertinents restent en push + in-app uniquement.
-    sender_id = parcel.get("sender_user_id")
     if sender_id and notify_sender:
         sender_first = _first_name(parcel.get("sender_name"))
         is_creation = (new_status == ParcelStatus.CREATED)
@@ -555,19 +686,20 @@ async def notify_parcel_status_change(parcel: dict, new_status: ParcelStatus):
             whatsapp_template=sender_template,
             whatsapp_variables=sender_template_vars,
             skip_whatsapp=not is_creation,
+            profile=profiles.get(sender_id),
         )
 
     # Notifier destinataire
     if not notify_recipient:
         return
 
-    recipient_phone = parcel.get("recipient_phone")
-    recipient_user_id = parcel.get("recipient_user_id")
+    recipient_profile = profiles.get(recipient_user_id) if recipient_user_id else None
     if not recipient_user_id and recipient_phone:
-        # Recherche tardive (si inscrit entre temps)
-        user = await _find_user_by_phone(recipient_phone)
-        if user:
-            recipient_user_id = user["user_id"]
+        # Recherche tardive (si inscrit entre temps) — déjà incluse dans la
+        # requête groupée ci-dessus via les variantes du numéro.
+        recipient_profile = profile_for_phone(profiles, recipient_phone)
+        if recipient_profile:
+            recipient_user_id = recipient_profile.user_id
 
     recipient_first = _first_name(parcel.get("recipient_name"))
     recipient_body = _body_with_recipient_code(recipient_body_base, parcel, new_status)
@@ -608,6 +740,7 @@ async def notify_parcel_status_change(parcel: dict, new_status: ParcelStatus):
             whatsapp_template=recipient_template,
             whatsapp_variables=template_vars_recipient,
             whatsapp_button_variables=recipient_button_vars,
+            profile=recipient_profile,
         )
         # Le code de retrait/livraison est déjà inclus dans le template principal
         # pour CREATED, AVAILABLE_AT_RELAY et REDIRECTED_TO_RELAY. On envoie un
@@ -726,16 +859,18 @@ async def _store_and_send(
     target_view: Optional[str] = None,
     dedupe_key: Optional[str] = None,
     push_platform: Optional[str] = None,
+    profile: Optional[NotificationProfile] = None,
 ):
     """Stocke la notification en base et tente l'envoi.
 
     skip_whatsapp: si True, n'envoie ni template ni texte libre WhatsApp.
     Utile quand on veut limiter une notif à push + in-app seulement.
+    profile: profil déjà résolu par l'appelant (évite de relire le user) ;
+    chargé via le cache sinon.
     """
-    user = await db.users.find_one(
-        {"user_id": user_id},
-        {"notification_prefs": 1, "phone": 1, "fcm_token": 1, "role": 1},
-    )
+    if profile is None:
+        profile = await get_notification_profile(user_id)
+    user = profile.as_user_doc() if profile else None
     if not _notification_category_enabled(user, category):
         return {
             "stored": False,
@@ -796,6 +931,7 @@ async def _store_and_send(
             dedupe_key=dedupe_key,
             metadata=metadata,
             push_platform=push_platform,
+            profile=profile,
         )
 
     if not skip_whatsapp and _should_send_whatsapp_tracking(user, category):
@@ -851,36 +987,43 @@ async def _store_notification(
         return notif_id, True
 
     result = await db.notifications.update_one(
+        *_dedupe_upsert_args(notif, now),
+        upsert=True,
+    )
+    stored = await db.notifications.find_one(
         {"user_id": user_id, "dedupe_key": dedupe_key},
+        {"_id": 0, "notif_id": 1},
+    )
+    return (stored or {}).get("notif_id") or notif_id, result.upserted_id is not None
+
+
+def _dedupe_upsert_args(notif: dict, now: datetime) -> tuple[dict, dict]:
+    """Filtre + update de l'upsert `user_id + dedupe_key` d'une notif in-app."""
+    return (
+        {"user_id": notif["user_id"], "dedupe_key": notif["dedupe_key"]},
         {
             "$set": {
-                "title": title,
-                "body": body,
-                "status": status.value,
-                "metadata": metadata or {},
-                "ref_type": ref_type,
-                "ref_id": ref_id,
-                "event_type": event_type,
-                "target_view": target_view,
-                "sent_at": now if status == NotificationStatus.SENT else None,
+                "title": notif["title"],
+                "body": notif["body"],
+                "status": notif["status"],
+                "metadata": notif["metadata"],
+                "ref_type": notif["ref_type"],
+                "ref_id": notif["ref_id"],
+                "event_type": notif["event_type"],
+                "target_view": notif["target_view"],
+                "sent_at": notif["sent_at"],
                 "updated_at": now,
             },
             "$setOnInsert": {
-                "notif_id": notif_id,
-                "user_id": user_id,
-                "channel": channel.value,
-                "dedupe_key": dedupe_key,
+                "notif_id": notif["notif_id"],
+                "user_id": notif["user_id"],
+                "channel": notif["channel"],
+                "dedupe_key": notif["dedupe_key"],
                 "created_at": now,
                 "read_at": None,
             },
         },
-        upsert=True,
-    )
-    stored = await db.notifications.find_one(
-        {"user_id": user_id, "dedupe_key": dedupe_key},
-        {"_id": 0, "notif_id": 1},
     )
-    return (stored or {}).get("notif_id") or notif_id, result.upserted_id is not None
 
 
 async def _send_push(
@@ -896,11 +1039,11 @@ async def _send_push(
     dedupe_key: Optional[str] = None,
     metadata: Optional[dict] = None,
     push_platform: Optional[str] = None,
+    profile: Optional[NotificationProfile] = None,
 ):
-    user = await db.users.find_one(
-        {"user_id": user_id},
-        {"fcm_token": 1, "fcm_tokens": 1, "notification_prefs": 1},
-    )
+    if profile is None:
+        profile = await get_notification_profile(user_id)
+    user = profile.as_user_doc() if profile else None
     fcm_tokens = _push_tokens_from_user(user, push_platform)
     push_enabled = ((user or {}).get("notification_prefs") or {}).get("push", True)
 
@@ -960,7 +1103,8 @@ async def _send_push(
                 token=token,
             )
             try:
-                _messaging.send(message)
+                with external_call("fcm", "send"):
+                    _messaging.send(message)
                 sent_count += 1
             except Exception as token_error:
                 if _is_invalid_fcm_token_error(token_error):
@@ -968,6 +1112,7 @@ async def _send_push(
                 failed_reasons.append(str(token_error)[:160])
 
         if invalid_tokens:
+            invalidate_notification_profile(user_id)
             await db.users.update_one(
                 {"user_id": user_id},
                 {
@@ -996,11 +1141,14 @@ async def _send_push(
         return {"push_status": "failed", "push_reason": str(e)[:240]}
 
 
-async def _send_data_push(user_id: str, data: dict[str, str]) -> None:
-    user = await db.users.find_one(
-        {"user_id": user_id},
-        {"fcm_token": 1, "fcm_tokens": 1, "notification_prefs": 1},
-    )
+async def _send_data_push(
+    user_id: str,
+    data: dict[str, str],
+    profile: Optional[NotificationProfile] = None,
+) -> None:
+    if profile is None:
+        profile = await get_notification_profile(user_id)
+    user = profile.as_user_doc() if profile else None
     if not user or not ((user.get("notification_prefs") or {}).get("push", True)):
         return
     tokens = _push_tokens_from_user(user)
@@ -1037,6 +1185,7 @@ async def _send_data_push(user_id: str, data: dict[str, str]) -> None:
             )
         except Exception as exc:
             if _is_invalid_fcm_token_error(exc):
+                invalidate_notification_profile(user_id)
                 await db.users.update_one(
                     {"user_id": user_id},
                     {"$pull": {"fcm_tokens": {"token": token}}},
@@ -1112,9 +1261,12 @@ async def expire_mission_availability_notifications(
         "ref_id": mission_id,
         "dedupe_key": dedupe_key,
     }
-    for user_id in user_ids:
-        if user_id and user_id != accepted_by_user_id:
-            await _send_data_push(user_id, data)
+    targets = [user_id for user_id in user_ids if user_id and user_id != accepted_by_user_id]
+    profiles = await load_notification_profiles(targets)
+    for user_id in targets:
+        profile = profiles.get(user_id)
+        if profile:
+            await _send_data_push(user_id, data, profile)
 
 
 async def expire_mission_availability_for_user(
@@ -1204,7 +1356,10 @@ async def _whatsapp_post(payload: dict, phone: str) -> bool:
     }
     try:
         async with httpx.AsyncClient() as client:
-            resp = await client.post(url, json=payload, headers=headers, timeout=10)
+            with external_call("whatsapp", "send_message") as call:
+                resp = await client.post(url, json=payload, headers=headers, timeout=10)
+                if resp.status_code != 200:
+                    call.fail()
             log_doc["status_code"] = resp.status_code
             if resp.status_code == 200:
                 try:
@@ -1365,15 +1520,19 @@ async def notify_approaching_driver(parcel: dict):
 
     recipient_phone = parcel.get("recipient_phone")
     if recipient_phone:
-        user = await db.users.find_one({"phone": recipient_phone})
-        if user:
+        profile = profile_for_phone(
+            await load_notification_profiles(phones=[recipient_phone]),
+            recipient_phone,
+        )
+        if profile:
             await _store_and_send(
-                user_id=user["user_id"],
+                user_id=profile.user_id,
                 title="Livreur à proximité",
                 body=f"Votre colis {tracking_code} arrive. Préparez votre code de réception.",
                 ref_type="parcel",
                 ref_id=parcel_id,
                 category="parcel_updates",
+                profile=profile,
             )
 
 
@@ -1454,6 +1613,7 @@ async def notify_driver_pickup_confirmation_reminder(
     user_id: str,
     mission: dict,
     minutes_remaining: int,
+    profile: Optional[NotificationProfile] = None,
 ) -> None:
     tracking_code = mission.get("tracking_code", "N/A")
     body = (
@@ -1471,6 +1631,7 @@ async def notify_driver_pickup_confirmation_reminder(
         event_type="mission_detail",
         target_view="driver",
         dedupe_key=f"mission_pickup_reminder:{mission.get('mission_id')}",
+        profile=profile,
     )
 
 
@@ -1478,6 +1639,7 @@ async def notify_driver_mission_auto_released(
     *,
     user_id: str,
     mission: dict,
+    profile: Optional[NotificationProfile] = None,
 ) -> None:
     tracking_code = mission.get("tracking_code", "N/A")
     body = (
@@ -1495,31 +1657,60 @@ async def notify_driver_mission_auto_released(
         event_type="mission_unavailable",
         target_view="driver",
         dedupe_key=f"mission_released:{mission.get('mission_id')}",
+        profile=profile,
     )
 
 
+def _radius_label(radius_km: float) -> str:
+    return f"{radius_km:.0f}" if float(radius_km).is_integer() else f"{radius_km:.1f}"
+
+
+def _dispatch_wave_notification(mission: dict, radius_km: float) -> dict:
+    tracking_code = mission.get("tracking_code", "N/A")
+    return {
+        "title": "Nouvelle course près de vous",
+        "body": (
+            f"Une course pour le colis {tracking_code} est disponible dans un rayon de "
+            f"{_radius_label(radius_km)} km."
+        ),
+        "category": "parcel_updates",
+        "ref_type": "mission",
+        "ref_id": mission.get("mission_id"),
+        "metadata": {"dispatch_radius_km": radius_km},
+        "event_type": "mission_available",
+        "target_view": "driver",
+        "dedupe_key": f"mission_available:{mission.get('mission_id')}",
+    }
+
+
+def _dispatch_reminder_notification(mission: dict, radius_km: float) -> dict:
+    tracking_code = mission.get("tracking_code", "N/A")
+    return {
+        "title": "Course toujours disponible",
+        "body": (
+            f"La course pour le colis {tracking_code} est toujours disponible dans un rayon de "
+            f"{_radius_label(radius_km)} km."
+        ),
+        "category": "parcel_updates",
+        "ref_type": "mission",
+        "ref_id": mission.get("mission_id"),
+        "metadata": {"dispatch_radius_km": radius_km, "reminder": True},
+        "store_in_app": False,
+        "event_type": "mission_available",
+        "target_view": "driver",
+        "dedupe_key": f"mission_available:{mission.get('mission_id')}",
+    }
+
+
 async def notify_new_mission_dispatch_wave(
     *,
     user_ids: list[str],
     mission: dict,
     radius_km: float,
 ) -> dict:
-    tracking_code = mission.get("tracking_code", "N/A")
-    radius_label = f"{radius_km:.0f}" if float(radius_km).is_integer() else f"{radius_km:.1f}"
     return await send_targeted_notifications(
         user_ids=user_ids,
-        title="Nouvelle course près de vous",
-        body=(
-            f"Une course pour le colis {tracking_code} est disponible dans un rayon de "
-            f"{radius_label} km."
-        ),
-        category="parcel_updates",
-        ref_type="mission",
-        ref_id=mission.get("mission_id"),
-        metadata={"dispatch_radius_km": radius_km},
-        event_type="mission_available",
-        target_view="driver",
-        dedupe_key=f"mission_available:{mission.get('mission_id')}",
+        **_dispatch_wave_notification(mission, radius_km),
     )
 
 
@@ -1529,26 +1720,154 @@ async def notify_pending_mission_dispatch_reminder(
     mission: dict,
     radius_km: float,
 ) -> dict:
-    tracking_code = mission.get("tracking_code", "N/A")
-    radius_label = f"{radius_km:.0f}" if float(radius_km).is_integer() else f"{radius_km:.1f}"
     return await send_targeted_notifications(
         user_ids=user_ids,
-        title="Course toujours disponible",
-        body=(
-            f"La course pour le colis {tracking_code} est toujours disponible dans un rayon de "
-            f"{radius_label} km."
-        ),
-        category="parcel_updates",
-        ref_type="mission",
-        ref_id=mission.get("mission_id"),
-        metadata={"dispatch_radius_km": radius_km, "reminder": True},
-        store_in_app=False,
-        event_type="mission_available",
-        target_view="driver",
-        dedupe_key=f"mission_available:{mission.get('mission_id')}",
+        **_dispatch_reminder_notification(mission, radius_km),
     )
 
 
+# Compteurs cumulés depuis le démarrage du process : `uncoalesced_pushes` est
+# le volume qu'aurait produit l'envoi historique (un push par couple
+# mission/livreur), `pushes` celui réellement tenté après regroupement.
+DISPATCH_PUSH_STATS: dict[str, int] = {
+    "ticks": 0,
+    "uncoalesced_pushes": 0,
+    "pushes": 0,
+    "drivers": 0,
+}
+
+
+def _dispatch_summary_body(tracking_codes: list[str]) -> str:
+    shown = tracking_codes[:2]
+    others = len(tracking_codes) - len(shown)
+    label = " et ".join(shown) if not others else ", ".join(shown)
+    if others:
+        label += f" et {others} autre{'s' if others > 1 else ''}"
+    return f"Colis {label} : ouvrez l'app pour choisir votre course."
+
+
+class DispatchNotificationBatch:
+    """
+    Regroupe les notifications d'un tick de dispatch par livreur.
+
+    `advance_pending_delivery_dispatch` ajoute les cibles de chaque vague et
+    de chaque rappel, puis `flush()` envoie UN push par livreur (résumé
+    "3 courses près de vous" s'il y a plusieurs missions) et fait les upserts
+    in-app de ce livreur en un seul `bulk_write`. Un livreur concerné par une
+    seule mission reçoit exactement la notification historique.
+    """
+
+    def __init__(self) -> None:
+        # user_id → {mission_id: kwargs _store_and_send}
+        self._by_driver: dict[str, dict[str, dict]] = {}
+        self.pairs = 0
+
+    def add_wave(self, user_ids: list[str], mission: dict, radius_km: float) -> None:
+        self._add(user_ids, mission, _dispatch_wave_notification(mission, radius_km))
+
+    def add_reminder(self, user_ids: list[str], mission: dict, radius_km: float) -> None:
+        self._add(user_ids, mission, _dispatch_reminder_notification(mission, radius_km))
+
+    def _add(self, user_ids: list[str], mission: dict, notification: dict) -> None:
+        mission_id = mission.get("mission_id")
+        if not mission_id:
+            return
+        for user_id in user_ids:
+            clean_id = (user_id or "").strip()
+            if not clean_id:
+                continue
+            items = self._by_driver.setdefault(clean_id, {})
+            # Une vague (avec in-app) prime sur un rappel pour la même mission.
+            if mission_id in items and items[mission_id].get("store_in_app", True):
+                continue
+            if mission_id not in items:
+                self.pairs += 1
+            items[mission_id] = {**notification, "tracking_code": mission.get("tracking_code") or "N/A"}
+
+    async def flush(self) -> dict:
+        stats = {"drivers": len(self._by_driver), "uncoalesced_pushes": self.pairs, "pushes": 0}
+        if not self._by_driver:
+            return stats
+
+        profiles = await load_notification_profiles(self._by_driver)
+        for user_id, items in self._by_driver.items():
+            profile = profiles.get(user_id)
+            if not profile or not _notification_category_enabled(profile.as_user_doc(), "parcel_updates"):
+                continue
+            notifications = list(items.values())
+            if len(notifications) == 1:
+                kwargs = {k: v for k, v in notifications[0].items() if k != "tracking_code"}
+                result = await _store_and_send(
+                    user_id=user_id,
+                    skip_whatsapp=True,
+                    profile=profile,
+                    **kwargs,
+                )
+                if result.get("push_reason") != "duplicate_event":
+                    stats["pushes"] += 1
+                continue
+            if await self._flush_driver(user_id, notifications, profile):
+                stats["pushes"] += 1
+
+        DISPATCH_PUSH_STATS["ticks"] += 1
+        for key in ("drivers", "uncoalesced_pushes", "pushes"):
+            DISPATCH_PUSH_STATS[key] += stats[key]
+        self._by_driver = {}
+        self.pairs = 0
+        return stats
+
+    async def _flush_driver(
+        self,
+        user_id: str,
+        notifications: list[dict],
+        profile: NotificationProfile,
+    ) -> bool:
+        now = datetime.now(timezone.utc)
+        fresh_count = sum(1 for item in notifications if not item.get("store_in_app", True))
+        operations = []
+        for item in notifications:
+            if not item.get("store_in_app", True):
+                continue
+            notif = {
+                "notif_id": _notif_id(),
+                "user_id": user_id,
+                "channel": NotificationChannel.IN_APP.value,
+                "title": item["title"],
+                "body": item["body"],
+                "status": NotificationStatus.SENT.value,
+                "metadata": item.get("metadata") or {},
+                "ref_type": item.get("ref_type"),
+                "ref_id": item.get("ref_id"),
+                "event_type": item.get("event_type"),
+                "target_view": item.get("target_view"),
+                "dedupe_key": item["dedupe_key"],
+                "sent_at": now,
+            }
+            operations.append(UpdateOne(*_dedupe_upsert_args(notif, now), upsert=True))
+        if operations:
+            result = await db.notifications.bulk_write(operations, ordered=False)
+            fresh_count += len(result.upserted_ids or {})
+        if not fresh_count:
+            # Toutes les missions étaient déjà notifiées (même règle que
+            # `duplicate_event` dans `_store_and_send`).
+            return False
+
+        count = len(notifications)
+        await _send_push(
+            user_id=user_id,
+            title=f"{count} courses près de vous",
+            body=_dispatch_summary_body([item["tracking_code"] for item in notifications]),
+            ref_type="mission",
+            category="parcel_updates",
+            event_type="mission_available",
+            target_view="driver",
+            dedupe_key=f"dispatch_summary:{user_id}",
+            metadata={"mission_count": count},
+            profile=profile,
+        )
+        return True
+
+
 async def notify_new_parcel_message(
     parcel: dict,
     sender_id: str,
@@ -1828,13 +2147,23 @@ async def notify_application_result(
     return result
 
 
-async def notify_parcel_expired(parcel: dict):
+async def notify_parcel_expired(
+    parcel: dict,
+    profiles: Optional[dict[str, NotificationProfile]] = None,
+):
     """Notifie l'expéditeur et le destinataire qu'un colis a expiré."""
     tracking_code = parcel.get("tracking_code", "")
     parcel_id = parcel.get("parcel_id")
     body = f"Le colis {tracking_code} n'a pas été retiré dans les délais et a expiré."
 
     sender_id = parcel.get("sender_user_id")
+    recipient_phone = parcel.get("recipient_phone")
+    recipient_user_id = parcel.get("recipient_user_id")
+    if profiles is None:
+        profiles = await load_notification_profiles(
+            user_ids=[sender_id, recipient_user_id],
+            phones=[recipient_phone] if not recipient_user_id else [],
+        )
     if sender_id:
         await _store_and_send(
             user_id=sender_id,
@@ -1843,14 +2172,14 @@ async def notify_parcel_expired(parcel: dict):
             ref_type="parcel",
             ref_id=parcel_id,
             category="parcel_updates",
+            profile=profiles.get(sender_id),
         )
 
-    recipient_phone = parcel.get("recipient_phone")
-    recipient_user_id = parcel.get("recipient_user_id")
+    recipient_profile = profiles.get(recipient_user_id) if recipient_user_id else None
     if not recipient_user_id and recipient_phone:
-        user = await db.users.find_one({"phone": recipient_phone}, {"user_id": 1})
-        if user:
-            recipient_user_id = user["user_id"]
+        recipient_profile = profile_for_phone(profiles, recipient_phone)
+        if recipient_profile:
+            recipient_user_id = recipient_profile.user_id
 
     if recipient_user_id:
         await _store_and_send(
@@ -1860,11 +2189,42 @@ async def notify_parcel_expired(parcel: dict):
             ref_type="parcel",
             ref_id=parcel_id,
             category="parcel_updates",
+            profile=recipient_profile,
         )
     elif recipient_phone:
         await _send_whatsapp(recipient_phone, body)
 
 
+async def notify_parcels_expired(parcels: list[dict], concurrency: int = 10) -> int:
+    """
+    Variante par lot du job d'expiration : un seul chargement des profils pour
+    tous les colis, puis envois en parallèle (bornés par `concurrency`).
+    """
+    if not parcels:
+        return 0
+    profiles = await load_notification_profiles(
+        user_ids=[
+            user_id
+            for parcel in parcels
+            for user_id in (parcel.get("sender_user_id"), parcel.get("recipient_user_id"))
+        ],
+        phones=[parcel.get("recipient_phone") for parcel in parcels if not parcel.get("recipient_user_id")],
+    )
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _notify(parcel: dict) -> None:
+        async with semaphore:
+            await notify_parcel_expired(parcel, profiles)
+
+    results = await asyncio.gather(*(_notify(parcel) for parcel in parcels), return_exceptions=True)
+    failures = 0
+    for parcel, result in zip(parcels, results):
+        if isinstance(result, Exception):
+            failures += 1
+            logger.warning("Notification d'expiration non envoyée pour %s : %s", parcel.get("parcel_id"), result)
+    return len(parcels) - failures
+
+
 async def notify_location_confirmation_request(parcel: dict, actor: str, confirm_url: str, escalate_external: bool = False):
     """Demande ou relance de confirmation GPS pour expéditeur ou destinataire."""
     tracking_code = parcel.get("tracking_code", "")
@@ -10,9 +10,11 @@ from typing import Optional
 
 from config import settings
 from database import db
+from core.datetime_utils import as_aware_utc
 from core.exceptions import bad_request_exception
 from core.utils import normalize_phone
 from core.security import generate_tracking_code
+from core.tracking_cache import invalidate_tracking_parcel
 from models.common import ParcelStatus, DeliveryMode
 from models.parcel import ParcelCreate, ParcelEvent, ParcelQuote, QuoteResponse
 from services.pricing_service import calculate_price
@@ -23,6 +25,8 @@ from services.wallet_service import (
 from services.notification_service import notify_parcel_status_change, notify_delivery_code
 from services.payment_service import create_payment_link
 from services.admin_events_service import AdminEventType, record_admin_event
+from services.archive_service import find_with_archive
+from services.counters_service import record_parcel_change, record_parcels_status_change
 from services.google_maps_service import reverse_geocode
 
 import random
@@ -406,6 +410,88 @@ async def get_assigned_mission_auto_release_minutes(
         )
 
 
+# Rappels de confirmation de collecte, en minutes avant la réattribution.
+PICKUP_REMINDER_THRESHOLDS_MINUTES = (10, 5)
+
+
+def next_pickup_reminder_due_at(
+    assigned_at: datetime,
+    auto_release_at: datetime,
+    sent_thresholds: tuple[int, ...] = (),
+) -> Optional[datetime]:
+    """Prochain rappel à envoyer, ou None si tous les rappels utiles sont partis."""
+    window = auto_release_at - assigned_at
+    for threshold in PICKUP_REMINDER_THRESHOLDS_MINUTES:
+        if threshold in sent_thresholds or window <= timedelta(minutes=threshold):
+            continue
+        return auto_release_at - timedelta(minutes=threshold)
+    return None
+
+
+def pickup_deadline_fields(assigned_at: datetime, auto_release_minutes: int) -> dict:
+    """
+    Échéances posées à l'assignation : le job de fond n'interroge que les
+    missions dont `auto_release_at` ou `pickup_reminder_due_at` est dépassé.
+    """
+    auto_release_at = assigned_at + timedelta(minutes=auto_release_minutes)
+    return {
+        "auto_release_at": auto_release_at,
+        "pickup_reminder_due_at": next_pickup_reminder_due_at(assigned_at, auto_release_at),
+        "pickup_reminder_10_sent_at": None,
+        "pickup_reminder_5_sent_at": None,
+    }
+
+
+# À retirer ($unset) quand une mission quitte l'état ASSIGNED sans collecte.
+PICKUP_DEADLINE_UNSET = {
+    "auto_release_at": "",
+    "pickup_reminder_due_at": "",
+    "pickup_reminder_10_sent_at": "",
+    "pickup_reminder_5_sent_at": "",
+}
+
+GPS_REMINDER_ACTORS = ("sender", "recipient")
+GPS_REMINDER_CLOSED_STATUSES = {"delivered", "cancelled", "returned", "expired"}
+# Colis clos : plus aucune relance GPS due (sortie des index partiels de la boucle).
+GPS_REMINDERS_CLEARED = {f"gps_reminder_next_at.{actor}": None for actor in GPS_REMINDER_ACTORS}
+
+
+def gps_reminder_next_at(parcel: dict, actor: str) -> Optional[datetime]:
+    """
+    Date de la prochaine relance de confirmation GPS pour `actor`, ou None s'il
+    n'y a plus rien à relancer. Stockée dans `gps_reminder_next_at.<actor>` à la
+    création et après chaque relance : la boucle de fond ne lit que les colis
+    échus via un index partiel sur les colis non confirmés.
+    """
+    mode = parcel.get("delivery_mode") or ""
+    if actor == "sender":
+        applicable = mode.startswith("home_to_") and parcel.get("pickup_confirmed") is False
+        token = parcel.get("sender_confirm_token")
+        user_id = parcel.get("sender_user_id")
+    else:
+        applicable = mode.endswith("_to_home") and parcel.get("delivery_confirmed") is False
+        token = parcel.get("recipient_confirm_token")
+        user_id = parcel.get("recipient_user_id")
+    if not applicable or not token or parcel.get("status") in GPS_REMINDER_CLOSED_STATUSES:
+        return None
+
+    reminder_state = (parcel.get("gps_reminders") or {}).get(actor) or {}
+    if reminder_state.get("confirmed_at"):
+        return None
+    count = int(reminder_state.get("count") or 0)
+    if count >= settings.GPS_REMINDER_MAX_COUNT:
+        return None
+
+    initial_delay = timedelta(minutes=settings.GPS_REMINDER_INITIAL_MINUTES)
+    last_sent_at = as_aware_utc(reminder_state.get("last_sent_at"))
+    if last_sent_at is None:
+        created_at = as_aware_utc(parcel.get("created_at")) or datetime.now(timezone.utc)
+        return created_at + initial_delay
+    if user_id and count == 1:
+        return last_sent_at + timedelta(minutes=settings.GPS_REMINDER_ESCALATION_MINUTES)
+    return last_sent_at + initial_delay
+
+
 def resolve_delivery_dispatch_state(
     dispatch_settings: dict,
     dispatch_started_at: datetime,
@@ -972,7 +1058,14 @@ async def create_parcel(data: ParcelCreate, sender_user_id: str, sender_phone: s
     if recipient_user:
         parcel_doc["recipient_user_id"] = recipient_user["user_id"]
 
+    parcel_doc["gps_reminder_next_at"] = {
+        actor: gps_reminder_next_at(parcel_doc, actor) for actor in GPS_REMINDER_ACTORS
+    }
+    parcel_doc["recent_events"] = []
+    parcel_doc["event_count"] = 0
+
     await db.parcels.insert_one(parcel_doc)
+    await record_parcel_change(None, parcel_doc)
     
     # ── Déclenchement automatique de la mission de collecte ──
     # Uniquement pour les modes commençant par 'home_to_' (pickup chez l'expéditeur)
@@ -1114,6 +1207,140 @@ async def create_parcel(data: ParcelCreate, sender_user_id: str, sender_phone: s
     return result
 
 
+# Timeline embarquée (`recent_events`) : derniers événements du colis, champs
+# affichables uniquement (ni acteur ni métadonnées). `event_count` compte tous
+# les événements : tant qu'il ne dépasse pas la taille du tableau, celui-ci est
+# la timeline complète et le suivi public ne lit pas parcel_events. Les vues
+# authentifiées (détail colis, audit admin) lisent toujours parcel_events.
+RECENT_EVENTS_LIMIT = 20
+_RECENT_EVENT_FIELDS = ("event_id", "event_type", "from_status", "to_status", "notes", "created_at")
+# Listes de colis : la timeline embarquée n'y sert pas.
+PARCEL_LIST_PROJECTION = {"_id": 0, "recent_events": 0}
+
+EXPIRABLE_STATUSES = (ParcelStatus.AVAILABLE_AT_RELAY, ParcelStatus.REDIRECTED_TO_RELAY)
+EXPIRY_BATCH_SIZE = 500
+_EXPIRY_PROJECTION = {
+    "_id": 0,
+    "parcel_id": 1,
+    "tracking_code": 1,
+    "status": 1,
+    "sender_user_id": 1,
+    "recipient_user_id": 1,
+    "recipient_phone": 1,
+    "destination_relay_id": 1,
+    "redirect_relay_id": 1,
+}
+
+
+async def expire_overdue_parcels(now: Optional[datetime] = None) -> dict:
+    """
+    Expire par lots tous les colis en relais dont `expires_at` est dépassé,
+    via l'index (status, expires_at) :
+      - update_many par statut d'origine, puis relecture des colis réellement
+        expirés (`expired_at == now`) pour ignorer ceux retirés entre-temps ;
+      - événements STATUS_CHANGED en insert_many ;
+      - `current_load` des relais décrémenté (colis AVAILABLE_AT_RELAY
+        uniquement : c'est à ce statut que le relais l'a compté) ;
+      - notifications envoyées par lot.
+    """
+    from pymongo import UpdateOne
+    from services.notification_service import notify_parcels_expired
+
+    now = now or datetime.now(timezone.utc)
+    query = {
+        "status": {"$in": [status.value for status in EXPIRABLE_STATUSES]},
+        "expires_at": {"$lte": now},
+    }
+    totals = {"expired": 0, "notified": 0, "relays": 0}
+    while True:
+        batch = await db.parcels.find(query, _EXPIRY_PROJECTION).sort("expires_at", 1).limit(
+            EXPIRY_BATCH_SIZE
+        ).to_list(length=EXPIRY_BATCH_SIZE)
+        if not batch:
+            break
+
+        modified = 0
+        for status in EXPIRABLE_STATUSES:
+            ids = [parcel["parcel_id"] for parcel in batch if parcel["status"] == status.value]
+            if not ids:
+                continue
+            result = await db.parcels.update_many(
+                {"parcel_id": {"$in": ids}, "status": status.value, "expires_at": {"$lte": now}},
+                {"$set": {
+                    "status": ParcelStatus.EXPIRED.value,
+                    "expired_at": now,
+                    "updated_at": now,
+                    **GPS_REMINDERS_CLEARED,
+                }},
+            )
+            modified += result.modified_count
+            await record_parcels_status_change(status.value, ParcelStatus.EXPIRED.value, result.modified_count)
+        if not modified:
+            # Tout le lot a changé de statut entre la lecture et l'écriture.
+            break
+
+        expired_ids = {
+            doc["parcel_id"]
+            async for doc in db.parcels.find(
+                {"parcel_id": {"$in": [parcel["parcel_id"] for parcel in batch]}, "expired_at": now},
+                {"_id": 0, "parcel_id": 1},
+            )
+        }
+        expired = [parcel for parcel in batch if parcel["parcel_id"] in expired_ids]
+
+        if not expired:
+            break
+        events = [
+            _event_doc(
+                "STATUS_CHANGED",
+                parcel_id=parcel["parcel_id"],
+                from_status=ParcelStatus(parcel["status"]),
+                to_status=ParcelStatus.EXPIRED,
+                actor_id="system",
+                actor_role="system",
+                notes="Délai de retrait dépassé — expiration automatique",
+                created_at=now,
+            )
+            for parcel in expired
+        ]
+        await db.parcel_events.insert_many(events, ordered=False)
+        await db.parcels.bulk_write(
+            [
+                UpdateOne(
+                    {"parcel_id": event["parcel_id"], "recent_events": {"$exists": True}},
+                    recent_events_update([event]),
+                )
+                for event in events
+            ],
+            ordered=False,
+        )
+        # Après la timeline embarquée : un chargement du suivi public intercalé
+        # ne peut plus mettre en cache l'ancienne version.
+        for parcel in expired:
+            invalidate_tracking_parcel(parcel["parcel_id"])
+
+        relay_loads: dict[str, int] = {}
+        for parcel in expired:
+            relay_id = parcel.get("redirect_relay_id") or parcel.get("destination_relay_id")
+            if relay_id and parcel["status"] == ParcelStatus.AVAILABLE_AT_RELAY.value:
+                relay_loads[relay_id] = relay_loads.get(relay_id, 0) + 1
+        if relay_loads:
+            await db.relay_points.bulk_write(
+                [
+                    UpdateOne({"relay_id": relay_id}, {"$inc": {"current_load": -count}})
+                    for relay_id, count in relay_loads.items()
+                ],
+                ordered=False,
+            )
+
+        totals["expired"] += len(expired)
+        totals["relays"] += len(relay_loads)
+        totals["notified"] += await notify_parcels_expired(expired)
+        if len(batch) < EXPIRY_BATCH_SIZE:
+            break
+    return totals
+
+
 async def transition_status(
     parcel_id: str,
     new_status: ParcelStatus,
@@ -1145,10 +1372,12 @@ async def transition_status(
     # Renouveler le délai de retrait quand le colis arrive au relais (7 jours)
     if new_status in (ParcelStatus.AVAILABLE_AT_RELAY, ParcelStatus.REDIRECTED_TO_RELAY):
         update_fields["expires_at"] = now + timedelta(days=7)
+    closing = GPS_REMINDERS_CLEARED if new_status.value in GPS_REMINDER_CLOSED_STATUSES else {}
     await db.parcels.update_one(
         {"parcel_id": parcel_id},
-        {"$set": update_fields},
+        {"$set": {**update_fields, **closing}},
     )
+    await record_parcel_change(parcel, {**parcel, **update_fields})
 
     await _record_event(
         parcel_id=parcel_id,
@@ -1246,10 +1475,10 @@ async def transition_status(
                 logger.info(f"Mission {mission['mission_id']} complétée via scan relais pour {parcel_id}")
             if mission.get("driver_id"):
                 from services.loyalty_service import _check_referral_bonus
-                from services.ranking_service import refresh_driver_stats_for_period
+                from services.ranking_service import update_driver_stat
 
                 await _check_referral_bonus(mission["driver_id"])
-                await refresh_driver_stats_for_period(f"{now.year}-{now.month:02d}")
+                await update_driver_stat(mission["driver_id"])
 
                 # --- Déclenchement Phase 2 Transit ---
                 p = await db.parcels.find_one({"parcel_id": parcel_id})
@@ -1277,10 +1506,10 @@ async def transition_status(
             logger.info(f"Mission {mission['mission_id']} complétée (colis livré) pour {parcel_id}")
             if mission.get("driver_id"):
                 from services.loyalty_service import _check_referral_bonus
-                from services.ranking_service import refresh_driver_stats_for_period
+                from services.ranking_service import update_driver_stat
 
                 await _check_referral_bonus(mission["driver_id"])
-                await refresh_driver_stats_for_period(f"{now.year}-{now.month:02d}")
+                await update_driver_stat(mission["driver_id"])
 
     elif new_status in (ParcelStatus.CANCELLED, ParcelStatus.RETURNED):
         # Toute mission encore non terminale doit être clôturée, y compris les missions
@@ -1298,6 +1527,10 @@ async def transition_status(
             MissionStatus.IN_PROGRESS.value,
             MissionStatus.INCIDENT_REPORTED.value,
         ]
+        closed_driver_ids = await db.delivery_missions.distinct(
+            "driver_id",
+            {"parcel_id": parcel_id, "status": {"$in": active_statuses}, "driver_id": {"$ne": None}},
+        )
         await db.delivery_missions.update_many(
             {
                 "parcel_id": parcel_id,
@@ -1311,6 +1544,11 @@ async def transition_status(
                 "is_broadcast": False,
             }},
         )
+        if closed_driver_ids:
+            from services.ranking_service import update_driver_stat
+
+            for closed_driver_id in closed_driver_ids:
+                await update_driver_stat(closed_driver_id)
         logger.info(
             "Missions actives/pending du colis %s clôturées en %s après passage en %s",
             parcel_id, target_mission_status, new_status.value,
@@ -1677,7 +1915,7 @@ async def _create_delivery_mission(parcel: dict, from_status: ParcelStatus) -> N
 
 
 
-async def _record_event(
+def _event_doc(
     event_type: str,
     parcel_id: Optional[str] = None,
     from_status: Optional[ParcelStatus] = None,
@@ -1686,9 +1924,9 @@ async def _record_event(
     actor_role: Optional[str] = None,
     notes: Optional[str] = None,
     metadata: Optional[dict] = None,
-):
-    """Insère un ParcelEvent dans la collection parcel_events."""
-    event = {
+    created_at: Optional[datetime] = None,
+) -> dict:
+    return {
         "event_id":    _event_id(),
         "parcel_id":   parcel_id,
         "event_type":  event_type,
@@ -1698,15 +1936,81 @@ async def _record_event(
         "actor_role":  actor_role,
         "notes":       notes,
         "metadata":    metadata or {},
-        "created_at":  datetime.now(timezone.utc),
+        "created_at":  created_at or datetime.now(timezone.utc),
     }
+
+
+async def _record_event(
+    event_type: str,
+    parcel_id: Optional[str] = None,
+    from_status: Optional[ParcelStatus] = None,
+    to_status: Optional[ParcelStatus] = None,
+    actor_id: Optional[str] = None,
+    actor_role: Optional[str] = None,
+    notes: Optional[str] = None,
+    metadata: Optional[dict] = None,
+):
+    """
+    Insère un ParcelEvent dans la collection parcel_events et l'ajoute à la
+    timeline embarquée du colis. Les colis antérieurs à cette timeline (sans
+    champ `recent_events`) ne sont pas touchés : ils restent lus depuis
+    parcel_events.
+    """
+    event = _event_doc(
+        event_type,
+        parcel_id=parcel_id,
+        from_status=from_status,
+        to_status=to_status,
+        actor_id=actor_id,
+        actor_role=actor_role,
+        notes=notes,
+        metadata=metadata,
+    )
     await db.parcel_events.insert_one(event)
+    if parcel_id:
+        await db.parcels.update_one(
+            {"parcel_id": parcel_id, "recent_events": {"$exists": True}},
+            recent_events_update([event]),
+        )
+        # Statut et timeline publics ont changé (transition_status passe ici).
+        invalidate_tracking_parcel(parcel_id)
+
+
+def recent_events_update(events: list[dict]) -> dict:
+    """Ajout borné à `recent_events` (les plus anciens sortent du tableau)."""
+    return {
+        "$push": {
+            "recent_events": {
+                "$each": [{field: event.get(field) for field in _RECENT_EVENT_FIELDS} for event in events],
+                "$slice": -RECENT_EVENTS_LIMIT,
+            },
+        },
+        "$inc": {"event_count": len(events)},
+    }
+
+
+def embedded_timeline(parcel: dict) -> Optional[list]:
+    """Timeline embarquée si elle est complète, sinon None."""
+    recent = parcel.get("recent_events")
+    if recent is None or (parcel.get("event_count") or 0) > len(recent):
+        return None
+    return list(recent)
+
+
+async def get_parcel_timeline_for(parcel: dict) -> list:
+    """Timeline d'un colis déjà lu : embarquée dans le cas courant, parcel_events sinon."""
+    timeline = embedded_timeline(parcel)
+    if timeline is not None:
+        return timeline
+    return await get_parcel_timeline(parcel["parcel_id"])
 
 
 async def get_parcel_timeline(parcel_id: str) -> list:
-    """Retourne les événements triés chronologiquement."""
-    cursor = db.parcel_events.find(
+    """Retourne les événements triés chronologiquement (archive si le colis a été archivé)."""
+    return await find_with_archive(
+        "parcel_events",
         {"parcel_id": parcel_id},
         {"_id": 0},
-    ).sort("created_at", 1)
-    return await cursor.to_list(length=200)
+        sort=[("created_at", 1)],
+        length=200,
+    )
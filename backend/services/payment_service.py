@@ -7,6 +7,7 @@ from typing import Optional
 import httpx
 
 from config import settings
+from core.metrics import external_call
 
 logger = logging.getLogger(__name__)
 
@@ -74,12 +75,13 @@ async def create_payment_link(
 
     try:
         async with httpx.AsyncClient(timeout=15.0) as client:
-            resp = await client.post(
-                f"{FLUTTERWAVE_BASE_URL}/payments",
-                json=payload,
-                headers=_headers(),
-            )
-            resp.raise_for_status()
+            with external_call("flutterwave", "create_payment"):
+                resp = await client.post(
+                    f"{FLUTTERWAVE_BASE_URL}/payments",
+                    json=payload,
+                    headers=_headers(),
+                )
+                resp.raise_for_status()
             data = resp.json()
             if data.get("status") == "success":
                 return {
@@ -101,11 +103,12 @@ async def verify_payment(transaction_id: str) -> dict:
 
     try:
         async with httpx.AsyncClient(timeout=15.0) as client:
-            resp = await client.get(
-                f"{FLUTTERWAVE_BASE_URL}/transactions/{transaction_id}/verify",
-                headers=_headers(),
-            )
-            resp.raise_for_status()
+            with external_call("flutterwave", "verify_payment"):
+                resp = await client.get(
+                    f"{FLUTTERWAVE_BASE_URL}/transactions/{transaction_id}/verify",
+                    headers=_headers(),
+                )
+                resp.raise_for_status()
             data = resp.json()
             if data.get("status") == "success":
                 return data.get("data", {})
@@ -122,12 +125,13 @@ async def verify_by_tx_ref(tx_ref: str) -> dict:
 
     try:
         async with httpx.AsyncClient(timeout=15.0) as client:
-            resp = await client.get(
-                f"{FLUTTERWAVE_BASE_URL}/transactions",
-                params={"tx_ref": tx_ref},
-                headers=_headers(),
-            )
-            resp.raise_for_status()
+            with external_call("flutterwave", "verify_by_tx_ref"):
+                resp = await client.get(
+                    f"{FLUTTERWAVE_BASE_URL}/transactions",
+                    params={"tx_ref": tx_ref},
+                    headers=_headers(),
+                )
+                resp.raise_for_status()
             data = resp.json()
             items = data.get("data", [])
             if items:
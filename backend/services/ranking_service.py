@@ -1,8 +1,25 @@
+"""
+Statistiques mensuelles et classement des livreurs (collection driver_stats).
+
+Les stats sont maintenues au fil de l'eau : quand une mission se termine
+(complétée / échouée) ou qu'un livreur reçoit une note, `update_driver_stat`
+recalcule la ligne de CE livreur (agrégation indexée sur driver_id), puis
+`rerank_period` ne réécrit les rangs que si la clé de tri a changé — un seul
+`bulk_write` avec les seules lignes dont le rang ou le badge bouge.
+
+Les lectures (`get_driver_stats_for_period`, `get_driver_stats_for_drivers`,
+`count_ranked_drivers`) sont des requêtes indexées sur driver_stats ; le
+recalcul complet (`refresh_driver_stats_for_period`) ne sert plus qu'au job
+quotidien, au job mensuel et au premier affichage d'une période vide.
+"""
 import logging
 from calendar import monthrange
 from datetime import datetime, timezone
+from typing import Optional
 from uuid import uuid4
 
+from pymongo import ReturnDocument, UpdateOne
+
 from database import db
 from services.performance_rewards_service import get_performance_rewards_settings
 from services.wallet_service import credit_wallet
@@ -11,22 +28,30 @@ logger = logging.getLogger(__name__)
 
 MONTHLY_DRIVER_GOAL = 20
 
+RANKING_FIELDS = ("deliveries_success", "success_rate", "deliveries_total", "total_earned_xof")
+# Champs conservés d'un recalcul à l'autre (identifiant, bonus déjà versé).
+_INSERT_ONLY_FIELDS = ("stat_id", "bonus_paid_xof", "created_at")
 
-async def compute_driver_stats_for_period(period: str) -> list[dict]:
+
+def current_period(now: Optional[datetime] = None) -> str:
+    now = now or datetime.now(timezone.utc)
+    return f"{now.year}-{now.month:02d}"
+
+
+def _period_bounds(period: str) -> tuple[datetime, datetime]:
     year, month = map(int, period.split("-"))
     start = datetime(year, month, 1, tzinfo=timezone.utc)
     _, last_day = monthrange(year, month)
     end = datetime(year, month, last_day, 23, 59, 59, tzinfo=timezone.utc)
+    return start, end
 
-    drivers = await db.users.find(
-        {"role": "driver"},
-        {"_id": 0, "user_id": 1, "average_rating": 1, "total_ratings_count": 1},
-    ).to_list(None)
 
-    mission_stats_pipeline = [
+def _mission_stats_pipeline(period: str, driver_match) -> list[dict]:
+    start, end = _period_bounds(period)
+    return [
         {
             "$match": {
-                "driver_id": {"$exists": True, "$ne": None},
+                "driver_id": driver_match,
                 "$or": [
                     {"created_at": {"$gte": start, "$lte": end}},
                     {"completed_at": {"$gte": start, "$lte": end}},
@@ -51,89 +76,186 @@ async def compute_driver_stats_for_period(period: str) -> list[dict]:
         },
     ]
 
-    mission_stats = await db.delivery_missions.aggregate(mission_stats_pipeline).to_list(None)
+
+def _stat_values(driver: dict, count: dict) -> dict:
+    total = int(count.get("total") or 0)
+    success = int(count.get("success") or 0)
+    return {
+        "deliveries_total": total,
+        "deliveries_success": success,
+        "success_rate": round(success / max(total, 1) * 100, 1),
+        "avg_rating": float(driver.get("average_rating") or 0),
+        "total_earned_xof": float(count.get("earned") or 0),
+    }
+
+
+def ranking_key(stat: dict) -> tuple:
+    return (
+        -int(stat.get("deliveries_success") or 0),
+        -float(stat.get("success_rate") or 0),
+        -int(stat.get("deliveries_total") or 0),
+        -float(stat.get("total_earned_xof") or 0),
+        stat.get("driver_id") or "",
+    )
+
+
+def badge_for_rank(rank: int) -> str:
+    return {1: "gold", 2: "silver", 3: "bronze"}.get(rank, "none")
+
+
+async def compute_driver_stats_for_period(period: str) -> list[dict]:
+    drivers = await db.users.find(
+        {"role": "driver"},
+        {"_id": 0, "user_id": 1, "average_rating": 1, "total_ratings_count": 1},
+    ).to_list(None)
+
+    pipeline = _mission_stats_pipeline(period, {"$exists": True, "$ne": None})
+    mission_stats = await db.delivery_missions.aggregate(pipeline).to_list(None)
     stats_by_driver = {item["_id"]: item for item in mission_stats if item.get("_id")}
 
+    now = datetime.now(timezone.utc)
     stats_list = []
     for driver in drivers:
         driver_id = driver.get("user_id")
         if not driver_id:
             continue
-
-        count = stats_by_driver.get(driver_id, {})
-        total = int(count.get("total") or 0)
-        success = int(count.get("success") or 0)
-        rate = round(success / max(total, 1) * 100, 1)
-
         stats_list.append(
             {
                 "stat_id": f"stat_{uuid4().hex[:12]}",
                 "driver_id": driver_id,
                 "period": period,
-                "deliveries_total": total,
-                "deliveries_success": success,
-                "success_rate": rate,
-                "avg_rating": float(driver.get("average_rating") or 0),
-                "total_earned_xof": float(count.get("earned") or 0),
+                **_stat_values(driver, stats_by_driver.get(driver_id, {})),
                 "bonus_paid_xof": 0,
                 "rank": 0,
                 "badge": "none",
-                "created_at": datetime.now(timezone.utc),
-                "updated_at": datetime.now(timezone.utc),
+                "created_at": now,
+                "updated_at": now,
             }
         )
 
-    stats_list.sort(
-        key=lambda item: (
-            -item["deliveries_success"],
-            -item["success_rate"],
-            -item["deliveries_total"],
-            -item["total_earned_xof"],
-            item["driver_id"],
-        )
-    )
-
-    for index, stat in enumerate(stats_list):
-        stat["rank"] = index + 1
-        stat["badge"] = (
-            "gold"
-            if index == 0
-            else "silver"
-            if index == 1
-            else "bronze"
-            if index == 2
-            else "none"
-        )
+    stats_list.sort(key=ranking_key)
+    for index, stat in enumerate(stats_list, start=1):
+        stat["rank"] = index
+        stat["badge"] = badge_for_rank(index)
 
     return stats_list
 
 
-async def refresh_driver_stats_for_period(period: str) -> list[dict]:
+async def refresh_driver_stats_for_period(period: str) -> int:
+    """
+    Recalcul complet d'une période, persisté en un seul bulk_write. stat_id,
+    bonus_paid_xof et created_at des lignes existantes sont conservés.
+    """
     stats = await compute_driver_stats_for_period(period)
-    now = datetime.now(timezone.utc)
-
-    existing = await db.driver_stats.find(
-        {"period": period},
-        {"_id": 0, "driver_id": 1, "bonus_paid_xof": 1, "stat_id": 1, "created_at": 1},
-    ).to_list(None)
-    existing_by_driver = {item["driver_id"]: item for item in existing if item.get("driver_id")}
-
-    for stat in stats:
-        previous = existing_by_driver.get(stat["driver_id"])
-        if previous:
-            stat["stat_id"] = previous.get("stat_id", stat["stat_id"])
-            stat["bonus_paid_xof"] = previous.get("bonus_paid_xof", stat["bonus_paid_xof"])
-            stat["created_at"] = previous.get("created_at", stat["created_at"])
-        stat["updated_at"] = now
-        await db.driver_stats.update_one(
+    if not stats:
+        return 0
+    operations = [
+        UpdateOne(
             {"driver_id": stat["driver_id"], "period": period},
-            {"$set": stat},
+            {
+                "$set": {key: value for key, value in stat.items() if key not in _INSERT_ONLY_FIELDS},
+                "$setOnInsert": {key: stat[key] for key in _INSERT_ONLY_FIELDS},
+            },
             upsert=True,
         )
-
+        for stat in stats
+    ]
+    await db.driver_stats.bulk_write(operations, ordered=False)
+    return len(stats)
+
+
+async def rerank_period(period: str) -> int:
+    """
+    Retrie la période en mémoire (projection réduite aux clés de tri) et ne
+    réécrit que les lignes dont le rang ou le badge change.
+    """
+    projection = {"_id": 0, "driver_id": 1, "rank": 1, "badge": 1, **{field: 1 for field in RANKING_FIELDS}}
+    stats = await db.driver_stats.find({"period": period}, projection).to_list(None)
+    stats.sort(key=ranking_key)
+
+    operations = []
+    for rank, stat in enumerate(stats, start=1):
+        badge = badge_for_rank(rank)
+        if stat.get("rank") != rank or stat.get("badge") != badge:
+            operations.append(UpdateOne(
+                {"driver_id": stat["driver_id"], "period": period},
+                {"$set": {"rank": rank, "badge": badge}},
+            ))
+    if operations:
+        await db.driver_stats.bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+async def update_driver_stat(driver_id: str, period: Optional[str] = None) -> Optional[dict]:
+    """
+    Recalcule la ligne d'un livreur pour `period` (mois en cours par défaut)
+    et reclasse la période si sa clé de tri a bougé. Les erreurs sont
+    journalisées : une stat en retard ne doit pas faire échouer la mission.
+    """
+    period = period or current_period()
+    try:
+        driver = await db.users.find_one(
+            {"user_id": driver_id, "role": "driver"},
+            {"_id": 0, "user_id": 1, "average_rating": 1},
+        )
+        if not driver:
+            return None
+        rows = await db.delivery_missions.aggregate(_mission_stats_pipeline(period, driver_id)).to_list(1)
+        values = _stat_values(driver, rows[0] if rows else {})
+        now = datetime.now(timezone.utc)
+        previous = await db.driver_stats.find_one_and_update(
+            {"driver_id": driver_id, "period": period},
+            {
+                "$set": {**values, "updated_at": now},
+                "$setOnInsert": {
+                    "stat_id": f"stat_{uuid4().hex[:12]}",
+                    "bonus_paid_xof": 0,
+                    "rank": 0,
+                    "badge": "none",
+                    "created_at": now,
+                },
+            },
+            projection={"_id": 0, "driver_id": 1, **{field: 1 for field in RANKING_FIELDS}},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE,
+        )
+        if previous is None or ranking_key(previous) != ranking_key({**values, "driver_id": driver_id}):
+            await rerank_period(period)
+        return values
+    except Exception as exc:
+        logger.warning("Stats livreur %s (%s) non mises à jour : %s", driver_id, period, exc)
+        return None
+
+
+async def get_driver_stats_for_period(period: str, limit: Optional[int] = None) -> list[dict]:
+    """Classement d'une période, trié par rang (index period + rank)."""
+    cursor = db.driver_stats.find({"period": period}, {"_id": 0}).sort("rank", 1)
+    if limit:
+        cursor = cursor.limit(limit)
+    stats = await cursor.to_list(length=limit)
+    if not stats and await refresh_driver_stats_for_period(period):
+        # Première lecture d'une période jamais calculée.
+        cursor = db.driver_stats.find({"period": period}, {"_id": 0}).sort("rank", 1)
+        if limit:
+            cursor = cursor.limit(limit)
+        stats = await cursor.to_list(length=limit)
     return stats
 
 
+async def get_driver_stats_for_drivers(period: str, driver_ids: list[str]) -> dict[str, dict]:
+    if not driver_ids:
+        return {}
+    stats = await db.driver_stats.find(
+        {"period": period, "driver_id": {"$in": driver_ids}},
+        {"_id": 0},
+    ).to_list(length=len(driver_ids))
+    return {stat["driver_id"]: stat for stat in stats}
+
+
+async def count_ranked_drivers(period: str) -> int:
+    return await db.driver_stats.count_documents({"period": period})
+
+
 async def pay_monthly_driver_bonuses(period: str):
     stats = await db.driver_stats.find({"period": period}).to_list(None)
     rewards = await get_performance_rewards_settings()
@@ -183,10 +305,7 @@ async def pay_monthly_driver_bonuses(period: str):
 async def compute_relay_stats_and_pay_bonuses(period: str):
     rewards = await get_performance_rewards_settings()
     relay_volume_bonuses = rewards["relay"]["volume_bonuses"]
-    year, month = map(int, period.split("-"))
-    start = datetime(year, month, 1, tzinfo=timezone.utc)
-    _, last_day = monthrange(year, month)
-    end = datetime(year, month, last_day, 23, 59, 59, tzinfo=timezone.utc)
+    start, end = _period_bounds(period)
 
     relays = await db.relay_points.find({"is_active": True}).to_list(None)
     for relay in relays:
@@ -0,0 +1,248 @@
+"""
+Rétention des collections qui grossissent sans limite.
+
+Deux niveaux :
+  - "ttl" : logs éphémères (livraison WhatsApp, événements d'appel). Un index
+    TTL Mongo les supprime ; le job se contente de créer / corriger l'index.
+  - "archive" : données d'audit (notifications, cloche admin, timeline colis).
+    Au-delà de l'âge configuré, les documents sont déplacés vers
+    `<collection>_archive` (ou un fichier NDJSON gzip par jour) par lots,
+    avec une pause entre chaque lot pour ne pas saturer Mongo.
+  - "tiering" : colis terminés anciens, déplacés avec leurs missions et leurs
+    événements vers les collections `*_archive` (services/archive_service.py).
+    Toujours en collection : les lectures unitaires y retombent.
+
+Chaque exécution écrit un rapport dans `retention_runs` : documents déplacés,
+taille des données et des index avant/après par collection.
+"""
+import asyncio
+import gzip
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Optional
+
+from bson import json_util
+from pymongo.errors import BulkWriteError, OperationFailure
+
+from config import settings
+from database import db
+
+logger = logging.getLogger(__name__)
+
+# Code Mongo "duplicate key" : un lot déjà copié lors d'une exécution
+# interrompue est simplement ignoré à la réinsertion (même _id).
+_DUPLICATE_KEY = 11000
+
+
+def retention_policies() -> list[dict[str, Any]]:
+    return [
+        {
+            "collection": "whatsapp_delivery_logs",
+            "mode": "ttl",
+            "field": "created_at",
+            "days": settings.WHATSAPP_LOGS_RETENTION_DAYS,
+        },
+        {
+            "collection": "whatsapp_call_events",
+            "mode": "ttl",
+            "field": "created_at",
+            "days": settings.WHATSAPP_CALL_EVENTS_RETENTION_DAYS,
+        },
+        {
+            "collection": "notifications",
+            "mode": "archive",
+            "field": "created_at",
+            "days": settings.NOTIFICATIONS_RETENTION_DAYS,
+        },
+        {
+            "collection": "admin_events",
+            "mode": "archive",
+            "field": "created_at",
+            "days": settings.ADMIN_EVENTS_RETENTION_DAYS,
+        },
+        {
+            "collection": "parcel_events",
+            "mode": "archive",
+            "field": "created_at",
+            "days": settings.PARCEL_EVENTS_RETENTION_DAYS,
+        },
+        {
+            "collection": "parcels",
+            "mode": "tiering",
+            "field": "updated_at",
+            "days": settings.PARCEL_ARCHIVE_AFTER_DAYS,
+        },
+    ]
+
+
+async def collection_storage_stats(collection_name: str) -> dict[str, int]:
+    """Taille logique, taille disque et taille des index d'une collection."""
+    try:
+        rows = await db[collection_name].aggregate(
+            [{"$collStats": {"storageStats": {}}}]
+        ).to_list(length=1)
+    except OperationFailure:
+        rows = []
+    storage = (rows[0].get("storageStats") if rows else None) or {}
+    return {
+        "count": int(storage.get("count") or 0),
+        "size_bytes": int(storage.get("size") or 0),
+        "storage_bytes": int(storage.get("storageSize") or 0),
+        "index_bytes": int(storage.get("totalIndexSize") or 0),
+    }
+
+
+async def ensure_ttl_index(collection_name: str, field: str, expire_after_seconds: int) -> str:
+    """Crée l'index TTL ou aligne sa durée (collMod) sur la politique."""
+    collection = db[collection_name]
+    indexes = await collection.index_information()
+    for name, spec in indexes.items():
+        if spec.get("key") != [(field, 1)]:
+            continue
+        if spec.get("expireAfterSeconds") == expire_after_seconds:
+            return "unchanged"
+        if "expireAfterSeconds" in spec:
+            await db.command(
+                "collMod",
+                collection_name,
+                index={"name": name, "expireAfterSeconds": expire_after_seconds},
+            )
+            return "updated"
+        # Index simple existant sur le même champ : on le remplace par le TTL.
+        await collection.drop_index(name)
+        break
+    await collection.create_index([(field, 1)], expireAfterSeconds=expire_after_seconds)
+    return "created"
+
+
+def _archive_file(collection_name: str, day: datetime) -> Path:
+    directory = Path(settings.RETENTION_ARCHIVE_DIR or ".") / collection_name
+    return directory / f"{collection_name}-{day:%Y%m%d}.ndjson.gz"
+
+
+def _append_ndjson(path: Path, docs: list[dict]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Les membres gzip concaténés forment un fichier valide : append sûr.
+    with gzip.open(path, "at", encoding="utf-8") as handle:
+        for doc in docs:
+            handle.write(json_util.dumps(doc))
+            handle.write("\n")
+
+
+async def insert_into_archive(collection_name: str, docs: list[dict], now: datetime) -> None:
+    """Copie idempotente vers `<collection>_archive` (doublons ignorés)."""
+    try:
+        await db[f"{collection_name}_archive"].insert_many(
+            [{**doc, "archived_at": now} for doc in docs],
+            ordered=False,
+        )
+    except BulkWriteError as exc:
+        errors = exc.details.get("writeErrors") or []
+        if any(err.get("code") != _DUPLICATE_KEY for err in errors):
+            raise
+
+
+async def _copy_batch(collection_name: str, docs: list[dict], now: datetime) -> None:
+    if settings.RETENTION_ARCHIVE_FORMAT == "ndjson":
+        await asyncio.to_thread(_append_ndjson, _archive_file(collection_name, now), docs)
+        return
+    await insert_into_archive(collection_name, docs, now)
+
+
+async def archive_older_than(
+    collection_name: str,
+    field: str,
+    cutoff: datetime,
+    *,
+    batch_size: Optional[int] = None,
+    max_batches: Optional[int] = None,
+    pause_seconds: Optional[float] = None,
+) -> int:
+    """
+    Déplace par lots les documents dont `field < cutoff`. Copie puis suppression
+    par _id : une interruption entre les deux laisse au pire un doublon dans
+    l'archive, jamais une perte.
+    """
+    batch_size = batch_size or settings.RETENTION_BATCH_SIZE
+    max_batches = max_batches or settings.RETENTION_MAX_BATCHES_PER_RUN
+    if pause_seconds is None:
+        pause_seconds = settings.RETENTION_BATCH_PAUSE_MS / 1000
+    collection = db[collection_name]
+    moved = 0
+    for _ in range(max_batches):
+        docs = await collection.find({field: {"$lt": cutoff}}).sort(field, 1).limit(batch_size).to_list(
+            length=batch_size
+        )
+        if not docs:
+            break
+        await _copy_batch(collection_name, docs, datetime.now(timezone.utc))
+        result = await collection.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+        moved += result.deleted_count
+        if len(docs) < batch_size:
+            break
+        await asyncio.sleep(pause_seconds)
+    return moved
+
+
+async def _apply_policy(policy: dict[str, Any], now: datetime) -> dict[str, Any]:
+    name = policy["collection"]
+    before = await collection_storage_stats(name)
+    report: dict[str, Any] = {"collection": name, "mode": policy["mode"], "days": policy["days"]}
+    if policy["mode"] == "ttl":
+        report["ttl_index"] = await ensure_ttl_index(name, policy["field"], policy["days"] * 86400)
+    elif policy["mode"] == "tiering":
+        from services.archive_service import archive_terminal_parcels
+
+        report["archive_format"] = "collection"
+        report["moved_by_collection"] = await archive_terminal_parcels(now - timedelta(days=policy["days"]))
+        report["moved"] = sum(report["moved_by_collection"].values())
+    else:
+        report["archive_format"] = settings.RETENTION_ARCHIVE_FORMAT
+        report["moved"] = await archive_older_than(
+            name,
+            policy["field"],
+            now - timedelta(days=policy["days"]),
+        )
+    after = await collection_storage_stats(name)
+    report.update({
+        "before": before,
+        "after": after,
+        "bytes_reclaimed": max(before["size_bytes"] - after["size_bytes"], 0),
+        "index_bytes_reclaimed": max(before["index_bytes"] - after["index_bytes"], 0),
+    })
+    return report
+
+
+async def run_retention() -> dict[str, Any]:
+    """Applique toutes les politiques et persiste le rapport dans `retention_runs`."""
+    started_at = datetime.now(timezone.utc)
+    reports: list[dict[str, Any]] = []
+    for policy in retention_policies():
+        try:
+            reports.append(await _apply_policy(policy, started_at))
+        except Exception as exc:
+            logger.error("Rétention %s en échec : %s", policy["collection"], exc)
+            reports.append({"collection": policy["collection"], "mode": policy["mode"], "error": str(exc)[:240]})
+
+    run = {
+        "run_id": f"ret_{uuid.uuid4().hex[:12]}",
+        "started_at": started_at,
+        "finished_at": datetime.now(timezone.utc),
+        "collections": reports,
+        "bytes_reclaimed": sum(r.get("bytes_reclaimed", 0) for r in reports),
+        "documents_moved": sum(r.get("moved", 0) for r in reports),
+    }
+    await db.retention_runs.insert_one({**run})
+    logger.info(
+        "Rétention terminée : %s document(s) archivé(s), %s octet(s) libéré(s)",
+        run["documents_moved"],
+        run["bytes_reclaimed"],
+    )
+    return run
+
+
+async def list_retention_runs(limit: int = 20) -> list[dict[str, Any]]:
+    cursor = db.retention_runs.find({}, {"_id": 0}).sort("started_at", -1).limit(limit)
+    return await cursor.to_list(length=limit)
@@ -11,6 +11,7 @@ import httpx
 
 from config import settings
 from core.exceptions import bad_request_exception
+from core.metrics import external_call
 from database import db
 from services.wallet_service import get_or_create_wallet, credit_wallet
 
@@ -93,12 +94,13 @@ async def create_wallet_topup_checkout(
 
     try:
         async with httpx.AsyncClient(timeout=20.0) as client:
-            response = await client.post(
-                f"{STRIPE_BASE_URL}/checkout/sessions",
-                data=data,
-                headers=_stripe_headers(),
-            )
-            response.raise_for_status()
+            with external_call("stripe", "checkout_session"):
+                response = await client.post(
+                    f"{STRIPE_BASE_URL}/checkout/sessions",
+                    data=data,
+                    headers=_stripe_headers(),
+                )
+                response.raise_for_status()
             session = response.json()
     except httpx.HTTPStatusError as exc:
         detail = exc.response.text
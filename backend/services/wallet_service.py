@@ -2,14 +2,18 @@
 Service wallet : crédit/débit, distribution des revenus à chaque livraison réussie.
 """
 import logging
+import time
 import uuid
+from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Optional
+from typing import Iterable, Optional
 
-from pymongo.errors import OperationFailure
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
 
-from database import db, get_client
+from database import db, get_client, set_transactions_supported, transactions_supported
 from models.wallet import TransactionType
+from services.ledger_service import ledger_deltas
 
 logger = logging.getLogger(__name__)
 
@@ -17,26 +21,45 @@ logger = logging.getLogger(__name__)
 async def _run_in_transaction(op):
     """Execute op(session) dans une transaction Mongo si disponible (replica set),
     sinon execute sans session (meilleur effort). op est une coroutine acceptant
-    une session (ou None) et retournant le resultat final."""
+    une session (ou None) et retournant le resultat final. La capacité est
+    détectée une fois à la connexion (database.connect_db)."""
     client = get_client()
-    if client is None:
+    if client is None or transactions_supported() is False:
         return await op(None)
     try:
         async with await client.start_session() as session:
             async with session.start_transaction():
-                return await op(session)
+                result = await op(session)
     except OperationFailure as exc:
         # MongoDB standalone (pas de replica set) — fallback non atomique.
         if "Transaction numbers are only allowed" in str(exc) or "replica set" in str(exc).lower():
             logger.warning("MongoDB non replica-set, wallet en mode non atomique")
+            set_transactions_supported(False)
             return await op(None)
         raise
+    if transactions_supported() is None:
+        set_transactions_supported(True)
+    return result
 
 
 def _wallet_id() -> str:
     return f"wlt_{uuid.uuid4().hex[:12]}"
 
 
+def _new_wallet(owner_id: str, owner_type: str, now: datetime) -> dict:
+    return {
+        "wallet_id":  _wallet_id(),
+        "owner_id":   owner_id,
+        "owner_type": owner_type,
+        "balance":    0.0,
+        "pending":    0.0,
+        "currency":   "XOF",
+        "is_active":  True,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
 def _tx_id() -> str:
     return f"wtx_{uuid.uuid4().hex[:12]}"
 
@@ -147,6 +170,19 @@ async def record_wallet_transaction(
         if existing:
             return existing
 
+    tx = _build_transaction(wallet_id, amount, tx_type, description, parcel_id, reference)
+    await db.wallet_transactions.insert_one(tx, session=session)
+    return {k: v for k, v in tx.items() if k != "_id"}
+
+
+def _build_transaction(
+    wallet_id: str,
+    amount: float,
+    tx_type: str,
+    description: str,
+    parcel_id: Optional[str],
+    reference: Optional[str],
+) -> dict:
     tx = {
         "tx_id": _tx_id(),
         "wallet_id": wallet_id,
@@ -157,8 +193,8 @@ async def record_wallet_transaction(
         "reference": reference,
         "created_at": datetime.now(timezone.utc),
     }
-    await db.wallet_transactions.insert_one(tx, session=session)
-    return {k: v for k, v in tx.items() if k != "_id"}
+    tx["balance_delta"], tx["pending_delta"] = ledger_deltas(tx)
+    return tx
 
 
 async def get_or_create_wallet(owner_id: str, owner_type: str) -> dict:
@@ -167,18 +203,7 @@ async def get_or_create_wallet(owner_id: str, owner_type: str) -> dict:
     if wallet:
         return wallet
 
-    now = datetime.now(timezone.utc)
-    wallet = {
-        "wallet_id":  _wallet_id(),
-        "owner_id":   owner_id,
-        "owner_type": owner_type,
-        "balance":    0.0,
-        "pending":    0.0,
-        "currency":   "XOF",
-        "is_active":  True,
-        "created_at": now,
-        "updated_at": now,
-    }
+    wallet = _new_wallet(owner_id, owner_type, datetime.now(timezone.utc))
     await db.wallets.insert_one(wallet)
     return {k: v for k, v in wallet.items() if k != "_id"}
 
@@ -221,42 +246,6 @@ async def credit_wallet(
 
     tx = await _run_in_transaction(_op)
     logger.info(f"Wallet crédité : owner={owner_id} montant={amount} XOF")
-    return tx
-
-
-async def record_driver_revenue(
-    driver_id: str,
-    amount: float,
-    description: str,
-    parcel_id: Optional[str] = None,
-    reference: Optional[str] = None,
-    ensure_unique: bool = False,
-) -> dict:
-    wallet = await get_or_create_wallet(driver_id, "driver")
-
-    async def _op(session):
-        await db.users.update_one(
-            {"user_id": driver_id},
-            {"$inc": {"total_earned": amount}, "$set": {"updated_at": datetime.now(timezone.utc)}},
-            session=session,
-        )
-        return await record_wallet_transaction(
-            wallet_id=wallet["wallet_id"],
-            amount=amount,
-            tx_type=TransactionType.REVENUE.value,
-            description=description,
-            parcel_id=parcel_id,
-            reference=reference,
-            ensure_unique=ensure_unique,
-            session=session,
-        )
-
-    tx = await _run_in_transaction(_op)
-    logger.info(
-        "Revenu livreur enregistré hors solde : owner=%s montant=%s XOF",
-        driver_id,
-        amount,
-    )
     return tx
 
 
@@ -359,6 +348,206 @@ async def debit_wallet_allow_negative(
     return tx
 
 
+# ── Répartition des revenus à la livraison ──────────────────────────────────
+#
+# Planificateur : toutes les écritures d'un ou plusieurs colis livrés sont
+# calculées d'abord (fonction pure), puis appliquées en une seule transaction
+# par bulk_write — au lieu d'un get_or_create_wallet et d'une session par
+# écriture.
+
+RELAY_OWNER_CACHE_TTL_SECONDS = 600
+_RELAY_OWNER_CACHE_MAX_ENTRIES = 5000
+_relay_owner_cache: dict[str, tuple[float, Optional[str]]] = {}
+
+
+async def relay_owner_ids(relay_ids: Iterable[str]) -> dict[str, Optional[str]]:
+    """
+    Propriétaire de chaque relais. owner_user_id est fixé à la création du
+    relais : le cache n'expire que pour borner la mémoire et les relais supprimés.
+    """
+    now = time.monotonic()
+    owners: dict[str, Optional[str]] = {}
+    missing = []
+    for relay_id in {relay_id for relay_id in relay_ids if relay_id}:
+        cached = _relay_owner_cache.get(relay_id)
+        if cached and cached[0] > now:
+            owners[relay_id] = cached[1]
+        else:
+            missing.append(relay_id)
+    if missing:
+        relays = await db.relay_points.find(
+            {"relay_id": {"$in": missing}},
+            {"_id": 0, "relay_id": 1, "owner_user_id": 1},
+        ).to_list(length=len(missing))
+        found = {relay["relay_id"]: relay.get("owner_user_id") for relay in relays}
+        for relay_id in missing:
+            owners[relay_id] = found.get(relay_id)
+            if relay_id not in _relay_owner_cache and len(_relay_owner_cache) >= _RELAY_OWNER_CACHE_MAX_ENTRIES:
+                _relay_owner_cache.pop(next(iter(_relay_owner_cache)))
+            _relay_owner_cache[relay_id] = (now + RELAY_OWNER_CACHE_TTL_SECONDS, owners[relay_id])
+    return owners
+
+
+@dataclass
+class LedgerLeg:
+    owner_id: str
+    owner_type: str
+    amount: float
+    tx_type: str
+    description: str
+    parcel_id: Optional[str]
+    reference: str
+
+
+def plan_delivery_revenue(parcel: dict, relay_owners: dict[str, Optional[str]]) -> list[LedgerLeg]:
+    """
+    Écritures dues pour un colis livré. Le livreur conserve son revenu hors
+    plateforme (mouvements `revenue`, hors solde) ; les relais sont crédités
+    de leur commission.
+    """
+    breakdown = compute_delivery_commission_breakdown(parcel)
+    if breakdown["price_xof"] <= 0:
+        return []
+
+    parcel_id = parcel.get("parcel_id")
+    legs: list[LedgerLeg] = []
+    driver_id = parcel.get("assigned_driver_id")
+    if driver_id and breakdown["driver_revenue_xof"] > 0:
+        legs.append(LedgerLeg(
+            driver_id, "driver", breakdown["driver_revenue_xof"], TransactionType.REVENUE.value,
+            f"Revenu livraison {parcel_id}", parcel_id, f"driver_revenue:{parcel_id}",
+        ))
+        driver_bonus = float(parcel.get("driver_bonus_xof", 0.0) or 0.0)
+        if driver_bonus > 0:
+            legs.append(LedgerLeg(
+                driver_id, "driver", round(driver_bonus), TransactionType.REVENUE.value,
+                f"Revenu bonus changement d'adresse {parcel_id}", parcel_id, f"driver_bonus_revenue:{parcel_id}",
+            ))
+
+    origin_owner = relay_owners.get(parcel.get("origin_relay_id"))
+    if origin_owner and breakdown["origin_relay_commission_xof"] > 0:
+        legs.append(LedgerLeg(
+            origin_owner, "relay", breakdown["origin_relay_commission_xof"], TransactionType.CREDIT.value,
+            f"Commission relais origine {parcel_id}", parcel_id, f"relay_origin_commission:{parcel_id}",
+        ))
+
+    dest_relay_id = parcel.get("redirect_relay_id") or parcel.get("destination_relay_id")
+    dest_owner = relay_owners.get(dest_relay_id)
+    if dest_owner and breakdown["destination_relay_commission_xof"] > 0:
+        legs.append(LedgerLeg(
+            dest_owner, "relay", breakdown["destination_relay_commission_xof"], TransactionType.CREDIT.value,
+            f"Commission relais destination {parcel_id}", parcel_id, f"relay_destination_commission:{parcel_id}",
+        ))
+    return legs
+
+
+async def _wallets_for_owners(owner_types: dict[str, str]) -> dict[str, dict]:
+    """Wallets des propriétaires (création groupée des manquants)."""
+    projection = {"_id": 0, "wallet_id": 1, "owner_id": 1}
+    wallets = await db.wallets.find(
+        {"owner_id": {"$in": list(owner_types)}}, projection
+    ).to_list(length=len(owner_types))
+    by_owner = {wallet["owner_id"]: wallet for wallet in wallets}
+    missing = [owner_id for owner_id in owner_types if owner_id not in by_owner]
+    if missing:
+        now = datetime.now(timezone.utc)
+        try:
+            await db.wallets.insert_many(
+                [_new_wallet(owner_id, owner_types[owner_id], now) for owner_id in missing],
+                ordered=False,
+            )
+        except BulkWriteError:
+            # Wallet créé en parallèle (index unique owner_id) : on relit.
+            pass
+        created = await db.wallets.find({"owner_id": {"$in": missing}}, projection).to_list(length=len(missing))
+        by_owner.update({wallet["owner_id"]: wallet for wallet in created})
+    return by_owner
+
+
+async def apply_ledger_legs(legs: list[LedgerLeg]) -> list[dict]:
+    """
+    Applique les écritures en une transaction : un bulk_write sur wallets
+    (soldes), un sur users (total_earned), un insert_many sur
+    wallet_transactions. Les écritures déjà présentes (même wallet, référence
+    et type) sont ignorées : rejouer une livraison ne crédite pas deux fois.
+    """
+    if not legs:
+        return []
+    wallets = await _wallets_for_owners({leg.owner_id: leg.owner_type for leg in legs})
+
+    async def _op(session):
+        existing = await db.wallet_transactions.find(
+            {"reference": {"$in": [leg.reference for leg in legs]}},
+            {"_id": 0, "wallet_id": 1, "reference": 1, "tx_type": 1},
+            session=session,
+        ).to_list(length=None)
+        recorded = {(tx.get("wallet_id"), tx.get("reference"), tx.get("tx_type")) for tx in existing}
+
+        now = datetime.now(timezone.utc)
+        txs: list[dict] = []
+        balance_inc: dict[str, float] = {}
+        earned_inc: dict[str, float] = {}
+        for leg in legs:
+            wallet_id = wallets[leg.owner_id]["wallet_id"]
+            key = (wallet_id, leg.reference, leg.tx_type)
+            if key in recorded:
+                continue
+            recorded.add(key)
+            txs.append(_build_transaction(wallet_id, leg.amount, leg.tx_type, leg.description, leg.parcel_id, leg.reference))
+            earned_inc[leg.owner_id] = earned_inc.get(leg.owner_id, 0.0) + leg.amount
+            if leg.tx_type == TransactionType.CREDIT.value:
+                balance_inc[leg.owner_id] = balance_inc.get(leg.owner_id, 0.0) + leg.amount
+        if not txs:
+            return []
+
+        if balance_inc:
+            await db.wallets.bulk_write(
+                [
+                    UpdateOne({"owner_id": owner_id}, {"$inc": {"balance": amount}, "$set": {"updated_at": now}})
+                    for owner_id, amount in balance_inc.items()
+                ],
+                ordered=False,
+                session=session,
+            )
+        await db.users.bulk_write(
+            [
+                UpdateOne({"user_id": owner_id}, {"$inc": {"total_earned": amount}, "$set": {"updated_at": now}})
+                for owner_id, amount in earned_inc.items()
+            ],
+            ordered=False,
+            session=session,
+        )
+        await db.wallet_transactions.insert_many(txs, session=session)
+        return [{k: v for k, v in tx.items() if k != "_id"} for tx in txs]
+
+    return await _run_in_transaction(_op)
+
+
+async def distribute_delivery_revenue_batch(parcels: list[dict]) -> list[dict]:
+    """Répartit les revenus de plusieurs colis livrés en une seule transaction."""
+    relay_ids = []
+    for parcel in parcels:
+        relay_ids.extend([
+            parcel.get("origin_relay_id"),
+            parcel.get("redirect_relay_id") or parcel.get("destination_relay_id"),
+        ])
+    relay_owners = await relay_owner_ids(relay_ids)
+    legs = [leg for parcel in parcels for leg in plan_delivery_revenue(parcel, relay_owners)]
+    txs = await apply_ledger_legs(legs)
+    for parcel in parcels:
+        breakdown = compute_delivery_commission_breakdown(parcel)
+        if breakdown["price_xof"] <= 0:
+            continue
+        logger.info(
+            "Revenus distribués : colis=%s mode=%s prix=%s XOF commission_totale=%s XOF",
+            parcel.get("parcel_id"),
+            parcel.get("delivery_mode", ""),
+            breakdown["price_xof"],
+            breakdown["total_commission_xof"],
+        )
+    return txs
+
+
 async def distribute_delivery_revenue(parcel: dict):
     """
     Distribue les revenus à chaque livraison réussie.
@@ -367,69 +556,4 @@ async def distribute_delivery_revenue(parcel: dict):
     Denkma verse les relais et conserve sa propre commission via la couverture
     prélevée sur le wallet du livreur au moment de l'acceptation.
     """
-    driver_bonus = float(parcel.get("driver_bonus_xof", 0.0) or 0.0)
-    breakdown = compute_delivery_commission_breakdown(parcel)
-    price = breakdown["price_xof"]
-    if price <= 0:
-        return
-
-    mode = parcel.get("delivery_mode", "")
-    parcel_id = parcel.get("parcel_id")
-
-    if parcel.get("assigned_driver_id") and breakdown["driver_revenue_xof"] > 0:
-        await record_driver_revenue(
-            driver_id=parcel["assigned_driver_id"],
-            amount=breakdown["driver_revenue_xof"],
-            description=f"Revenu livraison {parcel_id}",
-            parcel_id=parcel_id,
-            reference=f"driver_revenue:{parcel_id}",
-            ensure_unique=True,
-        )
-        if driver_bonus > 0:
-            await record_driver_revenue(
-                driver_id=parcel["assigned_driver_id"],
-                amount=round(driver_bonus),
-                description=f"Revenu bonus changement d'adresse {parcel_id}",
-                parcel_id=parcel_id,
-                reference=f"driver_bonus_revenue:{parcel_id}",
-                ensure_unique=True,
-            )
-
-    if parcel.get("origin_relay_id") and breakdown["origin_relay_commission_xof"] > 0:
-        relay = await db.relay_points.find_one(
-            {"relay_id": parcel["origin_relay_id"]}, {"_id": 0}
-        )
-        if relay:
-            await credit_wallet(
-                owner_id=relay["owner_user_id"],
-                owner_type="relay",
-                amount=breakdown["origin_relay_commission_xof"],
-                description=f"Commission relais origine {parcel_id}",
-                parcel_id=parcel_id,
-                reference=f"relay_origin_commission:{parcel_id}",
-                ensure_unique=True,
-            )
-
-    dest_relay_id = parcel.get("redirect_relay_id") or parcel.get("destination_relay_id")
-    if dest_relay_id and breakdown["destination_relay_commission_xof"] > 0:
-        relay = await db.relay_points.find_one(
-            {"relay_id": dest_relay_id}, {"_id": 0}
-        )
-        if relay:
-            await credit_wallet(
-                owner_id=relay["owner_user_id"],
-                owner_type="relay",
-                amount=breakdown["destination_relay_commission_xof"],
-                description=f"Commission relais destination {parcel_id}",
-                parcel_id=parcel_id,
-                reference=f"relay_destination_commission:{parcel_id}",
-                ensure_unique=True,
-            )
-
-    logger.info(
-        "Revenus distribués : colis=%s mode=%s prix=%s XOF commission_totale=%s XOF",
-        parcel_id,
-        mode,
-        price,
-        breakdown["total_commission_xof"],
-    )
+    return await distribute_delivery_revenue_batch([parcel])
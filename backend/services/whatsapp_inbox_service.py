@@ -0,0 +1,275 @@
+"""
+File d'entrée du webhook WhatsApp Cloud API.
+
+Le webhook se contente de vérifier la signature, d'enregistrer le payload brut
+dans `whatsapp_webhook_inbox` et de répondre 200 : Meta relance les webhooks
+lents, ce qui dupliquait le travail en période de pointe.
+
+Un pool de workers réclame les entrées (visibilité type SQS : `available_at`
+repoussé pendant le traitement, une entrée abandonnée par un worker tombé
+redevient disponible), puis traite un lot complet d'un coup :
+  - appels : un seul bulk_write idempotent sur (call_event_id, event, status, timestamp) ;
+  - messages : ceux déjà connus (whatsapp_message_id) sont ignorés, les autres
+    sont préparés en parallèle (téléchargement des médias borné par un
+    sémaphore) puis écrits en bulk_write.
+Une entrée en échec est replanifiée avec un backoff exponentiel, puis marquée
+"failed" après WHATSAPP_INBOX_MAX_ATTEMPTS tentatives.
+"""
+import asyncio
+import hashlib
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from config import settings
+from database import db
+from services.whatsapp_support_service import (
+    build_whatsapp_inbound_message,
+    store_whatsapp_inbound_messages,
+)
+
+logger = logging.getLogger(__name__)
+
+# Durée pendant laquelle une entrée réclamée reste invisible aux autres workers.
+INBOX_VISIBILITY_TIMEOUT = timedelta(minutes=2)
+INBOX_IDLE_POLL_SECONDS = 5.0
+INBOX_RETRY_BASE_SECONDS = 5
+
+# Réveille les workers locaux dès qu'un payload est mis en file, sans attendre
+# le prochain poll.
+_inbox_wakeup = asyncio.Event()
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+async def enqueue_whatsapp_payload(payload: dict, payload_bytes: bytes) -> bool:
+    """
+    Enregistre un payload webhook. Une relance Meta à l'identique est ignorée
+    (empreinte sha256 unique). Renvoie False si le payload était déjà en file.
+    """
+    now = _now()
+    try:
+        await db.whatsapp_webhook_inbox.insert_one({
+            "inbox_id": f"wbh_{uuid.uuid4().hex[:16]}",
+            "payload_sha256": hashlib.sha256(payload_bytes).hexdigest(),
+            "payload": payload,
+            "status": "pending",
+            "attempts": 0,
+            "received_at": now,
+            "available_at": now,
+        })
+    except DuplicateKeyError:
+        return False
+    _inbox_wakeup.set()
+    return True
+
+
+async def _claim_entry(worker_id: str) -> dict | None:
+    now = _now()
+    return await db.whatsapp_webhook_inbox.find_one_and_update(
+        {"status": {"$in": ["pending", "processing"]}, "available_at": {"$lte": now}},
+        {
+            "$set": {
+                "status": "processing",
+                "locked_by": worker_id,
+                "available_at": now + INBOX_VISIBILITY_TIMEOUT,
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("available_at", 1)],
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def _claim_batch(worker_id: str) -> list[dict]:
+    entries: list[dict] = []
+    for _ in range(settings.WHATSAPP_INBOX_BATCH_SIZE):
+        entry = await _claim_entry(worker_id)
+        if not entry:
+            break
+        entries.append(entry)
+    return entries
+
+
+def _collect_changes(entries: list[dict]) -> tuple[list[dict], list[tuple[dict, dict]], list[tuple[dict, dict]]]:
+    statuses: list[dict] = []
+    messages: list[tuple[dict, dict]] = []
+    calls: list[tuple[dict, dict]] = []
+    for entry in entries:
+        for item in (entry.get("payload") or {}).get("entry") or []:
+            for change in item.get("changes") or []:
+                value = change.get("value") or {}
+                statuses.extend(value.get("statuses") or [])
+                messages.extend((value, message) for message in value.get("messages") or [])
+                calls.extend((value, call) for call in value.get("calls") or [])
+    return statuses, messages, calls
+
+
+def _call_event_doc(value: dict, call: dict, now: datetime) -> dict:
+    metadata = value.get("metadata") or {}
+    return {
+        "call_event_id": call.get("id") or call.get("call_id"),
+        "phone_number_id": metadata.get("phone_number_id"),
+        "display_phone_number": metadata.get("display_phone_number"),
+        "from": call.get("from"),
+        "to": call.get("to"),
+        "direction": call.get("direction"),
+        "status": call.get("status"),
+        "event": call.get("event"),
+        "timestamp": call.get("timestamp"),
+        "raw_call": call,
+        "created_at": now,
+    }
+
+
+async def _record_call_events(calls: list[tuple[dict, dict]]) -> int:
+    if not calls:
+        return 0
+    now = _now()
+    operations = []
+    for value, call in calls:
+        call_doc = _call_event_doc(value, call, now)
+        key = {field: call_doc[field] for field in ("call_event_id", "event", "status", "timestamp")}
+        operations.append(UpdateOne(key, {"$setOnInsert": call_doc}, upsert=True))
+        logger.info(
+            "WhatsApp call event: id=%s from=%s status=%s event=%s",
+            call_doc["call_event_id"],
+            call_doc["from"],
+            call_doc["status"],
+            call_doc["event"],
+        )
+    result = await db.whatsapp_call_events.bulk_write(operations, ordered=False)
+    return len(result.upserted_ids)
+
+
+async def _record_messages(messages: list[tuple[dict, dict]]) -> int:
+    if not messages:
+        return 0
+    ids = [message.get("id") for _, message in messages if message.get("id")]
+    known = set()
+    if ids:
+        cursor = db.whatsapp_support_messages.find(
+            {"whatsapp_message_id": {"$in": ids}},
+            {"_id": 0, "whatsapp_message_id": 1},
+        )
+        known = {doc["whatsapp_message_id"] async for doc in cursor}
+
+    fresh: list[tuple[dict, dict]] = []
+    for value, message in messages:
+        message_id = message.get("id")
+        logger.info(
+            "WhatsApp message reçu: from=%s id=%s type=%s timestamp=%s",
+            message.get("from"),
+            message_id,
+            message.get("type"),
+            message.get("timestamp"),
+        )
+        if message_id in known:
+            continue
+        if message_id:
+            known.add(message_id)
+        fresh.append((value, message))
+
+    semaphore = asyncio.Semaphore(settings.WHATSAPP_MEDIA_DOWNLOAD_CONCURRENCY)
+
+    async def _prepare(value: dict, message: dict) -> tuple[dict, dict]:
+        async with semaphore:
+            return await build_whatsapp_inbound_message(value, message)
+
+    results = await asyncio.gather(
+        *(_prepare(value, message) for value, message in fresh),
+        return_exceptions=True,
+    )
+    prepared: list[tuple[dict, dict]] = []
+    for result in results:
+        if isinstance(result, BaseException):
+            logger.warning("WhatsApp message non associé au support: %s", result)
+            continue
+        prepared.append(result)
+    prepared.sort(key=lambda item: str((item[0].get("raw_message") or {}).get("timestamp") or ""))
+    await store_whatsapp_inbound_messages(prepared)
+    return len(prepared)
+
+
+async def process_inbox_entries(entries: list[dict]) -> dict[str, int]:
+    """Traite un lot d'entrées de la file. Idempotent : rejouable sans doublon."""
+    statuses, messages, calls = _collect_changes(entries)
+    for status in statuses:
+        logger.info(
+            "WhatsApp status: id=%s recipient=%s status=%s timestamp=%s",
+            status.get("id"),
+            status.get("recipient_id"),
+            status.get("status"),
+            status.get("timestamp"),
+        )
+    return {
+        "statuses": len(statuses),
+        "calls": await _record_call_events(calls),
+        "messages": await _record_messages(messages),
+    }
+
+
+async def _complete(entries: list[dict], stats: dict[str, int]) -> None:
+    await db.whatsapp_webhook_inbox.update_many(
+        {"inbox_id": {"$in": [entry["inbox_id"] for entry in entries]}},
+        {
+            "$set": {"status": "done", "processed_at": _now(), "stats": stats},
+            "$unset": {"locked_by": "", "last_error": ""},
+        },
+    )
+
+
+async def _reschedule(entries: list[dict], error: Exception) -> None:
+    now = _now()
+    operations = []
+    for entry in entries:
+        attempts = int(entry.get("attempts") or 1)
+        if attempts >= settings.WHATSAPP_INBOX_MAX_ATTEMPTS:
+            update: dict[str, Any] = {"status": "failed", "processed_at": now}
+        else:
+            delay = INBOX_RETRY_BASE_SECONDS * (2 ** (attempts - 1))
+            update = {"status": "pending", "available_at": now + timedelta(seconds=delay)}
+        update["last_error"] = str(error)[:240]
+        operations.append(UpdateOne({"inbox_id": entry["inbox_id"]}, {"$set": update, "$unset": {"locked_by": ""}}))
+    await db.whatsapp_webhook_inbox.bulk_write(operations, ordered=False)
+
+
+async def _inbox_worker(worker_id: str) -> None:
+    while True:
+        try:
+            entries = await _claim_batch(worker_id)
+            if not entries:
+                try:
+                    await asyncio.wait_for(_inbox_wakeup.wait(), timeout=INBOX_IDLE_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                _inbox_wakeup.clear()
+                continue
+            try:
+                stats = await process_inbox_entries(entries)
+            except Exception as exc:
+                logger.error("Webhook WhatsApp : lot de %s entrée(s) en échec : %s", len(entries), exc)
+                await _reschedule(entries, exc)
+                continue
+            await _complete(entries, stats)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.error("Worker webhook WhatsApp %s : %s", worker_id, exc)
+            await asyncio.sleep(INBOX_IDLE_POLL_SECONDS)
+
+
+async def run_whatsapp_inbox_workers() -> None:
+    """Lance WHATSAPP_INBOX_WORKERS workers ; à annuler à l'arrêt de l'app."""
+    prefix = uuid.uuid4().hex[:6]
+    await asyncio.gather(*(
+        _inbox_worker(f"{prefix}-{index}")
+        for index in range(settings.WHATSAPP_INBOX_WORKERS)
+    ))
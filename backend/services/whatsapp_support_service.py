@@ -16,6 +16,7 @@ from bson import ObjectId
 from bson.errors import InvalidId
 from gridfs.errors import NoFile
 from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from pymongo import UpdateOne
 
 from config import UPLOADS_DIR, settings
 from database import db, get_db
@@ -623,8 +624,11 @@ async def start_support_template_conversation(
     }
 
 
-async def record_whatsapp_inbound_message(value: dict, message: dict) -> dict:
-    """Stocke un message entrant WhatsApp et associe client/colis si possible."""
+async def build_whatsapp_inbound_message(value: dict, message: dict) -> tuple[dict, dict]:
+    """
+    Prépare un message entrant (média téléchargé, client/colis associés) sans
+    rien écrire : renvoie le document message et la mise à jour conversation.
+    """
     phone = normalize_whatsapp_phone(message.get("from"))
     if not phone:
         raise ValueError("WhatsApp sender phone missing")
@@ -681,26 +685,55 @@ async def record_whatsapp_inbound_message(value: dict, message: dict) -> dict:
         "status": "open",
         "updated_at": now,
     }
-
-    await db.whatsapp_support_messages.update_one(
-        {"whatsapp_message_id": message.get("id")},
-        {"$setOnInsert": message_doc},
-        upsert=True,
+    return message_doc, conversation_update
+
+
+async def store_whatsapp_inbound_messages(prepared: list[tuple[dict, dict]]) -> None:
+    """
+    Écrit un lot de messages préparés : un bulk_write pour les messages
+    (idempotent sur whatsapp_message_id) et un pour les conversations, dans
+    l'ordre d'arrivée pour que le dernier message reste l'aperçu affiché.
+    """
+    if not prepared:
+        return
+    await db.whatsapp_support_messages.bulk_write(
+        [
+            UpdateOne(
+                {"whatsapp_message_id": message_doc["whatsapp_message_id"]},
+                {"$setOnInsert": message_doc},
+                upsert=True,
+            )
+            for message_doc, _ in prepared
+        ],
+        ordered=False,
     )
-    await db.whatsapp_support_conversations.update_one(
-        {"conversation_id": conversation_id},
-        {"$set": conversation_update, "$setOnInsert": {"created_at": now}},
-        upsert=True,
+    await db.whatsapp_support_conversations.bulk_write(
+        [
+            UpdateOne(
+                {"conversation_id": conversation_update["conversation_id"]},
+                {"$set": conversation_update, "$setOnInsert": {"created_at": conversation_update["updated_at"]}},
+                upsert=True,
+            )
+            for _, conversation_update in prepared
+        ],
+        ordered=True,
     )
 
-    logger.info(
-        "WhatsApp support message: phone=%s user=%s parcel=%s type=%s",
-        phone,
-        message_doc["matched_user_id"],
-        message_doc["matched_parcel_id"],
-        msg_type,
-    )
-    return message_doc
+    for message_doc, _ in prepared:
+        logger.info(
+            "WhatsApp support message: phone=%s user=%s parcel=%s type=%s",
+            message_doc["phone"],
+            message_doc["matched_user_id"],
+            message_doc["matched_parcel_id"],
+            message_doc["message_type"],
+        )
+
+
+async def record_whatsapp_inbound_message(value: dict, message: dict) -> dict:
+    """Stocke un message entrant WhatsApp et associe client/colis si possible."""
+    prepared = await build_whatsapp_inbound_message(value, message)
+    await store_whatsapp_inbound_messages([prepared])
+    return prepared[0]
 
 
 def serialize_support_doc(doc: dict | None) -> dict | None:
@@ -0,0 +1,75 @@
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from bson import ObjectId
+
+from core.dependencies import get_current_user_full
+from routers import users
+from routers.users import delete_my_account
+
+PHOTO_ID = ObjectId()
+ID_CARD_ID = ObjectId()
+LICENSE_ID = ObjectId()
+
+
+def _collection():
+    return SimpleNamespace(delete_many=AsyncMock(), count_documents=AsyncMock(return_value=0))
+
+
+def _fake_db():
+    return SimpleNamespace(
+        users=SimpleNamespace(find_one_and_update=AsyncMock(return_value={"user_id": "u1", "role": "driver"})),
+        user_sessions=_collection(),
+        notifications=_collection(),
+        otps=_collection(),
+        delivery_missions=_collection(),
+    )
+
+
+class DeleteMyAccountTests(unittest.IsolatedAsyncioTestCase):
+    def test_endpoint_reads_the_full_user_document(self):
+        # Le principal compact ne porte ni photo ni pièces KYC.
+        dependency = delete_my_account.__defaults__[0]
+        self.assertIs(dependency.dependency, get_current_user_full)
+
+    async def test_profile_picture_and_kyc_files_are_removed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            id_card = Path(tmp) / "id_card.jpg"
+            license_scan = Path(tmp) / "license.jpg"
+            id_card.write_bytes(b"id")
+            license_scan.write_bytes(b"license")
+            user = {
+                "user_id": "u1",
+                "role": "driver",
+                "phone": "+221770000000",
+                "profile_picture_file_id": str(PHOTO_ID),
+                "kyc_id_card_file_id": str(ID_CARD_ID),
+                "kyc_license_file_id": str(LICENSE_ID),
+                "kyc_id_card_path": str(id_card),
+                "kyc_license_path": str(license_scan),
+            }
+            photos = SimpleNamespace(delete=AsyncMock())
+            kyc = SimpleNamespace(delete=AsyncMock())
+
+            with (
+                patch.object(users, "db", _fake_db()),
+                patch.object(users, "_profile_photos_bucket", MagicMock(return_value=photos)),
+                patch.object(users, "_kyc_documents_bucket", MagicMock(return_value=kyc)),
+                patch.object(users, "record_user_change", AsyncMock()),
+                patch.object(users, "invalidate_notification_profile"),
+                patch.object(users, "invalidate_principal"),
+                patch.object(users, "_record_event", AsyncMock()),
+            ):
+                await delete_my_account(current_user=user)
+
+            self.assertFalse(id_card.exists())
+            self.assertFalse(license_scan.exists())
+        photos.delete.assert_awaited_once_with(PHOTO_ID)
+        self.assertEqual([call.args[0] for call in kyc.delete.await_args_list], [ID_CARD_ID, LICENSE_ID])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from services import admin_events_service
+from services.admin_events_service import (
+    SUBSCRIBER_QUEUE_SIZE,
+    AdminEventBroker,
+    public_event,
+    record_admin_event,
+)
+
+
+class AdminEventBrokerTests(unittest.IsolatedAsyncioTestCase):
+    async def test_publish_reaches_every_subscriber_once(self):
+        broker = AdminEventBroker()
+        first = broker.subscribe()
+        second = broker.subscribe()
+
+        self.assertTrue(broker.publish({"event_id": "adm_1", "title": "Incident"}))
+        # Même event relayé par le change stream : ignoré.
+        self.assertFalse(broker.publish({"event_id": "adm_1", "title": "Incident"}))
+
+        self.assertEqual(first.qsize(), 1)
+        self.assertEqual(second.qsize(), 1)
+        self.assertEqual((await first.get())["event_id"], "adm_1")
+
+    async def test_slow_subscriber_is_dropped_with_a_close_sentinel(self):
+        broker = AdminEventBroker()
+        queue = broker.subscribe()
+        for index in range(SUBSCRIBER_QUEUE_SIZE + 1):
+            broker.publish({"event_id": f"adm_{index}"})
+
+        self.assertEqual(broker.subscriber_count, 0)
+        drained = [queue.get_nowait() for _ in range(queue.qsize())]
+        self.assertIsNone(drained[-1])
+
+    async def test_record_admin_event_publishes_after_insert(self):
+        fake_db = SimpleNamespace(admin_events=SimpleNamespace(insert_one=AsyncMock()))
+        queue = admin_events_service.broker.subscribe()
+        try:
+            with patch.object(admin_events_service, "db", fake_db):
+                event_id = await record_admin_event("incident_reported", title="Incident")
+            event = queue.get_nowait()
+        finally:
+            admin_events_service.broker.unsubscribe(queue)
+
+        fake_db.admin_events.insert_one.assert_awaited_once()
+        self.assertEqual(event["event_id"], event_id)
+        self.assertEqual(event["severity"], "critical")
+
+    def test_public_event_hides_read_by(self):
+        event = public_event({"event_id": "adm_1", "read_by": ["admin-a"], "_id": "x"}, "admin-a")
+
+        self.assertNotIn("read_by", event)
+        self.assertNotIn("_id", event)
+        self.assertTrue(event["is_read"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from core import jobs
+from core.jobs import JobRegistry, render_prometheus
+from services.admin_events_service import AdminEventType
+
+
+def _fake_db():
+    return SimpleNamespace(job_status=SimpleNamespace(update_one=AsyncMock()))
+
+
+class JobRegistryTests(unittest.IsolatedAsyncioTestCase):
+    async def test_success_records_items_duration_and_snapshot(self):
+        registry = JobRegistry()
+        fake_db = _fake_db()
+
+        with patch.object(jobs, "db", fake_db):
+            await registry.run_once("dispatch", AsyncMock(return_value=4), interval_seconds=15)
+            await registry.run_once("dispatch", AsyncMock(return_value={"items": 2, "lag_seconds": 7}))
+
+        stats = registry.stats("dispatch")
+        self.assertEqual(stats.runs, 2)
+        self.assertEqual(stats.items_total, 6)
+        self.assertEqual(stats.last_lag_seconds, 7)
+        self.assertEqual(stats.duration_bucket_counts[-1], 2)
+        snapshot = fake_db.job_status.update_one.await_args.args[1]["$set"]
+        self.assertEqual(snapshot["name"], "dispatch")
+        self.assertFalse(snapshot["lagging"])
+
+    async def test_repeated_failures_raise_a_single_throttled_alert(self):
+        registry = JobRegistry()
+        failing = AsyncMock(side_effect=RuntimeError("mongo down"))
+
+        with (
+            patch.object(jobs, "db", _fake_db()),
+            patch("services.admin_events_service.record_admin_event", AsyncMock()) as alert,
+        ):
+            for _ in range(5):
+                await registry.run_once("expire_parcels", failing)
+
+        stats = registry.stats("expire_parcels")
+        self.assertEqual(stats.failures, 5)
+        self.assertEqual(stats.consecutive_failures, 5)
+        self.assertIn("mongo down", stats.last_error)
+        alert.assert_awaited_once()
+        self.assertEqual(alert.await_args.args[0], AdminEventType.JOB_LAGGING)
+
+    async def test_lag_beyond_factor_marks_job_lagging(self):
+        registry = JobRegistry()
+
+        with (
+            patch.object(jobs, "db", _fake_db()),
+            patch("services.admin_events_service.record_admin_event", AsyncMock()) as alert,
+        ):
+            await registry.run_once("gps", AsyncMock(return_value=0), interval_seconds=120, lag_seconds=600)
+
+        self.assertTrue(registry.stats("gps").lagging)
+        alert.assert_awaited_once()
+
+    async def test_periodic_passes_slower_than_interval_end_up_lagging(self):
+        registry = JobRegistry()
+        interval = 0.02
+
+        async def slow_pass():
+            await asyncio.sleep(interval * 2.5)
+            return 1
+
+        with (
+            patch.object(jobs, "db", _fake_db()),
+            patch("services.admin_events_service.record_admin_event", AsyncMock()) as alert,
+        ):
+            loop = asyncio.create_task(registry.run_periodic("slow", interval, slow_pass))
+            while registry.stats("slow").runs < 4:
+                await asyncio.sleep(interval)
+            loop.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await loop
+
+        stats = registry.stats("slow")
+        self.assertGreater(stats.max_lag_seconds, jobs.settings.JOB_LAG_ALERT_FACTOR * interval)
+        alert.assert_awaited()
+
+
+class HealthJobsAuthTests(unittest.IsolatedAsyncioTestCase):
+    async def test_job_endpoints_require_the_metrics_token(self):
+        import main
+
+        list_status = AsyncMock(return_value=[{"name": "dispatch", "last_error": "boom", "owner": "api-1:42"}])
+        with (
+            patch.object(main.settings, "METRICS_TOKEN", "s3cret"),
+            patch.object(main, "list_job_status", list_status),
+        ):
+            anonymous = SimpleNamespace(headers={})
+            self.assertEqual((await main.health_jobs(anonymous)).status_code, 401)
+            self.assertEqual((await main.health_jobs_metrics(anonymous)).status_code, 401)
+            list_status.assert_not_awaited()
+
+            authorized = SimpleNamespace(headers={"authorization": "Bearer s3cret"})
+            payload = await main.health_jobs(authorized)
+
+        self.assertEqual(payload["jobs"][0]["name"], "dispatch")
+
+
+class PrometheusRenderTests(unittest.TestCase):
+    def test_renders_histogram_and_counters(self):
+        text = render_prometheus([{
+            "name": "retention",
+            "runs": 3,
+            "failures": 1,
+            "items_total": 42,
+            "duration_buckets": {"1.0": 2},
+            "duration_sum": 1.5,
+        }])
+
+        self.assertIn('denkma_job_duration_seconds_bucket{job="retention",le="1.0"} 2', text)
+        self.assertIn('denkma_job_duration_seconds_count{job="retention"} 3', text)
+        self.assertIn('denkma_job_items_processed_total{job="retention"} 42', text)
+        self.assertIn('denkma_job_last_success_timestamp_seconds{job="retention"} 0.0', text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from pymongo.errors import DuplicateKeyError
+
+from core import leases
+from core.leases import acquire_lease, run_exclusive
+
+
+class BackgroundLeaseTests(unittest.IsolatedAsyncioTestCase):
+    async def test_lease_held_by_another_instance_is_not_acquired(self):
+        update_one = AsyncMock(side_effect=DuplicateKeyError("dup"))
+        delete_one = AsyncMock()
+        fake_db = SimpleNamespace(background_leases=SimpleNamespace(update_one=update_one, delete_one=delete_one))
+
+        with patch.object(leases, "db", fake_db):
+            held = await acquire_lease("delivery_dispatch", 30, owner="api-2")
+
+        self.assertFalse(held)
+        query = update_one.await_args.args[0]
+        # Exclusivité portée par `_id`, pas par l'index secondaire `name`.
+        self.assertEqual(query["_id"], "delivery_dispatch")
+        self.assertIn({"owner": "api-2"}, query["$or"])
+        # Seul un ancien document expiré (autre `_id`) est purgé.
+        purge = delete_one.await_args.args[0]
+        self.assertEqual(purge["_id"], {"$ne": "delivery_dispatch"})
+        self.assertIn("$lte", purge["expires_at"])
+
+    async def test_task_runs_only_while_lease_is_held_and_lease_released_on_stop(self):
+        started = asyncio.Event()
+
+        async def _loop():
+            started.set()
+            await asyncio.Event().wait()
+
+        with (
+            patch.object(leases, "acquire_lease", AsyncMock(return_value=True)),
+            patch.object(leases, "release_lease", AsyncMock()) as release,
+        ):
+            runner = asyncio.create_task(run_exclusive("scheduler", _loop, ttl_seconds=30))
+            await asyncio.wait_for(started.wait(), timeout=1)
+            runner.cancel()
+            await asyncio.gather(runner, return_exceptions=True)
+
+        release.assert_awaited_once_with("scheduler")
+
+    async def test_task_is_not_started_without_the_lease(self):
+        factory = AsyncMock()
+
+        with patch.object(leases, "acquire_lease", AsyncMock(return_value=False)):
+            runner = asyncio.create_task(run_exclusive("scheduler", factory, ttl_seconds=30))
+            await asyncio.sleep(0.05)
+            runner.cancel()
+            await asyncio.gather(runner, return_exceptions=True)
+
+        factory.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
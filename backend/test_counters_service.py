@@ -0,0 +1,164 @@
+import unittest
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from services import counters_service
+from services.counters_service import (
+    counter,
+    counter_deltas,
+    parcel_counter_values,
+    reconcile_counters,
+    record_parcel_change,
+    user_counter_values,
+)
+
+
+class CounterValuesTests(unittest.TestCase):
+    def test_delivery_moves_status_and_adds_revenue(self):
+        before = {"status": "out_for_delivery", "delivery_mode": "relay_to_home", "paid_price": 2500}
+        after = {**before, "status": "delivered"}
+
+        deltas = counter_deltas(parcel_counter_values(before), parcel_counter_values(after))
+
+        self.assertEqual(deltas, {
+            "parcels.by_status.out_for_delivery": -1,
+            "parcels.by_status.delivered": 1,
+            "revenue_xof": 2500.0,
+        })
+
+    def test_user_ban_and_role_change(self):
+        before = {"role": "driver", "is_active": True, "is_banned": False}
+        after = {**before, "role": "client", "is_banned": True}
+
+        deltas = counter_deltas(user_counter_values(before), user_counter_values(after))
+
+        self.assertEqual(deltas, {
+            "users.by_role.driver": -1,
+            "users.by_role.client": 1,
+            "users.active_drivers": -1,
+            "users.banned": 1,
+        })
+
+    def test_counter_reads_nested_paths(self):
+        doc = {"parcels": {"by_status": {"delivered": 4}}}
+        self.assertEqual(counter(doc, "parcels.by_status.delivered"), 4)
+        self.assertEqual(counter(doc, "payouts.by_status.pending"), 0)
+
+
+class RecordParcelChangeTests(unittest.IsolatedAsyncioTestCase):
+    async def test_creation_updates_global_and_day_documents(self):
+        bulk_write = AsyncMock()
+        fake_db = SimpleNamespace(ops_counters=SimpleNamespace(bulk_write=bulk_write))
+        parcel = {"status": "created", "delivery_mode": "relay_to_relay"}
+
+        with patch.object(counters_service, "db", fake_db), \
+                patch.object(counters_service, "datetime") as fake_datetime:
+            fake_datetime.now.return_value = datetime(2026, 5, 2, 10, tzinfo=timezone.utc)
+            await record_parcel_change(None, parcel)
+
+        operations = bulk_write.await_args.args[0]
+        self.assertEqual(len(operations), 2)
+        global_op, day_op = (operation._doc for operation in operations)
+        self.assertEqual(global_op["$inc"]["parcels.total"], 1)
+        self.assertEqual(operations[1]._filter, {"_id": "day:2026-05-02"})
+        self.assertEqual(day_op["$inc"], {"parcels_created": 1, "parcels_created_by_mode.relay_to_relay": 1})
+
+    async def test_write_failures_never_reach_the_caller(self):
+        fake_db = SimpleNamespace(ops_counters=SimpleNamespace(bulk_write=AsyncMock(side_effect=RuntimeError("down"))))
+        with patch.object(counters_service, "db", fake_db), \
+                self.assertLogs("services.counters_service", level="WARNING"):
+            await record_parcel_change({"status": "created"}, {"status": "cancelled"})
+
+
+
+def _parcel_facet(docs):
+    """Résultat du `$facet` global de `_rebuild_global` sur `docs`."""
+    def group(field):
+        counts: dict = {}
+        for doc in docs:
+            counts[doc.get(field)] = counts.get(doc.get(field), 0) + 1
+        return [{"_id": key, "n": n} for key, n in counts.items()]
+
+    revenue = sum(doc["paid_price"] for doc in docs if doc["status"] == "delivered" and doc.get("paid_price") is not None)
+    return {"by_status": group("status"), "by_mode": group("delivery_mode"), "revenue": [{"_id": None, "n": revenue}]}
+
+
+class ReconcileCountersTests(unittest.IsolatedAsyncioTestCase):
+    async def test_archived_parcels_stay_in_global_totals(self):
+        hot = [{"status": "created", "delivery_mode": "relay_to_relay"}]
+        archived = [
+            {"status": "delivered", "delivery_mode": "relay_to_relay", "paid_price": 1000},
+            {"status": "delivered", "delivery_mode": "home_delivery", "paid_price": 500},
+        ]
+
+        def parcels_aggregate(pipeline):
+            if not any("$facet" in stage for stage in pipeline):
+                return SimpleNamespace(to_list=AsyncMock(return_value=[]))
+            union = [stage["$unionWith"]["coll"] for stage in pipeline if "$unionWith" in stage]
+            docs = hot + (archived if union == ["parcels_archive"] else [])
+            return SimpleNamespace(to_list=AsyncMock(return_value=[_parcel_facet(docs)]))
+
+        users_facet = {"by_role": [], "banned": [], "kyc_verified": [], "phone_verified": [], "active_drivers": []}
+        fake_db = SimpleNamespace(
+            parcels=SimpleNamespace(aggregate=MagicMock(side_effect=parcels_aggregate)),
+            users=SimpleNamespace(
+                aggregate=MagicMock(return_value=SimpleNamespace(to_list=AsyncMock(return_value=[users_facet]))),
+                count_documents=AsyncMock(return_value=0),
+            ),
+            payout_requests=SimpleNamespace(aggregate=MagicMock(return_value=SimpleNamespace(to_list=AsyncMock(return_value=[])))),
+            parcel_events=SimpleNamespace(distinct=AsyncMock(return_value=[])),
+            ops_counters=SimpleNamespace(
+                find_one=AsyncMock(side_effect=lambda query: {
+                    "_id": "global",
+                    "parcels": {
+                        "total": 3,
+                        "by_status": {"created": 1, "delivered": 2},
+                        "by_mode": {"relay_to_relay": 2, "home_delivery": 1},
+                    },
+                    "revenue_xof": 1500,
+                } if query["_id"] == "global" else None),
+                update_one=AsyncMock(),
+            ),
+        )
+
+        with patch.object(counters_service, "db", fake_db):
+            corrected = await reconcile_counters(datetime(2026, 5, 2, 3, tzinfo=timezone.utc))
+
+        self.assertEqual(corrected, 0)
+        global_update = fake_db.ops_counters.update_one.await_args_list[0].args[1]
+        self.assertNotIn("$inc", global_update)
+        self.assertEqual(global_update["$set"], {"reconciled_at": datetime(2026, 5, 2, 3, tzinfo=timezone.utc)})
+
+    async def test_drift_is_applied_as_increment_read_after_rebuild(self):
+        events = []
+
+        async def rebuild_global():
+            events.append("rebuild")
+            return {"parcels.total": 5, "revenue_xof": 1500}
+
+        async def find_one(query):
+            events.append("read")
+            # Un incrément concurrent a porté le total à 4 pendant le recalcul.
+            return {"_id": "global", "parcels": {"total": 4, "stale": 2}, "revenue_xof": 1500}
+
+        fake_db = SimpleNamespace(ops_counters=SimpleNamespace(
+            find_one=AsyncMock(side_effect=find_one),
+            update_one=AsyncMock(),
+        ))
+        with (
+            patch.object(counters_service, "db", fake_db),
+            patch.object(counters_service, "RECONCILE_DAYS", 0),
+            patch.object(counters_service, "_rebuild_global", rebuild_global),
+        ):
+            corrected = await reconcile_counters(datetime(2026, 5, 2, 3, tzinfo=timezone.utc))
+
+        self.assertEqual(events, ["rebuild", "read"])
+        self.assertEqual(corrected, 2)
+        query, update = fake_db.ops_counters.update_one.await_args.args
+        self.assertEqual(query, {"_id": "global"})
+        self.assertEqual(update["$inc"], {"parcels.total": 1, "parcels.stale": -2})
+
+
+if __name__ == "__main__":
+    unittest.main()
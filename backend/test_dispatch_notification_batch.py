@@ -0,0 +1,100 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from services import notification_service
+from services.notification_service import DispatchNotificationBatch
+
+
+class _FakeCursor:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def __aiter__(self):
+        self._iter = iter(self._rows)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+def _mission(index: int) -> dict:
+    return {"mission_id": f"msn_{index}", "tracking_code": f"PKP-{index}"}
+
+
+class DispatchNotificationBatchTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        notification_service._profile_cache.clear()
+
+    async def test_groups_missions_into_one_push_per_driver(self):
+        fake_db = SimpleNamespace(
+            users=SimpleNamespace(find=lambda *_args, **_kwargs: _FakeCursor([
+                {"user_id": "driver-a"},
+                {"user_id": "driver-b"},
+            ])),
+            notifications=SimpleNamespace(
+                bulk_write=AsyncMock(return_value=SimpleNamespace(upserted_ids={0: "x", 1: "y"})),
+            ),
+        )
+        batch = DispatchNotificationBatch()
+        batch.add_wave(["driver-a", "driver-b"], _mission(1), 2.0)
+        batch.add_wave(["driver-a"], _mission(2), 2.0)
+        batch.add_reminder(["driver-a"], _mission(3), 5.0)
+
+        with (
+            patch.object(notification_service, "db", fake_db),
+            patch.object(notification_service, "_send_push", AsyncMock()) as send_push,
+            patch.object(
+                notification_service,
+                "_store_and_send",
+                AsyncMock(return_value={"push_status": "sent"}),
+            ) as store_and_send,
+        ):
+            stats = await batch.flush()
+
+        self.assertEqual(stats, {"drivers": 2, "uncoalesced_pushes": 4, "pushes": 2})
+        # driver-a : 2 upserts in-app (les vagues) en un seul bulk_write + 1 push résumé.
+        operations = fake_db.notifications.bulk_write.await_args.args[0]
+        self.assertEqual(len(operations), 2)
+        send_push.assert_awaited_once()
+        self.assertEqual(send_push.await_args.kwargs["title"], "3 courses près de vous")
+        # driver-b : une seule mission → notification historique inchangée.
+        store_and_send.assert_awaited_once()
+        self.assertEqual(store_and_send.await_args.kwargs["user_id"], "driver-b")
+        self.assertEqual(store_and_send.await_args.kwargs["dedupe_key"], "mission_available:msn_1")
+
+    async def test_wave_takes_precedence_over_reminder_for_same_mission(self):
+        batch = DispatchNotificationBatch()
+        batch.add_wave(["driver-a"], _mission(1), 2.0)
+        batch.add_reminder(["driver-a"], _mission(1), 2.0)
+
+        self.assertEqual(batch.pairs, 1)
+        item = batch._by_driver["driver-a"]["msn_1"]
+        self.assertNotIn("store_in_app", item)
+
+    async def test_skips_summary_push_when_every_mission_was_already_notified(self):
+        fake_db = SimpleNamespace(
+            users=SimpleNamespace(find=lambda *_args, **_kwargs: _FakeCursor([{"user_id": "driver-a"}])),
+            notifications=SimpleNamespace(
+                bulk_write=AsyncMock(return_value=SimpleNamespace(upserted_ids={})),
+            ),
+        )
+        batch = DispatchNotificationBatch()
+        batch.add_wave(["driver-a"], _mission(1), 2.0)
+        batch.add_wave(["driver-a"], _mission(2), 2.0)
+
+        with (
+            patch.object(notification_service, "db", fake_db),
+            patch.object(notification_service, "_send_push", AsyncMock()) as send_push,
+        ):
+            stats = await batch.flush()
+
+        send_push.assert_not_awaited()
+        self.assertEqual(stats["pushes"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
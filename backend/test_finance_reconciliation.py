@@ -0,0 +1,138 @@
+import asyncio
+import unittest
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from services import finance_reconciliation_service as reconciliation
+from services.finance_reconciliation_service import (
+    _persist_batch,
+    evaluate_wallets,
+    reconciliation_checks,
+    stream_ids,
+)
+
+
+def _cursor(docs):
+    return SimpleNamespace(to_list=AsyncMock(return_value=docs))
+
+
+class _AsyncRows:
+    def __init__(self, rows):
+        self.rows = list(rows)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.rows:
+            raise StopAsyncIteration
+        return self.rows.pop(0)
+
+
+class EvaluateWalletsTests(unittest.IsolatedAsyncioTestCase):
+    async def test_pending_mismatch_and_negative_balance(self):
+        fake_db = SimpleNamespace(
+            wallets=SimpleNamespace(find=MagicMock(return_value=_cursor([
+                {"wallet_id": "w1", "owner_id": "u1", "balance": 100.0, "pending": 500.0},
+                {"wallet_id": "w2", "owner_id": "u2", "balance": -20.0, "pending": 0.0},
+            ]))),
+            payout_requests=SimpleNamespace(aggregate=MagicMock(return_value=_cursor([
+                {"_id": "w1", "amount": 300.0},
+            ]))),
+            wallet_transactions=SimpleNamespace(aggregate=MagicMock(return_value=_cursor([
+                {"_id": {"wallet_id": "w1", "tx_type": "pending"}, "amount": 300.0},
+                {"_id": {"wallet_id": "w1", "tx_type": "credit"}, "amount": 900.0},
+            ]))),
+        )
+
+        with patch.object(reconciliation, "db", fake_db):
+            issues = await evaluate_wallets(["w1", "w2"])
+
+        by_kind = {(kind, subject_id): details for kind, subject_id, details in issues}
+        mismatch = by_kind[("wallet_pending_mismatches", "w1")]
+        self.assertEqual((mismatch["wallet_pending"], mismatch["expected_pending"]), (500.0, 300.0))
+        self.assertEqual(mismatch["ledger_totals"], {"pending": 300.0, "credit": 900.0})
+        self.assertIn(("negative_wallets", "w2"), by_kind)
+        self.assertEqual(len(issues), 2)
+
+
+class PersistBatchTests(unittest.IsolatedAsyncioTestCase):
+    async def test_flagged_subjects_open_and_others_resolve(self):
+        bulk_write = AsyncMock()
+        fake_db = SimpleNamespace(finance_discrepancies=SimpleNamespace(bulk_write=bulk_write))
+        issues = [("negative_wallets", "w2", {"wallet_id": "w2"})]
+
+        with patch.object(reconciliation, "db", fake_db):
+            await _persist_batch(("wallet_pending_mismatches", "negative_wallets"), ["w1", "w2"], issues, "rec_1")
+
+        operations = bulk_write.await_args.args[0]
+        upsert, *resolves = operations
+        self.assertEqual(upsert._filter, {"discrepancy_id": "negative_wallets:w2"})
+        self.assertEqual(upsert._doc["$set"]["status"], "open")
+        cleared = {op._filter["kind"]: op._filter["subject_id"]["$in"] for op in resolves}
+        self.assertEqual(cleared, {"wallet_pending_mismatches": ["w1", "w2"], "negative_wallets": ["w1"]})
+
+
+class SourcesTests(unittest.IsolatedAsyncioTestCase):
+    def test_incremental_run_only_reads_touched_subjects(self):
+        since = datetime(2026, 5, 1, tzinfo=timezone.utc)
+        full = {check["name"]: check["sources"] for check in reconciliation_checks(None)}
+        incremental = {check["name"]: check["sources"] for check in reconciliation_checks(since)}
+
+        self.assertEqual(full["wallets"], [("wallets", {}, "wallet_id")])
+        for _collection, query, _field in incremental["wallets"] + incremental["payouts"]:
+            self.assertIn({"$gte": since}, query.values())
+        self.assertEqual(full["missions"], incremental["missions"])
+
+    async def test_stream_ids_yields_bounded_batches(self):
+        rows = [{"_id": None}, *({"_id": f"w{i}"} for i in range(5))]
+        collection = SimpleNamespace(aggregate=MagicMock(return_value=_AsyncRows(rows)))
+
+        with patch.object(reconciliation, "db", {"wallets": collection}):
+            batches = [batch async for batch in stream_ids("wallets", {}, "wallet_id", 2)]
+
+        self.assertEqual(batches, [["w0", "w1"], ["w2", "w3"], ["w4"]])
+        self.assertEqual(collection.aggregate.call_args.kwargs["batchSize"], 2)
+
+
+class RunLeaseTests(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_run_in_the_same_process_is_refused(self):
+        holders: dict[str, str] = {}
+
+        async def acquire(name, _ttl, owner="instance"):
+            # Même filtre que core.leases : libre ou déjà détenu par `owner`.
+            return holders.setdefault(name, owner) == owner
+
+        async def release(name, owner="instance"):
+            if holders.get(name) == owner:
+                del holders[name]
+
+        inserted = asyncio.Event()
+        proceed = asyncio.Event()
+
+        async def insert_run(_doc):
+            inserted.set()
+            await proceed.wait()
+
+        fake_db = SimpleNamespace(
+            reconciliation_runs=SimpleNamespace(insert_one=insert_run, update_one=AsyncMock()),
+        )
+        with (
+            patch.object(reconciliation, "db", fake_db),
+            patch.object(reconciliation, "acquire_lease", acquire),
+            patch.object(reconciliation, "release_lease", release),
+            patch.object(reconciliation, "reconciliation_checks", MagicMock(return_value=[])),
+        ):
+            first = asyncio.create_task(reconciliation.run_reconciliation(full=True))
+            await inserted.wait()
+            self.assertIsNone(await asyncio.wait_for(reconciliation.run_reconciliation(full=True), timeout=1))
+            proceed.set()
+            run = await first
+
+        self.assertEqual(run["status"], "completed")
+        self.assertEqual(holders, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import main
+from config import settings
+from services.parcel_service import gps_reminder_next_at
+
+CREATED_AT = datetime(2026, 5, 4, 12, 0, tzinfo=timezone.utc)
+
+
+def _parcel(**overrides) -> dict:
+    parcel = {
+        "parcel_id": "prc_1",
+        "status": "created",
+        "delivery_mode": "home_to_home",
+        "pickup_confirmed": False,
+        "delivery_confirmed": False,
+        "sender_confirm_token": "tok-s",
+        "recipient_confirm_token": "tok-r",
+        "sender_user_id": "sender-1",
+        "recipient_user_id": None,
+        "created_at": CREATED_AT,
+        "gps_reminders": {"sender": {"count": 0}, "recipient": {"count": 0}},
+    }
+    parcel.update(overrides)
+    return parcel
+
+
+class GpsReminderScheduleTests(unittest.TestCase):
+    def test_first_reminder_is_due_after_initial_delay(self):
+        self.assertEqual(
+            gps_reminder_next_at(_parcel(), "sender"),
+            CREATED_AT + timedelta(minutes=settings.GPS_REMINDER_INITIAL_MINUTES),
+        )
+
+    def test_app_user_escalates_after_first_reminder(self):
+        sent_at = CREATED_AT + timedelta(minutes=5)
+        parcel = _parcel(gps_reminders={"sender": {"count": 1, "last_sent_at": sent_at}})
+
+        self.assertEqual(
+            gps_reminder_next_at(parcel, "sender"),
+            sent_at + timedelta(minutes=settings.GPS_REMINDER_ESCALATION_MINUTES),
+        )
+
+    def test_nothing_scheduled_once_confirmed_closed_or_capped(self):
+        self.assertIsNone(gps_reminder_next_at(_parcel(pickup_confirmed=True), "sender"))
+        self.assertIsNone(gps_reminder_next_at(_parcel(status="cancelled"), "recipient"))
+        self.assertIsNone(gps_reminder_next_at(_parcel(delivery_mode="home_to_relay"), "recipient"))
+        capped = {"recipient": {"count": settings.GPS_REMINDER_MAX_COUNT, "last_sent_at": CREATED_AT}}
+        self.assertIsNone(gps_reminder_next_at(_parcel(gps_reminders=capped), "recipient"))
+
+
+class DueGpsRemindersTests(unittest.IsolatedAsyncioTestCase):
+    async def test_closed_parcels_are_never_reminded(self):
+        self.assertFalse(await main._maybe_send_gps_reminder(_parcel(status="delivered"), "sender", CREATED_AT))
+
+        cursor = MagicMock()
+        cursor.sort.return_value.limit.return_value.to_list = AsyncMock(return_value=[])
+        fake_db = SimpleNamespace(parcels=SimpleNamespace(find=MagicMock(return_value=cursor)))
+        with patch.object(main, "db", fake_db):
+            await main._send_due_gps_reminders("recipient", CREATED_AT)
+
+        query = fake_db.parcels.find.call_args.args[0]
+        self.assertEqual(set(query["status"]["$nin"]), {"delivered", "cancelled", "returned", "expired"})
+
+
+if __name__ == "__main__":
+    unittest.main()
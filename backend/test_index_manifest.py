@@ -0,0 +1,123 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from pymongo import IndexModel
+
+import database
+from database import ensure_indexes, index_manifest, index_manifest_version, split_index_manifest
+
+
+class IndexManifestVersionTests(unittest.TestCase):
+    def test_version_is_stable_and_tracks_manifest_changes(self):
+        manifest = index_manifest()
+        self.assertEqual(index_manifest_version(manifest), index_manifest_version(index_manifest()))
+
+        manifest["parcels"].append(IndexModel([("status", 1), ("updated_at", 1)]))
+        self.assertNotEqual(index_manifest_version(manifest), index_manifest_version())
+
+    def test_compound_key_order_matters(self):
+        first = {"c": [IndexModel([("a", 1), ("b", 1)])]}
+        second = {"c": [IndexModel([("b", 1), ("a", 1)])]}
+        self.assertNotEqual(index_manifest_version(first), index_manifest_version(second))
+
+
+class EnsureIndexesTests(unittest.IsolatedAsyncioTestCase):
+    async def test_unchanged_manifest_skips_index_work(self):
+        fake_db = SimpleNamespace(
+            schema_meta=SimpleNamespace(find_one=AsyncMock(return_value={"version": index_manifest_version()})),
+        )
+        with (
+            patch.object(database, "_db_instance", fake_db),
+            patch.object(database, "create_indexes", AsyncMock()) as create,
+        ):
+            await ensure_indexes()
+
+        create.assert_not_called()
+        self.assertEqual(database.index_status["state"], "ready")
+
+    async def test_changed_manifest_builds_constraints_before_returning(self):
+        fake_db = SimpleNamespace(
+            schema_meta=SimpleNamespace(find_one=AsyncMock(return_value={"version": "old"})),
+        )
+        with (
+            patch.object(database, "_db_instance", fake_db),
+            patch.object(database, "create_constraint_indexes", AsyncMock(return_value=[])) as constraints,
+            patch.object(database, "create_indexes", AsyncMock()) as create,
+        ):
+            await ensure_indexes()
+            constraints.assert_awaited_once_with()
+            await asyncio.gather(database._index_task)
+
+        create.assert_awaited_once_with(index_manifest_version(), [])
+
+    async def test_constraint_build_only_creates_unique_and_ttl_indexes(self):
+        collections = {}
+
+        def collection(name):
+            collections.setdefault(name, SimpleNamespace(
+                create_indexes=AsyncMock(),
+                index_information=AsyncMock(return_value={}),
+            ))
+            return collections[name]
+
+        fake_db = MagicMock()
+        fake_db.__getitem__.side_effect = collection
+        with patch.object(database, "_db_instance", fake_db):
+            errors = await database.create_constraint_indexes()
+
+        self.assertEqual(errors, [])
+        inbox_models = collections["whatsapp_webhook_inbox"].create_indexes.await_args.args[0]
+        self.assertEqual(
+            {model.document["name"] for model in inbox_models},
+            {"inbox_id_1", "payload_sha256_1", "processed_at_1"},
+        )
+        for name in ("background_leases", "job_status"):
+            models = collections[name].create_indexes.await_args.args[0]
+            self.assertIn("name_1", {model.document["name"] for model in models})
+        for models in (c.create_indexes.await_args.args[0] for c in collections.values() if c.create_indexes.await_args):
+            for model in models:
+                self.assertTrue(model.document.get("unique") or "expireAfterSeconds" in model.document)
+
+
+class SplitIndexManifestTests(unittest.TestCase):
+    def test_split_preserves_every_index_once(self):
+        manifest = index_manifest()
+        constraints, performance = split_index_manifest(manifest)
+        for collection_name, models in manifest.items():
+            split = constraints.get(collection_name, []) + performance.get(collection_name, [])
+            self.assertCountEqual([m.document["name"] for m in split], [m.document["name"] for m in models])
+        for models in performance.values():
+            for model in models:
+                self.assertFalse(model.document.get("unique"))
+                self.assertNotIn("expireAfterSeconds", model.document)
+
+    def test_superseded_indexes_are_covered_by_a_compound_prefix(self):
+        manifest = index_manifest()
+        for collection_name, index_name in database.SUPERSEDED_INDEXES:
+            field = index_name.rsplit("_", 1)[0]
+            documents = [model.document for model in manifest[collection_name]]
+            self.assertNotIn(index_name, {document["name"] for document in documents})
+            self.assertTrue(
+                any(list(document["key"])[0] == field and len(document["key"]) > 1 for document in documents),
+                f"{collection_name}.{index_name}",
+            )
+
+
+class SupersededIndexDropTests(unittest.IsolatedAsyncioTestCase):
+    async def test_superseded_indexes_dropped_only_after_successful_build(self):
+        for build_errors, expected in (([], database.SUPERSEDED_INDEXES), (["parcels: boom"], ())):
+            fake_db = SimpleNamespace(schema_meta=SimpleNamespace(update_one=AsyncMock()))
+            with (
+                patch.object(database, "_db_instance", fake_db),
+                patch.object(database, "_build_indexes", AsyncMock(return_value=build_errors)),
+                patch.object(database, "_drop_superseded_index", AsyncMock()) as drop,
+            ):
+                await database.create_indexes("v", [])
+
+            self.assertEqual([call.args for call in drop.await_args_list], list(expected))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import json
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from core import firebase
+
+BACKEND_DIR = Path(__file__).resolve().parent
+
+
+class LazyImportTests(unittest.TestCase):
+    def test_importing_the_app_does_not_load_firebase(self):
+        probe = subprocess.run(
+            [sys.executable, "-c", "import json, sys, main; print(json.dumps(sorted(sys.modules)))"],
+            cwd=BACKEND_DIR,
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(probe.returncode, 0, probe.stderr[-2000:])
+        loaded = json.loads(probe.stdout.strip().splitlines()[-1])
+        self.assertNotIn("firebase_admin", loaded)
+        self.assertFalse([name for name in loaded if name.startswith("google.auth")])
+
+    def test_token_verification_fails_cleanly_without_credentials(self):
+        with (
+            patch.object(firebase, "_checked", True),
+            patch.object(firebase, "_app", None),
+        ):
+            with self.assertRaises(RuntimeError):
+                firebase.verify_firebase_id_token("x" * 40)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from services import ledger_service
+from services.ledger_service import audit_wallet, ledger_deltas, take_snapshot, with_running_balance
+
+T0 = datetime(2026, 5, 1, 12, 0)
+
+
+def _cursor(docs):
+    return SimpleNamespace(to_list=AsyncMock(return_value=docs))
+
+
+class LedgerDeltaTests(unittest.TestCase):
+    def test_legacy_payout_lifecycle(self):
+        self.assertEqual(ledger_deltas({"tx_type": "pending", "amount": 500, "reference": "pay_1"}), (-500, 500))
+        self.assertEqual(ledger_deltas({"tx_type": "debit", "amount": 500, "reference": "pay_1"}), (0.0, -500))
+        self.assertEqual(ledger_deltas({"tx_type": "credit", "amount": 500, "reference": "pay_2"}), (500, -500))
+        self.assertEqual(ledger_deltas({"tx_type": "debit", "amount": 80, "reference": "commission:m1"}), (-80, 0.0))
+        self.assertEqual(ledger_deltas({"tx_type": "revenue", "amount": 900}), (0.0, 0.0))
+
+    def test_recorded_deltas_take_precedence(self):
+        tx = {"tx_type": "debit", "amount": 80, "balance_delta": -30.0, "pending_delta": 0.0}
+        self.assertEqual(ledger_deltas(tx), (-30.0, 0.0))
+
+    def test_running_balance_walks_back_from_newest(self):
+        page = [
+            {"tx_id": "t3", "tx_type": "debit", "amount": 200},
+            {"tx_id": "t2", "tx_type": "credit", "amount": 1000},
+            {"tx_id": "t1", "tx_type": "revenue", "amount": 700},
+        ]
+        with_running_balance(page, 1300.0)
+        self.assertEqual([tx["balance_after"] for tx in page], [1300.0, 1500.0, 500.0])
+
+
+class SnapshotTests(unittest.IsolatedAsyncioTestCase):
+    def _fake_db(self, snapshot, ledger_row):
+        return SimpleNamespace(
+            wallet_balance_snapshots=SimpleNamespace(
+                find_one=AsyncMock(return_value=snapshot),
+                insert_one=AsyncMock(),
+            ),
+            wallet_transactions=SimpleNamespace(aggregate=MagicMock(return_value=_cursor([ledger_row] if ledger_row else []))),
+            wallets=SimpleNamespace(find_one=AsyncMock(return_value={"wallet_id": "w1", "balance": 1250.0, "pending": 0.0})),
+        )
+
+    async def test_snapshot_extends_previous_one(self):
+        previous = {"as_of_created_at": T0, "as_of_tx_id": "t9", "balance": 1000.0, "pending": 0.0, "tx_count": 9}
+        fake_db = self._fake_db(previous, {
+            "balance": 250.0, "pending": 0.0, "count": 2, "last_created_at": T0, "last_tx_id": "t11",
+        })
+
+        with patch.object(ledger_service, "db", fake_db):
+            snapshot = await take_snapshot("w1", T0)
+
+        self.assertEqual((snapshot["balance"], snapshot["tx_count"], snapshot["as_of_tx_id"]), (1250.0, 11, "t11"))
+        match = fake_db.wallet_transactions.aggregate.call_args.args[0][0]["$match"]["$and"]
+        self.assertIn({"$or": [{"created_at": {"$gt": T0}}, {"created_at": T0, "tx_id": {"$gt": "t9"}}]}, match)
+
+    async def test_audit_only_sums_after_snapshot(self):
+        previous = {"as_of_created_at": T0, "as_of_tx_id": "t9", "balance": 1000.0, "pending": 0.0}
+        fake_db = self._fake_db(previous, {
+            "balance": 200.0, "pending": 0.0, "count": 3, "last_created_at": T0, "last_tx_id": "t12",
+        })
+
+        with patch.object(ledger_service, "db", fake_db):
+            audit = await audit_wallet("w1")
+
+        self.assertEqual(audit["ledger_balance"], 1200.0)
+        self.assertEqual(audit["balance_drift"], 50.0)
+        self.assertEqual(audit["transactions_scanned"], 3)
+
+    async def test_no_new_transactions_means_no_snapshot(self):
+        fake_db = self._fake_db(None, None)
+        with patch.object(ledger_service, "db", fake_db):
+            self.assertIsNone(await take_snapshot("w1", T0))
+        fake_db.wallet_balance_snapshots.insert_one.assert_not_awaited()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+from types import SimpleNamespace
+
+from core.metrics import Histogram, MetricsMiddleware, external_call, EXTERNAL_CALL_DURATION, HTTP_REQUESTS
+
+
+class HistogramTests(unittest.TestCase):
+    def test_buckets_are_cumulative_and_inclusive(self):
+        histogram = Histogram("demo_seconds", "Démo.", ("route",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value, "/a")
+
+        lines = histogram.render()
+
+        self.assertIn('demo_seconds_bucket{route="/a",le="0.1"} 2', lines)
+        self.assertIn('demo_seconds_bucket{route="/a",le="1.0"} 3', lines)
+        self.assertIn('demo_seconds_bucket{route="/a",le="+Inf"} 4', lines)
+        self.assertIn('demo_seconds_count{route="/a"} 4', lines)
+
+
+class ExternalCallTests(unittest.TestCase):
+    def _count(self, *labels):
+        series = EXTERNAL_CALL_DURATION._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def test_outcome_reflects_exceptions_and_explicit_failures(self):
+        before_ok = self._count("demo", "op", "ok")
+        before_error = self._count("demo", "op", "error")
+
+        with external_call("demo", "op"):
+            pass
+        with external_call("demo", "op") as call:
+            call.fail()
+        with self.assertRaises(RuntimeError):
+            with external_call("demo", "op"):
+                raise RuntimeError("timeout")
+
+        self.assertEqual(self._count("demo", "op", "ok") - before_ok, 1)
+        self.assertEqual(self._count("demo", "op", "error") - before_error, 2)
+
+
+class MetricsMiddlewareTests(unittest.IsolatedAsyncioTestCase):
+    async def test_uses_templated_route_and_status_class(self):
+        async def app(scope, receive, send):
+            scope["route"] = SimpleNamespace(path="/api/parcels/{parcel_id}")
+            await send({"type": "http.response.start", "status": 404})
+
+        async def send(_message):
+            pass
+
+        labels = ("GET", "/api/parcels/{parcel_id}", "4xx")
+        before = HTTP_REQUESTS._values.get(labels, 0)
+        await MetricsMiddleware(app)({"type": "http", "method": "GET", "path": "/api/parcels/p_123"}, None, send)
+
+        self.assertEqual(HTTP_REQUESTS._values[labels] - before, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
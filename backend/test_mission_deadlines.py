@@ -0,0 +1,151 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock, patch
+
+from services import mission_deadline_service
+from services.mission_deadline_service import (
+    _reminder_update,
+    backfill_pickup_deadlines,
+    process_pickup_deadlines,
+    release_due_missions,
+)
+from services.parcel_service import pickup_deadline_fields
+
+NOW = datetime(2026, 5, 4, 12, 0, tzinfo=timezone.utc)
+
+
+class _FakeCursor:
+    def __init__(self, rows):
+        self._rows = list(rows)
+
+    def sort(self, *_args):
+        return self
+
+    def limit(self, *_args):
+        return self
+
+    async def to_list(self, length=None):
+        return list(self._rows)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._rows:
+            raise StopAsyncIteration
+        return self._rows.pop(0)
+
+
+class PickupDeadlineTests(unittest.TestCase):
+    def test_deadline_fields_schedule_first_useful_reminder(self):
+        fields = pickup_deadline_fields(NOW, 30)
+        self.assertEqual(fields["auto_release_at"], NOW + timedelta(minutes=30))
+        self.assertEqual(fields["pickup_reminder_due_at"], NOW + timedelta(minutes=20))
+
+        short = pickup_deadline_fields(NOW, 8)
+        self.assertEqual(short["pickup_reminder_due_at"], NOW + timedelta(minutes=3))
+
+        self.assertIsNone(pickup_deadline_fields(NOW, 5)["pickup_reminder_due_at"])
+
+    def test_ten_minute_reminder_schedules_the_five_minute_one(self):
+        assigned_at = NOW - timedelta(minutes=20)
+        mission = {"assigned_at": assigned_at, **pickup_deadline_fields(assigned_at, 30)}
+
+        threshold, fields = _reminder_update(mission, NOW)
+
+        self.assertEqual(threshold, 10)
+        self.assertEqual(fields["pickup_reminder_10_sent_at"], NOW)
+        self.assertNotIn("pickup_reminder_5_sent_at", fields)
+        self.assertEqual(fields["pickup_reminder_due_at"], NOW + timedelta(minutes=5))
+
+    def test_late_tick_sends_only_the_most_urgent_reminder(self):
+        assigned_at = NOW - timedelta(minutes=27)
+        mission = {"assigned_at": assigned_at, **pickup_deadline_fields(assigned_at, 30)}
+
+        threshold, fields = _reminder_update(mission, NOW)
+
+        self.assertEqual(threshold, 5)
+        self.assertIsNone(fields["pickup_reminder_due_at"])
+        self.assertEqual(fields["pickup_reminder_10_sent_at"], NOW)
+
+    def test_driver_deadline_is_the_stored_release_time(self):
+        from routers.deliveries import _attach_pickup_confirmation_window
+
+        assigned_at = NOW - timedelta(minutes=10)
+        # Réglage passé de 30 à 45 min après l'assignation : le job libère à 30.
+        mission = {"status": "assigned", "assigned_at": assigned_at, **pickup_deadline_fields(assigned_at, 30)}
+        _attach_pickup_confirmation_window(mission, auto_release_minutes=45, now=NOW)
+
+        self.assertEqual(mission["pickup_confirmation_deadline_at"], (assigned_at + timedelta(minutes=30)).isoformat())
+        self.assertEqual(mission["pickup_confirmation_timeout_minutes"], 30)
+        self.assertEqual(mission["pickup_confirmation_remaining_seconds"], 20 * 60)
+
+        legacy = {"status": "assigned", "assigned_at": assigned_at}
+        _attach_pickup_confirmation_window(legacy, auto_release_minutes=45, now=NOW)
+        self.assertEqual(legacy["pickup_confirmation_deadline_at"], (assigned_at + timedelta(minutes=45)).isoformat())
+
+
+class ReleaseDueMissionsTests(unittest.IsolatedAsyncioTestCase):
+    async def test_only_missions_actually_released_are_notified(self):
+        due = [
+            {"mission_id": "m1", "parcel_id": "p1", "driver_id": "d1"},
+            {"mission_id": "m2", "parcel_id": "p2", "driver_id": "d2"},
+        ]
+        finds = [_FakeCursor(due), _FakeCursor([{"mission_id": "m1"}])]
+        fake_db = SimpleNamespace(
+            delivery_missions=SimpleNamespace(
+                find=Mock(side_effect=lambda *_a, **_k: finds.pop(0)),
+                bulk_write=AsyncMock(return_value=SimpleNamespace(modified_count=1)),
+            ),
+            parcels=SimpleNamespace(bulk_write=AsyncMock()),
+        )
+
+        with (
+            patch.object(mission_deadline_service, "db", fake_db),
+            patch.object(mission_deadline_service, "load_notification_profiles", AsyncMock(return_value={})),
+            patch.object(mission_deadline_service, "notify_driver_mission_auto_released", AsyncMock()) as notify,
+        ):
+            released = await release_due_missions(NOW)
+
+        self.assertEqual(released, 1)
+        self.assertEqual(len(fake_db.delivery_missions.bulk_write.await_args.args[0]), 2)
+        self.assertEqual(len(fake_db.parcels.bulk_write.await_args.args[0]), 1)
+        notify.assert_awaited_once()
+        self.assertEqual(notify.await_args.kwargs["user_id"], "d1")
+
+
+class BackfillTests(unittest.IsolatedAsyncioTestCase):
+    async def test_backfill_drains_legacy_missions_in_batches(self):
+        legacy = [{"mission_id": "m1", "assigned_at": NOW - timedelta(minutes=5)}]
+        finds = [_FakeCursor(legacy), _FakeCursor([])]
+        fake_db = SimpleNamespace(delivery_missions=SimpleNamespace(
+            find=Mock(side_effect=lambda *_a, **_k: finds.pop(0)),
+            bulk_write=AsyncMock(return_value=SimpleNamespace(modified_count=1)),
+        ))
+
+        with (
+            patch.object(mission_deadline_service, "db", fake_db),
+            patch.object(mission_deadline_service, "DEADLINE_BATCH_SIZE", 1),
+            patch.object(mission_deadline_service, "get_assigned_mission_auto_release_minutes", AsyncMock(return_value=30)),
+        ):
+            backfilled = await backfill_pickup_deadlines()
+
+        self.assertEqual(backfilled, 1)
+        fields = fake_db.delivery_missions.bulk_write.await_args.args[0][0]._doc["$set"]
+        self.assertEqual(fields["auto_release_at"], NOW + timedelta(minutes=25))
+
+    async def test_periodic_pass_only_reads_due_missions(self):
+        with (
+            patch.object(mission_deadline_service, "release_due_missions", AsyncMock(return_value=0)),
+            patch.object(mission_deadline_service, "send_due_pickup_reminders", AsyncMock(return_value=0)),
+            patch.object(mission_deadline_service, "backfill_pickup_deadlines", AsyncMock()) as backfill,
+        ):
+            stats = await process_pickup_deadlines()
+
+        self.assertEqual(stats, {"released": 0, "reminded": 0})
+        backfill.assert_not_awaited()
+
+
+if __name__ == "__main__":
+    unittest.main()
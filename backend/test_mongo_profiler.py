@@ -0,0 +1,74 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from core import mongo_profiler
+from core.mongo_profiler import (
+    MongoCommandProfiler,
+    RequestProfile,
+    command_shape,
+    report_request_profile,
+    start_request_profile,
+)
+
+
+def _event(request_id, command_name="find", command=None, duration_micros=1500):
+    return SimpleNamespace(
+        request_id=request_id,
+        connection_id=("localhost", 27017),
+        command_name=command_name,
+        command=command or {"find": "users", "filter": {"user_id": "u1"}},
+        duration_micros=duration_micros,
+    )
+
+
+class CommandShapeTests(unittest.TestCase):
+    def test_shape_ignores_values_and_flattens_boolean_operators(self):
+        self.assertEqual(
+            command_shape("find", {"find": "users", "filter": {"user_id": "u1", "$or": [{"role": "driver"}]}}),
+            "find users {role,user_id}",
+        )
+        self.assertEqual(
+            command_shape("update", {"update": "parcels", "updates": [{"q": {"parcel_id": "p1"}, "u": {}}]}),
+            "update parcels {parcel_id}",
+        )
+        self.assertIsNone(command_shape("getMore", {"getMore": 1, "collection": "users"}))
+
+
+class MongoProfilerTests(unittest.TestCase):
+    def test_commands_are_attributed_to_the_current_request(self):
+        profiler = MongoCommandProfiler()
+        with patch.object(mongo_profiler.settings, "MONGO_PROFILER_ENABLED", True), \
+                patch.object(mongo_profiler.settings, "MONGO_PROFILER_SAMPLE_RATE", 1.0):
+            profile = start_request_profile()
+            for request_id in range(3):
+                profiler.started(_event(request_id))
+                profiler.succeeded(_event(request_id))
+        mongo_profiler._current_profile.set(None)
+
+        self.assertEqual(profile.count, 3)
+        self.assertAlmostEqual(profile.total_ms, 4.5)
+        self.assertEqual(profile.shapes["find users {user_id}"], 3)
+        self.assertEqual(profile.server_timing(), 'mongo;dur=4.5;desc="3 ops"')
+
+    def test_commands_outside_a_request_are_ignored(self):
+        profiler = MongoCommandProfiler()
+        profiler.started(_event(1))
+        profiler.succeeded(_event(1))
+        self.assertEqual(profiler._inflight, {})
+
+    def test_budget_and_repeated_shapes_are_logged(self):
+        profile = RequestProfile()
+        for _ in range(12):
+            profile.record("find users {user_id}", 1.0)
+        with patch.object(mongo_profiler.settings, "MONGO_PROFILER_OP_BUDGET", 10), \
+                patch.object(mongo_profiler.settings, "MONGO_PROFILER_REPEAT_THRESHOLD", 5), \
+                self.assertLogs("core.mongo_profiler", level="WARNING") as logs:
+            report_request_profile(profile, "GET", "/api/admin/fleet/live")
+
+        self.assertEqual(len(logs.records), 2)
+        self.assertIn("N+1", logs.output[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock, patch
+
+from models.common import ParcelStatus
+from services import notification_service
+from services.notification_service import (
+    NotificationProfile,
+    load_notification_profiles,
+    notify_parcel_status_change,
+)
+
+
+class _FakeCursor:
+    def __init__(self, rows):
+        self._rows = list(rows)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._rows:
+            raise StopAsyncIteration
+        return self._rows.pop(0)
+
+
+USERS = [
+    {"user_id": "sender-1", "role": "client", "phone": "+221700000001", "fcm_token": "tok-s"},
+    {"user_id": "recipient-1", "role": "client", "phone": "+221700000002", "fcm_token": "tok-r"},
+    {"user_id": "driver-1", "role": "driver", "phone": "+221700000003", "fcm_token": "tok-d"},
+]
+
+
+class NotificationProfileTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        notification_service._profile_cache.clear()
+
+    def test_profile_is_immutable(self):
+        profile = NotificationProfile.from_user({
+            "user_id": "u1",
+            "notification_prefs": {"push": False},
+            "fcm_tokens": [{"token": "a", "platform": "ios"}],
+        })
+
+        with self.assertRaises(Exception):
+            profile.phone = "+221700000000"
+        with self.assertRaises(TypeError):
+            profile.notification_prefs["push"] = True
+        self.assertEqual(profile.as_user_doc()["fcm_tokens"], [{"token": "a", "platform": "ios"}])
+
+    async def test_cached_profiles_are_not_read_again(self):
+        find = Mock(side_effect=lambda *_args, **_kwargs: _FakeCursor(USERS[:1]))
+        with patch.object(notification_service, "db", SimpleNamespace(users=SimpleNamespace(find=find))):
+            await load_notification_profiles(["sender-1"])
+            profiles = await load_notification_profiles(["sender-1"])
+
+        self.assertEqual(find.call_count, 1)
+        self.assertEqual(profiles["sender-1"].fcm_token, "tok-s")
+
+    async def test_status_change_resolves_every_recipient_with_one_users_read(self):
+        find = Mock(side_effect=lambda *_args, **_kwargs: _FakeCursor(USERS))
+        fake_db = SimpleNamespace(
+            users=SimpleNamespace(find=find, find_one=AsyncMock()),
+            delivery_missions=SimpleNamespace(find_one=AsyncMock(return_value={"mission_id": "m1"})),
+        )
+        parcel = {
+            "parcel_id": "p1",
+            "tracking_code": "PKP-1",
+            "delivery_mode": "relay_to_home",
+            "sender_user_id": "sender-1",
+            "recipient_phone": "700000002",
+            "assigned_driver_id": "driver-1",
+        }
+
+        with (
+            patch.object(notification_service, "db", fake_db),
+            patch.object(notification_service, "_store_notification", AsyncMock(return_value=("n1", True))),
+            patch.object(notification_service, "_send_push", AsyncMock(return_value={"push_status": "sent"})) as send_push,
+            patch.object(notification_service, "_send_whatsapp", AsyncMock()),
+            patch.object(notification_service, "_send_whatsapp_template", AsyncMock(return_value=True)),
+        ):
+            await notify_parcel_status_change(parcel, ParcelStatus.CANCELLED)
+
+        self.assertEqual(find.call_count, 1)
+        fake_db.users.find_one.assert_not_awaited()
+        notified = {call.kwargs["user_id"] for call in send_push.await_args_list}
+        self.assertEqual(notified, {"sender-1", "recipient-1", "driver-1"})
+        for call in send_push.await_args_list:
+            self.assertIsNotNone(call.kwargs["profile"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+
+from core import pagination
+from core.pagination import count_total, decode_cursor, encode_cursor, keyset_query, paginate
+
+BASE = datetime(2026, 5, 1, 12, 0)
+
+
+def _matches(doc, query):
+    for key, condition in query.items():
+        if key == "$and":
+            if not all(_matches(doc, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(_matches(doc, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = doc.get(key)
+            for op, operand in condition.items():
+                if value is None or (op == "$lt" and not value < operand) or (op == "$gt" and not value > operand):
+                    return False
+        elif doc.get(key) != condition:
+            return False
+    return True
+
+
+class _FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, keys):
+        for field, direction in reversed(keys):
+            self.docs.sort(key=lambda doc: doc[field], reverse=direction < 0)
+        return self
+
+    def skip(self, count):
+        self.docs = self.docs[count:]
+        return self
+
+    def limit(self, count):
+        self.docs = self.docs[:count]
+        return self
+
+    async def to_list(self, length):
+        return self.docs[:length]
+
+
+class _FakeCollection:
+    name = "parcels"
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.counts = 0
+
+    def find(self, query, _projection):
+        return _FakeCursor([dict(doc) for doc in self.docs if _matches(doc, query)])
+
+    async def count_documents(self, query):
+        self.counts += 1
+        return sum(1 for doc in self.docs if _matches(doc, query))
+
+    async def estimated_document_count(self):
+        return len(self.docs)
+
+
+class CursorTests(unittest.TestCase):
+    def test_round_trip_and_invalid_token(self):
+        token = encode_cursor({"created_at": BASE, "parcel_id": "p_1"}, "created_at", "parcel_id")
+        self.assertEqual(decode_cursor(token), (BASE, "p_1"))
+        with self.assertRaises(HTTPException):
+            decode_cursor("pas-un-curseur")
+
+    def test_keyset_query_breaks_ties_on_id(self):
+        token = encode_cursor({"created_at": BASE, "parcel_id": "p_1"}, "created_at", "parcel_id")
+        query = keyset_query({"sender_user_id": "u1"}, token, "created_at", "parcel_id")
+        after = query["$and"][1]["$or"]
+        self.assertIn({"created_at": {"$lt": BASE}}, after)
+        self.assertIn({"created_at": BASE, "parcel_id": {"$lt": "p_1"}}, after)
+
+
+class PaginateTests(unittest.IsolatedAsyncioTestCase):
+    async def test_cursor_pages_cover_everything_once(self):
+        # Horodatages en double pour exercer le départage par identifiant.
+        docs = [
+            {"parcel_id": f"p_{i:02d}", "created_at": BASE - timedelta(minutes=i // 2), "sender_user_id": "u1"}
+            for i in range(7)
+        ]
+        collection = _FakeCollection(docs)
+
+        seen, cursor = [], None
+        while True:
+            page = await paginate(collection, {"sender_user_id": "u1"}, id_field="parcel_id", limit=3, cursor=cursor)
+            seen.extend(doc["parcel_id"] for doc in page.items)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+
+        self.assertEqual(sorted(seen), sorted(doc["parcel_id"] for doc in docs))
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertNotIn("total", page.to_response("parcels"))
+
+    async def test_filtered_totals_are_cached(self):
+        pagination._count_cache.clear()
+        collection = _FakeCollection([{"parcel_id": "p_1", "created_at": BASE, "status": "created"}])
+
+        self.assertEqual(await count_total(collection, {"status": "created"}), 1)
+        self.assertEqual(await count_total(collection, {"status": "created"}), 1)
+        self.assertEqual(await count_total(collection, {}), 1)
+        self.assertEqual(collection.counts, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
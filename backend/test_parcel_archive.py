@@ -0,0 +1,90 @@
+import unittest
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from services import archive_service, retention_service
+from services.archive_service import archive_terminal_parcels, find_one_with_archive, find_with_archive
+
+CUTOFF = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+class _FakeFind:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def sort(self, *_args):
+        return self
+
+    def limit(self, *_args):
+        return self
+
+    async def to_list(self, length=None):
+        return list(self._docs)
+
+
+def _collection(docs=()):
+    return SimpleNamespace(
+        find=MagicMock(return_value=_FakeFind(docs)),
+        delete_many=AsyncMock(side_effect=lambda query: SimpleNamespace(deleted_count=len(query["_id"]["$in"]))),
+        insert_many=AsyncMock(),
+    )
+
+
+class _Db(dict):
+    def __getattr__(self, name):
+        return self[name]
+
+
+class ArchiveTerminalParcelsTests(unittest.IsolatedAsyncioTestCase):
+    async def test_parcel_moves_with_missions_and_events_unless_a_mission_is_open(self):
+        fake_db = _Db({
+            "parcels": _collection([
+                {"_id": 1, "parcel_id": "p1", "status": "delivered"},
+                {"_id": 2, "parcel_id": "p2", "status": "cancelled"},
+            ]),
+            "delivery_missions": _collection([
+                {"_id": 10, "parcel_id": "p1", "status": "completed"},
+                {"_id": 11, "parcel_id": "p2", "status": "assigned"},
+            ]),
+            "parcel_events": _collection([{"_id": 20, "parcel_id": "p1"}]),
+            "parcels_archive": _collection(),
+            "delivery_missions_archive": _collection(),
+            "parcel_events_archive": _collection(),
+        })
+        with patch.object(archive_service, "db", fake_db), patch.object(retention_service, "db", fake_db):
+            moved = await archive_terminal_parcels(CUTOFF, batch_size=10, pause_seconds=0)
+
+        self.assertEqual(moved, {"parcel_events": 1, "delivery_missions": 1, "parcels": 1})
+        archived = fake_db["parcels_archive"].insert_many.await_args.args[0]
+        self.assertEqual([doc["parcel_id"] for doc in archived], ["p1"])
+        self.assertIn("archived_at", archived[0])
+        fake_db["delivery_missions"].delete_many.assert_awaited_once_with({"_id": {"$in": [10]}})
+        events_query = fake_db["parcel_events"].find.call_args.args[0]
+        self.assertEqual(events_query, {"parcel_id": {"$in": ["p1"]}})
+        parcels_query = fake_db["parcels"].find.call_args.args[0]
+        self.assertEqual(parcels_query["updated_at"], {"$lt": CUTOFF})
+        self.assertIn("$nor", parcels_query)
+
+
+class ArchiveFallbackTests(unittest.IsolatedAsyncioTestCase):
+    async def test_reads_hot_collection_first(self):
+        hot = SimpleNamespace(find_one=AsyncMock(return_value={"parcel_id": "p1"}))
+        archive = SimpleNamespace(find_one=AsyncMock())
+        with patch.object(archive_service, "db", {"parcels": hot, "parcels_archive": archive}):
+            parcel = await find_one_with_archive("parcels", {"parcel_id": "p1"})
+
+        self.assertEqual(parcel, {"parcel_id": "p1"})
+        archive.find_one.assert_not_awaited()
+
+    async def test_falls_back_to_archive(self):
+        hot = SimpleNamespace(find=MagicMock(return_value=_FakeFind([])))
+        archive = SimpleNamespace(find=MagicMock(return_value=_FakeFind([{"event_type": "delivered"}])))
+        with patch.object(archive_service, "db", {"parcel_events": hot, "parcel_events_archive": archive}):
+            events = await find_with_archive("parcel_events", {"parcel_id": "p1"}, sort=[("created_at", 1)])
+
+        self.assertEqual(events, [{"event_type": "delivered"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock, patch
+
+from services import notification_service, parcel_service
+from services.parcel_service import expire_overdue_parcels
+
+NOW = datetime(2026, 5, 4, 12, 0, tzinfo=timezone.utc)
+
+
+class _FakeCursor:
+    def __init__(self, rows):
+        self._rows = list(rows)
+
+    def sort(self, *_args):
+        return self
+
+    def limit(self, *_args):
+        return self
+
+    async def to_list(self, length=None):
+        return list(self._rows)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._rows:
+            raise StopAsyncIteration
+        return self._rows.pop(0)
+
+
+class ParcelExpiryTests(unittest.IsolatedAsyncioTestCase):
+    async def test_expires_batch_records_events_and_adjusts_relay_load(self):
+        overdue = [
+            {"parcel_id": "p1", "status": "available_at_relay", "destination_relay_id": "r1"},
+            {"parcel_id": "p2", "status": "available_at_relay", "destination_relay_id": "r1"},
+            {"parcel_id": "p3", "status": "redirected_to_relay", "redirect_relay_id": "r2"},
+            {"parcel_id": "p4", "status": "available_at_relay", "destination_relay_id": "r3"},
+        ]
+        # p4 a été retiré entre la lecture et l'écriture.
+        finds = [_FakeCursor(overdue), _FakeCursor([{"parcel_id": p} for p in ("p1", "p2", "p3")])]
+        fake_db = SimpleNamespace(
+            parcels=SimpleNamespace(
+                find=Mock(side_effect=lambda *_a, **_k: finds.pop(0)),
+                update_many=AsyncMock(side_effect=[
+                    SimpleNamespace(modified_count=2),
+                    SimpleNamespace(modified_count=1),
+                ]),
+                bulk_write=AsyncMock(),
+            ),
+            parcel_events=SimpleNamespace(insert_many=AsyncMock()),
+            relay_points=SimpleNamespace(bulk_write=AsyncMock()),
+        )
+
+        # Timeline embarquée déjà écrite au moment de chaque invalidation du suivi.
+        invalidated = []
+        invalidate = Mock(side_effect=lambda parcel_id: invalidated.append(
+            (parcel_id, fake_db.parcels.bulk_write.await_count)
+        ))
+
+        with (
+            patch.object(parcel_service, "db", fake_db),
+            patch.object(parcel_service, "invalidate_tracking_parcel", invalidate),
+            patch.object(notification_service, "notify_parcels_expired", AsyncMock(return_value=3)) as notify,
+        ):
+            totals = await expire_overdue_parcels(NOW)
+
+        self.assertEqual(totals, {"expired": 3, "notified": 3, "relays": 1})
+        events = fake_db.parcel_events.insert_many.await_args.args[0]
+        self.assertEqual([e["parcel_id"] for e in events], ["p1", "p2", "p3"])
+        self.assertEqual(events[2]["from_status"], "redirected_to_relay")
+        self.assertEqual(events[0]["to_status"], "expired")
+        timeline_ops = fake_db.parcels.bulk_write.await_args.args[0]
+        self.assertEqual([op._filter["parcel_id"] for op in timeline_ops], ["p1", "p2", "p3"])
+        pushed = timeline_ops[0]._doc["$push"]["recent_events"]["$each"][0]
+        self.assertEqual(pushed["event_id"], events[0]["event_id"])
+        self.assertNotIn("actor_id", pushed)
+        self.assertEqual(invalidated, [("p1", 1), ("p2", 1), ("p3", 1)])
+        expired_set = fake_db.parcels.update_many.await_args.args[1]["$set"]
+        self.assertIsNone(expired_set["gps_reminder_next_at.sender"])
+        self.assertIsNone(expired_set["gps_reminder_next_at.recipient"])
+        relay_ops = fake_db.relay_points.bulk_write.await_args.args[0]
+        self.assertEqual(len(relay_ops), 1)
+        self.assertEqual(relay_ops[0]._doc, {"$inc": {"current_load": -2}})
+        self.assertEqual(len(notify.await_args.args[0]), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
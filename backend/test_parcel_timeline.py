@@ -0,0 +1,60 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from models.common import ParcelStatus
+from services import parcel_service
+from services.parcel_service import RECENT_EVENTS_LIMIT, _record_event, embedded_timeline
+
+
+class EmbeddedTimelineTests(unittest.TestCase):
+    def test_complete_embedded_timeline_is_used(self):
+        parcel = {"recent_events": [{"event_id": "e1"}, {"event_id": "e2"}], "event_count": 2}
+        self.assertEqual(embedded_timeline(parcel), [{"event_id": "e1"}, {"event_id": "e2"}])
+
+    def test_truncated_or_legacy_timeline_needs_full_history(self):
+        self.assertIsNone(embedded_timeline({"recent_events": [{"event_id": "e2"}], "event_count": 2}))
+        self.assertIsNone(embedded_timeline({"parcel_id": "p1"}))
+
+
+class RecordEventTests(unittest.IsolatedAsyncioTestCase):
+    async def test_event_is_pushed_to_bounded_parcel_timeline(self):
+        fake_db = SimpleNamespace(
+            parcel_events=SimpleNamespace(insert_one=AsyncMock()),
+            parcels=SimpleNamespace(update_one=AsyncMock()),
+        )
+
+        with patch.object(parcel_service, "db", fake_db):
+            await _record_event(
+                "STATUS_CHANGED",
+                parcel_id="p1",
+                from_status=ParcelStatus.IN_TRANSIT,
+                to_status=ParcelStatus.AT_DESTINATION_RELAY,
+                actor_id="d1",
+                metadata={"lat": 14.7},
+            )
+
+        event = fake_db.parcel_events.insert_one.await_args.args[0]
+        query, update = fake_db.parcels.update_one.await_args.args
+        self.assertEqual(query, {"parcel_id": "p1", "recent_events": {"$exists": True}})
+        push = update["$push"]["recent_events"]
+        self.assertEqual(push["$slice"], -RECENT_EVENTS_LIMIT)
+        self.assertEqual(push["$each"][0]["event_id"], event["event_id"])
+        self.assertEqual(push["$each"][0]["to_status"], "at_destination_relay")
+        self.assertNotIn("metadata", push["$each"][0])
+        self.assertEqual(update["$inc"], {"event_count": 1})
+
+    async def test_user_events_do_not_touch_parcels(self):
+        fake_db = SimpleNamespace(
+            parcel_events=SimpleNamespace(insert_one=AsyncMock()),
+            parcels=SimpleNamespace(update_one=AsyncMock()),
+        )
+
+        with patch.object(parcel_service, "db", fake_db):
+            await _record_event("PIN_CHANGED", actor_id="u1")
+
+        fake_db.parcels.update_one.assert_not_awaited()
+
+
+if __name__ == "__main__":
+    unittest.main()
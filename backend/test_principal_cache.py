@@ -0,0 +1,62 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from core import principal_cache as principal_module
+from core.principal_cache import PrincipalCache, _principal_change_pipeline, load_principal
+
+
+class PrincipalCacheTests(unittest.TestCase):
+    def test_lru_bound_and_ttl(self):
+        cache = PrincipalCache(max_entries=2, ttl_seconds=30)
+        cache.put("u1", {"_id": "oid1", "user_id": "u1"})
+        cache.put("u2", {"_id": "oid2", "user_id": "u2"})
+        cache.get("u1")
+        cache.put("u3", {"_id": "oid3", "user_id": "u3"})
+
+        self.assertIsNone(cache.get("u2"))
+        self.assertEqual(cache.get("u1"), {"user_id": "u1"})
+        self.assertNotIn("oid2", cache._by_object_id)
+
+        with patch.object(principal_module.time, "monotonic", return_value=principal_module.time.monotonic() + 31):
+            self.assertIsNone(cache.get("u1"))
+
+    def test_change_stream_event_invalidates_by_object_id(self):
+        cache = PrincipalCache(max_entries=10, ttl_seconds=30)
+        cache.put("u1", {"_id": "oid1", "user_id": "u1", "is_banned": False})
+        with patch.object(principal_module, "principal_cache", cache):
+            principal_module.apply_principal_change({"operationType": "update", "documentKey": {"_id": "oid1"}})
+        self.assertIsNone(cache.get("u1"))
+
+    def test_stale_load_is_not_cached_after_invalidation(self):
+        cache = PrincipalCache(max_entries=10, ttl_seconds=30)
+        generation = cache.generation
+        cache.invalidate("u1")
+        cache.put("u1", {"user_id": "u1", "role": "driver"}, generation)
+        self.assertEqual(len(cache), 0)
+
+    def test_pipeline_only_watches_projected_fields(self):
+        clauses = _principal_change_pipeline()[0]["$match"]["$or"]
+        self.assertIn({"updateDescription.updatedFields.is_banned": {"$exists": True}}, clauses)
+        self.assertNotIn({"updateDescription.updatedFields.favorite_addresses": {"$exists": True}}, clauses)
+
+
+class LoadPrincipalTests(unittest.IsolatedAsyncioTestCase):
+    async def test_second_lookup_skips_mongo(self):
+        cache = PrincipalCache(max_entries=10, ttl_seconds=30)
+        find_one = AsyncMock(return_value={"_id": "oid1", "user_id": "u1", "role": "client"})
+        with patch.object(principal_module, "principal_cache", cache), \
+                patch.object(principal_module, "db", SimpleNamespace(users=SimpleNamespace(find_one=find_one))):
+            first = await load_principal("u1")
+            second = await load_principal("u1")
+            principal_module.invalidate_principal("u1")
+            await load_principal("u1")
+
+        self.assertEqual(first, {"user_id": "u1", "role": "client"})
+        self.assertEqual(second, first)
+        self.assertEqual(find_one.await_count, 2)
+        self.assertEqual(find_one.await_args.args[1], principal_module.PRINCIPAL_PROJECTION)
+
+
+if __name__ == "__main__":
+    unittest.main()
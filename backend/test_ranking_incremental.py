@@ -0,0 +1,99 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from services import ranking_service
+from services.ranking_service import badge_for_rank, rerank_period, update_driver_stat
+
+
+def _stat(driver_id, success, total, rank=0, badge="none"):
+    return {
+        "driver_id": driver_id,
+        "deliveries_success": success,
+        "deliveries_total": total,
+        "success_rate": round(success / max(total, 1) * 100, 1),
+        "total_earned_xof": success * 1000.0,
+        "rank": rank,
+        "badge": badge,
+    }
+
+
+def _cursor(docs):
+    return SimpleNamespace(to_list=AsyncMock(return_value=docs))
+
+
+class RerankTests(unittest.IsolatedAsyncioTestCase):
+    async def test_only_changed_ranks_are_written(self):
+        stats = [
+            _stat("d1", 5, 5, rank=1, badge="gold"),
+            _stat("d2", 3, 4, rank=3, badge="bronze"),
+            _stat("d3", 4, 4, rank=2, badge="silver"),
+            _stat("d4", 0, 1, rank=4),
+        ]
+        # d2 passe devant d3 : seuls ces deux rangs changent.
+        stats[1]["deliveries_success"] = 4
+        stats[1]["deliveries_total"] = 4
+        stats[1]["success_rate"] = 100.0
+        stats[1]["total_earned_xof"] = 5000.0
+        bulk_write = AsyncMock()
+        fake_db = SimpleNamespace(driver_stats=SimpleNamespace(
+            find=MagicMock(return_value=_cursor(stats)),
+            bulk_write=bulk_write,
+        ))
+
+        with patch.object(ranking_service, "db", fake_db):
+            written = await rerank_period("2026-05")
+
+        self.assertEqual(written, 2)
+        operations = {op._filter["driver_id"]: op._doc["$set"] for op in bulk_write.await_args.args[0]}
+        self.assertEqual(operations, {
+            "d2": {"rank": 2, "badge": "silver"},
+            "d3": {"rank": 3, "badge": "bronze"},
+        })
+
+    def test_badges(self):
+        self.assertEqual([badge_for_rank(rank) for rank in (1, 2, 3, 4)], ["gold", "silver", "bronze", "none"])
+
+
+class UpdateDriverStatTests(unittest.IsolatedAsyncioTestCase):
+    def _fake_db(self, previous, mission_row):
+        return SimpleNamespace(
+            users=SimpleNamespace(find_one=AsyncMock(return_value={"user_id": "d1", "average_rating": 4.5})),
+            delivery_missions=SimpleNamespace(aggregate=MagicMock(return_value=_cursor([mission_row]))),
+            driver_stats=SimpleNamespace(find_one_and_update=AsyncMock(return_value=previous)),
+        )
+
+    async def test_unchanged_sort_key_skips_rerank(self):
+        previous = _stat("d1", 2, 3)
+        fake_db = self._fake_db(previous, {"_id": "d1", "total": 3, "success": 2, "earned": 2000})
+
+        with patch.object(ranking_service, "db", fake_db), \
+                patch.object(ranking_service, "rerank_period", AsyncMock()) as rerank:
+            values = await update_driver_stat("d1", "2026-05")
+
+        self.assertEqual(values["avg_rating"], 4.5)
+        rerank.assert_not_awaited()
+        match = fake_db.delivery_missions.aggregate.call_args.args[0][0]["$match"]
+        self.assertEqual(match["driver_id"], "d1")
+
+    async def test_completed_mission_triggers_rerank(self):
+        fake_db = self._fake_db(_stat("d1", 2, 3), {"_id": "d1", "total": 3, "success": 3, "earned": 3000})
+
+        with patch.object(ranking_service, "db", fake_db), \
+                patch.object(ranking_service, "rerank_period", AsyncMock()) as rerank:
+            await update_driver_stat("d1", "2026-05")
+
+        rerank.assert_awaited_once_with("2026-05")
+        update = fake_db.driver_stats.find_one_and_update.await_args.args[1]
+        self.assertEqual(update["$set"]["deliveries_success"], 3)
+        self.assertNotIn("bonus_paid_xof", update["$set"])
+
+    async def test_failures_are_logged_not_raised(self):
+        fake_db = SimpleNamespace(users=SimpleNamespace(find_one=AsyncMock(side_effect=RuntimeError("down"))))
+        with patch.object(ranking_service, "db", fake_db), \
+                self.assertLogs("services.ranking_service", level="WARNING"):
+            self.assertIsNone(await update_driver_stat("d1", "2026-05"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,180 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from pymongo.errors import PyMongoError
+
+from core import rate_limit_storage
+from core.rate_limit_storage import MongoSlidingWindowStorage
+
+NOW = 1_800_000_030.0  # milieu d'une fenêtre de 60 s
+
+
+class _FakeBuckets:
+    """Collection partagée entre plusieurs « process » (instances de stockage)."""
+
+    def __init__(self):
+        self.docs: dict[str, dict] = {}
+        self.round_trips = 0
+        self.background_trips = 0
+        self.in_background = False
+        self.locks: list = []
+
+    def _trip(self):
+        self.round_trips += 1
+        self.background_trips += self.in_background
+        assert not any(lock.locked() for lock in self.locks), "aller-retour Mongo sous verrou"
+
+    def find_one(self, query, _projection=None):
+        self._trip()
+        doc = self.docs.get(query["_id"])
+        return dict(doc) if doc else None
+
+    def find_one_and_update(self, query, update, upsert=False, return_document=None):
+        self._trip()
+        doc = self.docs.setdefault(query["_id"], {"_id": query["_id"], "count": 0})
+        doc["count"] += update["$inc"]["count"]
+        return dict(doc)
+
+    def update_one(self, query, update):
+        self._trip()
+        self.docs[query["_id"]]["count"] += update["$inc"]["count"]
+        return SimpleNamespace(modified_count=1)
+
+
+class _BackgroundExecutor:
+    """Exécute les réservations anticipées à la demande, comme le thread dédié."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.pending = []
+
+    def submit(self, fn, *args):
+        self.pending.append((fn, args))
+
+    def run_pending(self):
+        self.buckets.in_background = True
+        while self.pending:
+            fn, args = self.pending.pop(0)
+            fn(*args)
+        self.buckets.in_background = False
+
+
+def _storage(buckets):
+    storage = MongoSlidingWindowStorage("denkma-mongo://")
+    storage._client = {
+        rate_limit_storage.settings.DB_NAME: {rate_limit_storage.BUCKETS_COLLECTION: buckets}
+    }
+    storage._executor = _BackgroundExecutor(buckets)
+    buckets.locks.append(storage._lock)
+    return storage
+
+
+def _acquire(storage, key, limit, expiry=60):
+    granted = storage.acquire_sliding_window_entry(key, limit, expiry)
+    storage._executor.run_pending()
+    return granted
+
+
+class MongoSlidingWindowStorageTests(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(rate_limit_storage.time, "time", return_value=NOW)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reservations_batch_round_trips(self):
+        buckets = _FakeBuckets()
+        storage = _storage(buckets)
+
+        results = [_acquire(storage, "ip:1", 100) for _ in range(30)]
+
+        self.assertTrue(all(results))
+        # Aucun aller-retour sur la boucle : la première requête passe à crédit,
+        # la fenêtre précédente et les lots de 10 sont lus/réservés en arrière-plan.
+        self.assertEqual(buckets.round_trips - buckets.background_trips, 0)
+        self.assertEqual(buckets.background_trips, 5)
+
+    def test_small_limits_still_reserve_several_tokens(self):
+        buckets = _FakeBuckets()
+        storage = _storage(buckets)
+
+        results = [_acquire(storage, "ip:4", 20) for _ in range(20)]
+
+        self.assertTrue(all(results))
+        # Lots de 5 (RATE_LIMIT_MIN_RESERVATION) au lieu de 2 : 4 lots, puis une
+        # seule tentative rendue (fenêtre épuisée), tous en arrière-plan.
+        self.assertEqual(buckets.round_trips - buckets.background_trips, 0)
+        self.assertEqual(buckets.background_trips, 7)
+
+    def test_several_processes_never_exceed_the_global_limit(self):
+        buckets = _FakeBuckets()
+        workers = [_storage(buckets) for _ in range(3)]
+
+        granted = sum(
+            _acquire(worker, "ip:2", 20)
+            for _ in range(30)
+            for worker in workers
+        )
+
+        self.assertEqual(granted, 20)
+        current = buckets.docs[f"ip:2/{int(NOW / 60)}"]["count"]
+        self.assertLessEqual(current, 20)
+
+    def test_previous_window_weight_and_local_block(self):
+        buckets = _FakeBuckets()
+        window = int(NOW / 60)
+        buckets.docs[f"ip:3/{window - 1}"] = {"count": 10}
+        storage = _storage(buckets)
+
+        # Mi-fenêtre : la fenêtre précédente pèse 5 → 5 jetons disponibles sur 10.
+        granted = [_acquire(storage, "ip:3", 10) for _ in range(5)]
+        self.assertTrue(all(granted))
+        self.assertFalse(_acquire(storage, "ip:3", 10))
+
+        trips = buckets.round_trips
+        self.assertFalse(_acquire(storage, "ip:3", 10))
+        self.assertEqual(buckets.round_trips, trips)
+
+    def test_unit_lots_never_block_and_stop_at_the_limit(self):
+        buckets = _FakeBuckets()
+        storage = _storage(buckets)
+
+        results = [_acquire(storage, "ip:5", 5) for _ in range(7)]
+
+        self.assertEqual(results, [True] * 5 + [False] * 2)
+        self.assertEqual(buckets.round_trips - buckets.background_trips, 0)
+        self.assertEqual(buckets.docs[f"ip:5/{int(NOW / 60)}"]["count"], 5)
+
+    def test_credit_is_bounded_to_one_lot_per_process(self):
+        buckets = _FakeBuckets()
+        buckets.docs[f"ip:6/{int(NOW / 60)}"] = {"count": 5}
+        storage = _storage(buckets)
+
+        # Fenêtre déjà épuisée par d'autres process : la première requête passe
+        # à crédit (lot de 1), les suivantes sont refusées localement.
+        self.assertTrue(storage.acquire_sliding_window_entry("ip:6", 5, 60))
+        self.assertFalse(storage.acquire_sliding_window_entry("ip:6", 5, 60))
+        storage._executor.run_pending()
+        self.assertFalse(_acquire(storage, "ip:6", 5))
+        self.assertEqual(buckets.round_trips - buckets.background_trips, 0)
+        self.assertEqual(buckets.docs[f"ip:6/{int(NOW / 60)}"]["count"], 5)
+
+    def test_background_failure_triggers_fallback_without_blocking_check(self):
+        buckets = _FakeBuckets()
+        storage = _storage(buckets)
+        buckets.find_one = MagicMock(side_effect=PyMongoError("down"))
+
+        self.assertTrue(_acquire(storage, "ip:7", 10))
+        # slowapi bascule sur ses compteurs en mémoire quand le stockage lève.
+        with self.assertRaises(PyMongoError):
+            storage.acquire_sliding_window_entry("ip:7", 10, 60)
+
+        buckets.database = SimpleNamespace(command=MagicMock())
+        self.assertFalse(storage.check())
+        buckets.database.command.assert_not_called()
+        storage._executor.run_pending()
+        self.assertTrue(storage.check())
+
+
+if __name__ == "__main__":
+    unittest.main()
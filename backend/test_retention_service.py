@@ -0,0 +1,80 @@
+import unittest
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from services import retention_service
+from services.retention_service import archive_older_than, ensure_ttl_index
+
+
+class _FakeFind:
+    def __init__(self, batches):
+        self._batches = batches
+
+    def sort(self, *_args):
+        return self
+
+    def limit(self, *_args):
+        return self
+
+    async def to_list(self, length=None):
+        return self._batches.pop(0) if self._batches else []
+
+
+class RetentionServiceTests(unittest.IsolatedAsyncioTestCase):
+    async def test_archive_moves_batches_until_source_is_drained(self):
+        batches = [[{"_id": 1}, {"_id": 2}], [{"_id": 3}]]
+        source = SimpleNamespace(
+            find=lambda *_args, **_kwargs: _FakeFind(batches),
+            delete_many=AsyncMock(side_effect=[
+                SimpleNamespace(deleted_count=2),
+                SimpleNamespace(deleted_count=1),
+            ]),
+        )
+        archive = SimpleNamespace(insert_many=AsyncMock())
+        fake_db = {"notifications": source, "notifications_archive": archive}
+
+        with patch.object(retention_service, "db", fake_db):
+            moved = await archive_older_than(
+                "notifications",
+                "created_at",
+                datetime(2026, 1, 1, tzinfo=timezone.utc),
+                batch_size=2,
+                pause_seconds=0,
+            )
+
+        self.assertEqual(moved, 3)
+        self.assertEqual(archive.insert_many.await_count, 2)
+        archived_doc = archive.insert_many.await_args_list[0].args[0][0]
+        self.assertIn("archived_at", archived_doc)
+        source.delete_many.assert_any_await({"_id": {"$in": [1, 2]}})
+
+    async def test_ttl_index_duration_is_aligned_with_policy(self):
+        collection = SimpleNamespace(
+            index_information=AsyncMock(return_value={
+                "created_at_1": {"key": [("created_at", 1)], "expireAfterSeconds": 3600},
+            }),
+            create_index=AsyncMock(),
+        )
+        command = AsyncMock()
+
+        class _Db(dict):
+            pass
+
+        fake_db = _Db(whatsapp_delivery_logs=collection)
+        fake_db.command = command
+
+        with patch.object(retention_service, "db", fake_db):
+            outcome = await ensure_ttl_index("whatsapp_delivery_logs", "created_at", 86400)
+
+        self.assertEqual(outcome, "updated")
+        command.assert_awaited_once_with(
+            "collMod",
+            "whatsapp_delivery_logs",
+            index={"name": "created_at_1", "expireAfterSeconds": 86400},
+        )
+        collection.create_index.assert_not_awaited()
+
+
+if __name__ == "__main__":
+    unittest.main()
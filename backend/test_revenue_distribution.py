@@ -0,0 +1,96 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from services import wallet_service
+from services.wallet_service import apply_ledger_legs, plan_delivery_revenue, relay_owner_ids
+
+
+def _cursor(docs):
+    return SimpleNamespace(to_list=AsyncMock(return_value=docs))
+
+
+PARCEL = {
+    "parcel_id": "p1",
+    "delivery_mode": "relay_to_relay",
+    "paid_price": 1000,
+    "assigned_driver_id": "d1",
+    "origin_relay_id": "r1",
+    "destination_relay_id": "r2",
+    "driver_bonus_xof": 200,
+}
+
+
+class PlanTests(unittest.TestCase):
+    def test_relay_to_relay_legs(self):
+        legs = plan_delivery_revenue(PARCEL, {"r1": "owner1", "r2": "owner2"})
+
+        self.assertEqual(
+            [(leg.owner_id, leg.tx_type, leg.reference) for leg in legs],
+            [
+                ("d1", "revenue", "driver_revenue:p1"),
+                ("d1", "revenue", "driver_bonus_revenue:p1"),
+                ("owner1", "credit", "relay_origin_commission:p1"),
+                ("owner2", "credit", "relay_destination_commission:p1"),
+            ],
+        )
+        self.assertEqual(legs[2].amount, 75.0)
+
+    def test_unknown_relay_owner_is_skipped(self):
+        legs = plan_delivery_revenue(PARCEL, {"r1": None})
+        self.assertNotIn("relay", {leg.owner_type for leg in legs})
+
+
+class RelayOwnerCacheTests(unittest.IsolatedAsyncioTestCase):
+    async def test_second_lookup_is_served_from_cache(self):
+        wallet_service._relay_owner_cache.clear()
+        find = MagicMock(return_value=_cursor([{"relay_id": "r1", "owner_user_id": "owner1"}]))
+        with patch.object(wallet_service, "db", SimpleNamespace(relay_points=SimpleNamespace(find=find))):
+            first = await relay_owner_ids(["r1", None])
+            second = await relay_owner_ids(["r1"])
+
+        self.assertEqual(first, {"r1": "owner1"})
+        self.assertEqual(second, first)
+        self.assertEqual(find.call_count, 1)
+
+
+class ApplyLegsTests(unittest.IsolatedAsyncioTestCase):
+    async def test_single_transaction_with_bulk_writes_and_replay_skip(self):
+        legs = plan_delivery_revenue(PARCEL, {"r1": "owner1", "r2": "owner2"})
+        wallets = [
+            {"wallet_id": "w_d1", "owner_id": "d1"},
+            {"wallet_id": "w_o1", "owner_id": "owner1"},
+            {"wallet_id": "w_o2", "owner_id": "owner2"},
+        ]
+        # Le revenu principal a déjà été enregistré lors d'un premier passage.
+        existing = [{"wallet_id": "w_d1", "reference": "driver_revenue:p1", "tx_type": "revenue"}]
+        fake_db = SimpleNamespace(
+            wallets=SimpleNamespace(find=MagicMock(return_value=_cursor(wallets)), bulk_write=AsyncMock()),
+            users=SimpleNamespace(bulk_write=AsyncMock()),
+            wallet_transactions=SimpleNamespace(
+                find=MagicMock(return_value=_cursor(existing)),
+                insert_many=AsyncMock(),
+            ),
+        )
+        sessions = []
+
+        async def _run(op):
+            sessions.append("tx")
+            return await op("session")
+
+        with patch.object(wallet_service, "db", fake_db), \
+                patch.object(wallet_service, "_run_in_transaction", _run):
+            txs = await apply_ledger_legs(legs)
+
+        self.assertEqual(sessions, ["tx"])
+        self.assertEqual([tx["reference"] for tx in txs], [
+            "driver_bonus_revenue:p1", "relay_origin_commission:p1", "relay_destination_commission:p1",
+        ])
+        wallet_ops = fake_db.wallets.bulk_write.await_args.args[0]
+        self.assertEqual({op._filter["owner_id"]: op._doc["$inc"]["balance"] for op in wallet_ops},
+                         {"owner1": 75.0, "owner2": 75.0})
+        self.assertEqual(fake_db.wallet_transactions.insert_many.await_args.kwargs["session"], "session")
+
+
+if __name__ == "__main__":
+    unittest.main()
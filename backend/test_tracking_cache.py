@@ -0,0 +1,175 @@
+import unittest
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from fastapi import HTTPException
+from limits.storage import MemoryStorage
+from limits.strategies import MovingWindowRateLimiter
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+
+from core import rate_limit_storage
+from core.tracking_cache import TrackingCache, TrackingEntry, etag_matches, invalidate_tracking_parcel, tracking_cache
+from routers import tracking
+from routers.tracking import _conditional_headers, _not_modified, _public_tracking_entry
+from test_rate_limit_storage import NOW, _BackgroundExecutor, _FakeBuckets
+
+PARCEL = {
+    "parcel_id": "p1",
+    "tracking_code": "PKP-ABC-1234",
+    "status": "in_transit",
+    "delivery_mode": "relay_to_relay",
+    "created_at": datetime(2026, 5, 1, 8, 0, tzinfo=timezone.utc),
+    "updated_at": datetime(2026, 5, 1, 9, 30, tzinfo=timezone.utc),
+}
+TIMELINE = [
+    {"event_type": "PARCEL_CREATED", "to_status": "created", "created_at": datetime(2026, 5, 1, 8, 0, tzinfo=timezone.utc)},
+    {"event_type": "STATUS_CHANGED", "to_status": "in_transit", "created_at": datetime(2026, 5, 1, 9, 30, tzinfo=timezone.utc)},
+]
+
+
+def _request(host="203.0.113.7"):
+    return SimpleNamespace(client=SimpleNamespace(host=host), headers={})
+
+
+def _entry(parcel_id="p1", digest="abc"):
+    return TrackingEntry(parcel_id=parcel_id, payload={}, digest=digest, last_modified=None, expires_at=None)
+
+
+class TrackingCacheTests(unittest.TestCase):
+    def test_lru_eviction_and_parcel_invalidation(self):
+        cache = TrackingCache(max_entries=2, ttl_seconds=60)
+        cache.put("A", _entry("p1"))
+        cache.put("B", _entry("p2"))
+        cache.get("A")
+        cache.put("C", _entry("p3"))
+
+        self.assertIsNone(cache.get("B"))
+        self.assertIsNotNone(cache.get("A"))
+        cache.invalidate_parcel("p1")
+        self.assertIsNone(cache.get("A"))
+
+    def test_load_started_before_invalidation_is_not_cached(self):
+        cache = TrackingCache(max_entries=10, ttl_seconds=60)
+        generation = cache.generation
+        cache.invalidate_parcel("p1")
+        cache.put("A", _entry("p1"), generation)
+        self.assertEqual(len(cache), 0)
+
+    def test_misses_expire_and_are_dropped_by_invalidation(self):
+        cache = TrackingCache(max_entries=2, ttl_seconds=60, miss_ttl_seconds=30)
+        for code in ("A", "B", "C"):
+            cache.put_miss(code)
+
+        self.assertEqual(len(cache), 0)
+        self.assertFalse(cache.is_miss("A"))
+        self.assertTrue(cache.is_miss("C"))
+        cache.invalidate("C")
+        self.assertFalse(cache.is_miss("C"))
+
+    def test_if_none_match_uses_weak_comparison(self):
+        self.assertTrue(etag_matches('W/"abc", "def"', '"abc"'))
+        self.assertTrue(etag_matches("*", '"abc"'))
+        self.assertFalse(etag_matches('"abc-html"', '"abc"'))
+        self.assertFalse(etag_matches(None, '"abc"'))
+
+
+class PublicTrackingEntryTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        tracking_cache.clear()
+        patcher = patch.object(tracking, "limiter", Limiter(key_func=get_remote_address, storage_uri="memory://"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_hit_does_not_read_mongo_until_parcel_event(self):
+        find_parcel = AsyncMock(return_value=dict(PARCEL))
+        with patch.object(tracking, "find_one_with_archive", find_parcel), \
+                patch.object(tracking, "get_parcel_timeline_for", AsyncMock(return_value=list(TIMELINE))):
+            first = await _public_tracking_entry(_request(), "PKP-ABC-1234")
+            second = await _public_tracking_entry(_request(), "PKP-ABC-1234")
+            invalidate_tracking_parcel("p1")
+            await _public_tracking_entry(_request(), "PKP-ABC-1234")
+
+        self.assertIs(first, second)
+        self.assertEqual(find_parcel.await_count, 2)
+        self.assertEqual(first.last_modified, PARCEL["updated_at"])
+
+    async def test_unknown_code_is_remembered_briefly(self):
+        find_parcel = AsyncMock(return_value=None)
+        with patch.object(tracking, "find_one_with_archive", find_parcel), \
+                patch.object(tracking_cache, "miss_ttl_seconds", 30):
+            for _ in range(3):
+                with self.assertRaises(HTTPException) as raised:
+                    await _public_tracking_entry(_request(), "PKP-NOPE-0000")
+                self.assertEqual(raised.exception.status_code, 404)
+
+        find_parcel.assert_awaited_once()
+
+    async def test_mongo_lookups_are_budgeted_per_client(self):
+        find_parcel = AsyncMock(return_value=None)
+        statuses = []
+        with patch.object(tracking, "find_one_with_archive", find_parcel):
+            for index in range(7):
+                with self.assertRaises(HTTPException) as raised:
+                    await _public_tracking_entry(_request(), f"PKP-ENUM-{index:04d}")
+                statuses.append(raised.exception.status_code)
+            with self.assertRaises(HTTPException) as other_client:
+                await _public_tracking_entry(_request("198.51.100.1"), "PKP-ENUM-9999")
+
+        self.assertEqual(statuses, [404] * 5 + [429] * 2)
+        self.assertEqual(find_parcel.await_count, 6)
+        self.assertEqual(other_client.exception.status_code, 404)
+
+    async def test_shared_budget_never_reads_mongo_on_the_event_loop(self):
+        buckets = _FakeBuckets()
+        shared = Limiter(key_func=get_remote_address, storage_uri="denkma-mongo://", strategy="sliding-window-counter")
+        storage = shared._storage
+        storage._client = {rate_limit_storage.settings.DB_NAME: {rate_limit_storage.BUCKETS_COLLECTION: buckets}}
+        storage._executor = _BackgroundExecutor(buckets)
+        find_parcel = AsyncMock(return_value=None)
+        statuses = []
+        with patch.object(tracking, "limiter", shared), \
+                patch.object(rate_limit_storage.time, "time", return_value=NOW), \
+                patch.object(tracking, "find_one_with_archive", find_parcel):
+            for index in range(6):
+                with self.assertRaises(HTTPException) as raised:
+                    await _public_tracking_entry(_request(), f"PKP-SHARED-{index:04d}")
+                statuses.append(raised.exception.status_code)
+                # Le thread du stockage rattrape entre deux requêtes.
+                storage._executor.run_pending()
+
+        self.assertEqual(statuses, [404] * 5 + [429])
+        self.assertGreater(buckets.round_trips, 0)
+        self.assertEqual(buckets.round_trips, buckets.background_trips)
+
+    async def test_unavailable_shared_budget_falls_back_to_a_local_one(self):
+        broken = SimpleNamespace(enabled=True, limiter=SimpleNamespace(hit=MagicMock(side_effect=RuntimeError("down"))))
+        find_parcel = AsyncMock(return_value=None)
+        statuses = []
+        with patch.object(tracking, "limiter", broken), \
+                patch.object(tracking, "_LOCAL_LOOKUP_LIMITER", MovingWindowRateLimiter(MemoryStorage())), \
+                patch.object(tracking, "find_one_with_archive", find_parcel):
+            for index in range(6):
+                with self.assertRaises(HTTPException) as raised:
+                    await _public_tracking_entry(_request(), f"PKP-LOCAL-{index:04d}")
+                statuses.append(raised.exception.status_code)
+
+        self.assertEqual(statuses, [404] * 5 + [429])
+        self.assertEqual(find_parcel.await_count, 5)
+
+    async def test_matching_etag_returns_304_with_validators(self):
+        with patch.object(tracking, "find_one_with_archive", AsyncMock(return_value=dict(PARCEL))), \
+                patch.object(tracking, "get_parcel_timeline_for", AsyncMock(return_value=list(TIMELINE))):
+            entry = await _public_tracking_entry(_request(), "PKP-ABC-1234")
+
+        headers = _conditional_headers(entry, "html")
+        response = _not_modified(SimpleNamespace(headers={"if-none-match": headers["ETag"]}), headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["etag"], entry.etag("html"))
+        self.assertEqual(response.headers["last-modified"], "Fri, 01 May 2026 09:30:00 GMT")
+        self.assertIsNone(_not_modified(SimpleNamespace(headers={"if-none-match": entry.etag()}), headers))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock, patch
+
+from pymongo.errors import DuplicateKeyError
+
+from services import whatsapp_inbox_service
+from services.whatsapp_inbox_service import enqueue_whatsapp_payload, process_inbox_entries
+
+
+class _FakeCursor:
+    def __init__(self, rows):
+        self._rows = list(rows)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._rows:
+            raise StopAsyncIteration
+        return self._rows.pop(0)
+
+
+def _entry(messages=(), calls=()):
+    value = {"metadata": {"phone_number_id": "pn-1"}, "messages": list(messages), "calls": list(calls)}
+    return {"inbox_id": "wbh_1", "payload": {"entry": [{"changes": [{"value": value}]}]}}
+
+
+class WhatsAppInboxTests(unittest.IsolatedAsyncioTestCase):
+    async def test_duplicate_payload_is_not_enqueued_twice(self):
+        insert_one = AsyncMock(side_effect=[None, DuplicateKeyError("dup")])
+        fake_db = SimpleNamespace(whatsapp_webhook_inbox=SimpleNamespace(insert_one=insert_one))
+
+        with patch.object(whatsapp_inbox_service, "db", fake_db):
+            first = await enqueue_whatsapp_payload({"entry": []}, b'{"entry": []}')
+            second = await enqueue_whatsapp_payload({"entry": []}, b'{"entry": []}')
+
+        self.assertTrue(first)
+        self.assertFalse(second)
+        self.assertEqual(len(insert_one.await_args_list[0].args[0]["payload_sha256"]), 64)
+
+    async def test_known_messages_are_skipped_and_calls_written_in_one_batch(self):
+        fake_db = SimpleNamespace(
+            whatsapp_support_messages=SimpleNamespace(
+                find=Mock(return_value=_FakeCursor([{"whatsapp_message_id": "wamid.old"}])),
+            ),
+            whatsapp_call_events=SimpleNamespace(
+                bulk_write=AsyncMock(return_value=SimpleNamespace(upserted_ids={0: "a", 1: "b"})),
+            ),
+        )
+        entries = [
+            _entry(
+                messages=[
+                    {"id": "wamid.old", "from": "221700000001", "type": "text"},
+                    {"id": "wamid.new", "from": "221700000002", "type": "text"},
+                    {"id": "wamid.new", "from": "221700000002", "type": "text"},
+                ],
+                calls=[
+                    {"id": "call-1", "event": "connect", "status": "ringing"},
+                    {"id": "call-1", "event": "terminate", "status": "completed"},
+                ],
+            ),
+        ]
+
+        build = AsyncMock(side_effect=lambda value, message: ({"whatsapp_message_id": message["id"]}, {}))
+        with (
+            patch.object(whatsapp_inbox_service, "db", fake_db),
+            patch.object(whatsapp_inbox_service, "build_whatsapp_inbound_message", build),
+            patch.object(whatsapp_inbox_service, "store_whatsapp_inbound_messages", AsyncMock()) as store,
+        ):
+            stats = await process_inbox_entries(entries)
+
+        self.assertEqual(stats, {"statuses": 0, "calls": 2, "messages": 1})
+        build.assert_awaited_once()
+        self.assertEqual(store.await_args.args[0], [({"whatsapp_message_id": "wamid.new"}, {})])
+        operations = fake_db.whatsapp_call_events.bulk_write.await_args.args[0]
+        self.assertEqual(len(operations), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
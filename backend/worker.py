@@ -0,0 +1,44 @@
+"""
+Process dédié aux tâches de fond : `python -m worker`.
+
+Lance les boucles (dispatch, relances, auto-release, anomalies admin), le
+scheduler et les workers du webhook WhatsApp, sans serveur HTTP. Les boucles
+sont protégées par des baux Mongo (core/leases.py) : plusieurs process worker
+peuvent tourner, un seul exécute chaque boucle. Les API tournent alors avec
+ROLE=api et `uvicorn --workers N`.
+"""
+import asyncio
+import logging
+import signal
+
+from database import close_db, connect_db
+from main import start_background_tasks, stop_background_tasks
+
+logger = logging.getLogger("worker")
+
+
+async def run() -> None:
+    await connect_db()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    tasks = start_background_tasks()
+    logger.info("Denkma worker started")
+    try:
+        await stop.wait()
+    finally:
+        await stop_background_tasks(tasks)
+        await close_db()
+        logger.info("Denkma worker stopped")
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass